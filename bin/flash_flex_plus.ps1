@@ -8,10 +8,24 @@ param(
 
     [string]$FlashEncryptionKeyFile = "",
 
+    [string]$FactoryPack = $env:FLEX_FACTORY_PACK,
+
+    [string]$FactoryImage = "",
+
+    [string]$ReleaseDir = $env:FLEX_RELEASE_DIR,
+
+    [switch]$Differential,
+
+    [switch]$Verify,
+
     [switch]$SkipSSID
 )
 
 $ErrorActionPreference = "Stop"
+if (-not $Verify -and $env:FLEX_VERIFY_FLASH -eq "1") {
+    $Verify = [switch]::Present
+}
+$AttemptStartedAt = [DateTimeOffset]::UtcNow.ToUnixTimeSeconds()
 
 if (-not $Port) {
     $Port = "COM3"
@@ -26,8 +40,31 @@ if (-not $Password) {
     }
 }
 
+# Stage markers are parsed by the GUI for /metrics and the flash history; stages may nest.
+$script:StageStack = New-Object System.Collections.ArrayList
+
+function Start-Stage([string]$Name) {
+    Write-Host "::stage $Name start"
+    [void]$script:StageStack.Add($Name)
+}
+
+function Complete-Stage([string]$Name, [string]$Result = "ok") {
+    Write-Host "::stage $Name end $Result"
+    if ($script:StageStack.Count -gt 0) {
+        $script:StageStack.RemoveAt($script:StageStack.Count - 1)
+    }
+}
+
+trap {
+    for ($i = $script:StageStack.Count - 1; $i -ge 0; $i--) {
+        Write-Host "::stage $($script:StageStack[$i]) end failed"
+    }
+    $script:StageStack.Clear()
+    break
+}
+
 function Show-Usage {
-    Write-Host "Usage: .\flash_flex_plus.ps1 -Serial <serial> [-Password <softap-password>] [-Port COM3] [--SkipSSID]" -ForegroundColor Yellow
+    Write-Host "Usage: .\flash_flex_plus.ps1 -Serial <serial> [-Password <softap-password>] [-Port COM3] [-FactoryPack <file> | -FactoryImage <file>] [-Differential] [-Verify] [--SkipSSID]" -ForegroundColor Yellow
 }
 
 function Require-File([string]$Path) {
@@ -89,6 +126,55 @@ function Validate-Password([string]$Value) {
     }
 }
 
+function Read-PackField([byte[]]$Bytes, [int]$Offset, [int]$Length) {
+    $text = [System.Text.Encoding]::ASCII.GetString($Bytes, $Offset, $Length)
+    return $text.Split([char]0)[0]
+}
+
+function Export-PackPayload([string]$Pack, [string]$Serial, [string]$Password, [string]$Output) {
+    $stream = [System.IO.File]::OpenRead($Pack)
+    try {
+        $reader = New-Object System.IO.StreamReader($stream, [System.Text.Encoding]::ASCII)
+        $fields = $reader.ReadLine() -split " "
+        if ($fields.Count -ne 5 -or $fields[0] -ne "FPXPACK" -or $fields[1] -ne "1") {
+            throw "$Pack is not a factory pack."
+        }
+        $count = [int]$fields[2]
+        $partSize = [int]$fields[3]
+        $dataOffset = [long]$fields[4]
+        $slot = -1
+        for ($i = 0; $i -lt $count; $i++) {
+            $entry = $reader.ReadLine() -split " "
+            if ($entry[0] -eq $Serial) {
+                $slot = [int]$entry[1]
+                break
+            }
+        }
+        if ($slot -lt 0) {
+            throw "$Serial is not in factory pack $Pack."
+        }
+        $buffer = New-Object byte[] $partSize
+        $null = $stream.Seek($dataOffset + [long]$slot * $partSize, [System.IO.SeekOrigin]::Begin)
+        $read = 0
+        while ($read -lt $partSize) {
+            $chunk = $stream.Read($buffer, $read, $partSize - $read)
+            if ($chunk -le 0) { throw "Factory pack $Pack is truncated." }
+            $read += $chunk
+        }
+    } finally {
+        $stream.Dispose()
+    }
+    # Header is 8 bytes, then the 32-byte serial and 64-byte password fields.
+    if ((Read-PackField $buffer 8 32) -ne $Serial) {
+        throw "Factory pack slot $slot does not hold $Serial."
+    }
+    if ((Read-PackField $buffer 40 64) -ne $Password) {
+        throw "Factory pack password for $Serial differs from the requested password."
+    }
+    [System.IO.File]::WriteAllBytes($Output, $buffer)
+    Write-Host "Factory payload read from pack $Pack (slot $slot)."
+}
+
 function Resolve-ToolArch([string]$ToolsDir) {
     $preferred = "windows-amd64"
     $alt = "windows-arm64"
@@ -129,13 +215,99 @@ function Get-EfuseSummary([string]$Espefuse, [string]$Port) {
     return $output -replace "`r", ""
 }
 
-function Needs-FlashEncryptionSetup([string]$Espefuse, [string]$Port) {
+$script:BoardMac = ""
+
+function Record-BoardEfuses([int]$FlashCryptCnt) {
+    if ($script:BoardMac) {
+        & $PythonExe $EfuseRegistryTool --keyfile $FlashEncryptionKeyFile record --mac $script:BoardMac --flash-crypt-cnt $FlashCryptCnt
+    }
+}
+
+function Needs-FlashEncryptionSetup([string]$Esptool, [string]$Espefuse, [string]$Port) {
+    # One read_mem of EFUSE_BLK0_RDATA0 yields both the MAC (connect banner) and FLASH_CRYPT_CNT
+    # (bits 20-26), so no board needs the full summary unless the read itself fails.
+    $flashCryptCnt = ""
+    $probe = & $Esptool --chip esp32 --port $Port --before default_reset --after no_reset read_mem 0x3ff5a000 2>&1
+    if ($LASTEXITCODE -eq 0) {
+        $decoded = ($probe | ForEach-Object { "$_" -replace "`r", "" }) | & $PythonExe $EfuseRegistryTool --keyfile $FlashEncryptionKeyFile probe
+        foreach ($line in $decoded) {
+            if ($line -match "^BOARD_MAC='?([^']*)'?$") { $script:BoardMac = $Matches[1] }
+            if ($line -match "^FLASH_CRYPT_CNT=(\d*)$") { $flashCryptCnt = $Matches[1] }
+        }
+    }
+    if ($flashCryptCnt -ne "") {
+        Write-Host "Board $($script:BoardMac): FLASH_CRYPT_CNT=$flashCryptCnt."
+        Record-BoardEfuses -FlashCryptCnt ([int]$flashCryptCnt)
+        return ([int]$flashCryptCnt -eq 0)
+    }
+
     $summary = Get-EfuseSummary -Espefuse $Espefuse -Port $Port
     $line = ($summary -split "`n" | Where-Object { $_ -match "FLASH_CRYPT_CNT" } | Select-Object -First 1)
-    if ($line -and $line -match "=\s*0\b") { return $true }
+    if ($line -and $line -match "=\s*(\d+)") {
+        Record-BoardEfuses -FlashCryptCnt ([int]$Matches[1])
+        if ([int]$Matches[1] -eq 0) { return $true }
+    }
     return $false
 }
 
+function Check-DeviceIdentity([string]$Esptool, [string]$Port) {
+    # A board flashed before as this serial becomes a rework; a board flashed as another serial, or a
+    # serial already given to another board, stops the run before any eFuse or flash write
+    # (FLEX_DEVICE_CONFLICTS=warn flashes anyway).
+    if (-not $script:BoardMac) {
+        $macOutput = & $Esptool --chip esp32 --port $Port --before default_reset --after no_reset read_mac 2>&1
+        foreach ($line in $macOutput) {
+            if ("$line" -match "MAC:\s*((?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2})") {
+                $script:BoardMac = $Matches[1].ToLower()
+                break
+            }
+        }
+    }
+    if (-not $script:BoardMac) {
+        Write-Warning "Chip MAC unknown; device identity check skipped."
+        return
+    }
+    Write-Host "Chip MAC: $($script:BoardMac)"
+    $verdict = & $PythonExe $DeviceRegistryTool check --mac $script:BoardMac --serial $Serial
+    if ($LASTEXITCODE -ne 0) {
+        Write-Warning "Device registry unavailable; identity check skipped."
+        return
+    }
+    $status = ""
+    $message = ""
+    foreach ($line in $verdict) {
+        if ($line -match "^DEVICE_STATUS=(.*)$") { $status = $Matches[1] }
+        if ($line -match "^DEVICE_MESSAGE='?(.*?)'?$") { $message = $Matches[1].Replace("'`"'`"'", "'") }
+    }
+    if ($status -eq "known" -and -not $script:Differential) {
+        Write-Host "$message Re-flashing as a rework: only regions whose digest differs are rewritten."
+        $script:Differential = $true
+    } elseif ($status -eq "mac_conflict" -or $status -eq "serial_conflict") {
+        if ($env:FLEX_DEVICE_CONFLICTS -eq "warn") {
+            Write-Warning "Identity conflict: $message"
+        } else {
+            throw "Identity conflict: $message Nothing was written; set FLEX_DEVICE_CONFLICTS=warn to flash anyway."
+        }
+    }
+}
+
+function Get-MatchingRegions([string]$Esptool, [string]$Port, [string]$Baud, [object[]]$Regions, [string]$After = "no_reset") {
+    # The chip hashes each range itself (verify_flash); only regions reported as matching are skipped.
+    $verifyArgs = @("--chip", "esp32", "--port", $Port, "--baud", $Baud, "--before", "default_reset", "--after", $After, "verify_flash") + $Regions
+    $output = & $Esptool @verifyArgs 2>&1 | ForEach-Object { "$_" -replace "`r", "" }
+    $matching = @()
+    $pending = $null
+    foreach ($line in $output) {
+        if ($line -match '^(?i)verifying' -and $line -match '(?:@|at) (0x[0-9a-fA-F]+)') {
+            $pending = [Convert]::ToInt64($Matches[1], 16)
+        } elseif ($null -ne $pending -and $line -match '(?i)verify ok|successful') {
+            $matching += $pending
+            $pending = $null
+        }
+    }
+    return $matching
+}
+
 function Burn-FlashEncryption([string]$Espefuse, [string]$Port, [string]$KeyFile) {
     Write-Host "Burning flash encryption key and eFuses..." -ForegroundColor Cyan
     $burnKeyOutput = "BURN`n" | & $Espefuse --port $Port burn_key flash_encryption $KeyFile 2>&1
@@ -150,14 +322,17 @@ function Burn-FlashEncryption([string]$Espefuse, [string]$Port, [string]$KeyFile
         Write-Host $burnKeyOutput
     }
 
-    "BURN`n" | & $Espefuse --port $Port burn_efuse FLASH_CRYPT_CONFIG 0xf
-    "BURN`n" | & $Espefuse --port $Port burn_efuse FLASH_CRYPT_CNT 1
-    "BURN`n" | & $Espefuse --port $Port burn_efuse DISABLE_DL_DECRYPT 1
-    "BURN`n" | & $Espefuse --port $Port burn_efuse DISABLE_DL_CACHE 1
+    # One burn_efuse call programs all four fields in a single connect/burn cycle.
+    "BURN`n" | & $Espefuse --port $Port burn_efuse `
+        FLASH_CRYPT_CONFIG 0xf `
+        FLASH_CRYPT_CNT 1 `
+        DISABLE_DL_DECRYPT 1 `
+        DISABLE_DL_CACHE 1
     if ($LASTEXITCODE -ne 0) {
         throw "Failed to burn flash encryption eFuses."
     }
     Write-Host "Flash encryption eFuses programmed." -ForegroundColor Green
+    Record-BoardEfuses -FlashCryptCnt 1
 }
 
 Validate-Serial $Serial
@@ -177,7 +352,9 @@ if ($Serial.StartsWith("FP")) {
 }
 
 $ScriptDir = Split-Path -Parent $MyInvocation.MyCommand.Path
-$ReleaseDir = Join-Path $ScriptDir "release"
+if (-not $ReleaseDir) {
+    $ReleaseDir = Join-Path $ScriptDir "release"
+}
 $ToolsRoot = Join-Path (Join-Path $ScriptDir "tools") "esptool"
 $ToolArch = Resolve-ToolArch $ToolsRoot
 $ToolsDir = Join-Path $ToolsRoot $ToolArch
@@ -188,42 +365,59 @@ New-Item -ItemType Directory -Force -Path $LogDir | Out-Null
 Require-File $ReleaseDir
 Require-File $FactoryTool
 
-$ManifestPath = Join-Path $ReleaseDir "manifest.json"
-Require-File $ManifestPath
-
-$Manifest = Get-Content $ManifestPath | ConvertFrom-Json
-$Artifacts = $Manifest.artifacts
-
-$Bootloader = Join-Path $ReleaseDir $Artifacts.bootloader
-$BootApp0   = Join-Path $ReleaseDir $Artifacts.boot_app0
-$Partitions = Join-Path $ReleaseDir $Artifacts.partitions
-$Firmware   = Join-Path $ReleaseDir $Artifacts.firmware
-$Spiffs     = Join-Path $ReleaseDir $Artifacts.spiffs
-$FactoryTemplate = Join-Path $ReleaseDir $Artifacts.factory_cfg
-
-[$Bootloader, $BootApp0, $Partitions, $Firmware, $Spiffs, $FactoryTemplate] | ForEach-Object {
-    Require-File $_
+$PythonExe = Resolve-Python
+$FlashPlanTool = Join-Path (Join-Path $ScriptDir "tools") "flash_plan.py"
+$EfuseRegistryTool = Join-Path (Join-Path $ScriptDir "tools") "efuse_registry.py"
+$FlashHistoryTool = Join-Path (Join-Path $ScriptDir "tools") "flash_history.py"
+$DeviceRegistryTool = Join-Path (Join-Path $ScriptDir "tools") "device_registry.py"
+Require-File $FlashPlanTool
+Require-File $EfuseRegistryTool
+Require-File $FlashHistoryTool
+Require-File $DeviceRegistryTool
+
+# The flash plan resolves each artifact against the partition table and checks it fits its region;
+# sizes and digests are cached per release, so repeat runs only stat the manifest.
+Start-Stage "plan"
+$planJson = & $PythonExe $FlashPlanTool json --release-dir $ReleaseDir
+if ($LASTEXITCODE -ne 0) {
+    throw "Flash plan for $ReleaseDir failed verification."
 }
+$Plan = ($planJson -join "`n") | ConvertFrom-Json
+Complete-Stage "plan"
+$FactoryRegion = $Plan.regions | Where-Object { $_.name -eq "factory_cfg" }
+if (-not $FactoryRegion) {
+    throw "Flash plan has no factory_cfg region."
+}
+$FactoryOffset = "0x{0:X}" -f [int64]$FactoryRegion.offset
 
-$EsptoolPath   = Join-Path $ToolsDir "esptool.exe"
-$EspefusePath  = Join-Path $ToolsDir "espefuse.exe"
+# FLEX_ESPTOOL/FLEX_ESPEFUSE replace the bundled binaries (e.g. with simulated fixtures).
+$EsptoolPath   = if ($env:FLEX_ESPTOOL) { $env:FLEX_ESPTOOL } else { Join-Path $ToolsDir "esptool.exe" }
+$EspefusePath  = if ($env:FLEX_ESPEFUSE) { $env:FLEX_ESPEFUSE } else { Join-Path $ToolsDir "espefuse.exe" }
 $EspsecurePath = Join-Path $ToolsDir "espsecure.exe"
 Require-Exe $EsptoolPath
 Require-Exe $EspefusePath
 Require-Exe $EspsecurePath
 
-$PythonExe = Resolve-Python
-
 $FactoryPlainPath = New-TempFilePath "factorycfg_plain_"
-$factoryArgs = @(
-    $FactoryTool,
-    "--serial", $Serial,
-    "--password", $Password,
-    "--output", $FactoryPlainPath
-)
-& $PythonExe @factoryArgs
+Start-Stage "payload"
+if ($FactoryImage) {
+    Require-File $FactoryImage
+    Write-Host "Using prepared factory image $FactoryImage."
+} elseif ($FactoryPack) {
+    Require-File $FactoryPack
+    Export-PackPayload -Pack $FactoryPack -Serial $Serial -Password $Password -Output $FactoryPlainPath
+} else {
+    $factoryArgs = @(
+        $FactoryTool,
+        "--serial", $Serial,
+        "--password", $Password,
+        "--output", $FactoryPlainPath
+    )
+    & $PythonExe @factoryArgs
+}
+Complete-Stage "payload"
 
-$EncryptionEnabled = $Manifest.flash_encryption -eq "enabled"
+$EncryptionEnabled = $Plan.flash_encryption -eq "enabled"
 if (-not $EncryptionEnabled) {
     throw "Manifest flash_encryption is 'disabled'; production flashing requires encrypted bundles."
 }
@@ -232,61 +426,186 @@ if (-not $FlashEncryptionKeyFile) {
 }
 Require-File $FlashEncryptionKeyFile
 
-if (Needs-FlashEncryptionSetup -Espefuse $EspefusePath -Port $Port) {
+$EncryptionBurnedThisRun = $false
+Start-Stage "efuse_read"
+$needsSetup = Needs-FlashEncryptionSetup -Esptool $EsptoolPath -Espefuse $EspefusePath -Port $Port
+Complete-Stage "efuse_read"
+Check-DeviceIdentity -Esptool $EsptoolPath -Port $Port
+if ($needsSetup) {
+    Start-Stage "key_burn"
     Burn-FlashEncryption -Espefuse $EspefusePath -Port $Port -KeyFile $FlashEncryptionKeyFile
+    Complete-Stage "key_burn"
+    $EncryptionBurnedThisRun = $true
 } else {
     Write-Host "Flash encryption already enabled on target." -ForegroundColor Green
 }
 
-$FactoryFlashPath = New-TempFilePath "factorycfg_enc_"
-$espsecureArgs = @(
-    "encrypt_flash_data",
-    "--keyfile", $FlashEncryptionKeyFile,
-    "--address", "0x3F0000",
-    "--output", $FactoryFlashPath,
-    $FactoryPlainPath
-)
-& $EspsecurePath @espsecureArgs
+if ($FactoryImage) {
+    $FactoryFlashPath = $FactoryImage
+} else {
+    $FactoryFlashPath = New-TempFilePath "factorycfg_enc_"
+    $espsecureArgs = @(
+        "encrypt_flash_data",
+        "--keyfile", $FlashEncryptionKeyFile,
+        "--address", $FactoryOffset,
+        "--output", $FactoryFlashPath,
+        $FactoryPlainPath
+    )
+    Start-Stage "encrypt"
+    & $EspsecurePath @espsecureArgs
+    Complete-Stage "encrypt"
+}
+
+$factorySize = (Get-Item -LiteralPath $FactoryFlashPath).Length
+if ($factorySize -gt $FactoryRegion.limit) {
+    throw "factory_cfg ($factorySize bytes) exceeds its $($FactoryRegion.limit)-byte region at $FactoryOffset."
+}
 
-$UsePreEncrypted = ($FactoryTemplate -like "*.enc.*") -or ($Bootloader -like "*.enc.*")
+$UsePreEncrypted = @($Plan.regions | Where-Object { $_.path -like "*.enc.*" }).Count -gt 0
 $CompressionArg = if ($UsePreEncrypted) { "--no-compress" } else { "--encrypt" }
 $FlashBaud = if ($env:FLEX_FLASH_BAUD) { $env:FLEX_FLASH_BAUD } else { "460800" }
+# "auto" negotiates the write rate per USB-UART adapter; see tools/baud_profile.py.
+$BaudProfileTool = Join-Path (Join-Path $ScriptDir "tools") "baud_profile.py"
+$NegotiateBaud = $FlashBaud -eq "auto"
+$FlashBaudRates = @($FlashBaud)
+if ($NegotiateBaud) {
+    $rateLine = & $PythonExe $BaudProfileTool rates --port $Port
+    $FlashBaudRates = if ($LASTEXITCODE -eq 0 -and $rateLine) { @("$rateLine".Trim() -split "\s+") } else { @("460800") }
+    Write-Host "Baud rates for this adapter: $($FlashBaudRates -join ' ')"
+}
+# The differential compare reads at a rate a write has confirmed; candidates may start with a probe.
+$CompareBaud = $FlashBaudRates[0]
+if ($NegotiateBaud) {
+    $confirmedLine = & $PythonExe $BaudProfileTool confirmed --port $Port
+    $CompareBaud = if ($LASTEXITCODE -eq 0 -and $confirmedLine) { "$confirmedLine".Trim() } else { "115200" }
+}
+$WriteBaud = $CompareBaud
+
+# write_regions merges neighbouring images (bootloader + partition table, otadata + app) into
+# cached combined files, so esptool sets up fewer regions; nvs is never part of one.
+$WriteRegions = if ($Plan.write_regions) { $Plan.write_regions } else { $Plan.regions }
+$FlashRegions = @()
+foreach ($region in $WriteRegions) {
+    $regionPath = if ($region.name -eq "factory_cfg") { $FactoryFlashPath } else { $region.path }
+    $FlashRegions += @(("0x{0:X}" -f [int64]$region.offset), $regionPath)
+}
+
+if ($Differential) {
+    if ($EncryptionBurnedThisRun) {
+        Write-Host "Flash encryption was just enabled; differential re-flash needs a full write."
+    } else {
+        Write-Host "Comparing on-device region digests..." -ForegroundColor Cyan
+        Start-Stage "compare"
+        $matching = Get-MatchingRegions -Esptool $EsptoolPath -Port $Port -Baud $CompareBaud -Regions $FlashRegions
+        Complete-Stage "compare"
+        $changed = @()
+        for ($i = 0; $i -lt $FlashRegions.Count; $i += 2) {
+            $address = $FlashRegions[$i]
+            if ($matching -contains [Convert]::ToInt64($address, 16)) {
+                Write-Host "  ${address}: digest matches, skipping"
+            } else {
+                Write-Host "  ${address}: digest differs or unreadable, rewriting"
+                $changed += @($address, $FlashRegions[$i + 1])
+            }
+        }
+        $FlashRegions = $changed
+    }
+}
 
 $flashArgs = @(
-    "--chip", "esp32",
-    "--port", $Port,
-    "--baud", $FlashBaud,
     "--before", "default_reset",
     "--after", "hard_reset",
     "write_flash",
     $CompressionArg,
     "--flash_mode", "dio",
     "--flash_freq", "40m",
-    "--flash_size", "detect",
-    "0x1000", $Bootloader,
-    "0x8000", $Partitions,
-    "0xE000", $BootApp0,
-    "0x10000", $Firmware,
-    "0x290000", $Spiffs,
-    "0x3F0000", $FactoryFlashPath
-)
+    "--flash_size", "detect"
+) + $FlashRegions
 
-Write-Host "Flashing $($Manifest.version) to $Port" -ForegroundColor Cyan
+Write-Host "Flashing $($Plan.version) to $Port" -ForegroundColor Cyan
 
 $flashStatus = "failed"
 try {
-    & $EsptoolPath @flashArgs
+    if ($FlashRegions.Count -eq 0) {
+        Write-Host "All regions already match $($Plan.version); nothing to rewrite."
+        & $EsptoolPath --chip esp32 --port $Port --before default_reset --after hard_reset read_mac | Out-Null
+    } else {
+        Start-Stage "write_flash"
+        foreach ($baud in $FlashBaudRates) {
+            $writeOutput = & $EsptoolPath --chip esp32 --port $Port --baud $baud @flashArgs 2>&1 | ForEach-Object { Write-Host $_; "$_" }
+            $writeExit = $LASTEXITCODE
+            if (-not $NegotiateBaud) { break }
+            if ($writeExit -ne 0) {
+                ($writeOutput -join "`n") | & $PythonExe $BaudProfileTool classify
+                if ($LASTEXITCODE -ne 0) { break }
+                & $PythonExe $BaudProfileTool record --port $Port --baud $baud --failed
+                Write-Host "Link error at $baud baud; retrying at a lower rate." -ForegroundColor Yellow
+                continue
+            }
+            $WriteBaud = $baud
+            & $PythonExe $BaudProfileTool record --port $Port --baud $baud
+            break
+        }
+        if ($writeExit -ne 0) {
+            throw "esptool write_flash failed (exit $writeExit)."
+        }
+        Complete-Stage "write_flash"
+        if ($Verify) {
+            # The chip hashes each written range; a mismatch fails the unit without a readback. The
+            # check runs at the rate the write succeeded at, never at one it gave up on.
+            Write-Host "Verifying written regions against the bundle digests..." -ForegroundColor Cyan
+            Start-Stage "verify"
+            $matching = Get-MatchingRegions -Esptool $EsptoolPath -Port $Port -Baud $WriteBaud -Regions $FlashRegions -After "hard_reset"
+            $mismatched = @()
+            for ($i = 0; $i -lt $FlashRegions.Count; $i += 2) {
+                $address = $FlashRegions[$i]
+                if ($matching -contains [Convert]::ToInt64($address, 16)) {
+                    Write-Host "  ${address}: verified"
+                } else {
+                    Write-Host "  ${address}: digest mismatch" -ForegroundColor Red
+                    $mismatched += $address
+                }
+            }
+            if ($mismatched.Count -gt 0) {
+                throw "Post-flash verification failed at $($mismatched -join ', ')."
+            }
+            Complete-Stage "verify"
+        }
+    }
     Write-Host "Flash complete." -ForegroundColor Green
     $flashStatus = "wired_only"
 } finally {
     if (Test-Path $FactoryPlainPath) {
         Remove-Item $FactoryPlainPath -ErrorAction SilentlyContinue
     }
-    if ($FactoryFlashPath -and (Test-Path $FactoryFlashPath) -and $FactoryFlashPath -ne $FactoryPlainPath) {
+    if ($FactoryFlashPath -and (Test-Path $FactoryFlashPath) -and $FactoryFlashPath -ne $FactoryPlainPath -and $FactoryFlashPath -ne $FactoryImage) {
         Remove-Item $FactoryFlashPath -ErrorAction SilentlyContinue
     }
-    $logLine = "{0},{1},{2},{3}`n" -f (Get-Date -Format "yyyy-MM-ddTHH:mm:ssZ"), $Serial, (Split-Path $ReleaseDir -Leaf), $flashStatus
-    Add-Content -Path (Join-Path $LogDir "flash_log.csv") -Value $logLine
+    # The GUI records its own attempts (with stage timings) and sets FLEX_HISTORY_EXTERNAL=1.
+    if ($env:FLEX_HISTORY_EXTERNAL -ne "1") {
+        $historyArgs = @(
+            $FlashHistoryTool, "record",
+            "--serial", $Serial,
+            "--status", $flashStatus,
+            "--started-at", $AttemptStartedAt,
+            "--release", $Plan.version,
+            "--port", $Port
+        )
+        if ($script:BoardMac) { $historyArgs += @("--mac", $script:BoardMac) }
+        if ($Differential) { $historyArgs += "--rework" }
+        & $PythonExe @historyArgs
+        if ($LASTEXITCODE -ne 0) {
+            Write-Warning "Unable to record the attempt in flash history."
+        }
+        # The board's MAC -> serial entry in logs/device_registry.sqlite3.
+        if ($script:BoardMac -and $flashStatus -ne "failed") {
+            $station = if ($env:FLEX_STATION_NAME) { $env:FLEX_STATION_NAME } else { $env:COMPUTERNAME }
+            & $PythonExe $DeviceRegistryTool record --mac $script:BoardMac --serial $Serial --release $Plan.version --station $station
+            if ($LASTEXITCODE -ne 0) {
+                Write-Warning "Unable to record the board in the device registry."
+            }
+        }
+    }
 }
 
 if (-not $SkipSSID) {
@@ -3,13 +3,20 @@ set -euo pipefail
 
 usage() {
   cat <<USAGE
-Usage: ./flash_flex_plus.sh --serial <serial> [--password <softap-password>] [--port <serial-port>] [--wifi-provision]
+Usage: ./flash_flex_plus.sh --serial <serial> [--password <softap-password>] [--port <serial-port>] [--factory-pack <file> | --factory-cfg <file>] [--diff-reflash] [--verify] [--wifi-provision]
 
 Arguments:
   --serial, -s      Required per-unit serial suffix (alphanumeric/_/-).
   --password, -w    Optional SoftAP password override (defaults to Flex policy).
   --port, -p        Serial/USB port (default \$FLEX_SERIAL_PORT or /dev/cu.SLAB_USBtoUART).
-  --wifi-provision  Rejoin the factory SSID and call /debug/update after flashing (default: off).
+  --factory-pack    Batch pack from gen_factory_payload.py --batch (default \$FLEX_FACTORY_PACK);
+                    the unit's payload is read from it instead of being generated.
+  --factory-cfg     Factory image already built (and encrypted) for this unit; flashed as-is.
+  --diff-reflash    Rework mode: ask the chip for each region's MD5 and rewrite only regions that differ.
+  --verify          After writing, have the chip hash each written region and compare it with the
+                    image's MD5 (default \$FLEX_VERIFY_FLASH); a mismatch fails the unit.
+  --wifi-provision  Provision the unit over Wi-Fi (factory SSID, /debug/update) in the background
+                    after flashing (default: off).
   --skip-ssid       Legacy alias for disabling Wi-Fi provisioning (now the default).
   --help, -h        Show this message.
 USAGE
@@ -19,6 +26,10 @@ SERIAL=""
 PORT="${FLEX_SERIAL_PORT:-auto}"
 AP_PASSWORD="${FLEX_AP_PASSWORD:-}"
 WIFI_PROVISION="${FLEX_WIFI_PROVISION:-0}"
+FACTORY_PACK="${FLEX_FACTORY_PACK:-}"
+FACTORY_CFG_IMAGE=""
+DIFF_REFLASH="${FLEX_DIFF_REFLASH:-0}"
+VERIFY_FLASH="${FLEX_VERIFY_FLASH:-0}"
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -34,6 +45,22 @@ while [[ $# -gt 0 ]]; do
       AP_PASSWORD="${2:-}"
       shift 2
       ;;
+    --factory-pack)
+      FACTORY_PACK="${2:-}"
+      shift 2
+      ;;
+    --factory-cfg)
+      FACTORY_CFG_IMAGE="${2:-}"
+      shift 2
+      ;;
+    --diff-reflash)
+      DIFF_REFLASH=1
+      shift
+      ;;
+    --verify)
+      VERIFY_FLASH=1
+      shift
+      ;;
     --wifi-provision)
       WIFI_PROVISION=1
       shift
@@ -101,13 +128,16 @@ if ! [[ "${AP_PASSWORD}" =~ ^[[:print:]]+$ ]]; then
   exit 1
 fi
 
-if [[ "$(uname -s 2>/dev/null || echo unknown)" != "Darwin" ]]; then
+# FLEX_ESPTOOL/FLEX_ESPEFUSE replace the bundled macOS binaries (e.g. with the simulated fixtures of
+# tools/sim_device.py), which also lets the script run on Linux.
+if [[ "$(uname -s 2>/dev/null || echo unknown)" != "Darwin" && -z "${FLEX_ESPTOOL:-}" ]]; then
   echo "Error: flash_flex_plus.sh currently supports macOS only." >&2
   exit 1
 fi
 
 PRODUCTION_ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-RELEASES_DIR="${PRODUCTION_ROOT}/release"
+# The GUI passes the release snapshot it verified for this job; standalone runs use the checkout's.
+RELEASES_DIR="${FLEX_RELEASE_DIR:-${PRODUCTION_ROOT}/release}"
 TOOLS_DIR="${PRODUCTION_ROOT}/tools/esptool"
 ESPTOOL=""
 ESPEFUSE=""
@@ -117,17 +147,87 @@ FLASH_ENCRYPTION_KEY_FILE="${FLASH_ENCRYPTION_KEY_FILE:-${PRODUCTION_ROOT}/keys/
 FLASH_ENCRYPTION_ENABLED="${FLASH_ENCRYPTION_ENABLED:-1}"
 LOG_DIR="${PRODUCTION_ROOT}/logs"
 FACTORY_CFG_TOOL="${PRODUCTION_ROOT}/tools/gen_factory_payload.py"
+FLASH_CRYPT_TOOL="${PRODUCTION_ROOT}/tools/flash_crypt.py"
+FLASH_PLAN_TOOL="${PRODUCTION_ROOT}/tools/flash_plan.py"
+PORT_WATCHER_TOOL="${PRODUCTION_ROOT}/tools/port_watcher.py"
+BAUD_PROFILE_TOOL="${PRODUCTION_ROOT}/tools/baud_profile.py"
+# A number pins the write rate; "auto" negotiates it per USB-UART adapter (see baud_profile.py).
+FLASH_BAUD_SETTING="${FLEX_FLASH_BAUD:-460800}"
+PORT_CHECKED_FREE=0
+EFUSE_REGISTRY_TOOL="${PRODUCTION_ROOT}/tools/efuse_registry.py"
+FLASH_HISTORY_TOOL="${PRODUCTION_ROOT}/tools/flash_history.py"
+DEVICE_REGISTRY_TOOL="${PRODUCTION_ROOT}/tools/device_registry.py"
+WIFI_PROVISION_TOOL="${PRODUCTION_ROOT}/tools/wifi_provision.py"
+WIFI_PROVISION_LOG="${PRODUCTION_ROOT}/logs/wifi_provision.log"
 FACTORY_PARTITION_SIZE_HEX="${FACTORY_PARTITION_SIZE:-0x10000}"
 FACTORY_CFG_PLAIN_PATH=""
 FACTORY_CFG_FLASH_PATH=""
 mkdir -p "${LOG_DIR}"
 
+ATTEMPT_STARTED_AT="$(date +%s)"
+ATTEMPT_RECORDED=0
+
+# One row per attempt in logs/flash_history.sqlite3, and the board's MAC -> serial entry in
+# logs/device_registry.sqlite3 once it is flashed. The GUI records its own attempts (with stage
+# timings) and boards, and sets FLEX_HISTORY_EXTERNAL=1.
+log_entry() {
+  local status="$1"
+  ATTEMPT_RECORDED=1
+  if [[ "${FLEX_HISTORY_EXTERNAL:-0}" == "1" ]]; then
+    return 0
+  fi
+  if [[ -n "${BOARD_MAC:-}" && "${status}" != "failed" ]]; then
+    python3 "${DEVICE_REGISTRY_TOOL}" record --mac "${BOARD_MAC}" --serial "${SERIAL}" \
+      --release "${BUNDLE_VERSION:-$(basename "${RELEASES_DIR}")}" --station "${FLEX_STATION_NAME:-$(hostname)}" \
+      || echo "Warning: unable to record the board in the device registry." >&2
+  fi
+  local args=(
+    record
+    --serial "${SERIAL}"
+    --status "${status}"
+    --started-at "${ATTEMPT_STARTED_AT}"
+    --release "${BUNDLE_VERSION:-$(basename "${RELEASES_DIR}")}"
+    --port "${PORT}"
+  )
+  if [[ -n "${BOARD_MAC:-}" ]]; then
+    args+=(--mac "${BOARD_MAC}")
+  fi
+  if [[ "${DIFF_REFLASH}" == "1" ]]; then
+    args+=(--rework)
+  fi
+  python3 "${FLASH_HISTORY_TOOL}" "${args[@]}" || echo "Warning: unable to record the attempt in flash history." >&2
+}
+
+# Stage markers are parsed by the GUI for /metrics and the flash history; stages may nest.
+STAGE_STACK=()
+stage_start() {
+  echo "::stage $1 start"
+  STAGE_STACK+=("$1")
+}
+
+stage_end() {
+  echo "::stage $1 end ${2:-ok}"
+  local count=${#STAGE_STACK[@]}
+  if (( count > 0 )); then
+    unset "STAGE_STACK[$((count - 1))]"
+  fi
+}
+
 TEMP_FILES=()
 cleanup() {
-  local file
+  local status=$?
+  local file i
   for file in "${TEMP_FILES[@]:-}"; do
     [[ -n "${file}" && -f "${file}" ]] && rm -f "${file}"
   done
+  if (( status != 0 )); then
+    for ((i = ${#STAGE_STACK[@]} - 1; i >= 0; i--)); do
+      echo "::stage ${STAGE_STACK[i]} end failed"
+    done
+  fi
+  if (( status != 0 && ATTEMPT_RECORDED == 0 )); then
+    log_entry "failed"
+  fi
 }
 trap cleanup EXIT
 
@@ -245,9 +345,30 @@ diagnose_serial_port_failure() {
   fi
 }
 
+# Block until the port (or, for auto, any USB serial device) appears; returns as soon as the node
+# is created instead of sleeping in fixed steps. Returns 1 once the whole timeout has passed.
+wait_for_port_event() {
+  local timeout="$1"
+  local rc=0
+  python3 "${PORT_WATCHER_TOOL}" wait --port "${PORT:-auto}" --timeout "${timeout}" >/dev/null 2>&1 || rc=$?
+  if (( rc == 1 )); then
+    return 1
+  fi
+  if (( rc != 0 )); then
+    # The watcher could not run; fall back to one fixed step per attempt.
+    sleep 1
+  fi
+  return 0
+}
+
+# Pass "recheck" after a failed esptool/espefuse call to look for processes holding the port again.
 ensure_serial_port_ready() {
   local wait_attempts="${FLEX_PORT_WAIT_ATTEMPTS:-10}"
   local attempt
+  if [[ "${1:-}" == "recheck" ]]; then
+    PORT_CHECKED_FREE=0
+  fi
+  stage_start port_wait
   for ((attempt = 1; attempt <= wait_attempts; attempt++)); do
     if [[ "${PORT}" == "auto" || -z "${PORT}" ]]; then
       local rc
@@ -261,28 +382,33 @@ ensure_serial_port_ready() {
         fi
       fi
       echo "Waiting for USB serial device to appear (${attempt}/${wait_attempts})..." >&2
-      sleep 1
+      wait_for_port_event "$((wait_attempts - attempt + 1))" || break
       continue
     fi
     if [[ ! -e "${PORT}" ]]; then
       echo "Waiting for serial port ${PORT} to appear (${attempt}/${wait_attempts})..." >&2
-      sleep 1
+      wait_for_port_event "$((wait_attempts - attempt + 1))" || break
       continue
     fi
-    local holders
-    holders="$(list_port_holders || true)"
-    if [[ -n "${holders}" ]]; then
-      if (( attempt == 1 )); then
-        echo "Serial port ${PORT} is currently in use:" >&2
-      else
-        echo "Serial port ${PORT} is still in use (${attempt}/${wait_attempts})." >&2
+    # lsof is slow on busy hosts; once the port was free in this run, only failures re-check it.
+    if (( ! PORT_CHECKED_FREE )); then
+      local holders
+      holders="$(list_port_holders || true)"
+      if [[ -n "${holders}" ]]; then
+        if (( attempt == 1 )); then
+          echo "Serial port ${PORT} is currently in use:" >&2
+        else
+          echo "Serial port ${PORT} is still in use (${attempt}/${wait_attempts})." >&2
+        fi
+        while IFS=$'\t' read -r cmd pid user; do
+          printf '  %s (pid %s, user %s)\n' "${cmd}" "${pid}" "${user}" >&2
+        done <<<"${holders}"
+        sleep 1
+        continue
       fi
-      while IFS=$'\t' read -r cmd pid user; do
-        printf '  %s (pid %s, user %s)\n' "${cmd}" "${pid}" "${user}" >&2
-      done <<<"${holders}"
-      sleep 1
-      continue
+      PORT_CHECKED_FREE=1
     fi
+    stage_end port_wait
     return 0
   done
 
@@ -308,7 +434,7 @@ read_efuse_summary() {
       if [[ -n "${output}" ]]; then
         echo "${output}" >&2
       fi
-      ensure_serial_port_ready
+      ensure_serial_port_ready recheck
       sleep 1
     fi
   done
@@ -335,51 +461,57 @@ get_file_size() {
   fi
 }
 
-verify_factory_payload_plain() {
-  local file="$1"
-  python3 - "$file" "$SERIAL" "$AP_PASSWORD" <<'PY'
-import binascii, struct, sys
-path, expected_serial, expected_password = sys.argv[1:4]
-MAGIC = 0x46505846
-HEADER_STRUCT = struct.Struct("<IHH")
-SERIAL_FIELD_LEN = 32
-PASSWORD_FIELD_LEN = 64
-RESERVED_LEN = 48
-CRC_STRUCT = struct.Struct("<I")
-
-with open(path, "rb") as fh:
-    blob = fh.read(HEADER_STRUCT.size + SERIAL_FIELD_LEN + PASSWORD_FIELD_LEN + RESERVED_LEN + CRC_STRUCT.size)
-
-min_len = HEADER_STRUCT.size + SERIAL_FIELD_LEN + PASSWORD_FIELD_LEN + RESERVED_LEN + CRC_STRUCT.size
-if len(blob) < min_len:
-    raise SystemExit("Factory payload truncated.")
-
-magic, version, flags = HEADER_STRUCT.unpack(blob[:HEADER_STRUCT.size])
-if magic != MAGIC:
-    raise SystemExit(f"Factory payload magic mismatch: 0x{magic:08x}")
-
-serial_start = HEADER_STRUCT.size
-serial_end = serial_start + SERIAL_FIELD_LEN
-password_end = serial_end + PASSWORD_FIELD_LEN
-reserved_end = password_end + RESERVED_LEN
-stored_crc, = CRC_STRUCT.unpack(blob[reserved_end:reserved_end + CRC_STRUCT.size])
-calc_crc = binascii.crc32(blob[:reserved_end]) & 0xFFFFFFFF
-if calc_crc != stored_crc:
-    raise SystemExit("Factory payload CRC mismatch.")
-
-serial = blob[serial_start:serial_end].split(b'\x00', 1)[0].decode('ascii', errors='ignore')
-password = blob[serial_end:password_end].split(b'\x00', 1)[0].decode('ascii', errors='ignore')
-if serial != expected_serial:
-    raise SystemExit(f"Factory payload serial mismatch (got '{serial}' expected '{expected_serial}').")
-if password != expected_password:
-    raise SystemExit("Factory payload password mismatch.")
-
-print(f"Factory payload verified (serial={serial}, version={version}, flags={flags}).")
-PY
+read_pack_field() {
+  local file="$1" offset="$2" length="$3"
+  dd if="${file}" bs=1 skip="${offset}" count="${length}" 2>/dev/null | tr -d '\000'
+}
+
+extract_factory_payload_from_pack() {
+  local pack="$1"
+  local output="$2"
+  local magic version count part_size data_offset
+  read -r magic version count part_size data_offset < <(head -n 1 "${pack}")
+  if [[ "${magic}" != "FPXPACK" || "${version}" != "1" ]]; then
+    echo "Error: ${pack} is not a factory pack." >&2
+    return 1
+  fi
+  data_offset=$((10#${data_offset}))
+  if (( part_size != FACTORY_PARTITION_SIZE_HEX )); then
+    echo "Error: factory pack partition size ${part_size} does not match ${FACTORY_PARTITION_SIZE_HEX}." >&2
+    return 1
+  fi
+  local slot
+  slot="$(head -c "${data_offset}" "${pack}" | awk -v serial="${SERIAL}" 'NR > 1 && $1 == serial { print $2; exit }')"
+  if [[ -z "${slot}" ]]; then
+    echo "Error: ${SERIAL} is not in factory pack ${pack}." >&2
+    return 1
+  fi
+  dd if="${pack}" of="${output}" bs="${part_size}" skip="$((data_offset / part_size + slot))" count=1 2>/dev/null
+  # Header is 8 bytes, then the 32-byte serial and 64-byte password fields.
+  if [[ "$(read_pack_field "${output}" 8 32)" != "${SERIAL}" ]]; then
+    echo "Error: factory pack slot ${slot} does not hold ${SERIAL}." >&2
+    return 1
+  fi
+  if [[ "$(read_pack_field "${output}" 40 64)" != "${AP_PASSWORD}" ]]; then
+    echo "Error: factory pack password for ${SERIAL} differs from the requested password." >&2
+    return 1
+  fi
+  echo "Factory payload read from pack ${pack} (slot ${slot})."
 }
 
 prepare_factory_payload() {
-  if [[ ! -x "${FACTORY_CFG_TOOL}" ]]; then
+  if [[ -n "${FACTORY_CFG_IMAGE}" ]]; then
+    local image_size
+    if ! image_size="$(get_file_size "${FACTORY_CFG_IMAGE}")" || (( image_size != FACTORY_PARTITION_SIZE_HEX )); then
+      echo "Error: prepared factory image ${FACTORY_CFG_IMAGE} is missing or not ${FACTORY_PARTITION_SIZE_HEX} bytes." >&2
+      exit 1
+    fi
+    echo "Using prepared factory image ${FACTORY_CFG_IMAGE}."
+    FACTORY_CFG_FLASH_PATH="${FACTORY_CFG_IMAGE}"
+    return
+  fi
+
+  if [[ -z "${FACTORY_PACK}" && ! -x "${FACTORY_CFG_TOOL}" ]]; then
     echo "Error: factory payload generator missing at ${FACTORY_CFG_TOOL}. Run build_output.sh." >&2
     exit 1
   fi
@@ -387,24 +519,38 @@ prepare_factory_payload() {
   local plaintext
   plaintext="$(mktemp)"
   TEMP_FILES+=("${plaintext}")
-  python3 "${FACTORY_CFG_TOOL}" \
-    --serial "${SERIAL}" \
-    --password "${AP_PASSWORD}" \
-    --partition-size "${FACTORY_PARTITION_SIZE_HEX}" \
-    --output "${plaintext}"
+  if [[ -n "${FACTORY_PACK}" ]]; then
+    if ! extract_factory_payload_from_pack "${FACTORY_PACK}" "${plaintext}"; then
+      exit 1
+    fi
+  else
+    # The generator verifies magic, CRC and fields of the image before writing it.
+    python3 "${FACTORY_CFG_TOOL}" \
+      --serial "${SERIAL}" \
+      --password "${AP_PASSWORD}" \
+      --partition-size "${FACTORY_PARTITION_SIZE_HEX}" \
+      --output "${plaintext}"
+  fi
   FACTORY_CFG_PLAIN_PATH="${plaintext}"
-  verify_factory_payload_plain "${FACTORY_CFG_PLAIN_PATH}"
 
   if [[ "${FLASH_ENCRYPTION_ENABLED}" == "1" ]]; then
-    ensure_espsecure
     local encrypted
     encrypted="$(mktemp)"
     TEMP_FILES+=("${encrypted}")
-    "${ESPSECURE_PYTHON}" "${ESPSECURE_TOOL}" encrypt_flash_data \
-      --keyfile "${FLASH_ENCRYPTION_KEY_FILE}" \
-      --address 0x3F0000 \
-      --output "${encrypted}" \
-      "${FACTORY_CFG_PLAIN_PATH}"
+    if [[ -f "${FLASH_CRYPT_TOOL}" ]]; then
+      python3 "${FLASH_CRYPT_TOOL}" \
+        --keyfile "${FLASH_ENCRYPTION_KEY_FILE}" \
+        --address "${FACTORY_CFG_OFFSET}" \
+        --output "${encrypted}" \
+        "${FACTORY_CFG_PLAIN_PATH}"
+    else
+      ensure_espsecure
+      "${ESPSECURE_PYTHON}" "${ESPSECURE_TOOL}" encrypt_flash_data \
+        --keyfile "${FLASH_ENCRYPTION_KEY_FILE}" \
+        --address "${FACTORY_CFG_OFFSET}" \
+        --output "${encrypted}" \
+        "${FACTORY_CFG_PLAIN_PATH}"
+    fi
     FACTORY_CFG_FLASH_PATH="${encrypted}"
   else
     FACTORY_CFG_FLASH_PATH="${FACTORY_CFG_PLAIN_PATH}"
@@ -412,43 +558,22 @@ prepare_factory_payload() {
 }
 
 verify_flash_plan() {
-  local layout=(
-    "bootloader;0x1000;0x8000;${BOOTLOADER_BIN}"
-    "partitions;0x8000;0x9000;${PARTITIONS_BIN}"
-    "boot_app0;0xe000;0x10000;${BOOT_APP0_BIN}"
-    "firmware;0x10000;0x150000;${FIRMWARE_BIN}"
-    "spiffs;0x290000;0x3F0000;${SPIFFS_BIN}"
-    "factory_cfg;0x3F0000;0x400000;${FACTORY_CFG_FLASH_PATH}"
-  )
-  local ok=1
-  echo "Verifying flash layout and region sizes..."
-  local entry
-  for entry in "${layout[@]}"; do
-    IFS=';' read -r name start_hex end_hex path <<<"${entry}"
-    if [[ -z "${path}" ]]; then
-      echo "Verification error: path for ${name} not set." >&2
-      ok=0
-      continue
-    fi
-    local start=$((start_hex))
-    local end=$((end_hex))
-    local max_size=$((end - start))
-    local size
-    if ! size="$(get_file_size "${path}")"; then
-      ok=0
-      continue
-    fi
-    printf '  %-11s %10d bytes (limit %d)\n' "${name}" "${size}" "${max_size}"
-    if (( size > max_size )); then
-      echo "Verification error: ${name} exceeds allocated size." >&2
-      ok=0
-    fi
-  done
-  if (( ok )); then
-    echo "Flash plan validated."
-    return 0
+  # Release artifacts were checked when the plan was loaded; only the per-unit image is new here.
+  local size
+  if [[ -z "${FACTORY_CFG_FLASH_PATH}" ]]; then
+    echo "Verification error: path for factory_cfg not set." >&2
+    return 1
   fi
-  return 1
+  if ! size="$(get_file_size "${FACTORY_CFG_FLASH_PATH}")"; then
+    return 1
+  fi
+  printf '  %-11s %10d bytes (limit %d)\n' "factory_cfg" "${size}" "$((FACTORY_CFG_LIMIT))"
+  if (( size > FACTORY_CFG_LIMIT )); then
+    echo "Verification error: factory_cfg exceeds allocated size." >&2
+    return 1
+  fi
+  echo "Flash plan validated."
+  return 0
 }
 
 
@@ -462,6 +587,8 @@ select_tool_binaries() {
     ESPTOOL="${TOOLS_DIR}/macos-amd64/esptool"
     ESPEFUSE="${TOOLS_DIR}/macos-amd64/espefuse"
   fi
+  ESPTOOL="${FLEX_ESPTOOL:-${ESPTOOL}}"
+  ESPEFUSE="${FLEX_ESPEFUSE:-${ESPEFUSE}}"
 
   if [[ ! -x "${ESPTOOL}" ]]; then
     echo "Error: esptool binary not found at ${ESPTOOL}. Run build_output.sh to refresh tools." >&2
@@ -546,143 +673,115 @@ if [[ ! -f "${FLASH_ENCRYPTION_KEY_FILE}" ]]; then
   exit 1
 fi
 
-echo "Updating production repo..."
-if ! git -C "${PRODUCTION_ROOT}" fetch --quiet --tags; then
-  echo "Error: unable to fetch updates. Verify network connectivity and Git credentials." >&2
+# The flash plan resolves each artifact (encrypted first, then plain) against the partition table
+# and checks it fits its region. Sizes and digests are cached per release, so this is a lookup on
+# every unit after the first. Neighbouring images come back merged into cached combined files
+# (FLEX_COALESCE_REGIONS), so esptool sets up fewer regions per unit.
+stage_start plan
+if ! plan_output="$(python3 "${FLASH_PLAN_TOOL}" shell --release-dir "${RELEASES_DIR}")"; then
+  echo "Error: flash plan for ${RELEASES_DIR} failed verification." >&2
   exit 1
 fi
-if ! git -C "${PRODUCTION_ROOT}" pull --ff-only; then
-  echo "Error: git pull failed. Resolve merge/credential issues before flashing." >&2
+eval "${plan_output}"
+stage_end plan
+
+FACTORY_CFG_OFFSET=""
+FACTORY_CFG_LIMIT=""
+for ((i = 0; i < ${#PLAN_REGION_NAMES[@]}; i++)); do
+  if [[ "${PLAN_REGION_NAMES[i]}" == "factory_cfg" ]]; then
+    FACTORY_CFG_OFFSET="${PLAN_REGION_OFFSETS[i]}"
+    FACTORY_CFG_LIMIT="${PLAN_REGION_LIMITS[i]}"
+  fi
+done
+if [[ -z "${FACTORY_CFG_OFFSET}" ]]; then
+  echo "Error: flash plan has no factory_cfg region." >&2
   exit 1
 fi
+echo "Flash plan loaded for bundle ${BUNDLE_VERSION}."
 
-MANIFEST="${RELEASES_DIR}/manifest.json"
-if [[ ! -f "${MANIFEST}" ]]; then
-  echo "Error: manifest.json missing in ${RELEASES_DIR}." >&2
-  exit 1
+if [[ "${FLASH_ENCRYPTION_ENABLED}" == "1" ]]; then
+  USE_PRE_ENCRYPTED=1
+else
+  USE_PRE_ENCRYPTED=0
 fi
 
-eval "$(python3 - "${MANIFEST}" <<'PY'
-import json, shlex, sys
-from pathlib import Path
-manifest = Path(sys.argv[1])
-data = json.loads(manifest.read_text())
-arts = data.get('artifacts', {})
-encs = data.get('encrypted_artifacts') or {}
-def emit(key, value):
-    if value is None:
-        raise SystemExit(f"Missing manifest value: {key}")
-    print(f"{key}={shlex.quote(str(value))}")
-def emit_optional(key, value):
-    if value is None:
-        print(f"{key}=")
-    else:
-        print(f"{key}={shlex.quote(str(value))}")
-emit('FACTORY_SSID', data.get('factory_ssid', 'FP00-00000000'))
-emit('FACTORY_PASSWORD', data.get('ap_password', '12345678'))
-emit('TARGET_IP', data.get('target_ip', '192.168.4.1'))
-emit('ART_BOOTLOADER', arts.get('bootloader'))
-emit('ART_BOOT_APP0', arts.get('boot_app0'))
-emit('ART_PARTITIONS', arts.get('partitions'))
-emit('ART_FIRMWARE', arts.get('firmware'))
-emit('ART_SPIFFS', arts.get('spiffs'))
-emit('ART_FACTORY_CFG', arts.get('factory_cfg'))
-emit_optional('ENC_BOOTLOADER', encs.get('bootloader'))
-emit_optional('ENC_BOOT_APP0', encs.get('boot_app0'))
-emit_optional('ENC_PARTITIONS', encs.get('partitions'))
-emit_optional('ENC_FIRMWARE', encs.get('firmware'))
-emit_optional('ENC_SPIFFS', encs.get('spiffs'))
-emit_optional('ENC_FACTORY_CFG', encs.get('factory_cfg'))
-PY
-)" || {
-  echo "Error: manifest missing required fields." >&2
-  exit 1
-}
-
-BOOTLOADER_BIN="${RELEASES_DIR}/${ART_BOOTLOADER}"
-BOOT_APP0_BIN="${RELEASES_DIR}/${ART_BOOT_APP0}"
-PARTITIONS_BIN="${RELEASES_DIR}/${ART_PARTITIONS}"
-FIRMWARE_BIN="${RELEASES_DIR}/${ART_FIRMWARE}"
-SPIFFS_BIN="${RELEASES_DIR}/${ART_SPIFFS}"
-FACTORY_CFG_TEMPLATE_BIN="${RELEASES_DIR}/${ART_FACTORY_CFG}"
-
-ENC_BOOTLOADER_BIN=""
-ENC_BOOT_APP0_BIN=""
-ENC_PARTITIONS_BIN=""
-ENC_FIRMWARE_BIN=""
-ENC_SPIFFS_BIN=""
-ENC_FACTORY_CFG_BIN=""
-if [[ -n "${ENC_BOOTLOADER:-}" ]]; then
-  ENC_BOOTLOADER_BIN="${RELEASES_DIR}/${ENC_BOOTLOADER}"
-fi
-if [[ -n "${ENC_BOOT_APP0:-}" ]]; then
-  ENC_BOOT_APP0_BIN="${RELEASES_DIR}/${ENC_BOOT_APP0}"
-fi
-if [[ -n "${ENC_PARTITIONS:-}" ]]; then
-  ENC_PARTITIONS_BIN="${RELEASES_DIR}/${ENC_PARTITIONS}"
-fi
-if [[ -n "${ENC_FIRMWARE:-}" ]]; then
-  ENC_FIRMWARE_BIN="${RELEASES_DIR}/${ENC_FIRMWARE}"
-fi
-if [[ -n "${ENC_SPIFFS:-}" ]]; then
-  ENC_SPIFFS_BIN="${RELEASES_DIR}/${ENC_SPIFFS}"
-fi
-if [[ -n "${ENC_FACTORY_CFG:-}" ]]; then
-  ENC_FACTORY_CFG_BIN="${RELEASES_DIR}/${ENC_FACTORY_CFG}"
+if (( USE_PRE_ENCRYPTED )); then
+  echo "Using pre-encrypted release bundle for flashing."
 fi
 
-select_artifact_path() {
-  local preferred="$1"
-  local fallback="$2"
-  if [[ -n "${preferred}" && -f "${preferred}" ]]; then
-    echo "${preferred}"
-    return 0
-  fi
-  if [[ -n "${fallback}" && -f "${fallback}" ]]; then
-    echo "${fallback}"
-    return 0
+BOARD_MAC=""
+
+# One read-mem of EFUSE_BLK0_RDATA0 yields both the MAC (connect banner) and FLASH_CRYPT_CNT (bits
+# 20-26), so no board needs the full espefuse summary unless the read itself fails.
+probe_board_efuses() {
+  local output
+  if ! output="$("${ESPTOOL}" --chip esp32 --port "${PORT}" --before default-reset --after no-reset \
+    read-mem 0x3ff5a000 2>&1)"; then
+    return 1
   fi
-  return 1
+  tr -d '\r' <<<"${output}" | python3 "${EFUSE_REGISTRY_TOOL}" --keyfile "${FLASH_ENCRYPTION_KEY_FILE}" probe
 }
 
-USE_PRE_ENCRYPTED=0
+record_board_efuses() {
+  if [[ -n "${BOARD_MAC}" ]]; then
+    python3 "${EFUSE_REGISTRY_TOOL}" --keyfile "${FLASH_ENCRYPTION_KEY_FILE}" \
+      record --mac "${BOARD_MAC}" --flash-crypt-cnt "$1" || true
+  fi
+}
 
-choose_or_fail() {
-  local preferred="$1"
-  local fallback="$2"
-  local label="$3"
-  local chosen
-  if ! chosen="$(select_artifact_path "${preferred}" "${fallback}")"; then
-    echo "Error: required artifact '${label}' missing (checked '${preferred:-<none>}' and '${fallback:-<none>}')." >&2
-    exit 1
+# A board flashed before as this serial is re-flashed as a rework; a board flashed as another serial,
+# or a serial already given to another board, stops the run before any eFuse or flash write
+# (FLEX_DEVICE_CONFLICTS=warn flashes anyway).
+check_device_identity() {
+  if [[ -z "${BOARD_MAC}" ]]; then
+    ensure_serial_port_ready
+    BOARD_MAC="$("${ESPTOOL}" --chip esp32 --port "${PORT}" --before default-reset --after no-reset read-mac 2>&1 \
+      | tr -d '\r' | sed -n 's/^MAC: *\([0-9a-fA-F:]\{17\}\).*/\1/p' | head -n 1)" || true
   fi
-  if [[ -n "${preferred}" && "${chosen}" == "${preferred}" ]]; then
-    USE_PRE_ENCRYPTED=1
+  if [[ -z "${BOARD_MAC}" ]]; then
+    echo "Warning: chip MAC unknown; device identity check skipped."
+    return 0
+  fi
+  echo "Chip MAC: ${BOARD_MAC}"
+  local DEVICE_STATUS="" DEVICE_MESSAGE="" verdict
+  if ! verdict="$(python3 "${DEVICE_REGISTRY_TOOL}" check --mac "${BOARD_MAC}" --serial "${SERIAL}")"; then
+    echo "Warning: device registry unavailable; identity check skipped." >&2
+    return 0
   fi
-  printf '%s' "${chosen}"
+  eval "${verdict}"
+  case "${DEVICE_STATUS}" in
+    known)
+      if [[ "${DIFF_REFLASH}" != "1" ]]; then
+        echo "${DEVICE_MESSAGE} Re-flashing as a rework: only regions whose digest differs are rewritten."
+        DIFF_REFLASH=1
+      fi
+      ;;
+    mac_conflict | serial_conflict)
+      if [[ "${FLEX_DEVICE_CONFLICTS:-block}" == "warn" ]]; then
+        echo "Warning: Identity conflict: ${DEVICE_MESSAGE}"
+      else
+        echo "Error: Identity conflict: ${DEVICE_MESSAGE} Nothing was written; set FLEX_DEVICE_CONFLICTS=warn to flash anyway." >&2
+        exit 1
+      fi
+      ;;
+  esac
 }
 
-
-BOOTLOADER_BIN="$(choose_or_fail "${ENC_BOOTLOADER_BIN}" "${BOOTLOADER_BIN}" "bootloader")"
-BOOT_APP0_BIN="$(choose_or_fail "${ENC_BOOT_APP0_BIN}" "${BOOT_APP0_BIN}" "boot_app0")"
-PARTITIONS_BIN="$(choose_or_fail "${ENC_PARTITIONS_BIN}" "${PARTITIONS_BIN}" "partitions")"
-FIRMWARE_BIN="$(choose_or_fail "${ENC_FIRMWARE_BIN}" "${FIRMWARE_BIN}" "firmware")"
-SPIFFS_BIN="$(choose_or_fail "${ENC_SPIFFS_BIN}" "${SPIFFS_BIN}" "spiffs")"
-FACTORY_CFG_TEMPLATE_BIN="$(choose_or_fail "${ENC_FACTORY_CFG_BIN}" "${FACTORY_CFG_TEMPLATE_BIN}" "factory_cfg")"
-
-if [[ "${FLASH_ENCRYPTION_ENABLED}" == "1" ]]; then
-  USE_PRE_ENCRYPTED=1
-else
-  USE_PRE_ENCRYPTED=0
-fi
-
-if (( USE_PRE_ENCRYPTED )); then
-  echo "Using pre-encrypted release bundle for flashing."
-fi
-
 needs_flash_encryption_setup() {
-  local summary
+  local summary probe
+  local FLASH_CRYPT_CNT=""
   ensure_serial_port_ready
+  if probe="$(probe_board_efuses)"; then
+    eval "${probe}"
+  fi
+  check_device_identity
+  if [[ -n "${FLASH_CRYPT_CNT}" ]]; then
+    echo "Board ${BOARD_MAC:-with unknown MAC}: FLASH_CRYPT_CNT=${FLASH_CRYPT_CNT}."
+    record_board_efuses "${FLASH_CRYPT_CNT}"
+    (( FLASH_CRYPT_CNT == 0 ))
+    return
+  fi
+
   if ! summary="$(read_efuse_summary)"; then
     echo "Error: unable to read eFuse summary via ${ESPEFUSE}." >&2
     diagnose_serial_port_failure
@@ -691,8 +790,12 @@ needs_flash_encryption_setup() {
   local line
   line="$(grep 'FLASH_CRYPT_CNT' <<<"${summary}" || true)"
   if [[ "${line}" =~ "= 0" ]]; then
+    record_board_efuses 0
     return 0
   fi
+  if [[ "${line}" =~ =\ ([0-9]+) ]]; then
+    record_board_efuses "${BASH_REMATCH[1]}"
+  fi
   return 1
 }
 
@@ -712,17 +815,28 @@ burn_flash_encryption() {
   else
     printf '%s\n' "${burn_key_output}"
   fi
-  printf 'BURN\n' | "${ESPEFUSE}" --port "${PORT}" burn_efuse FLASH_CRYPT_CONFIG 0xf
-  printf 'BURN\n' | "${ESPEFUSE}" --port "${PORT}" burn_efuse FLASH_CRYPT_CNT 1
-  printf 'BURN\n' | "${ESPEFUSE}" --port "${PORT}" burn_efuse DISABLE_DL_DECRYPT 1
-  printf 'BURN\n' | "${ESPEFUSE}" --port "${PORT}" burn_efuse DISABLE_DL_CACHE 1
+  # One burn_efuse call programs all four fields in a single connect/burn cycle.
+  printf 'BURN\n' | "${ESPEFUSE}" --port "${PORT}" burn_efuse \
+    FLASH_CRYPT_CONFIG 0xf \
+    FLASH_CRYPT_CNT 1 \
+    DISABLE_DL_DECRYPT 1 \
+    DISABLE_DL_CACHE 1
   echo "Flash encryption eFuses programmed."
+  record_board_efuses 1
 }
 
+ENCRYPTION_BURNED_THIS_RUN=0
+
 prepare_flash_encryption() {
+  stage_start efuse_read
   if needs_flash_encryption_setup; then
+    stage_end efuse_read
+    ENCRYPTION_BURNED_THIS_RUN=1
+    stage_start key_burn
     burn_flash_encryption
+    stage_end key_burn
   else
+    stage_end efuse_read
     echo "Flash encryption already enabled on target."
   fi
 }
@@ -736,19 +850,18 @@ if [[ "${FLASH_ENCRYPTION_ENABLED}" == "1" ]]; then
   prepare_flash_encryption
 else
   echo "Flash encryption disabled for this run; writing plaintext images."
+  check_device_identity
 fi
 
+stage_start payload
 prepare_factory_payload
+stage_end payload
 if [[ -z "${FACTORY_CFG_FLASH_PATH}" ]]; then
   echo "Error: failed to prepare factory configuration payload." >&2
   exit 1
 fi
 
 flash_cmd=(
-  "${ESPTOOL}"
-  --chip esp32
-  --port "${PORT}"
-  --baud "${FLEX_FLASH_BAUD:-460800}"
   --before default-reset
   --after hard-reset
   write-flash
@@ -764,102 +877,183 @@ else
   flash_cmd+=(-z)
 fi
 
-flash_cmd+=(
-  --flash-mode dio
-  --flash-freq 40m
-  --flash-size detect
-  0x1000 "${BOOTLOADER_BIN}"
-  0x8000 "${PARTITIONS_BIN}"
-  0xe000 "${BOOT_APP0_BIN}"
-  0x10000 "${FIRMWARE_BIN}"
-  0x290000 "${SPIFFS_BIN}"
-  0x3F0000 "${FACTORY_CFG_FLASH_PATH}"
-)
-
-ensure_serial_port_ready
-
-if ! verify_flash_plan; then
-  echo "Flash plan verification failed; aborting before touching hardware." >&2
-  exit 1
-fi
-
-echo "Flashing bundle $(basename "${RELEASES_DIR}") to ${PORT}..."
-"${flash_cmd[@]}"
-
-echo "Flash complete."
+FLASH_REGIONS=()
+for ((i = 0; i < ${#PLAN_REGION_NAMES[@]}; i++)); do
+  if [[ "${PLAN_REGION_NAMES[i]}" == "factory_cfg" ]]; then
+    FLASH_REGIONS+=("${PLAN_REGION_OFFSETS[i]}" "${FACTORY_CFG_FLASH_PATH}")
+  else
+    FLASH_REGIONS+=("${PLAN_REGION_OFFSETS[i]}" "${PLAN_REGION_PATHS[i]}")
+  fi
+done
 
-log_entry() {
-  local status="$1"
-  printf '%s,%s,%s,%s\n' "$(date -u +%Y-%m-%dT%H:%M:%SZ)" "${SERIAL}" "$(basename "${RELEASES_DIR}")" "${status}" >> "${LOG_DIR}/flash_log.csv"
+# Prints the addresses of regions whose on-chip MD5 matches the image. esptool's verify-flash has
+# the chip hash each range, so nothing is read back over the serial link. Regions that are not
+# reported as matching (mismatch, error, no output) are rewritten. $1 is the link rate.
+list_matching_regions() {
+  local baud="$1"
+  local after="${2:-no-reset}"
+  local output
+  output="$("${ESPTOOL}" --chip esp32 --port "${PORT}" --baud "${baud}" \
+    --before default-reset --after "${after}" verify-flash "${FLASH_REGIONS[@]}" 2>&1)" || true
+  printf '%s\n' "${output}" | tr -d '\r' | awk '
+    tolower($0) ~ /^verifying/ {
+      pending = ""
+      if (match($0, /(@|at) 0x[0-9a-fA-F]+/)) {
+        pending = substr($0, RSTART, RLENGTH)
+        sub(/^(@|at) /, "", pending)
+      }
+      next
+    }
+    pending != "" && tolower($0) ~ /(verify ok|successful)/ { print pending; pending = "" }
+  '
 }
 
-restore_wifi_after_provision() {
-  local device="${WIFI_RESTORE_DEVICE:-}"
-  local ssid="${WIFI_RESTORE_SSID:-}"
-  if [[ -n "${device}" && -n "${ssid}" && "${ssid}" != "You are not associated with an AirPort network." ]]; then
-    networksetup -setairportnetwork "${device}" "${ssid}" >/dev/null 2>&1 || true
+select_changed_regions() {
+  local matching
+  matching="$(list_matching_regions "${COMPARE_BAUD}")"
+  local -a changed=()
+  local i address
+  for ((i = 0; i < ${#FLASH_REGIONS[@]}; i += 2)); do
+    address="${FLASH_REGIONS[i]}"
+    if [[ -n "${matching}" ]] && grep -qix "0x0*${address#0x}" <<<"${matching}"; then
+      echo "  ${address}: digest matches, skipping"
+    else
+      changed+=("${address}" "${FLASH_REGIONS[i + 1]}")
+      echo "  ${address}: digest differs or unreadable, rewriting"
+    fi
+  done
+  if ((${#changed[@]} > 0)); then
+    FLASH_REGIONS=("${changed[@]}")
+  else
+    FLASH_REGIONS=()
   fi
 }
 
-provision_serial() {
-  if ! command -v networksetup >/dev/null 2>&1 || ! command -v curl >/dev/null 2>&1; then
-    echo "Skipping SSID provisioning: networksetup/curl not available." >&2
-    return 1
-  fi
+# Post-write check: every written region must hash, on the chip, to its image's MD5. Costs one
+# connection plus the chip's hashing time instead of a full readback. Runs at the rate the write
+# just succeeded at, never at one it gave up on.
+verify_written_regions() {
+  local matching
+  matching="$(list_matching_regions "${WRITE_BAUD}" hard-reset)"
+  local i address failed=0
+  for ((i = 0; i < ${#FLASH_REGIONS[@]}; i += 2)); do
+    address="${FLASH_REGIONS[i]}"
+    if [[ -n "${matching}" ]] && grep -qix "0x0*${address#0x}" <<<"${matching}"; then
+      echo "  ${address}: verified"
+    else
+      echo "  ${address}: digest mismatch" >&2
+      failed=1
+    fi
+  done
+  return "${failed}"
+}
 
-  local wifi_device="${WIFI_DEVICE:-}"
-  if [[ -z "${wifi_device}" ]]; then
-    wifi_device=$(networksetup -listallhardwareports | awk '/Hardware Port: Wi-Fi/{getline; print $2; exit}')
-  fi
-  if [[ -z "${wifi_device}" ]]; then
-    echo "Unable to determine Wi-Fi interface. Set WIFI_DEVICE and retry." >&2
-    return 1
-  fi
+ensure_serial_port_ready
 
-  WIFI_RESTORE_DEVICE="${wifi_device}"
-  WIFI_RESTORE_SSID=$(networksetup -getairportnetwork "${wifi_device}" 2>/dev/null | awk -F': ' 'NR==1{print $2}')
-  trap restore_wifi_after_provision RETURN
+FLASH_BAUD_RATES=("${FLASH_BAUD_SETTING}")
+if [[ "${FLASH_BAUD_SETTING}" == "auto" ]]; then
+  read -r -a FLASH_BAUD_RATES <<<"$(python3 "${BAUD_PROFILE_TOOL}" rates --port "${PORT}" 2>/dev/null || echo 460800)"
+  echo "Baud rates for this adapter: ${FLASH_BAUD_RATES[*]}"
+fi
+# The differential compare reads at a rate a write has confirmed; candidates may start with a probe.
+COMPARE_BAUD="${FLASH_BAUD_RATES[0]}"
+if [[ "${FLASH_BAUD_SETTING}" == "auto" ]]; then
+  COMPARE_BAUD="$(python3 "${BAUD_PROFILE_TOOL}" confirmed --port "${PORT}" 2>/dev/null || echo 115200)"
+fi
+WRITE_BAUD="${COMPARE_BAUD}"
+
+# Writes the regions at the first rate in FLASH_BAUD_RATES. In auto mode a link error (sync,
+# checksum, timeout) retries at the next lower rate, and every outcome updates the adapter's profile.
+# WRITE_BAUD is left at the rate that succeeded.
+write_flash_regions() {
+  local baud failed output_file
+  output_file="$(mktemp "${TMPDIR:-/tmp}/flex_write.XXXXXX")"
+  for baud in "${FLASH_BAUD_RATES[@]}"; do
+    if "${ESPTOOL}" --chip esp32 --port "${PORT}" --baud "${baud}" "${flash_cmd[@]}" 2>&1 | tee "${output_file}"; then
+      failed=0
+    else
+      failed=1
+    fi
+    if [[ "${FLASH_BAUD_SETTING}" != "auto" ]]; then
+      break
+    fi
+    if (( failed )) && ! python3 "${BAUD_PROFILE_TOOL}" classify <"${output_file}"; then
+      break
+    fi
+    if (( failed )); then
+      python3 "${BAUD_PROFILE_TOOL}" record --port "${PORT}" --baud "${baud}" --failed || true
+      echo "Link error at ${baud} baud; retrying at a lower rate." >&2
+      continue
+    fi
+    WRITE_BAUD="${baud}"
+    python3 "${BAUD_PROFILE_TOOL}" record --port "${PORT}" --baud "${baud}" || true
+    break
+  done
+  rm -f "${output_file}"
+  return "${failed}"
+}
 
-  echo "Connecting ${wifi_device} to factory SSID ${FACTORY_SSID}..."
-  if ! networksetup -setairportnetwork "${wifi_device}" "${FACTORY_SSID}" "${FACTORY_PASSWORD}"; then
-    echo "Failed to join ${FACTORY_SSID}." >&2
-    trap - RETURN
-    restore_wifi_after_provision
-    return 1
+if ! verify_flash_plan; then
+  echo "Flash plan verification failed; aborting before touching hardware." >&2
+  exit 1
+fi
+
+if [[ "${DIFF_REFLASH}" == "1" ]]; then
+  if (( ENCRYPTION_BURNED_THIS_RUN )); then
+    echo "Flash encryption was just enabled; differential re-flash needs a full write."
+  else
+    echo "Comparing on-device region digests..."
+    stage_start compare
+    select_changed_regions
+    stage_end compare
   fi
+fi
 
-  echo "Waiting for device ${TARGET_IP}..."
-  local attempt=0
-  until ping -c 1 -W 1000 "${TARGET_IP}" >/dev/null 2>&1; do
-    attempt=$((attempt + 1))
-    if (( attempt > 20 )); then
-      echo "Device did not respond at ${TARGET_IP}." >&2
-      trap - RETURN
-      restore_wifi_after_provision
-      return 1
+if ((${#FLASH_REGIONS[@]} == 0)); then
+  echo "All regions already match bundle $(basename "${RELEASES_DIR}"); nothing to rewrite."
+  "${ESPTOOL}" --chip esp32 --port "${PORT}" --before default-reset --after hard-reset read-mac >/dev/null
+else
+  flash_cmd+=(
+    --flash-mode dio
+    --flash-freq 40m
+    --flash-size detect
+    "${FLASH_REGIONS[@]}"
+  )
+  echo "Flashing bundle $(basename "${RELEASES_DIR}") to ${PORT}..."
+  stage_start write_flash
+  write_flash_regions
+  stage_end write_flash
+  if [[ "${VERIFY_FLASH}" == "1" ]]; then
+    echo "Verifying written regions against the bundle digests..."
+    stage_start verify
+    if ! verify_written_regions; then
+      echo "Error: post-flash verification failed; the unit does not hold the bundle." >&2
+      exit 1
     fi
-    sleep 1
-  done
-
-  echo "Provisioning SSID via /debug/update"
-  curl --silent --show-error --fail \
-    --user "${FLEX_DEBUG_USER:-admin}:${FLEX_DEBUG_PASSWORD:-S1mpl3Flex#2025}" \
-    --data-urlencode "serial=${SERIAL}" \
-    --data-urlencode "password=${AP_PASSWORD}" \
-    "http://${TARGET_IP}/debug/update"
+    stage_end verify
+  fi
+fi
 
-  echo "SSID updated. Device will reboot as ${SERIAL}."
-  trap - RETURN
-  restore_wifi_after_provision
-}
+echo "Flash complete."
 
 if (( WIFI_PROVISION == 1 )); then
-  if provision_serial; then
-    log_entry "wifi_success"
+  # The unit boots and is provisioned by a background worker, so the fixture is free right away.
+  # wifi_provision.py waits its turn for the Wi-Fi interface and settles this attempt's history row.
+  log_entry "wifi_pending"
+  provision_args=(
+    provision
+    --serial "${SERIAL}"
+    --ssid "${FACTORY_SSID}"
+    --target-ip "${TARGET_IP}"
+  )
+  if [[ "${FLEX_HISTORY_EXTERNAL:-0}" == "1" ]]; then
+    provision_args=(--history "" "${provision_args[@]}")
   else
-    echo "Warning: SSID provisioning failed after flash; wiring already updated." >&2
-    log_entry "wifi_failed"
+    provision_args+=(--started-at "${ATTEMPT_STARTED_AT}")
   fi
+  FLEX_AP_PASSWORD="${AP_PASSWORD}" FLEX_FACTORY_PASSWORD="${FACTORY_PASSWORD}" \
+    nohup python3 "${WIFI_PROVISION_TOOL}" "${provision_args[@]}" >>"${WIFI_PROVISION_LOG}" 2>&1 </dev/null &
+  echo "Wi-Fi provisioning of ${SERIAL} continues in the background (log: ${WIFI_PROVISION_LOG})."
 else
   log_entry "wired_only"
 fi
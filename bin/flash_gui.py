@@ -3,23 +3,55 @@
 
 from __future__ import annotations
 
-import csv
+import asyncio
+import concurrent.futures
+import collections
 import http.server
 import json
 import os
 import platform
-import glob
+import itertools
 import re
 import shlex
 import shutil
+import sqlite3
 import subprocess
+import sys
+import tempfile
 import threading
+import time
 import urllib.parse
 import webbrowser
 from pathlib import Path
-from typing import ClassVar
+from typing import Callable, ClassVar, Mapping, NamedTuple
+
+# Start-up timings are reported from here, so module imports are included.
+PROCESS_STARTED = time.perf_counter()
 
 PRODUCTION_DIR = Path(__file__).resolve().parent
+TOOLS_DIR = PRODUCTION_DIR / "tools"
+if str(TOOLS_DIR) not in sys.path:
+    sys.path.insert(0, str(TOOLS_DIR))
+
+import flash_crypt  # noqa: E402
+import efuse_registry  # noqa: E402
+import flash_engine  # noqa: E402
+import flash_history  # noqa: E402
+import flash_metrics  # noqa: E402
+import flash_plan  # noqa: E402
+import flash_progress  # noqa: E402
+import baud_profile  # noqa: E402
+import coordinator  # noqa: E402
+import device_registry  # noqa: E402
+import gen_factory_payload  # noqa: E402
+import port_watcher  # noqa: E402
+import production_queue  # noqa: E402
+import async_http  # noqa: E402
+import release_updater  # noqa: E402
+import transcripts  # noqa: E402
+import unit_store  # noqa: E402
+import wifi_provision  # noqa: E402
+
 DOWNLOAD_MODE_IMAGE_CANDIDATES = [
     PRODUCTION_DIR / "download mode.png",
     PRODUCTION_DIR.parent / "download mode.png",
@@ -28,88 +60,38 @@ DOWNLOAD_MODE_IMAGE_CANDIDATES = [
 PASSWORD_DB_PATH = PRODUCTION_DIR / "passwords.csv"
 DEFAULT_PASSWORD = "12345678"
 FLOW_VERSION = "gui-1.0.0"
-MANIFEST_PATH = PRODUCTION_DIR / "release" / "manifest.json"
-SERIAL_MIN = 1
-SERIAL_MAX = 100
-YEAR_MIN = 0
-YEAR_MAX = 99
-MONTH_MIN = 1
-MONTH_MAX = 12
-IDENTIFIER_PREFIX = "FP"
+RELEASE_DIR = PRODUCTION_DIR / "release"
+MANIFEST_PATH = RELEASE_DIR / "manifest.json"
+PACKS_DIR = PRODUCTION_DIR / "packs"
+# "auto" flashes through flash_engine when esptool is importable; "script" always uses the helpers.
+FLASH_ENGINE_MODE = os.environ.get("FLEX_FLASH_ENGINE", "auto").strip().lower()
+# A number pins the write rate; "auto" negotiates it per USB-UART adapter (see baud_profile.py).
+FLASH_BAUD = os.environ.get("FLEX_FLASH_BAUD", str(flash_engine.DEFAULT_FLASH_BAUD)).strip().lower()
+# Post-write MD5 check of every written region (on-chip hashing, no readback); the helper scripts read the same variable.
+VERIFY_FLASH = os.environ.get("FLEX_VERIFY_FLASH", "0").strip().lower() in ("1", "true", "on")
+FLASH_ENCRYPTION_KEY_PATH = Path(
+    os.environ.get("FLASH_ENCRYPTION_KEY_FILE", str(PRODUCTION_DIR / "keys" / "flash_encryption_key.bin"))
+)
+FACTORY_PARTITION_SIZE = int(os.environ.get("FACTORY_PARTITION_SIZE", "0x10000"), 0)
 ANSI_ESCAPE = re.compile(r"\x1B\[[0-9;?]*[ -/]*[@-~]")
-
-
-def validate_year(value: int) -> None:
-    if not (YEAR_MIN <= value <= YEAR_MAX):
-        raise ValueError(f"Year must be between {YEAR_MIN:02d} and {YEAR_MAX:02d}.")
-
-
-def validate_month(value: int) -> None:
-    if not (MONTH_MIN <= value <= MONTH_MAX):
-        raise ValueError(f"Month must be between {MONTH_MIN:02d} and {MONTH_MAX:02d}.")
-
-
-def format_identifier(batch: int, year: int, month: int, serial: int) -> str:
-    return f"{IDENTIFIER_PREFIX}{batch:02d}-{year:02d}{month:02d}{serial:04d}"
-
-
-class PasswordDatabase:
-    def __init__(self, path: Path, default_password: str) -> None:
-        self.path = path
-        self.default_password = default_password
-        self.entries: dict[tuple[int, int], str] = {}
-        self.loaded_from_disk = False
-
-    def load(self) -> None:
-        if not self.path.exists():
-            self.entries = {}
-            self.loaded_from_disk = False
-            return
-        self.loaded_from_disk = True
-        with self.path.open("r", encoding="utf-8", newline="") as fh:
-            reader = csv.DictReader(fh)
-            required = {"batch", "serial", "password"}
-            if not required.issubset(reader.fieldnames or set()):
-                raise SystemExit("Password CSV must contain batch,serial,password columns.")
-            self.entries = {}
-            for row in reader:
-                try:
-                    batch = int(row["batch"])
-                    serial = int(row["serial"])
-                except (TypeError, ValueError) as exc:
-                    raise SystemExit(f"Invalid batch/serial value in {self.path}: {row}") from exc
-                password = row["password"].strip()
-                if not (SERIAL_MIN <= serial <= SERIAL_MAX):
-                    raise SystemExit(f"Serial {serial} out of supported range {SERIAL_MIN}-{SERIAL_MAX}.")
-                if len(password) < 8 or len(password) > 63:
-                    raise SystemExit(f"Password for batch {batch} serial {serial} violates length constraints.")
-                key = (batch, serial)
-                if key in self.entries:
-                    raise SystemExit(f"Duplicate password entry for batch {batch} serial {serial:04d}.")
-                self.entries[key] = password
-
-    def lookup(self, batch: int, serial: int, year: int, month: int) -> dict[str, object]:
-        if batch <= 0:
-            raise ValueError("Batch number must be positive.")
-        if not (SERIAL_MIN <= serial <= SERIAL_MAX):
-            raise ValueError(f"Serial must be between {SERIAL_MIN} and {SERIAL_MAX}.")
-        validate_year(year)
-        validate_month(month)
-        password = self.entries.get((batch, serial), self.default_password)
-        serial_suffix = format_identifier(batch, year, month, serial)
-        ssid = serial_suffix
-        return {
-            "batch": batch,
-            "year": year,
-            "month": month,
-            "serial_number": serial,
-            "serial": serial_suffix,
-            "ssid": ssid,
-            "password": password,
-        }
-
-
-PASSWORD_DB = PasswordDatabase(PASSWORD_DB_PATH, DEFAULT_PASSWORD)
+AUTO_PORT_KEY = "auto"
+MAX_PARALLEL_JOBS = int(os.environ.get("FLEX_MAX_PARALLEL_JOBS", "4"))
+RELEASE_UPDATE_INTERVAL = float(os.environ.get("FLEX_RELEASE_UPDATE_INTERVAL", str(release_updater.DEFAULT_INTERVAL)))
+LOG_POLL_MAX_WAIT = 25.0
+# "threaded" serves each connection on its own thread; "asyncio" serves every client from one event loop.
+HTTP_SERVER_MODE = os.environ.get("FLEX_HTTP_SERVER", "threaded").strip().lower()
+# Headless runs (e.g. tools/bench_flash.py) set FLEX_OPEN_BROWSER=0.
+OPEN_BROWSER = os.environ.get("FLEX_OPEN_BROWSER", "1").strip().lower() in ("1", "true", "on")
+# Provision flashed units over Wi-Fi in the background (see tools/wifi_provision.py).
+WIFI_PROVISION = os.environ.get("FLEX_WIFI_PROVISION", "0").strip().lower() in ("1", "true", "on")
+# Line coordinator (tools/coordinator.py) that leases serials to this station; unset runs standalone.
+COORDINATOR_URL = os.environ.get("FLEX_COORDINATOR_URL", "").strip()
+STATION_NAME = os.environ.get("FLEX_STATION_NAME", "").strip() or platform.node() or "station"
+# Port add/remove events wake the queue at once; the interval only bounds how long a missed one delays it.
+QUEUE_POLL_INTERVAL = 5.0
+
+
+UNIT_STORE = unit_store.UnitStore(PASSWORD_DB_PATH, DEFAULT_PASSWORD)
 
 INDEX_HTML = """<!DOCTYPE html>
 <html lang="en">
@@ -138,9 +120,14 @@ INDEX_HTML = """<!DOCTYPE html>
     .status-flashing .status-spinner { display: inline-block; }
     @keyframes spin { from { transform: rotate(0deg); } to { transform: rotate(360deg); } }
     textarea { width: 100%; height: 320px; font-family: ui-monospace, SFMono-Regular, Consolas, monospace; border: 1px solid #c0c9d2; border-radius: 4px; padding: 8px; resize: none; box-sizing: border-box; }
+    .progress { display: flex; align-items: center; gap: 12px; margin-bottom: 8px; font-size: 0.9rem; }
+    .progress progress { flex: 1; height: 14px; }
     .message { color: #b91c1c; min-height: 1.2rem; }
+    .startup { font-size: 0.85rem; color: #475569; margin-bottom: 12px; }
     .actions { display: flex; gap: 12px; flex-wrap: wrap; }
     .actions button { flex: none; }
+    .actions label { display: flex; align-items: center; gap: 6px; font-weight: 500; margin: 0; }
+    .actions input[type="checkbox"] { width: auto; }
     .modal { position: fixed; inset: 0; display: none; align-items: center; justify-content: center; background: rgba(15, 23, 42, 0.55); backdrop-filter: blur(3px); padding: 12px; z-index: 50; }
     .modal.open { display: flex; }
     .modal-card { position: relative; width: min(520px, 100%); background: #fff; color: #0f172a; border-radius: 10px; padding: 18px; box-shadow: 0 20px 60px rgba(0,0,0,0.25); }
@@ -152,11 +139,17 @@ INDEX_HTML = """<!DOCTYPE html>
     .modal button.secondary:hover { background-color: #cbd5e1; }
     .download-image { margin-top: 12px; border: 1px solid #e2e8f0; border-radius: 8px; padding: 8px; background: #f8fafc; }
     .download-image img { width: 100%; height: auto; display: block; border-radius: 6px; }
+    .jobs { width: 100%; border-collapse: collapse; margin-bottom: 12px; font-size: 0.9rem; }
+    .jobs th, .jobs td { text-align: left; padding: 4px 6px; border-bottom: 1px solid #e2e8f0; }
+    .jobs tr.selected td { background-color: #eff6ff; }
+    .jobs tbody tr { cursor: pointer; }
+    .queue td button { padding: 2px 8px; font-size: 0.85rem; margin-right: 4px; }
   </style>
 </head>
 <body>
   <h1>Flex Plus Production Flasher</h1>
-  <p>Provide the batch (two digits), build year/month, and inter-batch serial (001-100). Flex Plus uses a static SoftAP password (default <strong>12345678</strong> unless overridden via <code>passwords.csv</code>). Each SSID/serial becomes <strong>FP&lt;batch&gt;-&lt;year&gt;&lt;month&gt;&lt;serial&gt;</strong>.</p>
+  <div class="startup" id="startup" hidden></div>
+  <p>Provide the batch (two digits), build year/month, and inter-batch serial (0001-9999). Flex Plus uses a static SoftAP password (default <strong>12345678</strong> unless overridden via <code>passwords.csv</code>). Each SSID/serial becomes <strong>FP&lt;batch&gt;-&lt;year&gt;&lt;month&gt;&lt;serial&gt;</strong>.</p>
   <form id="flash-form">
     <div class="row">
       <div>
@@ -174,8 +167,8 @@ INDEX_HTML = """<!DOCTYPE html>
     </div>
     <div class="row">
       <div>
-        <label for="serialNumber">Inter-batch serial (001-100)</label>
-        <input id="serialNumber" name="serialNumber" type="number" min="1" max="100" value="1" required>
+        <label for="serialNumber">Inter-batch serial (0001-9999)</label>
+        <input id="serialNumber" name="serialNumber" type="number" min="1" max="9999" value="1" required>
       </div>
       <div style="flex:0 0 auto;align-self:flex-end;">
         <button type="button" id="next-button">Next</button>
@@ -206,6 +199,16 @@ INDEX_HTML = """<!DOCTYPE html>
     </div>
     <div class="actions">
       <button id="flash-button" type="submit">Flash</button>
+      <label><input type="checkbox" id="rework"> Rework (rewrite changed regions only)</label>
+    </div>
+    <div class="row">
+      <div>
+        <label for="lastSerial">Queue through serial</label>
+        <input id="lastSerial" name="lastSerial" type="number" min="1" max="9999" value="100">
+      </div>
+      <div style="flex:0 0 auto;align-self:flex-end;">
+        <button type="button" id="queue-button">Queue run on port</button>
+      </div>
     </div>
     <div class="message" id="form-message"></div>
   </form>
@@ -221,6 +224,18 @@ INDEX_HTML = """<!DOCTYPE html>
     <span id="flow-version" class="status-badge status-ready" style="background:#eef2ff;color:#312e81;">Flow <span id="flow-version-text">unknown</span></span>
     <span id="bundle-version" class="status-badge status-ready" style="background:#ecfeff;color:#134e4a;">Bundle <span id="bundle-version-text">unknown</span></span>
   </div>
+  <table class="jobs" id="jobs" hidden>
+    <thead><tr><th>Port</th><th>Unit</th><th>Status</th></tr></thead>
+    <tbody id="jobs-body"></tbody>
+  </table>
+  <table class="jobs queue" id="queue" hidden>
+    <thead><tr><th>Port</th><th>Serials</th><th>Next</th><th>Done / failed</th><th></th></tr></thead>
+    <tbody id="queue-body"></tbody>
+  </table>
+  <div class="progress" id="progress" hidden>
+    <progress id="progress-bar" max="100" value="0"></progress>
+    <span id="progress-text"></span>
+  </div>
   <textarea id="logs" readonly placeholder="Logs will appear here..."></textarea>
 
   <div class="modal" id="download-modal" aria-hidden="true">
@@ -243,6 +258,9 @@ INDEX_HTML = """<!DOCTYPE html>
     const statusBadge = document.getElementById('status');
     const statusTextEl = document.getElementById('status-text');
     const logsEl = document.getElementById('logs');
+    const progressEl = document.getElementById('progress');
+    const progressBar = document.getElementById('progress-bar');
+    const progressText = document.getElementById('progress-text');
     const messageEl = document.getElementById('form-message');
     const batchInput = document.getElementById('batch');
     const yearInput = document.getElementById('year');
@@ -252,21 +270,34 @@ INDEX_HTML = """<!DOCTYPE html>
     const ssidInput = document.getElementById('ssid');
     const passwordInput = document.getElementById('password');
     const portSelect = document.getElementById('port');
+    const reworkInput = document.getElementById('rework');
     const refreshPortsBtn = document.getElementById('refresh-ports');
     const form = document.getElementById('flash-form');
     const flashButton = document.getElementById('flash-button');
     const nextButton = document.getElementById('next-button');
     const flowVersionEl = document.getElementById('flow-version-text');
     const bundleVersionEl = document.getElementById('bundle-version-text');
+    const startupEl = document.getElementById('startup');
     const downloadModal = document.getElementById('download-modal');
     const downloadConfirmBtn = document.getElementById('download-confirm');
     const downloadCancelBtn = document.getElementById('download-cancel');
     const downloadHelpBtn = document.getElementById('download-help');
     const downloadImage = document.getElementById('download-image');
+    const jobsTable = document.getElementById('jobs');
+    const jobsBody = document.getElementById('jobs-body');
+    const lastSerialInput = document.getElementById('lastSerial');
+    const queueButton = document.getElementById('queue-button');
+    const queueTable = document.getElementById('queue');
+    const queueBody = document.getElementById('queue-body');
     const SERIAL_MIN = 1;
-    const SERIAL_MAX = 100;
+    const SERIAL_MAX = 9999;
+    // Derived fields come from /lookup_range in blocks; entries expire so passwords.csv edits show up.
+    const UNIT_BLOCK = 100;
+    const UNIT_CACHE_TTL_MS = 15000;
+    const unitCache = new Map();
     const STATUS_CODES = ['ready', 'flashing', 'success', 'failed'];
     let derivedReady = false;
+    let coordinatorMode = false;
 
     function updateStatus(status) {
       const fallback = { code: 'ready', message: 'Ready to flash' };
@@ -337,17 +368,132 @@ INDEX_HTML = """<!DOCTYPE html>
       monthInput.value = String(now.getMonth() + 1).padStart(2, '0');
     }
 
+    function selectedPortKey() {
+      return portSelect.value || 'auto';
+    }
+
+    function renderJobs(jobs) {
+      const list = Array.isArray(jobs) ? jobs : [];
+      jobsTable.hidden = list.length === 0;
+      jobsBody.innerHTML = '';
+      const selected = selectedPortKey();
+      list.forEach(job => {
+        const row = document.createElement('tr');
+        if (job.port === selected) row.className = 'selected';
+        [job.port, job.serial || '-', (job.status && job.status.message) || ''].forEach((text, index) => {
+          const cell = document.createElement('td');
+          if (index === 1 && job.serial) {
+            // The unit's full transcript, kept on disk after the job's log here is replaced.
+            const link = document.createElement('a');
+            link.href = `/transcript?${new URLSearchParams({ serial: job.serial }).toString()}`;
+            link.target = '_blank';
+            link.textContent = text;
+            link.addEventListener('click', event => event.stopPropagation());
+            cell.appendChild(link);
+          } else {
+            cell.textContent = text;
+          }
+          row.appendChild(cell);
+        });
+        row.addEventListener('click', () => {
+          const value = job.port === 'auto' ? '' : job.port;
+          if (![...portSelect.options].some(opt => opt.value === value)) {
+            const opt = document.createElement('option');
+            opt.value = value;
+            opt.textContent = value;
+            portSelect.appendChild(opt);
+          }
+          portSelect.value = value;
+          resetLogCursor();
+          refreshState();
+        });
+        jobsBody.appendChild(row);
+      });
+    }
+
+    async function queueAction(params) {
+      try {
+        const response = await fetch('/queue', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
+          body: params.toString()
+        });
+        const payload = await response.json();
+        messageEl.textContent = payload.ok ? '' : (payload.error || 'Queue request failed.');
+        if (payload.ok) renderQueue(payload.runs);
+      } catch (err) {
+        messageEl.textContent = 'Queue request failed. Check the terminal for details.';
+      }
+    }
+
+    function renderQueue(runs) {
+      const list = Array.isArray(runs) ? runs : [];
+      queueTable.hidden = list.length === 0;
+      queueBody.innerHTML = '';
+      list.forEach(run => {
+        const row = document.createElement('tr');
+        const next = run.awaiting_swap ? `${run.next_serial} (swap board)` : String(run.next_serial);
+        [run.port, `${String(run.batch).padStart(2, '0')}: ${run.first}-${run.last}`, next, `${run.flashed} / ${run.failed}`].forEach(text => {
+          const cell = document.createElement('td');
+          cell.textContent = text;
+          row.appendChild(cell);
+        });
+        const actions = document.createElement('td');
+        [['next', 'Go'], ['skip', 'Skip'], ['remove', 'Stop']].forEach(([action, label]) => {
+          const button = document.createElement('button');
+          button.type = 'button';
+          button.textContent = label;
+          button.addEventListener('click', () => queueAction(new URLSearchParams({ action, port: run.port })));
+          actions.appendChild(button);
+        });
+        row.appendChild(actions);
+        queueBody.appendChild(row);
+      });
+    }
+
+    function queueRun() {
+      const portValue = portSelect.value;
+      if (!portValue) {
+        messageEl.textContent = 'Select the fixture\'s serial port to queue a run.';
+        return;
+      }
+      queueAction(new URLSearchParams({
+        action: 'add',
+        port: portValue,
+        batch: batchInput.value.trim(),
+        year: yearInput.value.trim(),
+        month: monthInput.value.trim(),
+        first: serialInput.value.trim(),
+        last: lastSerialInput.value.trim(),
+        rework: reworkInput.checked ? '1' : '0'
+      }));
+    }
+
+    function renderStartup(startup) {
+      if (!startup || startup.ready) {
+        startupEl.hidden = true;
+        return false;
+      }
+      const marks = { running: '…', ok: '✓', failed: '✗' };
+      startupEl.hidden = false;
+      startupEl.textContent = 'Starting up: ' + Object.entries(startup.tasks)
+        .map(([name, task]) => `${name} ${marks[task.state] || ''}`)
+        .join(' · ');
+      return true;
+    }
+
     async function refreshState() {
       try {
-        const response = await fetch('/state');
+        const params = new URLSearchParams({ port: selectedPortKey() });
+        const response = await fetch(`/state?${params.toString()}`);
         if (!response.ok) return;
         const data = await response.json();
+        if (data.port !== selectedPortKey()) return;
         updateStatus(data.status);
-        const wasAtBottom = logsEl.scrollTop + logsEl.clientHeight >= logsEl.scrollHeight - 8;
-        logsEl.value = data.logs;
-        if (wasAtBottom) {
-          logsEl.scrollTop = logsEl.scrollHeight;
-        }
+        renderJobs(data.jobs);
+        renderQueue(data.queue);
+        coordinatorMode = Boolean(data.coordinator);
+        if (renderStartup(data.startup)) setTimeout(refreshState, 300);
         flashButton.disabled = data.busy || !derivedReady;
         if (data.flow_version) {
           flowVersionEl.textContent = `${data.flow_version} (${data.flow_revision || 'unknown'})`;
@@ -361,6 +507,91 @@ INDEX_HTML = """<!DOCTYPE html>
       }
     }
 
+    const logCursor = { port: null, run: 0, rev: -1, seq: 0, controller: null };
+
+    function resetLogCursor() {
+      logCursor.port = selectedPortKey();
+      logCursor.run = 0;
+      logCursor.rev = -1;
+      logCursor.seq = 0;
+      logsEl.value = '';
+      if (logCursor.controller) logCursor.controller.abort();
+    }
+
+    function appendLogLines(lines, reset) {
+      const wasAtBottom = logsEl.scrollTop + logsEl.clientHeight >= logsEl.scrollHeight - 8;
+      if (reset) logsEl.value = '';
+      if (lines.length > 0) {
+        logsEl.value += (logsEl.value ? '\n' : '') + lines.join('\n');
+      }
+      if (wasAtBottom) {
+        logsEl.scrollTop = logsEl.scrollHeight;
+      }
+    }
+
+    function updateProgress(progress) {
+      if (!progress || progress.percent === null) {
+        progressEl.hidden = true;
+        return;
+      }
+      progressEl.hidden = false;
+      progressBar.value = progress.percent;
+      const parts = [progress.region ? `${progress.phase} ${progress.region}` : progress.phase, `${progress.percent}%`];
+      if (progress.rate_kbps !== null) parts.push(`${progress.rate_kbps} KB/s`);
+      if (progress.eta_seconds && progress.phase === 'writing') parts.push(`ETA ${Math.ceil(progress.eta_seconds)} s`);
+      progressText.textContent = parts.join(' · ');
+    }
+
+    async function pollLogs() {
+      while (true) {
+        if (logCursor.port !== selectedPortKey()) resetLogCursor();
+        const port = logCursor.port;
+        const params = new URLSearchParams({
+          port,
+          run: String(logCursor.run),
+          rev: String(logCursor.rev),
+          since: String(logCursor.seq)
+        });
+        logCursor.controller = new AbortController();
+        try {
+          const response = await fetch(`/logs?${params.toString()}`, { signal: logCursor.controller.signal });
+          if (!response.ok) throw new Error(`HTTP ${response.status}`);
+          const data = await response.json();
+          if (port !== logCursor.port) continue;
+          appendLogLines(Array.isArray(data.lines) ? data.lines : [], data.reset);
+          logCursor.run = data.run;
+          logCursor.rev = data.rev;
+          logCursor.seq = data.seq;
+          updateStatus(data.status);
+          updateProgress(data.progress);
+          flashButton.disabled = data.busy || !derivedReady;
+        } catch (err) {
+          if (err.name !== 'AbortError') {
+            console.error('Log poll failed', err);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+          }
+        }
+      }
+    }
+
+    async function lookupUnit(batch, year, month, serial) {
+      const first = Math.floor((serial - SERIAL_MIN) / UNIT_BLOCK) * UNIT_BLOCK + SERIAL_MIN;
+      const last = Math.min(first + UNIT_BLOCK - 1, SERIAL_MAX);
+      const key = `${batch}/${year}/${month}/${first}`;
+      const cached = unitCache.get(key);
+      if (cached && Date.now() - cached.fetchedAt < UNIT_CACHE_TTL_MS) {
+        return cached.units[serial - first];
+      }
+      const params = new URLSearchParams({ batch, year, month, first, last });
+      const response = await fetch(`/lookup_range?${params.toString()}`);
+      const payload = await response.json();
+      if (!response.ok || !payload.ok) {
+        throw new Error(payload.error || 'Lookup failed.');
+      }
+      unitCache.set(key, { units: payload.units, fetchedAt: Date.now() });
+      return payload.units[serial - first];
+    }
+
     async function lookupDerived() {
       const batch = batchInput.value.trim();
       const year = yearInput.value.trim();
@@ -394,38 +625,60 @@ INDEX_HTML = """<!DOCTYPE html>
         passwordInput.value = '';
         return;
       }
+      const serialNum = parseInt(serial, 10);
+      if (Number.isNaN(serialNum) || serialNum < SERIAL_MIN || serialNum > SERIAL_MAX) {
+        derivedReady = false;
+        flashButton.disabled = true;
+        messageEl.textContent = `Serial must be between ${SERIAL_MIN} and ${SERIAL_MAX}.`;
+        serialSuffixInput.value = '';
+        ssidInput.value = '';
+        passwordInput.value = '';
+        return;
+      }
+      let unit;
       try {
-        const params = new URLSearchParams({
-          batch,
-          serial,
-          year: yearNum.toString().padStart(2, '0'),
-          month: monthNum.toString().padStart(2, '0')
-        });
-        const response = await fetch(`/lookup?${params.toString()}`);
-        const payload = await response.json();
-        if (!response.ok || !payload.ok) {
-          derivedReady = false;
-          flashButton.disabled = true;
-          messageEl.textContent = payload.error || 'Lookup failed.';
-          serialSuffixInput.value = '';
-          ssidInput.value = '';
-          passwordInput.value = '';
-          return;
-        }
-        derivedReady = true;
-        messageEl.textContent = '';
-        serialSuffixInput.value = payload.serial;
-        ssidInput.value = payload.ssid;
-        passwordInput.value = payload.password;
-        flashButton.disabled = false;
+        unit = await lookupUnit(batch, yearNum.toString().padStart(2, '0'), monthNum.toString().padStart(2, '0'), serialNum);
       } catch (err) {
         derivedReady = false;
         flashButton.disabled = true;
-        messageEl.textContent = 'Lookup request failed. Check the terminal for details.';
+        messageEl.textContent = err instanceof TypeError
+          ? 'Lookup request failed. Check the terminal for details.'
+          : err.message;
+        serialSuffixInput.value = '';
+        ssidInput.value = '';
+        passwordInput.value = '';
+        return;
       }
+      derivedReady = true;
+      messageEl.textContent = '';
+      serialSuffixInput.value = unit.serial;
+      ssidInput.value = unit.ssid;
+      passwordInput.value = unit.password;
+      flashButton.disabled = false;
     }
 
-    function handleNext() {
+    async function handleNext() {
+      if (coordinatorMode) {
+        // The line coordinator hands out serials, so two stations never flash the same one.
+        const params = new URLSearchParams({
+          batch: batchInput.value.trim(),
+          year: yearInput.value.trim(),
+          month: monthInput.value.trim()
+        });
+        try {
+          const response = await fetch(`/next_serial?${params.toString()}`);
+          const payload = await response.json();
+          if (!payload.ok) {
+            messageEl.textContent = payload.error || 'The coordinator did not hand out a serial.';
+            return;
+          }
+          serialInput.value = payload.serial;
+          lookupDerived();
+        } catch (err) {
+          messageEl.textContent = 'Next-serial request failed. Check the terminal for details.';
+        }
+        return;
+      }
       const current = parseInt(serialInput.value, 10) || SERIAL_MIN;
       if (current >= SERIAL_MAX) {
         messageEl.textContent = `Reached serial ${SERIAL_MAX}. Increase the batch number to continue.`;
@@ -453,10 +706,13 @@ INDEX_HTML = """<!DOCTYPE html>
       params.set('year', yearInput.value.trim());
       params.set('month', monthInput.value.trim());
       params.set('serial', serialInput.value.trim());
-       const portValue = portSelect.value;
-       if (portValue && portValue !== 'auto') {
-         params.set('port', portValue);
-       }
+      if (reworkInput.checked) {
+        params.set('rework', '1');
+      }
+      const portValue = portSelect.value;
+      if (portValue && portValue !== 'auto') {
+        params.set('port', portValue);
+      }
       try {
         const response = await fetch('/flash', {
           method: 'POST',
@@ -474,28 +730,51 @@ INDEX_HTML = """<!DOCTYPE html>
       }
     }
 
+    function renderPorts(list) {
+      const ports = Array.isArray(list) ? list : [];
+      const current = portSelect.value;
+      portSelect.innerHTML = '<option value=\"\">Auto</option>';
+      ports.forEach(p => {
+        const opt = document.createElement('option');
+        opt.value = p;
+        opt.textContent = p;
+        portSelect.appendChild(opt);
+      });
+      if (current && ports.includes(current)) {
+        portSelect.value = current;
+      }
+    }
+
     async function refreshPorts() {
       try {
         const response = await fetch('/ports');
         if (!response.ok) return;
         const data = await response.json();
-        const ports = Array.isArray(data.ports) ? data.ports : [];
-        const current = portSelect.value;
-        portSelect.innerHTML = '<option value=\"\">Auto</option>';
-        ports.forEach(p => {
-          const opt = document.createElement('option');
-          opt.value = p;
-          opt.textContent = p;
-          portSelect.appendChild(opt);
-        });
-        if (current && ports.includes(current)) {
-          portSelect.value = current;
-        }
+        renderPorts(data.ports);
       } catch (err) {
         console.error('Port refresh failed', err);
       }
     }
 
+    async function watchPorts() {
+      let seq = 0;
+      while (true) {
+        try {
+          const response = await fetch(`/port-events?since=${seq}`);
+          if (!response.ok) throw new Error(`HTTP ${response.status}`);
+          const data = await response.json();
+          if (data.seq !== seq) {
+            seq = data.seq;
+            renderPorts(data.ports);
+            refreshState();
+          }
+        } catch (err) {
+          console.error('Port watch failed', err);
+          await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+      }
+    }
+
     if (downloadHelpBtn && downloadImage) {
       downloadHelpBtn.addEventListener('click', () => {
         if (downloadImage.hasAttribute('hidden')) {
@@ -516,38 +795,52 @@ INDEX_HTML = """<!DOCTYPE html>
     yearInput.addEventListener('input', markDerivedDirty);
     monthInput.addEventListener('input', markDerivedDirty);
     nextButton.addEventListener('click', handleNext);
+    queueButton.addEventListener('click', queueRun);
     refreshPortsBtn.addEventListener('click', refreshPorts);
+    portSelect.addEventListener('change', () => {
+      resetLogCursor();
+      refreshState();
+    });
     setDefaultYearMonth();
     updateStatus({ code: 'ready', message: 'Ready to flash' });
-    setInterval(refreshState, 1000);
+    setInterval(refreshState, 3000);
     lookupDerived();
     refreshState();
     refreshPorts();
+    pollLogs();
+    watchPorts();
   </script>
 </body>
 </html>
 """
 
 
-def load_password_db() -> None:
-    PASSWORD_DB.load()
-    if not PASSWORD_DB.loaded_from_disk:
+def load_password_db() -> str:
+    UNIT_STORE.load()
+    if not UNIT_STORE.loaded_from_disk:
         print(
             f"No passwords.csv found at {PASSWORD_DB_PATH}. "
             f"Defaulting every unit to password {DEFAULT_PASSWORD}."
         )
+        return "default password for every unit"
+    print(f"Loaded {UNIT_STORE.units} unit password(s) from {PASSWORD_DB_PATH}.")
+    return f"{UNIT_STORE.units} unit(s)"
 
 
-def load_manifest_info() -> dict[str, str]:
-    manifest = {"version": "unknown", "built_at": "unknown"}
+def load_manifest_info(release_dir: Path = RELEASE_DIR) -> dict[str, str]:
+    manifest = {"version": "unknown", "built_at": "unknown", "flash_encryption": "unknown"}
     try:
-        data = json.loads(MANIFEST_PATH.read_text())
-        manifest["version"] = str(data.get("version", "unknown"))
-        manifest["built_at"] = str(data.get("built_at", "unknown"))
+        plan = flash_plan.load_plan(release_dir)
     except FileNotFoundError:
-        print(f"Warning: manifest.json not found at {MANIFEST_PATH}")
+        print(f"Warning: manifest.json not found at {release_dir / MANIFEST_PATH.name}")
     except Exception as exc:  # noqa: BLE001
-        print(f"Warning: failed to parse manifest.json: {exc}")
+        print(f"Warning: failed to load flash plan: {exc}")
+    else:
+        summary = plan.summary()
+        for key in manifest:
+            manifest[key] = str(summary[key])
+        for error in plan.errors:
+            print(f"Warning: flash plan: {error}")
     return manifest
 
 
@@ -565,33 +858,250 @@ def detect_flow_revision() -> str:
         return "unknown"
 
 
-MANIFEST_INFO = load_manifest_info()
-FLOW_REVISION = detect_flow_revision()
+# Both are filled in by start-up tasks once the server is already listening.
+MANIFEST_INFO = {"version": "loading", "built_at": "", "flash_encryption": "unknown"}
+FLOW_REVISION = "loading"
+
+
+def start_release_updater(manager: "FlashManager") -> release_updater.ReleaseUpdater:
+    """Activate the last verified release and keep fetching new ones in the background."""
+
+    def swapped(release_dir: Path, plan: flash_plan.FlashPlan) -> None:
+        global MANIFEST_INFO
+        MANIFEST_INFO = load_manifest_info(release_dir)
+
+    updater = release_updater.ReleaseUpdater(
+        interval=RELEASE_UPDATE_INTERVAL, is_idle=manager.idle, on_swap=swapped
+    )
+    manager.updater = updater
+    global MANIFEST_INFO
+    MANIFEST_INFO = load_manifest_info(updater.active_release_dir())
+    updater.start()
+    return updater
+
+
+def find_factory_pack(unit: dict[str, object]) -> Path | None:
+    """Return the pre-generated batch pack holding this unit's payload, if one exists."""
+    path = PACKS_DIR / gen_factory_payload.pack_file_name(int(unit["batch"]), int(unit["year"]), int(unit["month"]))
+    if not path.exists():
+        return None
+    try:
+        with gen_factory_payload.FactoryPack(path) as pack:
+            return path if str(unit["serial"]) in pack else None
+    except (OSError, ValueError) as exc:
+        print(f"Warning: ignoring factory pack {path}: {exc}")
+        return None
+
+
+def prepare_factory_image(
+    unit: dict[str, object], factory_pack: Path | None, plan: flash_plan.FlashPlan
+) -> Path | None:
+    """Build and flash-encrypt the unit's factorycfg image in-process.
+
+    Returns a temporary file for the flasher, or None when the script has to prepare the payload
+    itself (plaintext bundle or no key on this station).
+    """
+    if not plan.encrypted or not FLASH_ENCRYPTION_KEY_PATH.exists():
+        return None
+    serial = str(unit["serial"])
+    password = str(unit["password"])
+    region = plan.region(flash_plan.FACTORY_CFG)
+    encryptor = flash_crypt.load_encryptor(FLASH_ENCRYPTION_KEY_PATH)
+    if factory_pack:
+        with gen_factory_payload.FactoryPack(factory_pack) as pack:
+            view = pack.payload(serial)
+            try:
+                gen_factory_payload.verify_payload(view, serial, password)
+                encrypted = encryptor.encrypt(view, region.offset)
+            finally:
+                view.release()
+    else:
+        image = gen_factory_payload.build_partition_image(serial, password, FACTORY_PARTITION_SIZE)
+        gen_factory_payload.verify_payload(image, serial, password)
+        encrypted = encryptor.encrypt(image, region.offset)
+    if len(encrypted) > region.limit:
+        raise ValueError(f"factory image ({len(encrypted)} bytes) exceeds its {region.limit}-byte region")
+    fd, name = tempfile.mkstemp(prefix="factorycfg_enc_", suffix=".bin")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(encrypted)
+    return Path(name)
+
+
+class PreparedUnit(NamedTuple):
+    serial: str
+    release_dir: Path
+    plan: flash_plan.FlashPlan
+    factory_pack: Path | None
+    factory_image: Path | None
+    notes: list[str]
+
+    def discard(self) -> None:
+        if self.factory_image:
+            self.factory_image.unlink(missing_ok=True)
+
+
+def prepare_unit(unit: dict[str, object], release_dir: Path) -> PreparedUnit:
+    """Load the plan and build the unit's encrypted factory image; safe to run ahead of the flash."""
+    plan = flash_plan.load_plan(release_dir)
+    factory_pack: Path | None = None
+    factory_image: Path | None = None
+    notes: list[str] = []
+    if not plan.errors:
+        factory_pack = find_factory_pack(unit)
+        if factory_pack:
+            notes.append(f"Using factory payload from {factory_pack.name}")
+        try:
+            factory_image = prepare_factory_image(unit, factory_pack, plan)
+        except (OSError, ValueError) as exc:
+            notes.append(f"Warning: in-process factory image failed ({exc}); the flasher will build it.")
+        if factory_image:
+            notes.append("Factory image built and encrypted in-process.")
+    return PreparedUnit(str(unit["serial"]), release_dir, plan, factory_pack, factory_image, notes)
+
+
+def open_history() -> flash_history.HistoryStore | None:
+    """Open the attempt history, folding in a legacy flash_log.csv once."""
+    try:
+        history = flash_history.HistoryStore()
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Warning: flash history unavailable: {exc}")
+        return None
+    legacy = flash_history.LEGACY_CSV_PATH
+    if legacy.exists():
+        try:
+            added = history.import_csv(legacy)
+            legacy.replace(legacy.with_name(legacy.name + ".imported"))
+            print(f"Imported {added} attempt(s) from {legacy.name} into the flash history.")
+        except (OSError, sqlite3.Error) as exc:
+            print(f"Warning: unable to import {legacy}: {exc}")
+    return history
+
+
+def open_devices(history: flash_history.HistoryStore | None) -> device_registry.DeviceRegistry | None:
+    """Open the MAC -> serial registry, seeding an empty one from the flash history."""
+    try:
+        registry = device_registry.DeviceRegistry()
+        if history is not None and registry.count() == 0:
+            added = registry.import_history(history.path)
+            if added:
+                print(f"Seeded the device registry with {added} flash(es) from the flash history.")
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Warning: device registry unavailable: {exc}")
+        return None
+    return registry
+
+
+def open_transcripts() -> transcripts.TranscriptStore | None:
+    """Open the transcript index and settle transcripts a previous run left open."""
+    try:
+        store = transcripts.TranscriptStore()
+        store.recover()
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Warning: unit transcripts unavailable: {exc}")
+        return None
+    return store
+
+
+class StartupTasks:
+    """Start-up work run in parallel after the HTTP server is bound; /state reports each task as it settles.
 
+    Flashing waits for the tasks marked required; the rest (the git revision, say) only feed the page.
+    """
 
-def update_production_repo() -> None:
-    commands = [
-        ["git", "-C", str(PRODUCTION_DIR), "fetch", "--quiet", "--tags"],
-        ["git", "-C", str(PRODUCTION_DIR), "pull", "--ff-only"],
-    ]
-    for cmd in commands:
+    def __init__(self, on_done: Callable[[], None] | None = None) -> None:
+        self._lock = threading.Lock()
+        self._tasks: dict[str, dict[str, object]] = {}
+        self._functions: dict[str, Callable[[], str | None]] = {}
+        self._pending = 0
+        self._on_done = on_done
+        self.listening_after: float | None = None
+        self.ready_after: float | None = None
+
+    def add(self, name: str, fn: Callable[[], str | None], required: bool = True) -> None:
+        with self._lock:
+            self._tasks[name] = {"state": "running", "required": required, "seconds": None, "detail": None}
+            self._functions[name] = fn
+            self._pending += 1
+
+    def start(self) -> None:
+        """Run every added task, each on its own thread."""
+        for name, fn in self._functions.items():
+            threading.Thread(target=self._run, args=(name, fn), name=f"startup-{name}", daemon=True).start()
+
+    def _run(self, name: str, fn: Callable[[], str | None]) -> None:
+        started = time.perf_counter()
         try:
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError as exc:  # noqa: PERF203
-            stderr = exc.stderr.decode("utf-8", errors="ignore").strip()
-            print(f"Warning: git command failed ({' '.join(cmd)}): {stderr}")
-            break
+            detail, state = fn(), "ok"
+        except Exception as exc:  # noqa: BLE001
+            detail, state = str(exc), "failed"
+            print(f"Warning: start-up task {name} failed: {exc}")
+        with self._lock:
+            self._tasks[name].update(state=state, seconds=round(time.perf_counter() - started, 3), detail=detail)
+            self._pending -= 1
+            done = self._pending == 0
+            if done:
+                self.ready_after = time.perf_counter() - PROCESS_STARTED
+        if done:
+            print(self.report(), flush=True)
+            if self._on_done is not None:
+                self._on_done()
+
+    def listening(self) -> None:
+        self.listening_after = time.perf_counter() - PROCESS_STARTED
+
+    def waiting_for(self) -> list[str]:
+        """Required tasks still running (failed ones do not block; their errors surface when used)."""
+        with self._lock:
+            return [name for name, task in self._tasks.items() if task["required"] and task["state"] == "running"]
+
+    def summary(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "ready": self._pending == 0,
+                "listening_after": _round(self.listening_after),
+                "ready_after": _round(self.ready_after),
+                "tasks": {name: dict(task) for name, task in self._tasks.items()},
+            }
+
+    def report(self) -> str:
+        with self._lock:
+            tasks = ", ".join(
+                f"{name} {task['seconds']:.2f} s{'' if task['state'] == 'ok' else ' (failed)'}"
+                for name, task in self._tasks.items()
+            )
+        listening = f"listening after {self.listening_after:.2f} s; " if self.listening_after is not None else ""
+        ready = f"; ready after {self.ready_after:.2f} s" if self.ready_after is not None else ""
+        return f"Start-up: {listening}{tasks}{ready}"
+
 
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 3)
 
-def build_flash_command(serial: str, password: str, port: str | None) -> tuple[list[str], Path]:
+
+def build_flash_command(
+    serial: str,
+    password: str,
+    port: str | None,
+    factory_pack: Path | None = None,
+    factory_image: Path | None = None,
+    differential: bool = False,
+) -> tuple[list[str], Path]:
     system = platform.system()
-    if system == "Darwin":
+    # Linux runs the macOS script against FLEX_ESPTOOL/FLEX_ESPEFUSE (tools/sim_device.py fixtures).
+    if system in ("Darwin", "Linux"):
         script = PRODUCTION_DIR / "flash_flex_plus.sh"
         if not script.exists():
             raise FileNotFoundError(f"macOS script not found: {script}")
-        cmd = ["/bin/bash", str(script), "--serial", serial, "--password", password]
+        cmd = ["/bin/bash", str(script), "--serial", serial]
         if port:
             cmd.extend(["--port", port])
+        if factory_image:
+            cmd.extend(["--factory-cfg", str(factory_image)])
+        elif factory_pack:
+            cmd.extend(["--factory-pack", str(factory_pack)])
+        if differential:
+            cmd.append("--diff-reflash")
+        cmd.extend(["--password", password])
         return cmd, PRODUCTION_DIR
     if system == "Windows":
         script = PRODUCTION_DIR / "flash_flex_plus.ps1"
@@ -608,11 +1118,16 @@ def build_flash_command(serial: str, password: str, port: str | None) -> tuple[l
             str(script),
             "-Serial",
             serial,
-            "-Password",
-            password,
         ]
         if port:
             command.extend(["-Port", port])
+        if factory_image:
+            command.extend(["-FactoryImage", str(factory_image)])
+        elif factory_pack:
+            command.extend(["-FactoryPack", str(factory_pack)])
+        if differential:
+            command.append("-Differential")
+        command.extend(["-Password", password])
         return command, PRODUCTION_DIR
     raise RuntimeError(f"Unsupported operating system: {system}")
 
@@ -625,109 +1140,498 @@ def find_powershell() -> str:
     raise FileNotFoundError("Neither pwsh nor powershell was found on PATH.")
 
 
-def list_serial_ports() -> list[str]:
-    system = platform.system()
-    ports: list[str] = []
+PORT_WATCHER = port_watcher.PortWatcher()
 
-    def add_port(port: str) -> None:
-        port = port.strip()
-        if port and port not in ports:
-            ports.append(port)
 
-    try:
-        if system == "Darwin":
-            patterns = (
-                "/dev/cu.usbserial-*",
-                "/dev/cu.SLAB_USB*",
-                "/dev/cu.usbmodem*",
-                "/dev/cu.wchusbserial*",
-            )
-            for pat in patterns:
-                for dev in glob.glob(pat):
-                    add_port(dev)
-        elif system == "Windows":
-            try:
-                import serial.tools.list_ports  # type: ignore
-            except Exception:
-                try:
-                    result = subprocess.run(
-                        [
-                            "powershell",
-                            "-NoLogo",
-                            "-NoProfile",
-                            "[System.IO.Ports.SerialPort]::GetPortNames() | Sort-Object",
-                        ],
-                        capture_output=True,
-                        text=True,
-                        timeout=5,
-                        check=True,
-                    )
-                except Exception:
-                    add_port("COM3")
-                    add_port("COM4")
-                else:
-                    for line in result.stdout.splitlines():
-                        add_port(line.strip())
-            else:
-                for info in serial.tools.list_ports.comports():  # type: ignore[attr-defined]
-                    add_port(info.device)
-        else:
-            # Fallback: check common Linux patterns
-            for dev in glob.glob("/dev/ttyUSB*") + glob.glob("/dev/ttyACM*"):
-                add_port(dev)
-    except Exception as exc:  # noqa: BLE001
-        print(f"Warning: failed to enumerate serial ports: {exc}")
-    return ports
+def list_serial_ports() -> list[str]:
+    """Ports from the watcher's cached inventory; enumeration happens on the watcher thread."""
+    return PORT_WATCHER.devices()
+
+
+class LogRing:
+    """Bounded log buffer where every line carries a monotonically increasing sequence number."""
+
+    def __init__(self, max_lines: int) -> None:
+        self._lines: collections.deque[str] = collections.deque(maxlen=max(1, max_lines))
+        self.next_seq = 0
+
+    @property
+    def first_seq(self) -> int:
+        return self.next_seq - len(self._lines)
+
+    def append(self, line: str) -> None:
+        self._lines.append(line)
+        self.next_seq += 1
+
+    def reset(self, lines: list[str]) -> None:
+        self._lines.clear()
+        for line in lines:
+            self.append(line)
+
+    def since(self, seq: int) -> tuple[list[str], bool]:
+        """Return lines numbered >= seq and whether older lines were already dropped."""
+        first = self.first_seq
+        truncated = seq < first
+        skip = max(0, seq - first)
+        return list(itertools.islice(self._lines, skip, None)), truncated
+
+    def text(self) -> str:
+        return "\n".join(self._lines)
+
+
+class FlashJob:
+    """Status and log buffer for the flash running on a single serial port."""
+
+    def __init__(self, port_key: str, max_lines: int) -> None:
+        self.port_key = port_key
+        self.busy = False
+        self.run = 0
+        self.revision = 0
+        self.serial_label = ""
+        self.mac = ""
+        self.rework = False
+        self.identity_warning = ""
+        self.status_code = "ready"
+        self.status_message = "Ready to flash Flex Plus"
+        self.logs = LogRing(max_lines)
+        self.transcript: transcripts.TranscriptWriter | None = None
+        self.progress: flash_progress.ProgressTracker | None = None
+
+    def summary(self) -> dict[str, object]:
+        return {
+            "port": self.port_key,
+            "serial": self.serial_label,
+            "busy": self.busy,
+            "status": {"code": self.status_code, "message": self.status_message},
+            "progress": self.progress.snapshot() if self.progress is not None else None,
+        }
 
 
 class FlashManager:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_jobs: int = MAX_PARALLEL_JOBS,
+        history: flash_history.HistoryStore | None = None,
+        transcript_store: transcripts.TranscriptStore | None = None,
+    ) -> None:
+        self._history = history
+        self._transcripts = transcript_store
+        self._devices: device_registry.DeviceRegistry | None = None
+        self._metrics = flash_metrics.StageMetrics()
         self._lock = threading.Lock()
-        self._busy = False
-        self._status_code = "ready"
-        self._status_message = "Ready to flash Flex Plus"
-        self._logs: list[str] = []
+        self._changed = threading.Condition(self._lock)
+        self._jobs: dict[str, FlashJob] = {}
+        self._starting: dict[str, str] = {}
         self._max_lines = 600
+        self._max_jobs = max(1, max_jobs)
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._max_jobs, thread_name_prefix="flash-job"
+        )
+        self._running = 0
+        self._baud_profile = baud_profile.BaudProfile()
+        self.updater: release_updater.ReleaseUpdater | None = None
+        self._listeners: list[Callable[[], None]] = []
+        self.provisioner: wifi_provision.ProvisionQueue | None = None
+        self.coordinator: coordinator.CoordinatorClient | None = None
+        self.startup: StartupTasks | None = None
+
+    def attach_history(self, history: flash_history.HistoryStore | None) -> None:
+        self._history = history
+
+    def attach_transcripts(self, transcript_store: transcripts.TranscriptStore | None) -> None:
+        self._transcripts = transcript_store
+
+    def attach_devices(self, registry: device_registry.DeviceRegistry | None) -> None:
+        self._devices = registry
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """callback() runs, under the manager lock, whenever a job changes; it must not block."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    @property
+    def history(self) -> flash_history.HistoryStore | None:
+        return self._history
+
+    @property
+    def transcripts(self) -> transcripts.TranscriptStore | None:
+        return self._transcripts
+
+    @property
+    def devices(self) -> device_registry.DeviceRegistry | None:
+        return self._devices
+
+    def idle(self) -> bool:
+        with self._lock:
+            return self._running == 0
+
+    def busy(self, port: str | None) -> bool:
+        with self._lock:
+            job = self._jobs.get(self.port_key(port))
+            return job is not None and job.busy
+
+    def release_dir(self) -> Path:
+        return self.updater.active_release_dir() if self.updater is not None else RELEASE_DIR
 
-    def start(self, batch: int, year: int, month: int, serial: int, port: str | None) -> tuple[bool, str]:
+    def metrics_text(self) -> str:
+        with self._lock:
+            gauges = {"flex_jobs_active": self._running, "flex_jobs_max": self._max_jobs}
+        return self._metrics.render(gauges)
+
+    @staticmethod
+    def port_key(port: str | None) -> str:
+        return port or AUTO_PORT_KEY
+
+    def start(
+        self,
+        batch: int,
+        year: int,
+        month: int,
+        serial: int,
+        port: str | None,
+        rework: bool = False,
+        prepared: PreparedUnit | None = None,
+        on_finish: Callable[[bool], None] | None = None,
+    ) -> tuple[bool, str]:
+        waiting = self.startup.waiting_for() if self.startup is not None else []
+        if waiting:
+            return False, f"The station is still starting up ({', '.join(waiting)}); try again in a moment."
         try:
-            unit = PASSWORD_DB.lookup(batch, serial, year, month)
+            unit = UNIT_STORE.lookup(batch, serial, year, month)
         except ValueError as exc:
             return False, str(exc)
         serial_label = str(unit["serial"])
         year_value = int(unit["year"])
         month_value = int(unit["month"])
+        key = self.port_key(port)
+        lease_key = coordinator.LeaseKey(batch, year_value, month_value)
+        with self._lock:
+            conflict = self._start_conflict_locked(key, serial_label)
+            if conflict is not None:
+                return False, conflict
+            # The claim below runs outside the lock; holding the port and serial keeps a second
+            # start from passing these checks meanwhile, so a claimed lease is never turned away.
+            self._starting[key] = serial_label
+        if self.coordinator is not None and not rework and not self._flashed_here(serial_label):
+            # Reworked units were leased when first flashed; new ones must be this station's to flash.
+            # A serial this station's registry already holds is checked against the board at connect.
+            try:
+                self.coordinator.claim(lease_key, serial)
+            except BaseException as exc:
+                with self._lock:
+                    del self._starting[key]
+                if isinstance(exc, coordinator.CoordinatorError):
+                    return False, str(exc)
+                raise
 
         with self._lock:
-            if self._busy:
-                return False, "Flash already in progress."
-            self._busy = True
-            self._status_code = "flashing"
-            self._status_message = f"Flashing {serial_label}..."
-            self._logs = [
-                f"Starting flash for batch {batch:02d} serial {serial:04d} ({year_value:02d}/{month_value:02d})",
-                f"SSID: {unit['ssid']}",
-            ]
-
-        thread = threading.Thread(target=self._run_flash, args=(unit, port), daemon=True)
-        thread.start()
+            del self._starting[key]
+            job = self._jobs.get(key)
+            if job is None:
+                job = FlashJob(key, self._max_lines)
+                self._jobs[key] = job
+            job.busy = True
+            job.serial_label = serial_label
+            job.mac = ""
+            job.rework = rework
+            job.identity_warning = ""
+            job.progress = flash_progress.ProgressTracker()
+            job.status_code = "flashing"
+            if self._running >= self._max_jobs:
+                job.status_message = f"Queued {serial_label} (all {self._max_jobs} slots busy)..."
+            else:
+                job.status_message = f"Flashing {serial_label}..."
+            job.run += 1
+            job.logs.reset(
+                [
+                    f"Starting flash for batch {batch:02d} serial {serial:04d} ({year_value:02d}/{month_value:02d})",
+                    f"SSID: {unit['ssid']}",
+                    *(["Rework: only regions whose on-device digest differs are rewritten."] if rework else []),
+                ]
+            )
+            self._running += 1
+            self._notify_locked(job)
+
+        if self.coordinator is not None:
+            on_finish = self._report_to_coordinator(job, lease_key, serial, port, on_finish)
+        self._pool.submit(self._run_flash, job, unit, port, rework, prepared, on_finish)
         return True, "Flash started."
 
-    def _append_log(self, message: str) -> None:
+    def _start_conflict_locked(self, key: str, serial_label: str) -> str | None:
+        busy = {k: job.serial_label for k, job in self._jobs.items() if job.busy}
+        busy.update(self._starting)
+        if key in busy:
+            return f"Flash already in progress on {key}."
+        if busy and (key == AUTO_PORT_KEY or AUTO_PORT_KEY in busy):
+            return "Select a serial port for each fixture to flash several units at once."
+        for other_key, other_serial in busy.items():
+            if other_serial == serial_label:
+                return f"{serial_label} is already being flashed on {other_key}."
+        return None
+
+    def _flashed_here(self, serial_label: str) -> bool:
+        if self._devices is None:
+            return False
+        try:
+            return self._devices.by_serial(serial_label) is not None
+        except sqlite3.Error:
+            return False
+
+    def _report_to_coordinator(
+        self,
+        job: FlashJob,
+        lease_key: coordinator.LeaseKey,
+        serial: int,
+        port: str | None,
+        on_finish: Callable[[bool], None] | None,
+    ) -> Callable[[bool], None]:
+        client = self.coordinator
+        assert client is not None
+        serial_label = job.serial_label
+        started = time.monotonic()
+        client.job_started(lease_key, serial, serial_label, self.port_key(port))
+
+        def finished(success: bool) -> None:
+            seconds = time.monotonic() - started
+            client.job_finished(lease_key, serial, serial_label, self.port_key(port), success, seconds, job.mac or None)
+            if on_finish is not None:
+                on_finish(success)
+
+        return finished
+
+    def _notify_locked(self, job: FlashJob) -> None:
+        job.revision += 1
+        self._changed.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def _append_log(self, job: FlashJob, message: str) -> None:
         sanitized = ANSI_ESCAPE.sub("", message.replace("\r", ""))
+        finished = None
+        with self._lock:
+            # `Writing at` lines only update the job's progress record; the transcript keeps them all.
+            if job.progress is not None:
+                is_progress, finished = job.progress.feed(sanitized)
+            else:
+                is_progress = flash_progress.is_progress_line(sanitized)
+            if not is_progress:
+                job.logs.append(sanitized)
+            transcript = job.transcript
+            self._notify_locked(job)
+        if transcript is not None:
+            transcript.write(sanitized)
+        if finished is not None:
+            self._metrics.observe_write(finished[1], finished[2])
+
+    def _track_regions(self, job: FlashJob, plan: flash_plan.FlashPlan) -> None:
+        regions = [flash_progress.Region(region.name, region.offset, region.size) for region in plan.write_regions()]
         with self._lock:
-            self._logs.append(sanitized)
-            if len(self._logs) > self._max_lines:
-                self._logs = self._logs[-self._max_lines :]
+            if job.progress is not None:
+                job.progress.set_regions(regions)
 
-    def _run_flash(self, unit: dict[str, object], port: str | None) -> None:
+    def _open_transcript(self, job: FlashJob, serial: str, port: str | None, started_at: float) -> None:
+        if self._transcripts is None:
+            return
+        try:
+            transcript = self._transcripts.open(serial, port or AUTO_PORT_KEY, started_at)
+        except (OSError, sqlite3.Error) as exc:
+            self._append_log(job, f"Warning: unable to open the unit transcript: {exc}")
+            return
+        with self._lock:
+            lines = job.logs.text().splitlines()
+            job.transcript = transcript
+        for line in lines:
+            transcript.write(line)
+
+    def _close_transcript(self, job: FlashJob, status: str) -> None:
+        with self._lock:
+            transcript, job.transcript = job.transcript, None
+        if transcript is None:
+            return
+        try:
+            transcript.close(status, job.mac or None)
+        except (OSError, sqlite3.Error) as exc:
+            print(f"Warning: unable to finish the transcript of {job.serial_label}: {exc}", file=sys.stderr)
+
+    def _check_device(self, job: FlashJob, mac: str) -> bool:
+        """Check the connected chip against the identity registry; True when the job becomes a rework."""
+        job.mac = mac
+        if self._devices is None or not mac:
+            return False
+        try:
+            verdict = self._devices.check(mac, job.serial_label)
+        except (ValueError, sqlite3.Error) as exc:
+            self._append_log(job, f"Warning: device registry unavailable: {exc}")
+            return False
+        if verdict.conflict:
+            with self._lock:
+                job.identity_warning = verdict.message
+            if device_registry.BLOCK_CONFLICTS:
+                raise flash_engine.FlashEngineError(
+                    f"{device_registry.CONFLICT_NOTE} {verdict.message} Nothing was written;"
+                    " set FLEX_DEVICE_CONFLICTS=warn to flash anyway."
+                )
+            self._append_log(job, f"Warning: {device_registry.CONFLICT_NOTE} {verdict.message}")
+            return False
+        if verdict.status == "known" and not job.rework:
+            self._append_log(
+                job, f"{verdict.message} {device_registry.REWORK_NOTE}: only regions whose digest differs are rewritten."
+            )
+            with self._lock:
+                job.rework = True
+            return True
+        return False
+
+    def _record_device(self, job: FlashJob, serial: str, release: str | None) -> None:
+        if self._devices is None or not job.mac:
+            return
+        try:
+            self._devices.record(job.mac, serial, release, STATION_NAME)
+        except (ValueError, sqlite3.Error) as exc:
+            self._append_log(job, f"Warning: unable to record the board in the device registry: {exc}")
+
+    def _stage_done(self, stages: dict[str, float], name: str, seconds: float, ok: bool) -> None:
+        # Stages such as port_wait can run more than once per unit; the history keeps the total.
+        stages[name] = round(stages.get(name, 0.0) + seconds, 3)
+        self._metrics.observe(name, seconds, ok)
+
+    def _run_engine(
+        self,
+        job: FlashJob,
+        plan: flash_plan.FlashPlan,
+        port: str,
+        factory_image: Path,
+        rework: bool,
+        stages: dict[str, float],
+    ) -> bool:
+        write_regions = plan.write_regions()
+        regions = [
+            (region.offset, factory_image if region.name == flash_plan.FACTORY_CFG else region.path)
+            for region in write_regions
+        ]
+        digests = {region.path: region.md5 for region in write_regions}
+        if VERIFY_FLASH:
+            digests[factory_image] = flash_engine.file_md5(factory_image)
+        self._append_log(job, f"Flashing {plan.version} to {port} over one esptool session.")
+        negotiate = FLASH_BAUD == "auto"
+        adapter = baud_profile.adapter_key(port, PORT_WATCHER.ports()) if negotiate else ""
+        rates = self._baud_profile.candidates(adapter) if negotiate else [int(FLASH_BAUD)]
+        if negotiate:
+            self._append_log(job, f"Baud rates for this adapter: {' '.join(map(str, rates))}")
+        for index, baud in enumerate(rates):
+            try:
+                job.mac = flash_engine.flash_unit(
+                    port,
+                    regions,
+                    FLASH_ENCRYPTION_KEY_PATH,
+                    differential=rework,
+                    digests=digests,
+                    baud=baud,
+                    log=lambda message: self._append_log(job, message),
+                    on_stage=lambda name, seconds, ok: self._stage_done(stages, name, seconds, ok),
+                    verify=VERIFY_FLASH,
+                    on_connect=lambda mac: self._check_device(job, mac),
+                )
+            except flash_engine.FlashEngineError as exc:
+                self._append_log(job, f"Error: {exc}")
+                if not negotiate or not baud_profile.is_link_error(str(exc)):
+                    return False
+                self._baud_profile.record(adapter, baud, ok=False)
+                if index + 1 < len(rates):
+                    self._append_log(job, f"Link error at {baud} baud; retrying at a lower rate.")
+                continue
+            if negotiate:
+                self._baud_profile.record(adapter, baud, ok=True)
+            return True
+        return False
+
+    def _record_attempt(
+        self,
+        job: FlashJob,
+        port: str | None,
+        release: str | None,
+        rework: bool,
+        started_at: float,
+        stages: dict[str, float],
+        success: bool,
+        status: str | None = None,
+    ) -> None:
+        if self._history is None:
+            return
+        try:
+            self._history.record(
+                job.serial_label,
+                status or ("success" if success else "failed"),
+                started_at,
+                finished_at=time.time(),
+                mac=job.mac or None,
+                port=port or AUTO_PORT_KEY,
+                release=release,
+                rework=rework,
+                stages=stages,
+                message=job.status_message,
+            )
+        except sqlite3.Error as exc:
+            self._append_log(job, f"Warning: unable to record the attempt in flash history: {exc}")
+
+    def _run_flash(
+        self,
+        job: FlashJob,
+        unit: dict[str, object],
+        port: str | None,
+        rework: bool,
+        prepared: PreparedUnit | None = None,
+        on_finish: Callable[[bool], None] | None = None,
+    ) -> None:
         success = False
         serial_suffix = str(unit["serial"])
         password = str(unit["password"])
+        factory_image: Path | None = None
+        started_at = time.time()
+        stage_start = time.monotonic()
+        stages: dict[str, float] = {}
+        release: str | None = None
+        with self._lock:
+            job.status_message = f"Flashing {serial_suffix}..."
+            self._notify_locked(job)
+        self._open_transcript(job, serial_suffix, port, started_at)
         try:
-            command, workdir = build_flash_command(serial_suffix, password, port)
+            release_dir = self.release_dir()
+            if prepared is not None and (prepared.release_dir != release_dir or prepared.serial != serial_suffix):
+                prepared.discard()
+                prepared = None
+            if prepared is None:
+                prepared = prepare_unit(unit, release_dir)
+            else:
+                self._append_log(job, "Using the unit prepared while the previous one was flashing.")
+            plan = prepared.plan
+            factory_pack = prepared.factory_pack
+            factory_image = prepared.factory_image
+            release = plan.version
+            if plan.errors:
+                for error in plan.errors:
+                    self._append_log(job, f"Verification error: {error}")
+                raise ValueError(f"flash plan for release {plan.version} failed verification")
+            for note in prepared.notes:
+                self._append_log(job, note)
+            self._track_regions(job, plan)
+            self._stage_done(stages, "prepare", time.monotonic() - stage_start, True)
+            stage_start = time.monotonic()
+            if factory_image and port and FLASH_ENGINE_MODE != "script" and flash_engine.available():
+                success = self._run_engine(job, plan, port, factory_image, rework, stages)
+                self._stage_done(stages, "flash", time.monotonic() - stage_start, success)
+                return
+            command, workdir = build_flash_command(
+                serial_suffix, password, port, factory_pack, factory_image, differential=rework
+            )
             command_display = " ".join(shlex.quote(part) for part in command[:-1] + ["******"])
-            self._append_log(f"Command: {command_display}")
+            self._append_log(job, f"Command: {command_display}")
+            env = dict(os.environ)
+            env["FLEX_RELEASE_DIR"] = str(release_dir)
+            if self._history is not None:
+                env["FLEX_HISTORY_EXTERNAL"] = "1"
+            if self.provisioner is not None:
+                env["FLEX_WIFI_PROVISION"] = "0"  # Provisioned by this GUI's workers once the script exits.
             process = subprocess.Popen(
                 command,
                 cwd=str(workdir),
@@ -735,66 +1639,347 @@ class FlashManager:
                 stderr=subprocess.STDOUT,
                 text=True,
                 bufsize=1,
+                env=env,
             )
             assert process.stdout is not None
+            open_stages: dict[str, float] = {}
             for line in process.stdout:
-                self._append_log(line.rstrip())
+                marker = flash_metrics.STAGE_MARKER.match(line.strip())
+                if marker:
+                    if job.transcript is not None:
+                        job.transcript.write(line)
+                    name = marker.group("name")
+                    if marker.group("event") == "start":
+                        open_stages[name] = time.monotonic()
+                    elif name in open_stages:
+                        seconds = time.monotonic() - open_stages.pop(name)
+                        self._stage_done(stages, name, seconds, marker.group("result") != "failed")
+                    continue
+                if not job.mac:
+                    match = efuse_registry.MAC_RE.search(line)
+                    if match:
+                        job.mac = match.group(1).lower()
+                if device_registry.REWORK_NOTE in line:
+                    job.rework = True
+                elif device_registry.CONFLICT_NOTE in line:
+                    job.identity_warning = line.split(device_registry.CONFLICT_NOTE, 1)[1].strip()
+                self._append_log(job, line.rstrip())
             success = process.wait() == 0
+            for name, started in open_stages.items():
+                self._stage_done(stages, name, time.monotonic() - started, False)
+            self._stage_done(stages, "flash", time.monotonic() - stage_start, success)
         except FileNotFoundError as exc:
-            self._append_log(f"Error: {exc}")
+            self._append_log(job, f"Error: {exc}")
         except Exception as exc:  # noqa: BLE001
-            self._append_log(f"Error launching flash: {exc}")
+            self._append_log(job, f"Error launching flash: {exc}")
         finally:
+            if factory_image:
+                factory_image.unlink(missing_ok=True)
             final_message = "Flash completed successfully." if success else "Flash failed. Check above logs."
             with self._lock:
-                self._busy = False
+                job.busy = False
+                self._running -= 1
+                if job.progress is not None:
+                    job.progress.finish(success)
                 if success:
-                    self._status_code = "success"
-                    self._status_message = f"Successfully flashed {serial_suffix}."
+                    job.status_code = "success"
+                    job.status_message = f"Successfully flashed {serial_suffix}."
+                    if job.identity_warning:
+                        job.status_message += f" Warning: {job.identity_warning}"
+                elif job.identity_warning:
+                    job.status_code = "failed"
+                    job.status_message = f"Not flashed: {job.identity_warning}"
                 else:
-                    self._status_code = "failed"
-                    self._status_message = f"Failed flashing {serial_suffix}. Retry."
-            self._append_log(final_message)
-
-    def state(self) -> dict[str, object]:
+                    job.status_code = "failed"
+                    job.status_message = f"Failed flashing {serial_suffix}. Retry."
+                self._notify_locked(job)
+            self._append_log(job, final_message)
+            self._metrics.unit_finished(success)
+            provision = success and self.provisioner is not None
+            self._record_attempt(
+                job, port, release, job.rework, started_at, stages, success, status="wifi_pending" if provision else None
+            )
+            if success:
+                self._record_device(job, serial_suffix, release)
+            if provision:
+                summary = plan.summary()
+                self.provisioner.submit(
+                    wifi_provision.ProvisionTask(
+                        serial_suffix,
+                        password,
+                        str(summary["factory_ssid"]),
+                        str(summary["ap_password"]),
+                        str(summary["target_ip"]),
+                        started_at,
+                    )
+                )
+                self._append_log(job, "Wi-Fi provisioning queued; the fixture is free for the next unit.")
+            self._close_transcript(job, "success" if success else "failed")
+            if on_finish is not None:
+                on_finish(success)
+
+    def state(self, port: str | None = None) -> dict[str, object]:
+        key = self.port_key(port)
         with self._lock:
+            job = self._jobs.get(key)
+            selected = job.summary() if job else FlashJob(key, 0).summary()
             return {
-                "status": {"code": self._status_code, "message": self._status_message},
-                "busy": self._busy,
-                "logs": "\n".join(self._logs),
+                "port": key,
+                "status": selected["status"],
+                "busy": selected["busy"],
+                "jobs": [self._jobs[k].summary() for k in sorted(self._jobs)],
+                "active_jobs": self._running,
+                "max_jobs": self._max_jobs,
                 "manifest": MANIFEST_INFO,
                 "flow_version": FLOW_VERSION,
                 "flow_revision": FLOW_REVISION,
+                "release_update": self.updater.status() if self.updater is not None else None,
+                "units": UNIT_STORE.status(),
+                "provisioning": self.provisioner.summary() if self.provisioner is not None else None,
+                "coordinator": self.coordinator.status() if self.coordinator is not None else None,
+                "startup": self.startup.summary() if self.startup is not None else None,
             }
 
+    def logs_since(self, port: str | None, run: int, rev: int, seq: int, timeout: float) -> dict[str, object]:
+        """Long-poll a port's job until it changes from the caller's (run, rev) cursor.
 
-class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
-    manager: ClassVar[FlashManager]
+        Only log lines numbered >= seq are returned, so the response size does not grow with the log.
+        """
+        key = self.port_key(port)
+        deadline = time.monotonic() + max(0.0, min(timeout, LOG_POLL_MAX_WAIT))
+        with self._lock:
+            while True:
+                job = self._jobs.get(key)
+                if job is not None and (job.run != run or job.revision != rev):
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            if job is None:
+                return {**FlashJob(key, 0).summary(), "run": 0, "rev": 0, "seq": 0, "reset": False, "lines": []}
+            reset = job.run != run
+            lines, truncated = job.logs.since(0 if reset else seq)
+            return {
+                **job.summary(),
+                "run": job.run,
+                "rev": job.revision,
+                "seq": job.logs.next_seq,
+                "reset": reset or truncated,
+                "lines": lines,
+            }
 
-    def do_GET(self) -> None:
-        if self.path == "/" or self.path.startswith("/?"):
-            self._send_response(200, INDEX_HTML.encode("utf-8"), "text/html; charset=utf-8")
-        elif self.path.startswith("/state"):
-            payload = json.dumps(self.manager.state()).encode("utf-8")
-            self._send_response(200, payload, "application/json")
-        elif self.path.startswith("/lookup"):
-            self._handle_lookup()
-        elif self.path.startswith("/ports"):
-            ports = list_serial_ports()
-            payload = json.dumps({"ok": True, "ports": ports}).encode("utf-8")
-            self._send_response(200, payload, "application/json")
-        elif self.path.startswith("/download-mode-image"):
-            self._handle_download_image()
-        else:
-            self.send_error(404, "Not found")
 
-    def do_POST(self) -> None:
-        if self.path != "/flash":
-            self.send_error(404, "Not found")
+def _discard_prepared(future: concurrent.futures.Future[PreparedUnit | None]) -> None:
+    prepared = future.result()
+    if prepared is not None:
+        prepared.discard()
+
+
+class ProductionRunner:
+    """Works through the production queue: starts each port's next unit once a fresh board is attached.
+
+    While unit N flashes, unit N+1's plan, payload and encrypted factory image are prepared on a
+    background worker, so the next start only has to connect and write.
+    """
+
+    def __init__(self, manager: FlashManager, queue: production_queue.ProductionQueue) -> None:
+        self.manager = manager
+        self.queue = queue
+        self._lock = threading.Lock()
+        self._prepared: dict[str, tuple[int, concurrent.futures.Future[PreparedUnit | None]]] = {}
+        self._prep_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="prepare")
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            PORT_WATCHER.subscribe(self._port_event)
+            self._thread = threading.Thread(target=self._loop, name="production-queue", daemon=True)
+            self._thread.start()
+
+    def _port_event(self, event: dict[str, object]) -> None:
+        if event["event"] == "remove":
+            # The flashed board is gone; the next one may be attached.
+            self.queue.board_swapped(str(event["port"]["device"]))
+        self.wake()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def add(self, run: production_queue.QueueRun) -> None:
+        UNIT_STORE.lookup(run.batch, run.first, run.year, run.month)
+        UNIT_STORE.lookup(run.batch, run.last, run.year, run.month)
+        self.queue.add(run)
+        self.wake()
+
+    def remove(self, port: str) -> None:
+        self.queue.remove(port)
+        self._drop_prepared(port)
+
+    def proceed(self, port: str) -> None:
+        """Start the next unit without waiting for the port to drop (fixtures whose adapter stays attached)."""
+        self.queue.board_swapped(port)
+        self.wake()
+
+    def skip(self, port: str) -> None:
+        self.queue.skip(port)
+        self.wake()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(QUEUE_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self._tick()
+            except Exception as exc:  # noqa: BLE001
+                print(f"Warning: production queue step failed: {exc}")
+
+    def _tick(self) -> None:
+        runs = self.queue.runs()
+        if not runs:
             return
-        length = int(self.headers.get("Content-Length", "0"))
-        body = self.rfile.read(length).decode("utf-8")
-        data = urllib.parse.parse_qs(body)
+        present = set(list_serial_ports())
+        for run in runs:
+            if run.port not in present:
+                self.queue.board_swapped(run.port)
+                continue
+            if run.awaiting_swap or self.manager.busy(run.port):
+                continue
+            self._start_unit(run)
+
+    def _start_unit(self, run: production_queue.QueueRun) -> None:
+        serial = run.next_serial
+        prepared = self._take_prepared(run.port, serial)
+
+        def finished(success: bool) -> None:
+            self.queue.finished(run.port, serial, success)
+            self.wake()
+
+        ok, message = self.manager.start(
+            run.batch, run.year, run.month, serial, run.port, run.rework, prepared=prepared, on_finish=finished
+        )
+        if not ok:
+            if prepared is not None:
+                prepared.discard()
+            print(f"Warning: production queue on {run.port} could not start serial {serial}: {message}")
+            return
+        if serial < run.last:
+            self._prepare_ahead(run, serial + 1)
+
+    def _prepare_ahead(self, run: production_queue.QueueRun, serial: int) -> None:
+        release_dir = self.manager.release_dir()
+
+        def build() -> PreparedUnit | None:
+            try:
+                return prepare_unit(UNIT_STORE.lookup(run.batch, serial, run.year, run.month), release_dir)
+            except Exception as exc:  # noqa: BLE001
+                print(f"Warning: preparing serial {serial} ahead failed: {exc}")
+                return None
+
+        with self._lock:
+            entry = self._prepared.get(run.port)
+            if entry is not None and entry[0] == serial:
+                return
+        self._drop_prepared(run.port)
+        with self._lock:
+            self._prepared[run.port] = (serial, self._prep_pool.submit(build))
+
+    def _take_prepared(self, port: str, serial: int) -> PreparedUnit | None:
+        with self._lock:
+            entry = self._prepared.get(port)
+            if entry is None or entry[0] != serial:
+                return None
+            del self._prepared[port]
+        return entry[1].result()
+
+    def _drop_prepared(self, port: str) -> None:
+        with self._lock:
+            entry = self._prepared.pop(port, None)
+        if entry is not None:
+            entry[1].add_done_callback(_discard_prepared)
+
+
+def _query(target: str) -> dict[str, list[str]]:
+    return urllib.parse.parse_qs(urllib.parse.urlparse(target).query)
+
+
+def _json(payload: dict[str, object], status: int = 200) -> async_http.Response:
+    return async_http.Response(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+
+INDEX_ASSET = async_http.StaticAsset(INDEX_HTML.encode("utf-8"), "text/html; charset=utf-8")
+_download_image: tuple[Path, int, async_http.StaticAsset] | None = None
+
+
+def download_image_asset() -> async_http.StaticAsset | None:
+    """The download-mode PNG, read once and kept in memory until the file changes."""
+    global _download_image
+    path = next((p for p in DOWNLOAD_MODE_IMAGE_CANDIDATES if p.exists()), None)
+    if path is None:
+        return None
+    mtime = path.stat().st_mtime_ns
+    cached = _download_image
+    if cached is None or cached[0] != path or cached[1] != mtime:
+        cached = _download_image = (path, mtime, async_http.StaticAsset(path.read_bytes(), "image/png", compress=False))
+    return cached[2]
+
+
+class FlashApi:
+    """Routes shared by the threaded and asyncio front ends; every handler returns an async_http.Response."""
+
+    LONG_POLL_PATHS = ("/logs", "/port-events")
+
+    def __init__(self, manager: FlashManager, runner: ProductionRunner) -> None:
+        self.manager = manager
+        self.runner = runner
+
+    def get(self, target: str, headers: Mapping[str, str]) -> async_http.Response:
+        path = urllib.parse.urlparse(target).path
+        if path == "/":
+            return INDEX_ASSET.response(headers)
+        if path == "/state":
+            port = _query(target).get("port", [""])[0].strip() or None
+            return _json({**self.manager.state(port), "queue": self.runner.queue.summary()})
+        if path in self.LONG_POLL_PATHS:
+            return self.poll(target, blocking=True)[2]
+        if path == "/queue":
+            return _json({"ok": True, "runs": self.runner.queue.summary()})
+        if path == "/history":
+            return self._history(target)
+        if path == "/metrics":
+            body = self.manager.metrics_text().encode("utf-8")
+            return async_http.Response(200, body, "text/plain; version=0.0.4; charset=utf-8")
+        if path == "/lookup_range":
+            return self._lookup_range(target)
+        if path == "/transcript":
+            return self._transcript(target, headers)
+        if path == "/lookup":
+            return self._lookup(target)
+        if path == "/device":
+            return self._device(target)
+        if path == "/next_serial":
+            return self._next_serial(target)
+        if path == "/ports":
+            details = [info.to_dict() for info in PORT_WATCHER.ports()]
+            return _json({"ok": True, "ports": [info["device"] for info in details], "details": details})
+        if path == "/download-mode-image":
+            try:
+                asset = download_image_asset()
+            except OSError as exc:
+                return async_http.text_response(500, f"Unable to read download mode image: {exc}")
+            if asset is None:
+                return async_http.text_response(404, "Download mode image not found")
+            return asset.response(headers)
+        return async_http.text_response(404, "Not found")
+
+    def post(self, target: str, body: bytes) -> async_http.Response:
+        path = urllib.parse.urlparse(target).path
+        if path not in ("/flash", "/queue"):
+            return async_http.text_response(404, "Not found")
+        data = urllib.parse.parse_qs(body.decode("utf-8"))
+        if path == "/queue":
+            return self._queue(data)
         try:
             batch = int(data.get("batch", [""])[0])
             year = int(data.get("year", [""])[0])
@@ -803,80 +1988,337 @@ class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
             port = data.get("port", [""])[0].strip()
             if not port:
                 port = None
+            rework = data.get("rework", ["0"])[0] in ("1", "true", "on")
         except (TypeError, ValueError):
-            self._json_response(
-                {"ok": False, "error": "Batch, year, month, and serial must be integers."},
-                status=400,
-            )
-            return
+            return _json({"ok": False, "error": "Batch, year, month, and serial must be integers."}, status=400)
 
-        ok, message = self.manager.start(batch, year, month, serial, port)
-        status_code = 200 if ok else 400
-        payload = {"ok": ok}
+        ok, message = self.manager.start(batch, year, month, serial, port, rework)
+        payload: dict[str, object] = {"ok": ok}
         if not ok:
             payload["error"] = message
-        self._json_response(payload, status=status_code)
+        return _json(payload, status=200 if ok else 400)
+
+    def poll(self, target: str, blocking: bool = False) -> tuple[bool, float, async_http.Response]:
+        """Answer a long-poll route: (changed, requested wait, response).
+
+        blocking=True waits here for up to the requested time (threaded front end); otherwise the
+        current state is returned at once and the caller waits for a change and asks again.
+        """
+        path = urllib.parse.urlparse(target).path
+        params = _query(target)
+        if path == "/logs":
+            try:
+                port = params.get("port", [""])[0].strip() or None
+                run = int(params.get("run", ["0"])[0] or 0)
+                rev = int(params.get("rev", ["-1"])[0] or -1)
+                seq = int(params.get("since", ["0"])[0] or 0)
+                timeout = min(float(params.get("wait", [str(LOG_POLL_MAX_WAIT)])[0] or 0), LOG_POLL_MAX_WAIT)
+            except (TypeError, ValueError):
+                return True, 0.0, _json({"ok": False, "error": "run, rev, since and wait must be numbers."}, status=400)
+            result = self.manager.logs_since(port, run, rev, seq, timeout if blocking else 0.0)
+            changed = result["run"] != run or result["rev"] != rev
+            return changed, timeout, _json({"ok": True, **result})
+        try:
+            since = int(params.get("since", ["0"])[0] or 0)
+            timeout = min(float(params.get("wait", [str(LOG_POLL_MAX_WAIT)])[0] or 0), LOG_POLL_MAX_WAIT)
+        except (TypeError, ValueError):
+            return True, 0.0, _json({"ok": False, "error": "since and wait must be numbers."}, status=400)
+        events, seq = PORT_WATCHER.events_since(since, timeout if blocking else 0.0)
+        return bool(events), timeout, _json({"ok": True, "seq": seq, "events": events, "ports": list_serial_ports()})
+
+    def _queue(self, data: dict[str, list[str]]) -> async_http.Response:
+        action = data.get("action", [""])[0]
+        port = data.get("port", [""])[0].strip()
+        if not port:
+            return _json({"ok": False, "error": "Select the serial port the run is for."}, status=400)
+        try:
+            if action == "add":
+                batch = int(data.get("batch", [""])[0])
+                run = production_queue.QueueRun(
+                    port,
+                    batch,
+                    int(data.get("year", [""])[0]),
+                    int(data.get("month", [""])[0]),
+                    int(data.get("first", [""])[0]),
+                    int(data.get("last", [""])[0]),
+                    rework=data.get("rework", ["0"])[0] in ("1", "true", "on"),
+                )
+                self.runner.add(run)
+            elif action == "remove":
+                self.runner.remove(port)
+            elif action == "next":
+                self.runner.proceed(port)
+            elif action == "skip":
+                self.runner.skip(port)
+            else:
+                raise ValueError(f"Unknown queue action '{action}'.")
+        except (TypeError, ValueError) as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        return _json({"ok": True, "runs": self.runner.queue.summary()})
+
+    def _history(self, target: str) -> async_http.Response:
+        history = self.manager.history
+        if history is None:
+            return _json({"ok": False, "error": "Flash history is unavailable."}, status=503)
+        first = {key: values[0].strip() for key, values in _query(target).items() if values and values[0].strip()}
+        try:
+            filters = {column: first[column] for column in flash_history.FILTER_COLUMNS if column in first}
+            since = flash_history.parse_time(first["since"]) if "since" in first else None
+            until = flash_history.parse_time(first["until"]) if "until" in first else None
+            limit = int(first.get("limit", flash_history.DEFAULT_PAGE_SIZE))
+            rows, next_cursor = history.query(filters, since, until, limit, first.get("cursor"))
+        except (TypeError, ValueError) as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        return _json({"ok": True, "rows": rows, "next_cursor": next_cursor})
+
+    def _transcript(self, target: str, headers: Mapping[str, str]) -> async_http.Response:
+        """A unit's newest transcript by serial and/or MAC (or one by id); list=1 returns the index rows."""
+        store = self.manager.transcripts
+        if store is None:
+            return _json({"ok": False, "error": "Unit transcripts are unavailable."}, status=503)
+        first = {key: values[0].strip() for key, values in _query(target).items() if values and values[0].strip()}
+        listing = first.get("list") in ("1", "true", "on")
+        try:
+            if "id" in first:
+                row = store.get(int(first["id"]))
+                rows = [row] if row else []
+            else:
+                rows = store.find(first.get("serial"), first.get("mac"), int(first.get("limit", 20)) if listing else 1)
+        except (TypeError, ValueError) as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        except sqlite3.Error as exc:
+            return _json({"ok": False, "error": f"transcript index: {exc}"}, status=500)
+        if listing:
+            return _json({"ok": True, "transcripts": rows})
+        if not rows:
+            return async_http.text_response(404, "No transcript recorded for this unit.")
+        row = rows[0]
+        path = store.path_of(row)
+        try:
+            # A finished transcript is one complete gzip member and goes out as stored.
+            if row["status"] != "running" and "gzip" in (headers.get("accept-encoding") or "").lower():
+                return async_http.Response(
+                    200, path.read_bytes(), "text/plain; charset=utf-8", (("Content-Encoding", "gzip"),)
+                )
+            body = transcripts.read_gzip(path)
+        except OSError:
+            return async_http.text_response(404, "The transcript file has been removed.")
+        return async_http.Response(200, body, "text/plain; charset=utf-8")
+
+    def _device(self, target: str) -> async_http.Response:
+        """Rework triage: the board behind ?mac= (or ?serial=) and its attempts from the flash history."""
+        registry = self.manager.devices
+        if registry is None:
+            return _json({"ok": False, "error": "The device registry is unavailable."}, status=503)
+        first = {key: values[0].strip() for key, values in _query(target).items() if values and values[0].strip()}
+        try:
+            if "mac" in first:
+                device = registry.lookup(first["mac"])
+            elif "serial" in first:
+                device = registry.by_serial(first["serial"])
+            else:
+                raise ValueError("mac or serial is required")
+        except ValueError as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        except sqlite3.Error as exc:
+            return _json({"ok": False, "error": f"device registry: {exc}"}, status=500)
+        if device is None:
+            return _json({"ok": False, "error": "No board recorded for this query."}, status=404)
+        attempts: list[dict[str, object]] = []
+        history = self.manager.history
+        if history is not None:
+            try:
+                attempts, _ = history.query({"mac": str(device["mac"])}, limit=20)
+            except (ValueError, sqlite3.Error):
+                attempts = []
+        return _json({"ok": True, "device": device, "attempts": attempts})
 
-    def _handle_lookup(self) -> None:
-        query = urllib.parse.urlparse(self.path).query
-        params = urllib.parse.parse_qs(query)
+    def _lookup(self, target: str) -> async_http.Response:
+        params = _query(target)
         try:
             batch = int(params.get("batch", [""])[0])
             serial = int(params.get("serial", [""])[0])
             year = int(params.get("year", [""])[0])
             month = int(params.get("month", [""])[0])
-            unit = PASSWORD_DB.lookup(batch, serial, year, month)
+            unit = UNIT_STORE.lookup(batch, serial, year, month)
         except (ValueError, TypeError) as exc:
-            self._json_response({"ok": False, "error": str(exc)}, status=400)
-            return
-        self._json_response({"ok": True, **unit})
-
-    def _handle_download_image(self) -> None:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        return _json({"ok": True, **unit})
+
+    def _next_serial(self, target: str) -> async_http.Response:
+        """The next serial the line coordinator has leased to this station for a batch and month."""
+        client = self.manager.coordinator
+        if client is None:
+            return _json({"ok": False, "error": "This station is not attached to a line coordinator."}, status=404)
+        params = _query(target)
         try:
-            path = next((p for p in DOWNLOAD_MODE_IMAGE_CANDIDATES if p.exists()), None)
-            if path is None:
-                self.send_error(404, "Download mode image not found")
-                return
-            data = path.read_bytes()
-        except Exception as exc:  # noqa: BLE001
-            self.send_error(500, f"Unable to read download mode image: {exc}")
-            return
-        self.send_response(200)
-        self.send_header("Content-Type", "image/png")
-        self.send_header("Content-Length", str(len(data)))
-        self.send_header("Cache-Control", "no-store")
-        self.end_headers()
-        self.wfile.write(data)
+            key = coordinator.LeaseKey(
+                int(params.get("batch", [""])[0]), int(params.get("year", [""])[0]), int(params.get("month", [""])[0])
+            )
+            unit_store.validate_year(key.year)
+            unit_store.validate_month(key.month)
+            serial = client.next_serial(key)
+        except (TypeError, ValueError) as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        except coordinator.CoordinatorError as exc:
+            return _json({"ok": False, "error": str(exc)}, status=503)
+        return _json({"ok": True, "serial": serial})
+
+    def _lookup_range(self, target: str) -> async_http.Response:
+        params = _query(target)
+        try:
+            batch = int(params.get("batch", [""])[0])
+            year = int(params.get("year", [""])[0])
+            month = int(params.get("month", [""])[0])
+            first = int(params.get("first", [str(unit_store.SERIAL_MIN)])[0])
+            last = int(params.get("last", [str(unit_store.SERIAL_MAX)])[0])
+            units = UNIT_STORE.lookup_range(batch, year, month, first, last)
+        except (ValueError, TypeError) as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        return _json({"ok": True, "units": units})
+
 
-    def _json_response(self, payload: dict[str, object], status: int = 200) -> None:
-        body = json.dumps(payload).encode("utf-8")
-        self._send_response(status, body, "application/json")
+class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Threaded front end: one thread per connection, kept alive between requests."""
+
+    protocol_version = "HTTP/1.1"
+    api: ClassVar[FlashApi]
+
+    def do_GET(self) -> None:
+        self._send(self.api.get(self.path, {name.lower(): value for name, value in self.headers.items()}))
 
-    def _send_response(self, status: int, body: bytes, content_type: str) -> None:
-        self.send_response(status)
-        self.send_header("Content-Type", content_type)
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Cache-Control", "no-store")
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", "0"))
+        self._send(self.api.post(self.path, self.rfile.read(length)))
+
+    def _send(self, response: async_http.Response) -> None:
+        self.send_response(response.status)
+        if response.body or response.status != 304:
+            self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(response.body)))
+        if not any(name.lower() == "cache-control" for name, _ in response.headers):
+            self.send_header("Cache-Control", "no-store")
+        for name, value in response.headers:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(body)
+        self.wfile.write(response.body)
 
     def log_message(self, format: str, *args: object) -> None:  # noqa: A003
         return
 
 
+def serve_asyncio(api: FlashApi, on_ready: Callable[[str, int], None]) -> None:
+    """Asyncio front end: one event loop for every client; long-polls hold no thread while they wait."""
+    signal = async_http.ChangeSignal()
+    api.manager.add_listener(signal.notify)
+    PORT_WATCHER.subscribe(lambda _event: signal.notify())
+    # Handlers that touch SQLite or start jobs run here, off the event loop.
+    workers = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="http")
+
+    async def handle(request: async_http.Request) -> async_http.Response:
+        loop = asyncio.get_running_loop()
+        if request.method in ("GET", "HEAD") and request.path in FlashApi.LONG_POLL_PATHS:
+            changed, timeout, response = api.poll(request.target)
+            deadline = loop.time() + timeout
+            while not changed and deadline > loop.time():
+                await signal.wait(deadline - loop.time())
+                changed, _, response = api.poll(request.target)
+            return response
+        if request.method in ("GET", "HEAD"):
+            return await loop.run_in_executor(workers, api.get, request.target, request.headers)
+        if request.method == "POST":
+            return await loop.run_in_executor(workers, api.post, request.target, request.body)
+        return async_http.text_response(405, "Method not allowed")
+
+    try:
+        async_http.serve(handle, "127.0.0.1", 0, signal, on_ready)
+    finally:
+        workers.shutdown(wait=False)
+
+
+def start_background_init(manager: FlashManager, runner: ProductionRunner) -> StartupTasks:
+    """Everything but the HTTP server: the page comes up at once and reports each task as it finishes."""
+    startup = StartupTasks(on_done=runner.start)
+    manager.startup = startup
+
+    def passwords() -> str:
+        try:
+            return load_password_db()
+        except unit_store.UnitStoreError as exc:
+            print(f"Error: {exc}")
+            raise
+
+    def release() -> str:
+        start_release_updater(manager)
+        return MANIFEST_INFO["version"]
+
+    def history() -> str | None:
+        store = open_history()
+        manager.attach_history(store)
+        manager.attach_devices(open_devices(store))
+        if WIFI_PROVISION:
+            manager.provisioner = wifi_provision.ProvisionQueue(history_path=store.path if store is not None else None)
+            manager.provisioner.start()
+        return None if store is not None else "unavailable"
+
+    def unit_transcripts() -> str | None:
+        store = open_transcripts()
+        manager.attach_transcripts(store)
+        return None if store is not None else "unavailable"
+
+    def revision() -> str:
+        global FLOW_REVISION
+        FLOW_REVISION = detect_flow_revision()
+        return FLOW_REVISION
+
+    def engine() -> str:
+        if FLASH_ENGINE_MODE == "script":
+            return "shell helpers"
+        return "esptool library" if flash_engine.available() else "shell helpers (esptool not importable)"
+
+    startup.add("passwords", passwords)
+    startup.add("release", release)
+    startup.add("history", history)
+    startup.add("transcripts", unit_transcripts)
+    startup.add("flash engine", engine)
+    startup.add("revision", revision, required=False)
+    startup.start()
+    return startup
+
+
 def run_server() -> None:
-    update_production_repo()
-    load_password_db()
+    PORT_WATCHER.start()
     manager = FlashManager()
-    FlashRequestHandler.manager = manager
+    if COORDINATOR_URL:
+        manager.coordinator = coordinator.CoordinatorClient(COORDINATOR_URL, STATION_NAME)
+    runner = ProductionRunner(manager, production_queue.ProductionQueue())
+    api = FlashApi(manager, runner)
+    startup = start_background_init(manager, runner)
+
+    def announce(host: str, port: int) -> None:
+        url = f"http://{host}:{port}/"
+        startup.listening()
+        print(f"Flex Plus flasher listening on {url} ({HTTP_SERVER_MODE})", flush=True)
+        if manager.coordinator is not None:
+            manager.coordinator.station_url = url
+            manager.coordinator.start()
+            print(f"Station {STATION_NAME} takes its serials from the coordinator at {COORDINATOR_URL}", flush=True)
+        if not OPEN_BROWSER:
+            return
+        try:
+            webbrowser.open(url, new=2)
+        except Exception:  # noqa: BLE001
+            print("Opening the browser failed automatically; open the URL above manually.")
+
+    if HTTP_SERVER_MODE == "asyncio":
+        try:
+            serve_asyncio(api, announce)
+        except KeyboardInterrupt:
+            print("\nStopping server...")
+        return
+    FlashRequestHandler.api = api
     server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlashRequestHandler)
-    host, port = server.server_address
-    url = f"http://{host}:{port}/"
-    print(f"Flex Plus flasher listening on {url}")
-    try:
-        webbrowser.open(url, new=2)
-    except Exception:  # noqa: BLE001
-        print("Opening the browser failed automatically; open the URL above manually.")
+    announce(*server.server_address[:2])
     try:
         server.serve_forever()
     except KeyboardInterrupt:
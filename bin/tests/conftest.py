@@ -0,0 +1,12 @@
+"""Shared setup for the production tool tests: bin/tools and bin (flash_gui) are plain script directories."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+TOOLS_DIR = PRODUCTION_DIR / "tools"
+for directory in (PRODUCTION_DIR, TOOLS_DIR):
+    if str(directory) not in sys.path:
+        sys.path.insert(0, str(directory))
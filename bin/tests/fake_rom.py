@@ -0,0 +1,200 @@
+"""A fake ESP32 ROM loader (and flasher stub) behind a pty, for driving esptool without hardware.
+
+FakeEsp32 speaks the serial protocol esptool uses: SLIP framed commands for sync, register
+reads and writes, RAM download (the stub upload, answered with the stub's OHAI greeting), baud
+changes, plain and deflated flash writes and on-chip MD5s. eFuse registers are served by
+espefuse's own ESP32 eFuse controller emulation, so reads, batch burns and read protection behave
+as they do on a chip. The pty has no modem lines, so connect with --before no-reset and leave
+with --after no-reset.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import select
+import struct
+import threading
+import tty
+import zlib
+
+from espefuse.efuse.esp32.emulate_efuse_controller import EmulateEfuseController
+
+SLIP_END, SLIP_ESC, SLIP_ESC_END, SLIP_ESC_ESC = 0xC0, 0xDB, 0xDC, 0xDD
+
+SYNC, WRITE_REG, READ_REG = 0x08, 0x09, 0x0A
+FLASH_BEGIN, FLASH_DATA, FLASH_END = 0x02, 0x03, 0x04
+MEM_BEGIN, MEM_END, MEM_DATA = 0x05, 0x06, 0x07
+SPI_SET_PARAMS, SPI_ATTACH, CHANGE_BAUDRATE = 0x0B, 0x0D, 0x0F
+FLASH_DEFL_BEGIN, FLASH_DEFL_DATA, FLASH_DEFL_END, SPI_FLASH_MD5 = 0x10, 0x11, 0x12, 0x13
+
+CHIP_DETECT_MAGIC_REG = 0x40001000
+ESP32_MAGIC = 0x00F01D83
+UART_CLKDIV_REG = 0x3FF40014
+XTAL_HZ = 40_000_000
+SPI_CMD_REG = 0x3FF42000
+SPI_USR2_REG = 0x3FF42024
+SPI_W0_REG = 0x3FF42080
+SPI_CMD_USR = 1 << 18
+SPIFLASH_RDID = 0x9F
+# Winbond, 4 MB.
+FLASH_ID = 0x1640EF
+FLASH_SIZE = 4 * 1024 * 1024
+ROM_SYNC_VALUE = 0x20120707
+INVALID_MESSAGE = 0x05
+
+
+class FakeEsp32:
+    """One chip on a pty: port is the path esptool opens. Call close() to stop serving."""
+
+    def __init__(self, mac: str = "24:0a:c4:00:00:01", flash_crypt_cnt: int = 0) -> None:
+        self.efuses = EmulateEfuseController()
+        self.efuses.set_chip_revision(301)
+        mac_bytes = bytes.fromhex(mac.replace(":", ""))
+        self.efuses.direct_write_efuse(1, int.from_bytes(mac_bytes[2:6], "big"))
+        self.efuses.direct_write_efuse(2, int.from_bytes(mac_bytes[0:2], "big"))
+        if flash_crypt_cnt:
+            self.efuses.direct_write_efuse(0, flash_crypt_cnt << 20)
+        self.flash = bytearray(b"\xff" * FLASH_SIZE)
+        self.registers: dict[int, int] = {}
+        self.commands: list[int] = []
+        self.baud = 115200
+        self.stub = False
+        self._write_offset = 0
+        self._inflate: zlib._Decompress | None = None
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="fake-esp32", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self) -> "FakeEsp32":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def flash_crypt_cnt(self) -> int:
+        return (self.efuses.read_efuse(0) >> 20) & 0x7F
+
+    # Serial framing
+
+    def _serve(self) -> None:
+        frame = bytearray()
+        in_frame = escaped = False
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self._master, 4096)
+            except OSError:
+                continue
+            for byte in chunk:
+                if byte == SLIP_END:
+                    if in_frame and frame:
+                        self._dispatch(bytes(frame))
+                    frame.clear()
+                    in_frame = True
+                    escaped = False
+                elif not in_frame:
+                    continue
+                elif escaped:
+                    frame.append(SLIP_END if byte == SLIP_ESC_END else SLIP_ESC)
+                    escaped = False
+                elif byte == SLIP_ESC:
+                    escaped = True
+                else:
+                    frame.append(byte)
+
+    def _send(self, payload: bytes) -> None:
+        encoded = payload.replace(b"\xdb", b"\xdb\xdd").replace(b"\xc0", b"\xdb\xdc")
+        os.write(self._master, b"\xc0" + encoded + b"\xc0")
+
+    def _reply(self, op: int, value: int = 0, data: bytes = b"", error: int = 0) -> None:
+        # The ROM loader appends four status bytes, the stub two; the first is non-zero on failure.
+        status = bytes([1 if error else 0, error]) + (b"" if self.stub else b"\x00\x00")
+        body = data + status
+        self._send(struct.pack("<BBHI", 1, op, len(body), value) + body)
+
+    # Commands
+
+    def _dispatch(self, packet: bytes) -> None:
+        if len(packet) < 8 or packet[0] != 0:
+            return
+        _, op, size, _ = struct.unpack("<BBHI", packet[:8])
+        data = packet[8 : 8 + size]
+        self.commands.append(op)
+        if op == SYNC:
+            for _ in range(8):
+                self._reply(op, 0 if self.stub else ROM_SYNC_VALUE)
+        elif op == READ_REG:
+            self._reply(op, self._read_reg(struct.unpack("<I", data[:4])[0]))
+        elif op == WRITE_REG:
+            for index in range(0, len(data) - 15, 16):
+                address, value, mask, _ = struct.unpack("<IIII", data[index : index + 16])
+                self._write_reg(address, value, mask)
+            self._reply(op)
+        elif op in (MEM_BEGIN, MEM_DATA, SPI_SET_PARAMS, SPI_ATTACH):
+            self._reply(op)
+        elif op == MEM_END:
+            self._reply(op)
+            _, entry = struct.unpack("<II", data[:8])
+            if entry and not self.stub:
+                self.stub = True
+                self._send(b"OHAI")
+        elif op == CHANGE_BAUDRATE:
+            self._reply(op)
+            self.baud = struct.unpack("<I", data[:4])[0]
+        elif op in (FLASH_BEGIN, FLASH_DEFL_BEGIN):
+            self._write_offset = struct.unpack("<IIII", data[:16])[3]
+            self._inflate = zlib.decompressobj() if op == FLASH_DEFL_BEGIN else None
+            self._reply(op)
+        elif op in (FLASH_DATA, FLASH_DEFL_DATA):
+            length = struct.unpack("<I", data[:4])[0]
+            block = data[16 : 16 + length]
+            if self._inflate is not None:
+                block = self._inflate.decompress(block)
+            self.flash[self._write_offset : self._write_offset + len(block)] = block
+            self._write_offset += len(block)
+            self._reply(op)
+        elif op in (FLASH_END, FLASH_DEFL_END):
+            self._reply(op)
+        elif op == SPI_FLASH_MD5:
+            address, length = struct.unpack("<II", data[:8])
+            digest = hashlib.md5(self.flash[address : address + length])
+            self._reply(op, data=digest.digest() if self.stub else digest.hexdigest().encode())
+        else:
+            self._reply(op, error=INVALID_MESSAGE)
+
+    def _is_efuse(self, address: int) -> bool:
+        base = self.efuses.REGS.DR_REG_EFUSE_BASE
+        return base <= address < base + self.efuses.REGS.EFUSE_MEM_SIZE or address == self.efuses.REGS.APB_CTL_DATE_ADDR
+
+    def _read_reg(self, address: int) -> int:
+        if address == CHIP_DETECT_MAGIC_REG:
+            return ESP32_MAGIC
+        if address == UART_CLKDIV_REG:
+            return XTAL_HZ // self.baud
+        if self._is_efuse(address):
+            return self.efuses.read_reg(address)
+        return self.registers.get(address, 0)
+
+    def _write_reg(self, address: int, value: int, mask: int) -> None:
+        if self._is_efuse(address):
+            self.efuses.write_reg(address, value, mask)
+            return
+        value = (self.registers.get(address, 0) & ~mask) | (value & mask)
+        if address == SPI_CMD_REG and value & SPI_CMD_USR:
+            # The SPI peripheral runs the command at once; only the flash ID read returns data.
+            if self.registers.get(SPI_USR2_REG, 0) & 0xFFFF == SPIFLASH_RDID:
+                self.registers[SPI_W0_REG] = FLASH_ID
+            value &= ~SPI_CMD_USR
+        self.registers[address] = value
@@ -0,0 +1,159 @@
+"""Device identity registry: verdicts, MAC normalization, upserts, history import and the GUI's connect check."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+import device_registry
+import flash_engine
+import flash_gui
+import flash_history
+
+MAC = "24:0a:c4:12:34:56"
+OTHER_MAC = "24:0a:c4:65:43:21"
+SERIAL = "FP01-26100001"
+OTHER_SERIAL = "FP01-26100002"
+
+requires_engine = pytest.mark.skipif(not flash_engine.available(), reason="esptool v5 and espefuse are not installed")
+
+
+@pytest.fixture
+def registry(tmp_path: Path):
+    with device_registry.DeviceRegistry(tmp_path / "device_registry.sqlite3") as registry:
+        yield registry
+
+
+def test_check_gives_each_verdict(registry):
+    assert registry.check(MAC, SERIAL).status == "new"
+    registry.record(MAC, SERIAL, "v1", "station-a")
+
+    known = registry.check(MAC, SERIAL)
+    assert known.status == "known" and not known.conflict
+    assert known.known_serial == SERIAL
+
+    mac_conflict = registry.check(MAC, OTHER_SERIAL)
+    assert mac_conflict.status == "mac_conflict" and mac_conflict.conflict
+    assert mac_conflict.known_serial == SERIAL
+    assert "station-a" in mac_conflict.message
+
+    serial_conflict = registry.check(OTHER_MAC, SERIAL)
+    assert serial_conflict.status == "serial_conflict" and serial_conflict.conflict
+    assert serial_conflict.known_mac == MAC
+
+
+@pytest.mark.parametrize("value", ["24:0A:C4:12:34:56", "24-0a-c4-12-34-56", "240AC4123456"])
+def test_macs_are_normalized(registry, value):
+    assert device_registry.normalize_mac(value) == MAC
+    registry.record(value, SERIAL)
+    assert registry.lookup(MAC)["mac"] == MAC
+    assert registry.check(value.lower(), SERIAL).status == "known"
+
+
+@pytest.mark.parametrize("value", ["24:0a:c4:12:34", "24:0a:c4:12:34:5g", ""])
+def test_malformed_macs_are_rejected(value):
+    with pytest.raises(ValueError):
+        device_registry.normalize_mac(value)
+
+
+def test_latest_serial_wins(registry):
+    registry.record(MAC, SERIAL, "v1", "station-a", flashed_at=1000.0)
+    registry.record(MAC, OTHER_SERIAL, None, None, flashed_at=2000.0)
+
+    device = registry.lookup(MAC)
+    assert device["serial"] == OTHER_SERIAL
+    assert device["flashes"] == 2
+    assert device["first_flashed_at"] == 1000.0 and device["last_flashed_at"] == 2000.0
+    # Missing release and station keep the earlier values.
+    assert device["release"] == "v1" and device["station"] == "station-a"
+    assert registry.count() == 1
+    assert registry.by_serial(SERIAL) is None
+    assert registry.by_serial(OTHER_SERIAL)["mac"] == MAC
+
+
+def test_import_history_seeds_successful_attempts(registry, tmp_path):
+    history_path = tmp_path / "flash_history.sqlite3"
+    with flash_history.HistoryStore(history_path) as history:
+        history.record(SERIAL, "success", 1000.0, finished_at=1010.0, mac="24-0A-C4-12-34-56", release="v1")
+        history.record(OTHER_SERIAL, "failed", 1100.0, mac=OTHER_MAC)
+        history.record("FP01-26100003", "wired_only", 1200.0, release="v1")
+        history.record("FP01-26100004", "success", 1300.0, mac="not-a-mac")
+        history.record(OTHER_SERIAL, "wifi_success", 1400.0, finished_at=1450.0, mac=OTHER_MAC, release="v2")
+
+    assert registry.import_history(history_path) == 2
+    assert registry.lookup(MAC)["serial"] == SERIAL
+    assert registry.lookup(MAC)["last_flashed_at"] == 1010.0
+    assert registry.lookup(OTHER_MAC)["release"] == "v2"
+    assert registry.count() == 2
+
+
+# FlashManager._check_device on the fake ROM loader
+
+@pytest.fixture
+def images(tmp_path: Path) -> list[tuple[int, Path]]:
+    regions = []
+    for offset, size in ((0x1000, 0x2000), (0x10000, 0x3000)):
+        path = tmp_path / f"region_{offset:x}.bin"
+        path.write_bytes(os.urandom(size))
+        regions.append((offset, path))
+    return regions
+
+
+def _manager_job(registry) -> tuple[flash_gui.FlashManager, flash_gui.FlashJob]:
+    manager = flash_gui.FlashManager()
+    manager.attach_devices(registry)
+    job = flash_gui.FlashJob("fixture", 200)
+    job.serial_label = SERIAL
+    return manager, job
+
+
+def _flash(device, images, tmp_path: Path, lines: list[str], **kwargs) -> str:
+    return flash_engine.flash_unit(
+        device.port,
+        images,
+        kwargs.pop("key_path", None),
+        registry_path=tmp_path / "efuse_registry.sqlite3",
+        log=lines.append,
+        before="no-reset",
+        after="no-reset",
+        **kwargs,
+    )
+
+
+@requires_engine
+def test_known_board_is_reflashed_as_rework(registry, images, tmp_path):
+    from fake_rom import FakeEsp32
+
+    manager, job = _manager_job(registry)
+    registry.record(MAC, SERIAL)
+    with FakeEsp32(mac=MAC) as device:
+        _flash(device, images, tmp_path, [])
+        lines: list[str] = []
+        digests = {path: flash_engine.file_md5(path) for _, path in images}
+        _flash(device, images, tmp_path, lines, digests=digests, on_connect=lambda mac: manager._check_device(job, mac))
+
+    assert job.rework and job.mac == MAC
+    assert device_registry.REWORK_NOTE in job.logs.text()
+    assert sum("digest matches, skipping" in line for line in lines) == len(images)
+    assert not any(line.startswith("Wrote ") for line in lines)
+
+
+@requires_engine
+def test_conflict_in_block_mode_stops_before_any_write(registry, images, tmp_path, monkeypatch):
+    from fake_rom import FakeEsp32
+
+    monkeypatch.setattr(device_registry, "BLOCK_CONFLICTS", True)
+    manager, job = _manager_job(registry)
+    registry.record(MAC, OTHER_SERIAL)
+    key_path = tmp_path / "flash_encryption_key.bin"
+    key_path.write_bytes(os.urandom(32))
+    with FakeEsp32(mac=MAC) as device:
+        with pytest.raises(flash_engine.FlashEngineError, match=device_registry.CONFLICT_NOTE):
+            _flash(device, images, tmp_path, [], key_path=key_path, on_connect=lambda mac: manager._check_device(job, mac))
+        assert device.flash_crypt_cnt() == 0
+        assert device.flash == bytearray(b"\xff" * len(device.flash))
+
+    assert not job.rework
+    assert OTHER_SERIAL in job.identity_warning
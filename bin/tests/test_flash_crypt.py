@@ -0,0 +1,103 @@
+"""flash_crypt must produce espsecure.py's ciphertext byte for byte.
+
+The expected digests were produced with espsecure.py 4.7.0 (`encrypt_flash_data --keyfile K --address A
+--flash_crypt_conf C`) on the deterministic keys and data below; both the cryptography backend and the
+pure-Python AES fallback are checked against them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+import flash_crypt
+
+
+def _stream(seed: str, size: int) -> bytes:
+    out = bytearray()
+    counter = 0
+    while len(out) < size:
+        out += hashlib.sha256(f"{seed}:{counter}".encode()).digest()
+        counter += 1
+    return bytes(out[:size])
+
+
+# (key bytes, address, length, FLASH_CRYPT_CONFIG, sha256 of espsecure's output)
+ESPSECURE_VECTORS = [
+    (16, 0x3F0000, 0x1000, 0xF, "87e732d8f15f64e5d86a167479cd3e709f85ffc59176b91cea4785d4a70edbb8"),
+    (16, 0x1000, 0x400, 0xF, "f07f2cb2638bb556dd56c460bb24525359322e3c68a7e0193e1920f04cabfe2f"),
+    (16, 0x10010, 0x130, 0xF, "502dd48539b49a4df6e1babff6ce2d38874fe6df31c62b76014262ad067cc7df"),
+    (16, 0xE000, 0x200, 0x3, "156bb2a7e7dd193ccfe51a11b6f9b89f021b83c356b4154394bd25d5aa4c423e"),
+    (16, 0x1F0000, 0x800, 0x5, "15ae49742eb48d09b669618318fe11001caa461324ecf674c2c61fb9c3c09b0f"),
+    (16, 0x3FFF00, 0x100, 0xF, "351af34ff76ca0262ba2079b36b4548e53bd27921210c6097d59b3e36bf1ba1d"),
+    (16, 0x290000, 0x100, 0x0, "08fa80a8fe5f6750d5787dbfd9162365bcb338d9beaf2902117e72ba4459dadf"),
+    (24, 0x3F0000, 0x1000, 0xF, "cb43d9c5e0a25196b88b2bcea2cb56bb8dbab2c9866b669820a6aff620c87836"),
+    (24, 0x1000, 0x400, 0xF, "69051add80d5ee51d965efd89858bb702f87b827f10b24b5e1df9b23bc01b38a"),
+    (24, 0x10010, 0x130, 0xF, "cb18e0d415539d9687c3539c29e1d78753eb8ba65efc046bbecd4247fa277de4"),
+    (24, 0xE000, 0x200, 0x3, "778d9018b6b372f381b9afb7df2ecd1fb8fac42690e3c490aaffc7a43ae89ea3"),
+    (24, 0x1F0000, 0x800, 0x5, "dfff236ef39b0a14eaf8d9718b432f40e7886aab515dfbfe62d305f130336e89"),
+    (24, 0x3FFF00, 0x100, 0xF, "49a238db14b3615c8f45fe0383e1d9e83f90685de400a7e91b6c52de15be03f3"),
+    (24, 0x290000, 0x100, 0x0, "beb2807d69dc5fec93613ab50e8da6d393330ba2d6fb7dd5cf89e16e13895703"),
+    (32, 0x3F0000, 0x1000, 0xF, "225b06df9998ea9801fd3304c80546497aaf50573ed8487c1cd4337d2e267be0"),
+    (32, 0x1000, 0x400, 0xF, "e1aadebbcd92f380c5672db63f992b26f2276e530a592e0a5762cc9a97f0e782"),
+    (32, 0x10010, 0x130, 0xF, "88c4b447918e5d01a7374bbd5c85186810aecc35aad5f26fb4e5c217b4d13f65"),
+    (32, 0xE000, 0x200, 0x3, "15874f2521842b830bfc0bb3900a7ea18019f2ffdc62e213ae4ae14598610b8f"),
+    (32, 0x1F0000, 0x800, 0x5, "a2f8e5032341fc6bac0a208276f282d9b02e0439505876592bec0282002cba55"),
+    (32, 0x3FFF00, 0x100, 0xF, "eb1d2855daa7fbc333a56cd34568a40baaf54ba6fd7c4768487052fbcc8d6a7e"),
+    (32, 0x290000, 0x100, 0x0, "0124d26985754ef8532ba40beb40c0907560eba776699667940f5d751bfde7ca"),
+]
+
+BACKENDS = ["cryptography", "pure-python"]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    if request.param == "cryptography":
+        if flash_crypt.Cipher is None:
+            pytest.skip("cryptography is not installed")
+    else:
+        monkeypatch.setattr(flash_crypt, "Cipher", None)
+    return request.param
+
+
+def _key_file(tmp_path: Path, key_length: int) -> Path:
+    path = tmp_path / f"key{key_length}.bin"
+    path.write_bytes(_stream(f"key{key_length}", key_length))
+    return path
+
+
+@pytest.mark.parametrize("key_length, address, size, crypt_config, expected", ESPSECURE_VECTORS)
+def test_matches_espsecure_vectors(backend, tmp_path, key_length, address, size, crypt_config, expected):
+    key = flash_crypt.load_hardware_key(_key_file(tmp_path, key_length))
+    data = _stream(f"data:{address:x}:{size}", size)
+    encrypted = flash_crypt.encrypt_flash_data(key, data, address, crypt_config)
+    assert len(encrypted) == size
+    assert hashlib.sha256(encrypted).hexdigest() == expected
+
+
+def test_encryptor_cache_returns_the_same_ciphertext(tmp_path):
+    key_length, address, size, crypt_config, expected = ESPSECURE_VECTORS[0]
+    encryptor = flash_crypt.FlashEncryptor(flash_crypt.load_hardware_key(_key_file(tmp_path, key_length)), crypt_config)
+    data = _stream(f"data:{address:x}:{size}", size)
+    assert hashlib.sha256(encryptor.encrypt(data, address)).hexdigest() == expected
+    assert hashlib.sha256(encryptor.encrypt(data, address)).hexdigest() == expected
+
+
+def test_rejects_unaligned_input():
+    key = bytes(32)
+    with pytest.raises(ValueError):
+        flash_crypt.encrypt_flash_data(key, bytes(32), 0x1008)
+    with pytest.raises(ValueError):
+        flash_crypt.encrypt_flash_data(key, bytes(20), 0x1000)
+
+
+# espsecure v5 no longer takes 128-bit keys for the ESP32; the pinned vectors above still cover them.
+@pytest.mark.skipif(importlib.util.find_spec("espsecure") is None, reason="espsecure is not installed")
+@pytest.mark.parametrize("key_length", [24, 32])
+def test_live_compare_with_espsecure(tmp_path, key_length):
+    failures = flash_crypt.compare_with_espsecure(_key_file(tmp_path, key_length), [sys.executable, "-m", "espsecure"])
+    assert failures == 0
@@ -0,0 +1,155 @@
+"""flash_engine against the fake ROM loader: eFuse setup, writes, digests and per-job output."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+import flash_engine
+import flash_progress
+
+if not flash_engine.available():
+    pytest.skip("esptool v5 and espefuse are not installed", allow_module_level=True)
+
+from fake_rom import FakeEsp32  # noqa: E402
+
+NO_RESET = {"before": "no-reset", "after": "no-reset"}
+
+
+@pytest.fixture
+def images(tmp_path: Path) -> list[tuple[int, Path]]:
+    regions = []
+    for offset, size in ((0x1000, 0x5000), (0x8000, 0xC00), (0x10000, 0x12000)):
+        path = tmp_path / f"region_{offset:x}.bin"
+        path.write_bytes(os.urandom(size))
+        regions.append((offset, path))
+    return regions
+
+
+@pytest.fixture
+def key_path(tmp_path: Path) -> Path:
+    path = tmp_path / "flash_encryption_key.bin"
+    path.write_bytes(os.urandom(32))
+    return path
+
+
+def _flash(device: FakeEsp32, regions, tmp_path: Path, lines: list[str], **kwargs) -> str:
+    return flash_engine.flash_unit(
+        device.port,
+        regions,
+        kwargs.pop("key_path", None),
+        registry_path=tmp_path / "efuse_registry.sqlite3",
+        log=lines.append,
+        **NO_RESET,
+        **kwargs,
+    )
+
+
+def _written(device: FakeEsp32, offset: int, path: Path) -> bool:
+    return bytes(device.flash[offset : offset + path.stat().st_size]) == path.read_bytes()
+
+
+def test_flashes_encrypted_unit_and_keeps_esptool_output_in_the_job_log(images, key_path, tmp_path, capsys):
+    lines: list[str] = []
+    stages: list[tuple[str, bool]] = []
+    with FakeEsp32(mac="24:0a:c4:12:34:56") as device:
+        mac = _flash(
+            device,
+            images,
+            tmp_path,
+            lines,
+            key_path=key_path,
+            verify=True,
+            on_stage=lambda name, seconds, ok: stages.append((name, ok)),
+        )
+        assert mac == "24:0a:c4:12:34:56"
+        assert device.flash_crypt_cnt() == 1
+        assert all(_written(device, offset, path) for offset, path in images)
+
+    assert stages == [("connect", True), ("efuse_read", True), ("key_burn", True), ("write_flash", True), ("verify", True)]
+    assert capsys.readouterr().out == ""
+    text = "\n".join(lines)
+    assert "Stub flasher running." in text
+    assert "BURN BLOCK1" in text
+    assert any(flash_progress.is_progress_line(line) for line in lines)
+    for offset, path in images:
+        assert f"Wrote {path.stat().st_size} bytes at 0x{offset:08x}" in text
+
+
+def test_encrypted_board_is_decided_from_one_register_read(images, key_path, tmp_path):
+    lines: list[str] = []
+    stages: list[str] = []
+    with FakeEsp32(flash_crypt_cnt=1) as device:
+        _flash(device, images, tmp_path, lines, key_path=key_path, on_stage=lambda name, seconds, ok: stages.append(name))
+        rom_commands = device.commands[: device.commands.index(0x05)]
+    assert stages == ["connect", "efuse_read", "write_flash"]
+    assert "Board 24:0a:c4:00:00:01: FLASH_CRYPT_CNT=1." in lines
+    assert "Flash encryption already enabled on target." in lines
+    # Connect, chip detection and MAC take a handful of reads; espefuse's full read would add dozens.
+    assert rom_commands.count(0x0A) < 20
+
+
+def test_progress_tracker_sees_every_region(images, tmp_path):
+    lines: list[str] = []
+    with FakeEsp32() as device:
+        _flash(device, images, tmp_path, lines)
+    tracker = flash_progress.ProgressTracker(
+        flash_progress.Region(path.name, offset, path.stat().st_size) for offset, path in images
+    )
+    finished = [result for _, result in map(tracker.feed, lines) if result is not None]
+    assert sorted(size for _, size, _ in finished) == sorted(path.stat().st_size for _, path in images)
+
+
+def test_differential_reflash_skips_matching_regions(images, tmp_path):
+    with FakeEsp32() as device:
+        _flash(device, images, tmp_path, [])
+        changed_offset, changed_path = images[1]
+        changed_path.write_bytes(os.urandom(changed_path.stat().st_size))
+        digests = {path: hashlib.md5(path.read_bytes()).hexdigest() for _, path in images}
+        lines: list[str] = []
+        _flash(device, images, tmp_path, lines, differential=True, digests=digests)
+        assert _written(device, changed_offset, changed_path)
+    text = "\n".join(lines)
+    assert "Wrote" in text and f"at 0x{changed_offset:08x}" in text
+    assert sum("digest matches, skipping" in line for line in lines) == len(images) - 1
+
+
+def test_parallel_jobs_keep_their_own_output(images, tmp_path):
+    logs: dict[str, list[str]] = {}
+    errors: list[BaseException] = []
+    devices = [FakeEsp32(mac=f"24:0a:c4:00:00:{index:02x}") for index in range(1, 4)]
+
+    def job(device: FakeEsp32) -> None:
+        lines = logs.setdefault(device.port, [])
+        try:
+            _flash(device, images, tmp_path, lines)
+        except BaseException as exc:  # noqa: BLE001
+            errors.append(exc)
+
+    try:
+        threads = [threading.Thread(target=job, args=(device,)) for device in devices]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=120)
+    finally:
+        for device in devices:
+            device.close()
+
+    assert not errors
+    for device in devices:
+        lines = logs[device.port]
+        text = "\n".join(lines)
+        assert f"Connecting to {device.port}" in text
+        assert sum(line.startswith("Wrote ") for line in lines) == len(images)
+        assert not any(other.port in text for other in devices if other is not device)
+
+
+def test_unrouted_output_still_reaches_stdout(capsys):
+    flash_engine._OUTPUT.print("Connecting", end="")
+    flash_engine._OUTPUT.print("...")
+    assert capsys.readouterr().out == "Connecting...\n"
@@ -0,0 +1,109 @@
+"""Flash history: keyset paging, filters, time bounds, CSV import and attempt updates."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+import flash_history
+
+
+@pytest.fixture
+def store(tmp_path: Path):
+    with flash_history.HistoryStore(tmp_path / "flash_history.sqlite3") as store:
+        yield store
+
+
+def _page_through(store, limit: int, **kwargs) -> list[int]:
+    ids: list[int] = []
+    cursor = None
+    while True:
+        rows, cursor = store.query(limit=limit, cursor=cursor, **kwargs)
+        ids.extend(int(row["id"]) for row in rows)
+        if cursor is None:
+            return ids
+
+
+def test_paging_visits_rows_sharing_a_start_time_once(store):
+    # Five attempts at the same instant (different serials), around two at other times.
+    expected = [store.record("FP01-26100001", "success", 100.0)]
+    expected += [store.record(f"FP01-261000{index:02d}", "failed", 200.0) for index in range(10, 15)]
+    expected.append(store.record("FP01-26100002", "success", 300.0))
+
+    ids = _page_through(store, limit=2)
+    assert sorted(ids) == sorted(expected)
+    assert len(ids) == len(set(ids))
+    rows, _ = store.query(limit=len(expected))
+    assert [int(row["id"]) for row in rows] == ids
+    assert [row["started_at"] for row in rows] == sorted((row["started_at"] for row in rows), reverse=True)
+
+
+def test_cursor_carries_the_exact_start_time(store):
+    first = store.record("FP01-26100001", "success", 1760000000.123456)
+    second = store.record("FP01-26100002", "success", 1760000000.123456)
+    rows, cursor = store.query(limit=1)
+    assert [row["id"] for row in rows] == [second]
+    assert cursor == f"{1760000000.123456!r}:{second}"
+    rows, cursor = store.query(limit=1, cursor=cursor)
+    assert [row["id"] for row in rows] == [first] and cursor is None
+
+
+def test_filters(store):
+    store.record("FP01-26100001", "success", 100.0, mac="24:0A:C4:00:00:01", port="/dev/ttyUSB0")
+    store.record("FP02-26100001", "failed", 200.0, port="/dev/ttyUSB1")
+    assert [row["serial"] for row in store.query({"batch": "02"})[0]] == ["FP02-26100001"]
+    assert [row["serial"] for row in store.query({"ok": "1"})[0]] == ["FP01-26100001"]
+    assert [row["serial"] for row in store.query({"mac": "24:0a:c4:00:00:01"})[0]] == ["FP01-26100001"]
+
+
+@pytest.mark.parametrize("filters", [{"stages": "x"}, {"serial; DROP TABLE attempts": "x"}])
+def test_unknown_filters_are_rejected(store, filters):
+    with pytest.raises(ValueError, match="unknown filter"):
+        store.query(filters)
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "100.0", "abc:1", "100.0:x"])
+def test_malformed_cursors_are_rejected(store, cursor):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        store.query(cursor=cursor)
+
+
+def test_since_is_inclusive_and_until_exclusive(store):
+    for started_at in (100.0, 200.0, 300.0, 400.0):
+        store.record(f"FP01-2610{int(started_at):04d}", "success", started_at)
+    rows, _ = store.query(since=200.0, until=400.0)
+    assert [row["started_at"] for row in rows] == [300.0, 200.0]
+    assert flash_history.parse_time("2026-10-18T12:00:00Z") == 1792324800.0
+
+
+def test_reimporting_a_csv_adds_nothing(store, tmp_path):
+    csv_path = tmp_path / "flash_log.csv"
+    csv_path.write_text(
+        "2026-10-01T08:00:00Z,FP01-26100001,v1,success\n"
+        "2026-10-01T08:05:00Z,FP01-26100002,v1,failed\n"
+        "not a time,FP01-26100003,v1,success\n"
+        "short,row\n"
+    )
+    assert store.import_csv(csv_path) == 2
+    assert store.import_csv(csv_path) == 0
+    rows, _ = store.query()
+    assert [(row["serial"], row["ok"], row["batch"]) for row in rows] == [
+        ("FP01-26100002", False, "01"),
+        ("FP01-26100001", True, "01"),
+    ]
+
+
+def test_update_attempt_merges_stages(store):
+    store.record("FP01-26100001", "wifi_pending", 100.0, stages={"write_flash": 30.0, "connect": 1.5}, message="flashed")
+    assert store.update_attempt("FP01-26100001", 100.0, "wifi_success", stages={"wifi": 12.0, "connect": 2.0})
+    (row,), _ = store.query()
+    assert row["status"] == "wifi_success" and row["ok"]
+    assert row["stages"] == {"write_flash": 30.0, "connect": 2.0, "wifi": 12.0}
+    assert row["message"] == "flashed"
+
+    assert store.update_attempt("FP01-26100001", 100.0, "wifi_failed", message="no AP")
+    (row,), _ = store.query()
+    assert not row["ok"] and row["message"] == "no AP"
+    assert row["stages"]["wifi"] == 12.0
+    assert not store.update_attempt("FP01-26100001", 999.0, "success")
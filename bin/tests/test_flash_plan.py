@@ -0,0 +1,61 @@
+"""Combined flash images: contents, digests and concurrent builds from several flasher processes."""
+
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+from pathlib import Path
+
+import flash_plan
+
+
+def _region(tmp_path: Path, name: str, offset: int, limit: int, size: int) -> flash_plan.Region:
+    data = os.urandom(size)
+    path = tmp_path / f"{name}.bin"
+    path.write_bytes(data)
+    return flash_plan.Region(name, offset, limit, path, size, hashlib.sha256(data).hexdigest(), hashlib.md5(data).hexdigest())
+
+
+def _group(tmp_path: Path) -> list[flash_plan.Region]:
+    return [
+        _region(tmp_path, "bootloader", 0x1000, 0x7000, 0x4A10),
+        _region(tmp_path, "partitions", 0x8000, 0x1000, 0xC00),
+    ]
+
+
+def _build(group: list[flash_plan.Region], cache_dir: Path) -> tuple[str, str]:
+    region = flash_plan._combined_region(group, cache_dir)
+    return region.sha256, region.md5
+
+
+def _expected(group: list[flash_plan.Region]) -> bytes:
+    image = bytearray(b"\xff" * (group[-1].offset + group[-1].size - group[0].offset))
+    for region in group:
+        image[region.offset - group[0].offset : region.offset - group[0].offset + region.size] = region.path.read_bytes()
+    return bytes(image)
+
+
+def test_combined_image_pads_gaps_and_reports_its_digests(tmp_path):
+    group = _group(tmp_path)
+    combined = flash_plan._combined_region(group, tmp_path / "cache")
+    expected = _expected(group)
+    assert combined.name == "bootloader+partitions"
+    assert (combined.offset, combined.size) == (0x1000, len(expected))
+    assert combined.path.read_bytes() == expected
+    assert combined.sha256 == hashlib.sha256(expected).hexdigest()
+    assert combined.md5 == hashlib.md5(expected).hexdigest()
+    reused = flash_plan._combined_region(group, tmp_path / "cache")
+    assert reused == combined
+
+
+def test_concurrent_builds_do_not_collide(tmp_path):
+    group = _group(tmp_path)
+    cache_dir = tmp_path / "cache"
+    expected = _expected(group)
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(6) as pool:
+        results = pool.starmap(_build, [(group, cache_dir)] * 24)
+    assert set(results) == {(hashlib.sha256(expected).hexdigest(), hashlib.md5(expected).hexdigest())}
+    assert [path.suffix for path in cache_dir.iterdir()] == [".bin"]
+    assert next(cache_dir.iterdir()).read_bytes() == expected
@@ -0,0 +1,89 @@
+"""Progress records from esptool v4 and v5 output: per-region bytes, effective rate and ETA."""
+
+from __future__ import annotations
+
+import pytest
+
+import flash_progress
+
+REGIONS = (
+    flash_progress.Region("bootloader", 0x1000, 0x4000),
+    flash_progress.Region("app", 0x10000, 0x4000),
+)
+
+
+@pytest.mark.parametrize(
+    "line, offset, percent",
+    [
+        ("Writing at 0x00001000... (50 %)", "0x00001000", "50"),
+        ("Writing at 0x0001e5a8 [==============>               ]  48.7% 196608/403968 bytes...", "0x0001e5a8", "48.7"),
+        ("Writing at 0x0001e5a8... [==============================] 100.0% 403968/403968 bytes...", "0x0001e5a8", "100.0"),
+    ],
+)
+def test_writing_lines_of_both_esptool_versions(line, offset, percent):
+    match = flash_progress.WRITING_RE.search(line)
+    assert match is not None and match.groups() == (offset, percent)
+    assert flash_progress.is_progress_line(line)
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "Wrote 16384 bytes (8000 compressed) at 0x00001000 in 2.0 seconds (effective 65.5 kbit/s)...",
+        "Wrote 16384 bytes (8000 compressed) at 0x00001000 in 2.0 seconds (65.5 kbit/s).",
+    ],
+)
+def test_wrote_lines_of_both_esptool_versions(line):
+    match = flash_progress.WROTE_RE.search(line)
+    assert match is not None and match.groups() == ("16384", "8000", "0x00001000", "2.0")
+
+
+def test_snapshot_totals_rate_and_eta_across_formats():
+    tracker = flash_progress.ProgressTracker(REGIONS)
+    assert tracker.feed("Changing baud rate to 921600", now=0.0) == (False, None)
+    assert tracker.feed("Flash will be erased from 0x00001000 to 0x00004fff...", now=0.0) == (False, None)
+    assert tracker.feed("Compressed 16384 bytes to 8000...", now=0.0) == (False, None)
+    assert tracker.feed("Writing at 0x00001000... (50 %)", now=1.0) == (True, None)
+
+    snapshot = tracker.snapshot(now=1.0)
+    assert snapshot["phase"] == "writing"
+    assert (snapshot["region"], snapshot["offset"], snapshot["region_percent"]) == ("bootloader", "0x1000", 50.0)
+    assert (snapshot["bytes_written"], snapshot["bytes_total"], snapshot["percent"]) == (8192, 32768, 25.0)
+    assert snapshot["rate_kbps"] == 8.0 and snapshot["eta_seconds"] == 3.0
+    assert snapshot["baud"] == 921600
+
+    line = "Wrote 16384 bytes (8000 compressed) at 0x00001000 in 2.0 seconds (effective 65.5 kbit/s)..."
+    assert tracker.feed(line, now=2.0) == (False, ("bootloader", 16384, 2.0))
+    snapshot = tracker.snapshot(now=5.0)
+    assert snapshot["phase"] == "written" and snapshot["region"] is None
+    assert (snapshot["bytes_written"], snapshot["percent"]) == (16384, 50.0)
+    # Only the seconds spent writing count towards the rate, not the time since.
+    assert snapshot["rate_kbps"] == 8.0 and snapshot["eta_seconds"] == 2.0
+
+    # esptool v5: no erase line before the bar, and a percentage with one decimal.
+    line = "Writing at 0x00010000 [=======>                      ]  25.0% 4096/16384 bytes..."
+    assert tracker.feed(line, now=10.0) == (True, None)
+    snapshot = tracker.snapshot(now=11.0)
+    assert (snapshot["region"], snapshot["region_percent"]) == ("app", 25.0)
+    assert (snapshot["bytes_written"], snapshot["bytes_total"], snapshot["percent"]) == (20480, 32768, 62.5)
+    assert snapshot["rate_kbps"] == 6.7 and snapshot["eta_seconds"] == 1.8
+
+    line = "Wrote 16384 bytes (9000 compressed) at 0x00010000 in 2.0 seconds (65.5 kbit/s)."
+    assert tracker.feed(line, now=12.0) == (False, ("app", 16384, 2.0))
+    snapshot = tracker.snapshot(now=20.0)
+    assert snapshot["phase"] == "written"
+    assert (snapshot["bytes_written"], snapshot["bytes_total"], snapshot["percent"]) == (32768, 32768, 100.0)
+    assert snapshot["rate_kbps"] == 8.0 and snapshot["eta_seconds"] == 0.0
+
+    assert tracker.feed("Hard resetting via RTS pin...", now=21.0) == (False, None)
+    assert tracker.snapshot()["phase"] == "resetting"
+    tracker.finish(True)
+    assert tracker.snapshot()["phase"] == "done"
+
+
+def test_skipped_regions_leave_the_total():
+    tracker = flash_progress.ProgressTracker(REGIONS)
+    tracker.feed("  0x1000: digest matches, skipping")
+    tracker.feed("Writing at 0x00010000... (50 %)", now=0.0)
+    snapshot = tracker.snapshot(now=1.0)
+    assert (snapshot["bytes_written"], snapshot["bytes_total"]) == (8192, 16384)
@@ -0,0 +1,51 @@
+"""Factory payloads and batch packs: a pack written from the command line reads back slot by slot."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+import gen_factory_payload
+
+
+def test_batch_pack_round_trip_with_password_overrides(tmp_path: Path, capsys):
+    passwords = tmp_path / "passwords.csv"
+    passwords.write_text("batch,serial,password\n7,2,override-0002\n7,4,override-0004\n8,3,other-batch-03\n")
+    output = tmp_path / "packs" / "batch.fpxpack"
+    argv = ["--batch", "7", "--year", "26", "--month", "10", "--serials", "1-4,9", "--partition-size", "0x1000"]
+    argv += ["--passwords", str(passwords), "--password", "default-pass", "--pack-output", str(output)]
+    assert gen_factory_payload.main(argv) == 0
+    assert "5 units, 4096 bytes each" in capsys.readouterr().out
+
+    expected = {
+        "FP07-26100001": "default-pass",
+        "FP07-26100002": "override-0002",
+        "FP07-26100003": "default-pass",
+        "FP07-26100004": "override-0004",
+        "FP07-26100009": "default-pass",
+    }
+    with gen_factory_payload.FactoryPack(output) as pack:
+        assert pack.partition_size == 0x1000 and pack.data_offset % pack.partition_size == 0
+        assert set(pack.index) == set(expected)
+        for serial, password in expected.items():
+            view = pack.payload(serial)
+            try:
+                assert len(view) == pack.partition_size
+                assert gen_factory_payload.verify_payload(view, serial, password) == pack.crc(serial)
+                assert bytes(view[gen_factory_payload.PAYLOAD_LEN :]) == b"\xff" * (pack.partition_size - gen_factory_payload.PAYLOAD_LEN)
+                with pytest.raises(ValueError, match="password mismatch"):
+                    gen_factory_payload.verify_payload(view, serial, password + "x")
+            finally:
+                view.release()
+        assert "FP07-26100005" not in pack
+    assert output.stat().st_size == pack.data_offset + len(expected) * pack.partition_size
+
+
+def test_single_image_uses_the_default_partition_size(tmp_path: Path, monkeypatch):
+    monkeypatch.delenv("FLEX_FACTORY_PASSWORD", raising=False)
+    output = tmp_path / "factory_cfg.bin"
+    assert gen_factory_payload.main(["--serial", "FP01-26100001", "--output", str(output)]) == 0
+    image = output.read_bytes()
+    assert len(image) == gen_factory_payload.DEFAULT_PARTITION_SIZE
+    gen_factory_payload.verify_payload(image, "FP01-26100001", gen_factory_payload.DEFAULT_PASSWORD)
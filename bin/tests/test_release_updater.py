@@ -0,0 +1,74 @@
+"""ReleaseUpdater retries revisions that failed to stage and rejects only bundles that fail verification."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import release_updater
+
+CURRENT = "a" * 40
+UPSTREAM = "b" * 40
+
+
+@pytest.fixture
+def updater(tmp_path: Path, monkeypatch) -> release_updater.ReleaseUpdater:
+    def fake_git(repo_dir: Path, *args: str) -> str:
+        if args[:1] == ("rev-parse",) and "@{u}" in args:
+            return UPSTREAM
+        if args == ("rev-parse", "HEAD"):
+            return CURRENT
+        return ""
+
+    monkeypatch.setattr(release_updater, "_git", fake_git)
+    state_dir = tmp_path / ".releases"
+    state_dir.mkdir()
+    return release_updater.ReleaseUpdater(repo_dir=tmp_path, state_dir=state_dir, interval=0, log=lambda message: None)
+
+
+def _stage_results(monkeypatch, results: list[object]) -> list[str]:
+    calls: list[str] = []
+
+    def fake_stage(self, revision: str) -> Path:
+        calls.append(revision)
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(release_updater.ReleaseUpdater, "_stage", fake_stage)
+    return calls
+
+
+def test_staging_error_is_retried_on_the_next_poll(updater, tmp_path, monkeypatch):
+    release_dir = tmp_path / ".releases" / UPSTREAM[:12] / "release"
+    calls = _stage_results(
+        monkeypatch, [release_updater.ReleaseUpdateError("git archive bbbbbbbbbbbb failed: disk full"), release_dir]
+    )
+    monkeypatch.setattr(release_updater, "verify_release", lambda path: SimpleNamespace(version="1.2.3"))
+
+    assert updater.check_once() is False
+    assert "disk full" in updater.status()["last_error"]
+    assert updater.check_once() is True
+    assert calls == [UPSTREAM, UPSTREAM]
+    assert updater.status()["revision"] == UPSTREAM
+    assert updater.active_release_dir() == release_dir
+
+
+def test_bundle_that_fails_verification_is_not_staged_again(updater, tmp_path, monkeypatch):
+    release_dir = tmp_path / ".releases" / UPSTREAM[:12] / "release"
+    release_dir.mkdir(parents=True)
+    calls = _stage_results(monkeypatch, [release_dir])
+
+    def reject(path: Path):
+        raise release_updater.ReleaseUpdateError("bootloader.bin: sha256 mismatch")
+
+    monkeypatch.setattr(release_updater, "verify_release", reject)
+
+    assert updater.check_once() is False
+    assert updater.check_once() is False
+    assert calls == [UPSTREAM]
+    assert not release_dir.exists()
+    assert updater.status()["revision"] == CURRENT
@@ -0,0 +1,112 @@
+"""Unit store: the passwords.csv index, rebuilds on edits, rejected edits and the default password."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import unit_store
+
+DEFAULT = "default-pass"
+
+
+@pytest.fixture(autouse=True)
+def stat_on_every_lookup(monkeypatch):
+    monkeypatch.setattr(unit_store, "RELOAD_CHECK_INTERVAL", 0.0)
+
+
+@pytest.fixture
+def csv_path(tmp_path: Path) -> Path:
+    path = tmp_path / "passwords.csv"
+    path.write_text("batch,serial,password\n1,1,password-0001\n1,3,password-0003\n2,1,password-2001\n")
+    return path
+
+
+@pytest.fixture
+def store(tmp_path: Path, csv_path: Path) -> unit_store.UnitStore:
+    store = unit_store.UnitStore(csv_path, DEFAULT, index_path=tmp_path / "index" / "units.sqlite3")
+    store.load()
+    return store
+
+
+def _passwords(store: unit_store.UnitStore, batch: int = 1, first: int = 1, last: int = 4) -> list[str]:
+    return [unit["password"] for unit in store.lookup_range(batch, 26, 10, first, last)]
+
+
+def _built_at(index_path: Path) -> str:
+    conn = sqlite3.connect(str(index_path))
+    try:
+        return conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_serials_missing_from_the_csv_get_the_default_password(store):
+    assert _passwords(store) == ["password-0001", DEFAULT, "password-0003", DEFAULT]
+    assert _passwords(store, batch=2, first=1, last=2) == ["password-2001", DEFAULT]
+    unit = store.lookup(1, 3, 26, 10)
+    assert (unit["serial"], unit["ssid"], unit["password"]) == ("FP01-26100003", "FP01-26100003", "password-0003")
+    assert store.status()["units"] == 3 and store.status()["loaded_from_disk"]
+
+
+def test_an_unchanged_csv_reuses_the_index(store, csv_path):
+    built_at = _built_at(store.index_path)
+    again = unit_store.UnitStore(csv_path, DEFAULT, index_path=store.index_path)
+    again.load()
+    assert _passwords(again) == _passwords(store)
+    assert _built_at(store.index_path) == built_at
+
+
+def test_a_size_change_rebuilds_the_index(store, csv_path):
+    with csv_path.open("a") as fh:
+        fh.write("1,2,password-0002\n")
+    assert _passwords(store) == ["password-0001", "password-0002", "password-0003", DEFAULT]
+    assert store.status()["units"] == 4
+
+
+def test_an_mtime_change_alone_rebuilds_the_index(store, csv_path):
+    text = csv_path.read_text().replace("password-0003", "password-9993")
+    stat = csv_path.stat()
+    csv_path.write_text(text)
+    assert csv_path.stat().st_size == stat.st_size
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert _passwords(store)[2] == "password-9993"
+
+
+@pytest.mark.parametrize(
+    "edit, error",
+    [
+        ("1,4,short\n", "length"),
+        ("1,1,password-again\n", "Duplicate"),
+        ("1,10000,password-10000\n", "out of supported range"),
+        ("x,1,password-x001\n", "Invalid batch/serial"),
+    ],
+)
+def test_an_invalid_edit_keeps_the_previous_index(store, csv_path, edit, error, capsys):
+    with csv_path.open("a") as fh:
+        fh.write(edit)
+    assert _passwords(store) == ["password-0001", DEFAULT, "password-0003", DEFAULT]
+    assert error in store.status()["last_error"]
+    assert "keeping the previous unit index" in capsys.readouterr().err
+
+    csv_path.write_text("batch,serial,password\n1,4,password-0004\n")
+    assert _passwords(store) == [DEFAULT, DEFAULT, DEFAULT, "password-0004"]
+    assert store.status()["last_error"] is None
+
+
+def test_an_invalid_csv_fails_a_strict_load(tmp_path):
+    csv_path = tmp_path / "passwords.csv"
+    csv_path.write_text("batch,serial\n1,1\n")
+    store = unit_store.UnitStore(csv_path, DEFAULT, index_path=tmp_path / "units.sqlite3")
+    with pytest.raises(unit_store.UnitStoreError, match="columns"):
+        store.load()
+    assert not (tmp_path / "units.sqlite3").exists()
+
+
+def test_a_removed_csv_falls_back_to_the_default_password(store, csv_path):
+    csv_path.unlink()
+    assert _passwords(store) == [DEFAULT] * 4
+    assert not store.status()["loaded_from_disk"]
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Minimal asyncio HTTP/1.1 server for the flasher GUI, plus the cacheable static-asset helper.
+
+One event loop serves every connection: connections are kept alive between requests, and
+long-polls wait on a ChangeSignal instead of parking a thread each. Static assets are encoded,
+gzipped and hashed once; clients revalidate with If-None-Match and get 304 while the body is unchanged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import email.utils
+import gzip
+import hashlib
+import http
+import sys
+import threading
+import urllib.parse
+from typing import Awaitable, Callable, Mapping, NamedTuple
+
+IDLE_TIMEOUT = 60.0
+MAX_HEADER_LINES = 100
+MAX_BODY = 1 << 20
+SERVER_NAME = "flex-plus-flasher"
+
+
+class Request(NamedTuple):
+    method: str
+    target: str
+    headers: Mapping[str, str]
+    body: bytes
+
+    @property
+    def path(self) -> str:
+        return urllib.parse.urlparse(self.target).path
+
+
+class Response(NamedTuple):
+    status: int
+    body: bytes
+    content_type: str
+    headers: tuple[tuple[str, str], ...] = ()
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def text_response(status: int, message: str) -> Response:
+    return Response(status, message.encode("utf-8"), "text/plain; charset=utf-8")
+
+
+class StaticAsset:
+    """An in-memory body with a strong ETag and, for text types, a pre-compressed gzip variant."""
+
+    def __init__(self, body: bytes, content_type: str, compress: bool | None = None) -> None:
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if compress is None:
+            compress = content_type.startswith(("text/", "application/json", "application/javascript"))
+        gzipped = gzip.compress(body, mtime=0) if compress else None
+        self.gzipped = gzipped if gzipped is not None and len(gzipped) < len(body) else None
+
+    def response(self, headers: Mapping[str, str]) -> Response:
+        cache = (("Cache-Control", "no-cache"), ("ETag", self.etag), ("Vary", "Accept-Encoding"))
+        if_none_match = headers.get("if-none-match") or ""
+        if self.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+            return Response(304, b"", self.content_type, cache)
+        accept = headers.get("accept-encoding") or ""
+        if self.gzipped is not None and "gzip" in accept.lower():
+            return Response(200, self.gzipped, self.content_type, cache + (("Content-Encoding", "gzip"),))
+        return Response(200, self.body, self.content_type, cache)
+
+
+class ChangeSignal:
+    """Wakes coroutines on the server loop when another thread reports a change."""
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._waiters: set[asyncio.Future[None]] = set()
+        self._lock = threading.Lock()
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            self._loop = loop
+
+    def notify(self) -> None:
+        """Thread-safe; a no-op until a loop is attached."""
+        with self._lock:
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self) -> None:
+        waiters, self._waiters = self._waiters, set()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for the next notify(); False on timeout. Call from the loop the signal is attached to."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters.discard(waiter)
+
+
+def _encode(response: Response, keep_alive: bool, head: bool) -> bytes:
+    try:
+        reason = http.HTTPStatus(response.status).phrase
+    except ValueError:
+        reason = ""
+    lines = [
+        f"HTTP/1.1 {response.status} {reason}",
+        f"Server: {SERVER_NAME}",
+        f"Date: {email.utils.formatdate(usegmt=True)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        f"Content-Length: {len(response.body)}",
+    ]
+    if response.body or response.status != 304:
+        lines.append(f"Content-Type: {response.content_type}")
+    names = {name.lower() for name, _ in response.headers}
+    if "cache-control" not in names:
+        lines.append("Cache-Control: no-store")
+    lines.extend(f"{name}: {value}" for name, value in response.headers)
+    head_bytes = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return head_bytes if head else head_bytes + response.body
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[Request, bool] | Response | None:
+    """Parse one request; returns (request, keep_alive), an error Response, or None at end of stream."""
+    try:
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    if not line:
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        return text_response(400, "Malformed request line.")
+    method, target, version = parts
+    headers: dict[str, str] = {}
+    for _ in range(MAX_HEADER_LINES):
+        header = (await reader.readline()).decode("latin-1")
+        if header in ("\r\n", "\n", ""):
+            break
+        name, sep, value = header.partition(":")
+        if not sep:
+            return text_response(400, "Malformed header.")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        return text_response(431, "Too many headers.")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        return text_response(400, "Invalid Content-Length.")
+    if length < 0 or length > MAX_BODY:
+        return text_response(413, "Request body too large.")
+    body = await reader.readexactly(length) if length else b""
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return Request(method.upper(), target, headers, body), keep_alive
+
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: Handler) -> None:
+    try:
+        while True:
+            parsed = await _read_request(reader)
+            if parsed is None:
+                break
+            if isinstance(parsed, Response):
+                writer.write(_encode(parsed, keep_alive=False, head=False))
+                await writer.drain()
+                break
+            request, keep_alive = parsed
+            try:
+                response = await handler(request)
+            except Exception as exc:  # noqa: BLE001
+                print(f"Warning: request {request.method} {request.path} failed: {exc}", file=sys.stderr)
+                response = text_response(500, "Internal server error.")
+            writer.write(_encode(response, keep_alive, head=request.method == "HEAD"))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        pass
+    finally:
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
+
+
+def serve(
+    handler: Handler,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    signal: ChangeSignal | None = None,
+    on_ready: Callable[[str, int], None] | None = None,
+) -> None:
+    """Run the server until interrupted; on_ready(host, port) is called once it is listening."""
+
+    async def main() -> None:
+        if signal is not None:
+            signal.attach(asyncio.get_running_loop())
+        server = await asyncio.start_server(lambda r, w: _serve_connection(r, w, handler), host, port)
+        bound_host, bound_port = server.sockets[0].getsockname()[:2]
+        if on_ready is not None:
+            on_ready(bound_host, bound_port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
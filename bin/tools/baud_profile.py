@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Per-adapter flash baud rates, negotiated and remembered by the station.
+
+With FLEX_FLASH_BAUD=auto, write-flash starts at the rate this station last saw work for the
+USB-UART bridge (keyed by VID:PID:serial, or the port name when the platform hides USB details);
+unknown adapters start at the top of the ladder. A write that fails with a link error (sync,
+checksum, timeout, digest mismatch) is retried one step down. Repeated link errors demote the saved
+rate; after a long clean streak at a demoted rate, one attempt probes the next step up again.
+Reads between writes (the differential compare) run at the rate a write last confirmed, never at an
+untried probe; adapters with no clean write yet use the ROM's 115200.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+import port_watcher
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_PROFILE_PATH = PRODUCTION_DIR / "logs" / "baud_profile.json"
+
+LADDER = (2000000, 1500000, 921600, 460800, 230400, 115200)
+DEMOTE_AFTER = 2
+PROMOTE_AFTER = 25
+# Rates tried within one write before giving up; each try is a full write-flash.
+RATES_PER_WRITE = 3
+UNCONFIRMED_RATE = LADDER[-1]
+LINK_ERROR_RE = re.compile(
+    r"failed to connect|timed out waiting for packet|invalid head of packet|checksum|corrupt|"
+    r"packet content transfer stopped|serial exception|md5 of file does not match|"
+    r"possible serial noise|no serial data received",
+    re.IGNORECASE,
+)
+
+
+def is_link_error(output: str) -> bool:
+    return bool(LINK_ERROR_RE.search(output))
+
+
+def adapter_key(port: str, ports: Iterable[port_watcher.PortInfo] | None = None) -> str:
+    """'usb:10c4:ea60:0001' for USB bridges that report IDs, 'port:<device>' otherwise."""
+    if ports is None:
+        ports = port_watcher.enumerate_ports(port_watcher.default_patterns() + ((port,) if os.path.dirname(port) else ()))
+    for info in ports:
+        if info.device == port and info.vid is not None:
+            return f"usb:{info.vid:04x}:{info.pid or 0:04x}:{info.serial_number or ''}"
+    return f"port:{port}"
+
+
+def _step_down(baud: int) -> int | None:
+    return next((rate for rate in LADDER if rate < baud), None)
+
+
+def _step_up(baud: int) -> int | None:
+    return next((rate for rate in reversed(LADDER) if rate > baud), None)
+
+
+class BaudProfile:
+    def __init__(self, path: Path = DEFAULT_PROFILE_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._entries: dict[str, dict[str, int | float]] = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save_locked(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(json.dumps(self._entries, indent=1, sort_keys=True))
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            print(f"Warning: unable to save baud profile {self.path}: {exc}", file=sys.stderr)
+
+    def saved_rate(self, key: str) -> int | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            return int(entry["baud"]) if entry else None
+
+    def confirmed_rate(self, key: str, ceiling: int = LADDER[0]) -> int:
+        """The saved rate once a write has succeeded at it, else UNCONFIRMED_RATE."""
+        with self._lock:
+            entry = dict(self._entries.get(key) or {})
+        if not entry.get("confirmed"):
+            return UNCONFIRMED_RATE
+        return min(int(entry["baud"]), ceiling)
+
+    def candidates(self, key: str, ceiling: int = LADDER[0]) -> list[int]:
+        """Rates to try for one write, fastest first."""
+        with self._lock:
+            entry = dict(self._entries.get(key) or {})
+        start = ceiling
+        if entry:
+            start = min(int(entry["baud"]), ceiling)
+            probe = _step_up(start)
+            if entry.get("streak", 0) >= PROMOTE_AFTER and probe is not None and probe <= ceiling:
+                start = probe
+        return ([rate for rate in LADDER if rate <= start] or [start])[:RATES_PER_WRITE]
+
+    def record(self, key: str, baud: int, ok: bool) -> None:
+        """Record one write. Writes below the saved rate are in-attempt fallbacks and change nothing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"baud": baud, "streak": 0, "failures": 0, "confirmed": False}
+            saved = int(entry["baud"])
+            if ok and baud >= saved:
+                entry["streak"] = int(entry["streak"]) + 1 if baud == saved else 0
+                entry["baud"] = baud
+                entry["failures"] = 0
+                entry["confirmed"] = True
+            elif not ok and baud > saved:
+                # A promotion probe failed: stay put and earn the next probe with a new streak.
+                entry["streak"] = 0
+            elif not ok and baud == saved:
+                entry["streak"] = 0
+                entry["failures"] = int(entry["failures"]) + 1
+                lower = _step_down(saved)
+                # An adapter that never wrote cleanly is still negotiating and steps down at once.
+                if lower is not None and (entry["failures"] >= DEMOTE_AFTER or not entry["confirmed"]):
+                    entry["baud"] = lower
+                    entry["failures"] = 0
+            entry["updated_at"] = time.time()
+            self._save_locked()
+
+    def summary(self) -> dict[str, dict[str, int | float]]:
+        with self._lock:
+            return json.loads(json.dumps(self._entries))
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", default=str(DEFAULT_PROFILE_PATH), help="JSON profile file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rates = sub.add_parser("rates", help="Print the rates to try, fastest first, space separated.")
+    rates.add_argument("--port", required=True, help="Serial port of the adapter.")
+    rates.add_argument("--ceiling", type=int, default=LADDER[0])
+    confirmed = sub.add_parser("confirmed", help="Print the rate a write last succeeded at, for reads.")
+    confirmed.add_argument("--port", required=True, help="Serial port of the adapter.")
+    confirmed.add_argument("--ceiling", type=int, default=LADDER[0])
+    record = sub.add_parser("record", help="Record the outcome of a write at a rate.")
+    record.add_argument("--port", required=True, help="Serial port of the adapter.")
+    record.add_argument("--baud", type=int, required=True)
+    record.add_argument("--failed", action="store_true", help="The write failed with a link error.")
+    sub.add_parser("classify", help="Exit 0 if esptool output on stdin shows a link error.")
+    args = parser.parse_args(argv)
+
+    if args.command == "classify":
+        return 0 if is_link_error(sys.stdin.read()) else 1
+    profile = BaudProfile(Path(args.profile))
+    key = adapter_key(args.port)
+    if args.command == "rates":
+        print(" ".join(str(rate) for rate in profile.candidates(key, args.ceiling)))
+    elif args.command == "confirmed":
+        print(profile.confirmed_rate(key, args.ceiling))
+    else:
+        profile.record(key, args.baud, not args.failed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""Units-per-hour benchmark of the flasher GUI against simulated fixtures (macOS/Linux).
+
+The production directory is copied to a scratch directory so logs, history and profiles of the
+station are untouched. Simulated fixtures (sim_device.py) and the real GUI server are started there,
+and the GUI is driven over HTTP the way the operator page does: POST /flash per fixture, then /state
+until the unit finishes. For each fixture count the report gives units per hour (overall and per
+fixture) and the mean time of every stage, taken from the flash history the GUI records.
+
+With --stations N, N such stations (each its own GUI process and fixtures) run side by side against
+one coordinator.py; every fixture then asks its station for the next serial instead of using a fixed
+range, and the run fails if any serial was flashed by more than one station.
+
+--separate-regions turns off the combined low-address images (FLEX_COALESCE_REGIONS=0); running
+with and without it shows what coalescing saves per unit.
+
+Modeled device time is multiplied by --time-scale; host work (bash, python start-up, payload
+encryption) is not, so compare runs at the same scale.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import secrets
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+import sim_device
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+LISTENING_RE = re.compile(r"listening on (http://\S+/)")
+STATE_POLL_INTERVAL = 0.2
+FAILURE_RE = re.compile(r"fatal error|^Error", re.IGNORECASE)
+START_TIMEOUT = 30.0
+COPY_IGNORE = shutil.ignore_patterns("logs", ".cache", ".releases", "__pycache__", "esptool", "*.sqlite3*")
+
+
+class BenchError(RuntimeError):
+    pass
+
+
+class Station:
+    """A scratch copy of the production directory with simulated fixtures and its GUI running."""
+
+    def __init__(self, args: argparse.Namespace, fixtures: int, name: str = "bench") -> None:
+        self.args = args
+        self.name = name
+        self.scratch = Path(tempfile.mkdtemp(prefix="flex_bench_"))
+        self.root = self.scratch / "bin"
+        shutil.copytree(PRODUCTION_DIR, self.root, ignore=COPY_IGNORE)
+        key = self.scratch / "flash_encryption_key.bin"
+        key.write_bytes(secrets.token_bytes(32))
+        esptool, espefuse = sim_device.install(self.scratch / "simbin")
+        ports_dir = self.scratch / "ports"
+        self.env = dict(os.environ)
+        self.env.update(
+            {
+                "FLEX_SIM_TIME_SCALE": str(args.time_scale),
+                "FLEX_ESPTOOL": str(esptool),
+                "FLEX_ESPEFUSE": str(espefuse),
+                "FLEX_PORT_GLOBS": str(ports_dir / f"{sim_device.PORT_PREFIX}*"),
+                "FLEX_FLASH_ENGINE": "script",
+                "FLEX_FLASH_BAUD": args.baud,
+                "FLEX_VERIFY_FLASH": "1" if args.verify else "0",
+                "FLEX_COALESCE_REGIONS": "0" if args.separate_regions else "1",
+                # A reused board gets a new serial for every unit, which the device registry refuses.
+                "FLEX_DEVICE_CONFLICTS": "warn" if args.reuse_boards else "block",
+                "FLEX_MAX_PARALLEL_JOBS": str(fixtures),
+                "FLEX_RELEASE_UPDATE_INTERVAL": "0",
+                "FLEX_WIFI_PROVISION": "0",
+                "FLEX_OPEN_BROWSER": "0",
+                "FLEX_HTTP_SERVER": args.http_server,
+                "FLASH_ENCRYPTION_KEY_FILE": str(key),
+                "FLEX_STATION_NAME": name,
+            }
+        )
+        self.ports = [str(ports_dir / f"{sim_device.PORT_PREFIX}{index}") for index in range(fixtures)]
+        self._processes: list[subprocess.Popen[str]] = []
+        self.url = ""
+
+    def _spawn(self, command: list[str], log_name: str) -> tuple[subprocess.Popen[str], threading.Event, list[str]]:
+        process = subprocess.Popen(
+            command,
+            cwd=str(self.root),
+            env=self.env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        self._processes.append(process)
+        ready = threading.Event()
+        first_lines: list[str] = []
+
+        def drain() -> None:
+            assert process.stdout is not None
+            with (self.scratch / log_name).open("w") as log:
+                for line in process.stdout:
+                    log.write(line)
+                    log.flush()
+                    if not ready.is_set():
+                        first_lines.append(line.rstrip())
+                        if line.strip() == "ready" or LISTENING_RE.search(line):
+                            ready.set()
+            ready.set()
+
+        threading.Thread(target=drain, name=f"drain-{log_name}", daemon=True).start()
+        return process, ready, first_lines
+
+    def _wait_ready(self, process: subprocess.Popen[str], ready: threading.Event, lines: list[str], what: str) -> None:
+        if not ready.wait(START_TIMEOUT) or process.poll() is not None:
+            raise BenchError(f"{what} did not start: " + " | ".join(lines[-5:]))
+
+    def start(self) -> None:
+        args = self.args
+        serve = [
+            sys.executable,
+            str(self.root / "tools" / "sim_device.py"),
+            "serve",
+            "--count",
+            str(len(self.ports)),
+            "--dir",
+            str(Path(self.ports[0]).parent),
+            "--fail-sync",
+            str(args.fail_sync),
+            "--fail-write",
+            str(args.fail_write),
+        ]
+        if args.max_baud:
+            serve += ["--max-baud", str(args.max_baud)]
+        if args.seed is not None:
+            serve += ["--seed", str(args.seed)]
+        process, ready, lines = self._spawn(serve, "sim_device.log")
+        self._wait_ready(process, ready, lines, "Simulated fixtures")
+        process, ready, lines = self._spawn([sys.executable, str(self.root / "flash_gui.py")], "flash_gui.log")
+        self._wait_ready(process, ready, lines, "Flasher GUI")
+        match = next((LISTENING_RE.search(line) for line in lines if LISTENING_RE.search(line)), None)
+        if match is None:
+            raise BenchError("Flasher GUI did not report its URL.")
+        self.url = match.group(1)
+        deadline = time.monotonic() + START_TIMEOUT
+        while not dict(self.get("/state").get("startup") or {"ready": True}).get("ready"):
+            if time.monotonic() > deadline:
+                raise BenchError("Flasher GUI start-up tasks did not finish.")
+            time.sleep(STATE_POLL_INTERVAL)
+
+    def start_coordinator(self) -> str:
+        """Run coordinator.py from this station's scratch directory; returns its URL."""
+        command = [
+            sys.executable,
+            str(self.root / "tools" / "coordinator.py"),
+            "serve",
+            "--port",
+            "0",
+            "--db",
+            str(self.scratch / "coordinator.sqlite3"),
+        ]
+        process, ready, lines = self._spawn(command, "coordinator.log")
+        self._wait_ready(process, ready, lines, "Coordinator")
+        match = next((LISTENING_RE.search(line) for line in lines if LISTENING_RE.search(line)), None)
+        if match is None:
+            raise BenchError("Coordinator did not report its URL.")
+        return match.group(1)
+
+    def stop(self) -> None:
+        for process in reversed(self._processes):
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        if self.args.keep:
+            print(f"Scratch station kept at {self.scratch}")
+        else:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def get(self, path: str, **query: object) -> dict[str, object]:
+        target = self.url + path.lstrip("/")
+        if query:
+            target += "?" + urllib.parse.urlencode(query)
+        with urllib.request.urlopen(target, timeout=30) as response:
+            return json.loads(response.read())
+
+    def post(self, path: str, **fields: object) -> dict[str, object]:
+        body = urllib.parse.urlencode(fields).encode("ascii")
+        request = urllib.request.Request(self.url + path.lstrip("/"), data=body, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as exc:
+            return json.loads(exc.read() or b"{}")
+
+
+def _drive_fixture(
+    station: Station, port: str, serials: list[int | None], args: argparse.Namespace, errors: list[str]
+) -> None:
+    for serial in serials:
+        if serial is None:
+            try:
+                reply = station.get("/next_serial", batch=args.batch, year=args.year, month=args.month)
+            except urllib.error.HTTPError as exc:
+                errors.append(f"{port}: no serial from the coordinator: {json.loads(exc.read() or b'{}').get('error')}")
+                return
+            serial = int(reply["serial"])  # type: ignore[arg-type]
+        if not args.reuse_boards:
+            Path(port + ".swap").touch()
+        reply = station.post(
+            "/flash", batch=args.batch, year=args.year, month=args.month, serial=serial, port=port
+        )
+        if not reply.get("ok"):
+            errors.append(f"{port} serial {serial}: {reply.get('error')}")
+            continue
+        while True:
+            state = station.get("/state", port=port)
+            if not state.get("busy"):
+                break
+            time.sleep(STATE_POLL_INTERVAL)
+        if dict(state.get("status") or {}).get("code") == "failed":
+            lines = [str(line) for line in station.get("/logs", port=port, wait=0).get("lines", [])]
+            reason = next((line for line in reversed(lines) if FAILURE_RE.search(line)), "see the GUI log")
+            errors.append(f"{port} serial {serial} failed: {reason.strip()}")
+
+
+def run_scenario(
+    stations: list[Station], fixtures: int, first_serial: int, args: argparse.Namespace
+) -> dict[str, object]:
+    coordinated = len(stations) > 1
+    errors: list[str] = []
+    started = time.time()
+    threads = []
+    for offset, station in enumerate(stations):
+        for index, port in enumerate(station.ports[:fixtures]):
+            first = first_serial + (offset * fixtures + index) * args.units
+            serials: list[int | None] = [None if coordinated else first + n for n in range(args.units)]
+            thread = threading.Thread(target=_drive_fixture, args=(station, port, serials, args, errors))
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+    wall = time.time() - started
+
+    rows = [
+        row
+        for station in stations
+        for row in station.get("/history", since=started, limit=500).get("rows", [])
+        if row.get("port") in station.ports[:fixtures]
+    ]
+    flashed: dict[str, int] = {}
+    for row in rows:
+        if row.get("ok") and not row.get("rework"):
+            flashed[str(row.get("serial"))] = flashed.get(str(row.get("serial")), 0) + 1
+    errors += [f"{serial} was flashed {count} times" for serial, count in sorted(flashed.items()) if count > 1]
+    ok = sum(1 for row in rows if row.get("ok"))
+    slots = fixtures * len(stations)
+    stage_samples: dict[str, list[float]] = {}
+    for row in rows:
+        for name, seconds in dict(row.get("stages") or {}).items():
+            stage_samples.setdefault(name, []).append(float(seconds))
+    return {
+        "stations": len(stations),
+        "fixtures": fixtures,
+        "units": len(rows),
+        "ok": ok,
+        "failed": len(rows) - ok,
+        "errors": errors,
+        "wall_seconds": round(wall, 2),
+        "units_per_hour": round(ok * 3600 / wall, 1) if wall > 0 else 0.0,
+        "units_per_hour_per_fixture": round(ok * 3600 / wall / slots, 1) if wall > 0 else 0.0,
+        "stages": {name: round(statistics.fmean(values), 3) for name, values in sorted(stage_samples.items())},
+    }
+
+
+def print_report(results: list[dict[str, object]], args: argparse.Namespace) -> None:
+    print(
+        f"{args.stations} station(s), time scale {args.time_scale}, baud {args.baud}, {args.units} unit(s) per fixture,"
+        f" {'reused' if args.reuse_boards else 'fresh'} boards{', verify' if args.verify else ''}"
+    )
+    print(f"{'fixtures':>8} {'units':>6} {'ok':>4} {'failed':>6} {'wall s':>8} {'units/h':>9} {'per fixture/h':>14}")
+    for result in results:
+        print(
+            f"{result['fixtures']:>8} {result['units']:>6} {result['ok']:>4} {result['failed']:>6}"
+            f" {result['wall_seconds']:>8} {result['units_per_hour']:>9} {result['units_per_hour_per_fixture']:>14}"
+        )
+    stages = sorted({name for result in results for name in result["stages"]})  # type: ignore[union-attr]
+    if stages:
+        print()
+        print("Mean seconds per stage:")
+        print(f"{'stage':<12}" + "".join(f"{str(result['fixtures']) + ' fx':>10}" for result in results))
+        for name in stages:
+            cells = "".join(
+                f"{result['stages'].get(name, ''):>10}" for result in results  # type: ignore[union-attr]
+            )
+            print(f"{name:<12}{cells}")
+    for result in results:
+        for error in result["errors"]:  # type: ignore[union-attr]
+            print(f"Warning: {error}", file=sys.stderr)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default="1,2,4", help="Comma-separated fixture counts to run.")
+    parser.add_argument("--units", type=int, default=3, help="Units flashed per fixture in each run.")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="Multiplier on modeled device time.")
+    parser.add_argument("--baud", default="460800", help="FLEX_FLASH_BAUD for the GUI (a rate or 'auto').")
+    parser.add_argument("--verify", action="store_true", help="Run the post-flash verify stage.")
+    parser.add_argument(
+        "--separate-regions", action="store_true", help="Write every artifact on its own (no combined images)."
+    )
+    parser.add_argument("--reuse-boards", action="store_true", help="Keep the same board on a fixture between units.")
+    parser.add_argument("--fail-sync", type=float, default=0.0, help="Probability a connect fails to sync.")
+    parser.add_argument("--fail-write", type=float, default=0.0, help="Probability a write-flash breaks off.")
+    parser.add_argument("--max-baud", type=int, help="Simulated adapters fail writes and hashes above this rate.")
+    parser.add_argument("--seed", type=int, help="Seed for injected failures.")
+    parser.add_argument(
+        "--stations", type=int, default=1, help="GUI processes sharing one line coordinator (serials are leased)."
+    )
+    parser.add_argument("--http-server", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--year", type=int, default=int(time.strftime("%y")))
+    parser.add_argument("--month", type=int, default=int(time.strftime("%m")))
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch station (logs, history) afterwards.")
+    args = parser.parse_args(argv)
+
+    try:
+        counts = [int(part) for part in args.fixtures.split(",") if part.strip()]
+    except ValueError:
+        parser.error("--fixtures must be comma-separated integers")
+    if not counts or min(counts) < 1 or args.units < 1 or args.stations < 1:
+        parser.error("fixture counts, --units and --stations must be positive")
+    if args.stations * sum(counts) * args.units > 9999:
+        parser.error("the runs need more serials than one batch holds")
+
+    stations: list[Station] = []
+    results = []
+    try:
+        for index in range(args.stations):
+            stations.append(Station(args, max(counts), f"bench-{index + 1}"))
+        if args.stations > 1:
+            url = stations[0].start_coordinator()
+            for station in stations:
+                station.env["FLEX_COORDINATOR_URL"] = url
+        for station in stations:
+            station.start()
+        next_serial = 1
+        for fixtures in counts:
+            results.append(run_scenario(stations, fixtures, next_serial, args))
+            next_serial += args.stations * fixtures * args.units
+    except (BenchError, OSError, ValueError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        for station in stations:
+            station.stop()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results, args)
+    return 0 if all(result["failed"] == 0 and not result["errors"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
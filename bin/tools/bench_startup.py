@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Start-up benchmark of the flasher GUI: time to listen, to first paint and to ready.
+
+The production directory is copied to a scratch directory (as in bench_flash.py) and the GUI is
+started there --runs times. Each run measures, from process launch: the "listening on" line, the
+first successful GET / (the page the browser paints) and the moment /state reports every start-up
+task settled. --slow-git puts a git on PATH that sleeps first, standing in for a station with a slow
+disk or network; first paint must not wait for it. The exit status is 1 when the median first paint
+exceeds --budget, so the benchmark can guard start-up in CI or before a release.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from bench_flash import COPY_IGNORE, LISTENING_RE, PRODUCTION_DIR
+
+POLL_INTERVAL = 0.01
+RUN_TIMEOUT = 60.0
+
+
+def _slow_git(directory: Path, delay: float) -> None:
+    real = shutil.which("git")
+    directory.mkdir(parents=True, exist_ok=True)
+    shim = directory / "git"
+    shim.write_text(f'#!/bin/sh\nsleep {delay}\nexec "{real or "false"}" "$@"\n')
+    shim.chmod(0o755)
+
+
+def _get(url: str) -> dict[str, object] | None:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read()
+    except (urllib.error.URLError, OSError):
+        return None
+    return json.loads(body) if body.startswith(b"{") else {}
+
+
+def measure(root: Path, env: dict[str, str]) -> dict[str, float]:
+    launched = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(root / "flash_gui.py")],
+        cwd=str(root),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+    found: dict[str, object] = {}
+    heard = threading.Event()
+    output: list[str] = []
+
+    def drain() -> None:
+        assert process.stdout is not None
+        for line in process.stdout:
+            output.append(line.rstrip())
+            match = LISTENING_RE.search(line)
+            if match and not heard.is_set():
+                found["url"], found["listening"] = match.group(1), time.perf_counter() - launched
+                heard.set()
+        heard.set()
+
+    threading.Thread(target=drain, daemon=True).start()
+    try:
+        if not heard.wait(RUN_TIMEOUT) or "url" not in found:
+            raise RuntimeError("the GUI did not start: " + " | ".join(output[-5:]))
+        url = str(found["url"])
+        deadline = launched + RUN_TIMEOUT
+        while _get(url) is None:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("GET / never succeeded")
+            time.sleep(POLL_INTERVAL)
+        first_paint = time.perf_counter() - launched
+        while True:
+            state = _get(url + "state") or {}
+            if dict(state.get("startup") or {}).get("ready"):
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError("start-up tasks did not settle")
+            time.sleep(POLL_INTERVAL)
+        ready = time.perf_counter() - launched
+    finally:
+        process.terminate()
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {
+        "listening": round(float(found["listening"]), 3),
+        "first_paint": round(first_paint, 3),
+        "ready": round(ready, 3),
+    }
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="GUI launches to time (the first one is cold).")
+    parser.add_argument("--budget", type=float, default=1.5, help="Allowed median seconds to first paint.")
+    parser.add_argument("--slow-git", type=float, default=0.0, help="Seconds every git call sleeps first.")
+    parser.add_argument("--http-server", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory afterwards.")
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs must be positive")
+
+    scratch = Path(tempfile.mkdtemp(prefix="flex_startup_"))
+    root = scratch / "bin"
+    shutil.copytree(PRODUCTION_DIR, root, ignore=COPY_IGNORE)
+    env = dict(os.environ)
+    env.update(
+        {
+            "FLEX_OPEN_BROWSER": "0",
+            "FLEX_RELEASE_UPDATE_INTERVAL": "0",
+            "FLEX_HTTP_SERVER": args.http_server,
+            "FLEX_PORT_GLOBS": str(scratch / "no-ports" / "*"),
+        }
+    )
+    if args.slow_git > 0:
+        _slow_git(scratch / "slowbin", args.slow_git)
+        env["PATH"] = f"{scratch / 'slowbin'}{os.pathsep}{env.get('PATH', '')}"
+    runs = []
+    try:
+        for _ in range(args.runs):
+            runs.append(measure(root, env))
+    except (RuntimeError, OSError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if args.keep:
+            print(f"Scratch directory kept at {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    median = {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+    within = median["first_paint"] <= args.budget
+    if args.json:
+        print(json.dumps({"runs": runs, "median": median, "budget": args.budget, "ok": within}, indent=2))
+    else:
+        print(f"{'run':>4} {'listening':>10} {'first paint':>12} {'ready':>8}")
+        for index, run in enumerate(runs, 1):
+            print(f"{index:>4} {run['listening']:>10} {run['first_paint']:>12} {run['ready']:>8}")
+        print(f"{'med':>4} {median['listening']:>10} {median['first_paint']:>12} {median['ready']:>8}")
+        print(f"First paint budget {args.budget} s: {'ok' if within else 'EXCEEDED'}")
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
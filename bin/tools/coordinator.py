@@ -0,0 +1,711 @@
+#!/usr/bin/env python3
+"""Line coordinator: hands out serial leases to flashing stations and aggregates their throughput.
+
+Without it every station's GUI is on its own and two stations can flash the same FP<batch>-<YYMM><serial>.
+`coordinator.py serve` runs one process for the line; each station's GUI registers with it when
+FLEX_COORDINATOR_URL is set. Serials are leased in blocks of FLEX_COORDINATOR_BLOCK, so a station asks
+once per block rather than once per unit, and a serial typed by hand is claimed on its own before the
+flash starts. A lease lives while its station keeps sending heartbeats; when a station disappears for
+FLEX_COORDINATOR_LEASE_TTL seconds, its unflashed serials go back to the pool. Stations report each
+job's start and result, and the coordinator's page shows per-station and whole-line units per hour.
+
+CoordinatorClient is the station side used by flash_gui.py.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import NamedTuple
+
+import async_http
+import unit_store
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DB_PATH = PRODUCTION_DIR / "logs" / "coordinator.sqlite3"
+DEFAULT_PORT = 8765
+LEASE_BLOCK = int(os.environ.get("FLEX_COORDINATOR_BLOCK", "10"))
+LEASE_TTL = float(os.environ.get("FLEX_COORDINATOR_LEASE_TTL", "600"))
+HEARTBEAT_INTERVAL = 10.0
+# A station that has not sent a heartbeat for this long is shown offline.
+STATION_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+THROUGHPUT_WINDOW = 3600.0
+REQUEST_TIMEOUT = 5.0
+# Seconds a serial handed out by next_serial() is kept from the station's other fixtures.
+OFFER_HOLD = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stations (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    url TEXT,
+    registered_at REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    active_jobs INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY,
+    station INTEGER NOT NULL,
+    batch INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER NOT NULL,
+    granted_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    released_at REAL
+);
+CREATE INDEX IF NOT EXISTS leases_open ON leases (batch, year, month, released_at, expires_at);
+CREATE TABLE IF NOT EXISTS flashed (
+    batch INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    serial INTEGER NOT NULL,
+    station INTEGER NOT NULL,
+    mac TEXT,
+    at REAL NOT NULL,
+    PRIMARY KEY (batch, year, month, serial)
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    station INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    port TEXT,
+    ok INTEGER,
+    seconds REAL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_at ON events (at);
+"""
+
+
+class CoordinatorError(RuntimeError):
+    pass
+
+
+class CoordinatorUnreachable(CoordinatorError):
+    """No answer (or an unknown-station answer): the request is worth repeating later."""
+
+
+class LeaseKey(NamedTuple):
+    batch: int
+    year: int
+    month: int
+
+
+class CoordinatorStore:
+    """Stations, leases, flashed serials and job events in one SQLite file; thread-safe."""
+
+    def __init__(self, path: Path = DEFAULT_DB_PATH, lease_ttl: float = LEASE_TTL) -> None:
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def register(self, name: str, url: str | None, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO stations (name, url, registered_at, last_seen) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET url = excluded.url, last_seen = excluded.last_seen",
+                (name, url, now, now),
+            )
+            self._conn.commit()
+            return int(self._conn.execute("SELECT id FROM stations WHERE name = ?", (name,)).fetchone()[0])
+
+    def heartbeat(self, station: int, active_jobs: int, now: float | None = None) -> list[dict[str, object]]:
+        """Mark the station alive and extend its open leases; returns them so the station can resync."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE stations SET last_seen = ?, active_jobs = ? WHERE id = ?", (now, active_jobs, station)
+            )
+            if cursor.rowcount == 0:
+                raise KeyError(station)
+            self._conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE station = ? AND released_at IS NULL AND expires_at > ?",
+                (now + self.lease_ttl, station, now),
+            )
+            self._conn.commit()
+            return self._open_leases_locked(now, station)
+
+    def _open_leases_locked(self, now: float, station: int | None = None) -> list[dict[str, object]]:
+        sql = "SELECT * FROM leases WHERE released_at IS NULL AND expires_at > ?"
+        values: list[object] = [now]
+        if station is not None:
+            sql += " AND station = ?"
+            values.append(station)
+        return [dict(row) for row in self._conn.execute(sql + " ORDER BY id", values)]
+
+    def _taken_locked(self, key: LeaseKey, now: float) -> dict[int, tuple[int | None, str]]:
+        """Serials of key that are leased or already flashed: (open lease id or None, who holds them)."""
+        taken: dict[int, tuple[int | None, str]] = {}
+        names = {row["id"]: row["name"] for row in self._conn.execute("SELECT id, name FROM stations")}
+        for row in self._conn.execute(
+            "SELECT id, station, first, last FROM leases"
+            " WHERE batch = ? AND year = ? AND month = ? AND released_at IS NULL AND expires_at > ?",
+            (*key, now),
+        ):
+            for serial in range(row["first"], row["last"] + 1):
+                taken[serial] = (row["id"], f"leased to {names.get(row['station'], row['station'])}")
+        for row in self._conn.execute(
+            "SELECT serial, station FROM flashed WHERE batch = ? AND year = ? AND month = ?", key
+        ):
+            taken[row["serial"]] = (None, f"already flashed by {names.get(row['station'], row['station'])}")
+        return taken
+
+    def lease(
+        self,
+        station: int,
+        key: LeaseKey,
+        count: int = LEASE_BLOCK,
+        serial: int | None = None,
+        now: float | None = None,
+    ) -> dict[str, object]:
+        """Lease `serial` alone, or the lowest run of up to `count` free serials of the batch/month."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM stations WHERE id = ?", (station,)).fetchone() is None:
+                raise KeyError(station)
+            taken = self._taken_locked(key, now)
+            if serial is not None:
+                lease_id, holder = taken.get(serial, (None, ""))
+                if lease_id is not None:
+                    row = self._conn.execute("SELECT * FROM leases WHERE id = ?", (lease_id,)).fetchone()
+                    if row["station"] == station:
+                        return dict(row)  # Already this station's; it lost track of the lease.
+                if holder:
+                    raise CoordinatorError(f"{unit_store.format_identifier(*key, serial)} is {holder}.")
+                first = last = serial
+            else:
+                first = next(
+                    (s for s in range(unit_store.SERIAL_MIN, unit_store.SERIAL_MAX + 1) if s not in taken), None
+                )
+                if first is None:
+                    raise CoordinatorError(f"Batch {key.batch:02d} {key.year:02d}/{key.month:02d} has no free serials left.")
+                last = first
+                while last - first + 1 < max(1, count) and last + 1 <= unit_store.SERIAL_MAX and last + 1 not in taken:
+                    last += 1
+            cursor = self._conn.execute(
+                "INSERT INTO leases (station, batch, year, month, first, last, granted_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (station, *key, first, last, now, now + self.lease_ttl),
+            )
+            self._conn.commit()
+            return dict(self._conn.execute("SELECT * FROM leases WHERE id = ?", (cursor.lastrowid,)).fetchone())
+
+    def release(self, station: int, lease_id: int, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE leases SET released_at = ? WHERE id = ? AND station = ? AND released_at IS NULL",
+                (now, lease_id, station),
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def event(
+        self,
+        station: int,
+        kind: str,
+        serial: str,
+        key: LeaseKey | None = None,
+        serial_number: int | None = None,
+        port: str | None = None,
+        ok: bool | None = None,
+        seconds: float | None = None,
+        mac: str | None = None,
+        at: float | None = None,
+    ) -> None:
+        at = time.time() if at is None else at
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (station, kind, serial, port, ok, seconds, at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (station, kind, serial, port, None if ok is None else int(ok), seconds, at),
+            )
+            if kind == "finished" and ok and key is not None and serial_number is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO flashed (batch, year, month, serial, station, mac, at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*key, serial_number, station, mac.lower() if mac else None, at),
+                )
+            self._conn.commit()
+
+    def summary(self, now: float | None = None) -> dict[str, object]:
+        """Per-station and line totals over the last hour, plus the open leases."""
+        now = time.time() if now is None else now
+        since = now - THROUGHPUT_WINDOW
+        with self._lock:
+            stations = [dict(row) for row in self._conn.execute("SELECT * FROM stations ORDER BY name")]
+            counts = {
+                row["station"]: row
+                for row in self._conn.execute(
+                    "SELECT station, SUM(ok) AS ok, COUNT(*) - SUM(ok) AS failed, MIN(at - COALESCE(seconds, 0)) AS first"
+                    " FROM events WHERE kind = 'finished' AND at >= ? GROUP BY station",
+                    (since,),
+                )
+            }
+            leases = self._open_leases_locked(now)
+            flashed = {
+                row["station"]: row["n"]
+                for row in self._conn.execute("SELECT station, COUNT(*) AS n FROM flashed GROUP BY station")
+            }
+        remaining: dict[int, int] = {}
+        for lease in leases:
+            remaining[int(lease["station"])] = remaining.get(int(lease["station"]), 0) + int(lease["last"]) - int(lease["first"]) + 1
+        line_ok = line_failed = 0
+        line_first: float | None = None
+        for station in stations:
+            row = counts.get(station["id"])
+            ok = int(row["ok"] or 0) if row else 0
+            failed = int(row["failed"] or 0) if row else 0
+            first = float(row["first"]) if row else None
+            station.update(
+                online=now - float(station["last_seen"]) <= STATION_TIMEOUT,
+                ok_last_hour=ok,
+                failed_last_hour=failed,
+                units_per_hour=_rate(ok, first, now),
+                leased_serials=remaining.get(station["id"], 0),
+                flashed_total=flashed.get(station["id"], 0),
+            )
+            line_ok += ok
+            line_failed += failed
+            if first is not None:
+                line_first = first if line_first is None else min(line_first, first)
+        return {
+            "stations": stations,
+            "leases": leases,
+            "line": {
+                "ok_last_hour": line_ok,
+                "failed_last_hour": line_failed,
+                "units_per_hour": _rate(line_ok, line_first, now),
+                "active_jobs": sum(int(s["active_jobs"]) for s in stations if s["online"]),
+                "stations_online": sum(1 for s in stations if s["online"]),
+            },
+        }
+
+
+def _rate(units: int, first: float | None, now: float) -> float:
+    """Units per hour since the first job in the window (a line that started ten minutes ago is not diluted)."""
+    if not units or first is None:
+        return 0.0
+    return round(units * 3600 / max(60.0, min(THROUGHPUT_WINDOW, now - first)), 1)
+
+
+DASHBOARD_HTML = """<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Flex Plus line</title>
+  <style>
+    body { font-family: system-ui, -apple-system, "Segoe UI", sans-serif; margin: 24px; color: #0f172a; }
+    h1 { font-size: 1.4rem; }
+    .totals { display: flex; gap: 32px; margin-bottom: 16px; }
+    .totals div { font-size: 0.9rem; color: #475569; }
+    .totals strong { display: block; font-size: 1.6rem; color: #0f172a; }
+    table { border-collapse: collapse; width: 100%; }
+    th, td { text-align: left; padding: 6px 10px; border-bottom: 1px solid #e2e8f0; font-size: 0.9rem; }
+    .offline { color: #94a3b8; }
+  </style>
+</head>
+<body>
+  <h1>Flex Plus production line</h1>
+  <div class="totals">
+    <div><strong id="rate">-</strong>units / hour</div>
+    <div><strong id="ok">-</strong>flashed (last hour)</div>
+    <div><strong id="failed">-</strong>failed (last hour)</div>
+    <div><strong id="active">-</strong>jobs running</div>
+  </div>
+  <table>
+    <thead><tr><th>Station</th><th>State</th><th>Jobs</th><th>Units / hour</th><th>OK / failed (hour)</th><th>Flashed</th><th>Leased serials</th></tr></thead>
+    <tbody id="stations"></tbody>
+  </table>
+  <script>
+    async function refresh() {
+      try {
+        const response = await fetch('/summary');
+        const data = await response.json();
+        document.getElementById('rate').textContent = data.line.units_per_hour;
+        document.getElementById('ok').textContent = data.line.ok_last_hour;
+        document.getElementById('failed').textContent = data.line.failed_last_hour;
+        document.getElementById('active').textContent = data.line.active_jobs;
+        const body = document.getElementById('stations');
+        body.innerHTML = '';
+        data.stations.forEach(station => {
+          const row = document.createElement('tr');
+          if (!station.online) row.className = 'offline';
+          const name = document.createElement('td');
+          if (station.url) {
+            const link = document.createElement('a');
+            link.href = station.url;
+            link.target = '_blank';
+            link.textContent = station.name;
+            name.appendChild(link);
+          } else {
+            name.textContent = station.name;
+          }
+          row.appendChild(name);
+          [
+            station.online ? 'online' : 'offline',
+            station.active_jobs,
+            station.units_per_hour,
+            `${station.ok_last_hour} / ${station.failed_last_hour}`,
+            station.flashed_total,
+            station.leased_serials
+          ].forEach(text => {
+            const cell = document.createElement('td');
+            cell.textContent = text;
+            row.appendChild(cell);
+          });
+          body.appendChild(row);
+        });
+      } catch (err) {
+        console.error('Summary poll failed', err);
+      }
+    }
+    refresh();
+    setInterval(refresh, 2000);
+  </script>
+</body>
+</html>
+"""
+DASHBOARD_ASSET = async_http.StaticAsset(DASHBOARD_HTML.encode("utf-8"), "text/html; charset=utf-8")
+
+
+def _json(payload: dict[str, object], status: int = 200) -> async_http.Response:
+    return async_http.Response(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+
+def _fields(body: bytes) -> dict[str, str]:
+    return {key: values[0].strip() for key, values in urllib.parse.parse_qs(body.decode("utf-8")).items() if values}
+
+
+def _key(fields: dict[str, str]) -> LeaseKey:
+    key = LeaseKey(int(fields["batch"]), int(fields["year"]), int(fields["month"]))
+    if not 0 <= key.batch <= 99:
+        raise ValueError("Batch must be between 00 and 99.")
+    unit_store.validate_year(key.year)
+    unit_store.validate_month(key.month)
+    return key
+
+
+class CoordinatorApi:
+    def __init__(self, store: CoordinatorStore) -> None:
+        self.store = store
+
+    def handle(self, request: async_http.Request) -> async_http.Response:
+        if request.method in ("GET", "HEAD"):
+            if request.path == "/":
+                return DASHBOARD_ASSET.response(request.headers)
+            if request.path == "/summary":
+                return _json({"ok": True, **self.store.summary()})
+            return async_http.text_response(404, "Not found")
+        if request.method != "POST":
+            return async_http.text_response(405, "Method not allowed")
+        fields = _fields(request.body)
+        try:
+            if request.path == "/register":
+                if not fields.get("name"):
+                    raise ValueError("A station name is required.")
+                return _json({"ok": True, "station": self.store.register(fields["name"], fields.get("url"))})
+            station = int(fields.get("station", ""))
+            if "serial" in fields and request.path == "/lease":
+                unit_store.validate_serial(int(fields["serial"]))
+            if request.path == "/heartbeat":
+                leases = self.store.heartbeat(station, int(fields.get("active", "0") or 0))
+                return _json({"ok": True, "leases": leases})
+            if request.path == "/lease":
+                serial = int(fields["serial"]) if fields.get("serial") else None
+                count = int(fields.get("count") or LEASE_BLOCK)
+                return _json({"ok": True, "lease": self.store.lease(station, _key(fields), count, serial)})
+            if request.path == "/release":
+                return _json({"ok": self.store.release(station, int(fields.get("lease", "")))})
+            if request.path == "/event":
+                ok = fields["ok"] in ("1", "true", "on") if "ok" in fields else None
+                self.store.event(
+                    station,
+                    fields.get("kind", ""),
+                    fields.get("serial", ""),
+                    _key(fields) if "batch" in fields else None,
+                    int(fields["serial_number"]) if fields.get("serial_number") else None,
+                    fields.get("port") or None,
+                    ok,
+                    float(fields["seconds"]) if fields.get("seconds") else None,
+                    fields.get("mac") or None,
+                    float(fields["at"]) if fields.get("at") else None,
+                )
+                return _json({"ok": True})
+        except KeyError:
+            return _json({"ok": False, "error": "Unknown station; register again."}, status=404)
+        except CoordinatorError as exc:
+            return _json({"ok": False, "error": str(exc)}, status=409)
+        except (TypeError, ValueError) as exc:
+            return _json({"ok": False, "error": str(exc)}, status=400)
+        return async_http.text_response(404, "Not found")
+
+
+class CoordinatorClient:
+    """A station's link to the coordinator: holds its leases, claims serials and reports job events.
+
+    Claims are synchronous, since a flash must not start on a serial another station holds; events
+    and heartbeats go through a background thread so a slow coordinator never stalls a job.
+    """
+
+    def __init__(self, url: str, name: str, block: int = LEASE_BLOCK) -> None:
+        self.url = url.rstrip("/") + "/"
+        self.name = name
+        self.block = max(1, block)
+        self.station_url: str | None = None
+        self._lock = threading.Lock()
+        self._station: int | None = None
+        self._leases: dict[int, dict[str, object]] = {}
+        self._granted: set[int] = set()
+        self._done: set[tuple[int, int, int, int]] = set()
+        self._flashing: set[tuple[int, int, int, int]] = set()
+        self._offered: dict[tuple[int, int, int, int], float] = {}
+        self._next_lock = threading.Lock()
+        self._outbox: queue.Queue[tuple[str, dict[str, object]]] = queue.Queue()
+        self._active_jobs = 0
+        self.last_error: str | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="coordinator", daemon=True)
+            self._thread.start()
+
+    def _post(self, path: str, **fields: object) -> dict[str, object]:
+        body = urllib.parse.urlencode({k: v for k, v in fields.items() if v is not None}).encode("ascii")
+        request = urllib.request.Request(self.url + path, data=body, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as exc:
+            try:
+                payload = json.loads(exc.read() or b"{}")
+            except ValueError:
+                payload = {}
+            message = str(payload.get("error") or f"coordinator answered HTTP {exc.code}")
+            if exc.code == 404 and path != "register":
+                with self._lock:
+                    self._station = None  # The coordinator lost this station (new database); register again.
+                raise CoordinatorUnreachable(message) from None
+            raise CoordinatorError(message) from None
+        except (OSError, ValueError) as exc:
+            raise CoordinatorUnreachable(f"coordinator at {self.url} is unreachable: {exc}") from None
+
+    def _station_id(self) -> int:
+        with self._lock:
+            station = self._station
+        if station is None:
+            station = int(self._post("register", name=self.name, url=self.station_url)["station"])
+            with self._lock:
+                self._station = station
+        return station
+
+    def _held(self, key: LeaseKey) -> list[int]:
+        with self._lock:
+            return sorted(
+                serial
+                for lease in self._leases.values()
+                if LeaseKey(int(lease["batch"]), int(lease["year"]), int(lease["month"])) == key
+                for serial in range(int(lease["first"]), int(lease["last"]) + 1)
+                if (*key, serial) not in self._done and (*key, serial) not in self._flashing
+            )
+
+    def _add_lease(self, lease: dict[str, object]) -> None:
+        with self._lock:
+            self._leases[int(lease["id"])] = lease
+            self._granted.add(int(lease["id"]))
+
+    def _exhausted_locked(self, lease: dict[str, object]) -> bool:
+        key = (int(lease["batch"]), int(lease["year"]), int(lease["month"]))
+        return all((*key, serial) in self._done for serial in range(int(lease["first"]), int(lease["last"]) + 1))
+
+    def claim(self, key: LeaseKey, serial: int) -> None:
+        """Make sure this station holds serial; raises CoordinatorError if another one does."""
+        with self._lock:
+            if (*key, serial) in self._flashing:
+                return
+        if serial in self._held(key):
+            return
+        station = self._station_id()
+        self._add_lease(dict(self._post("lease", station=station, serial=serial, **key._asdict())["lease"]))
+
+    def next_serial(self, key: LeaseKey) -> int:
+        """The lowest serial this station holds and has not flashed or offered; leases a block when none is left.
+
+        An offered serial is held back from other fixtures for OFFER_HOLD seconds, or until its flash starts.
+        """
+        with self._next_lock:
+            now = time.monotonic()
+            with self._lock:
+                self._offered = {serial: at for serial, at in self._offered.items() if now - at < OFFER_HOLD}
+                offered = set(self._offered)
+            serial = next((s for s in self._held(key) if (*key, s) not in offered), None)
+            if serial is None:
+                station = self._station_id()
+                lease = dict(self._post("lease", station=station, count=self.block, **key._asdict())["lease"])
+                self._add_lease(lease)
+                serial = int(lease["first"])
+            with self._lock:
+                self._offered[(*key, serial)] = now
+            return serial
+
+    def job_started(self, key: LeaseKey, serial_number: int, serial: str, port: str | None) -> None:
+        with self._lock:
+            self._active_jobs += 1
+            self._flashing.add((*key, serial_number))
+            self._offered.pop((*key, serial_number), None)
+        self._outbox.put(("event", {"kind": "started", "serial": serial, "port": port, "at": time.time()}))
+
+    def job_finished(
+        self, key: LeaseKey, serial_number: int, serial: str, port: str | None, ok: bool, seconds: float, mac: str | None
+    ) -> None:
+        released = []
+        with self._lock:
+            self._active_jobs = max(0, self._active_jobs - 1)
+            self._flashing.discard((*key, serial_number))
+            if ok:
+                self._done.add((*key, serial_number))
+                for lease_id, lease in list(self._leases.items()):
+                    if self._exhausted_locked(lease):
+                        del self._leases[lease_id]
+                        released.append(lease_id)
+        fields = {
+            "kind": "finished",
+            "serial": serial,
+            "serial_number": serial_number,
+            "port": port,
+            "ok": int(ok),
+            "seconds": round(seconds, 3),
+            "mac": mac,
+            "at": time.time(),
+            **key._asdict(),
+        }
+        self._outbox.put(("event", fields))
+        for lease_id in released:
+            self._outbox.put(("release", {"lease": lease_id}))
+
+    def status(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "url": self.url,
+                "station": self.name,
+                "registered": self._station is not None,
+                "leases": [dict(lease) for lease in self._leases.values()],
+                "error": self.last_error,
+            }
+
+    def _loop(self) -> None:
+        next_heartbeat = 0.0
+        pending: list[tuple[str, dict[str, object]]] = []
+        while True:
+            timeout = max(0.0, next_heartbeat - time.monotonic())
+            try:
+                pending.append(self._outbox.get(timeout=timeout))
+                while True:
+                    pending.append(self._outbox.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                station = self._station_id()
+                while pending:
+                    path, fields = pending[0]
+                    try:
+                        self._post(path, station=station, **fields)
+                    except CoordinatorUnreachable:
+                        raise
+                    except CoordinatorError as exc:
+                        # Rejected outright (not a lost connection); retrying would not help.
+                        print(f"Warning: coordinator rejected a {path}: {exc}", file=sys.stderr)
+                    pending.pop(0)
+                if time.monotonic() >= next_heartbeat:
+                    with self._lock:
+                        active = self._active_jobs
+                        self._granted.clear()
+                    leases = self._post("heartbeat", station=station, active=active)["leases"]
+                    with self._lock:
+                        # The coordinator's view wins, so expired leases are dropped here too; leases granted
+                        # while the heartbeat was in flight are kept, and fully flashed ones are released.
+                        held = {int(lease["id"]): dict(lease) for lease in leases}  # type: ignore[union-attr]
+                        held.update({lease_id: self._leases[lease_id] for lease_id in self._granted if lease_id in self._leases})
+                        for lease_id, lease in list(held.items()):
+                            if self._exhausted_locked(lease):
+                                del held[lease_id]
+                                self._outbox.put(("release", {"lease": lease_id}))
+                        self._leases = held
+                    next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
+                self.last_error = None
+            except CoordinatorError as exc:
+                if self.last_error != str(exc):
+                    print(f"Warning: {exc}", file=sys.stderr)
+                self.last_error = str(exc)
+                next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Run the coordinator for the line.")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on (0.0.0.0 for other machines).")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (0 picks a free one).")
+    serve.add_argument("--db", default=str(DEFAULT_DB_PATH), help="SQLite file for stations, leases and events.")
+    sub.add_parser("summary", help="Print a running coordinator's summary.").add_argument(
+        "--url", default=f"http://127.0.0.1:{DEFAULT_PORT}/"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        try:
+            with urllib.request.urlopen(args.url.rstrip("/") + "/summary", timeout=REQUEST_TIMEOUT) as response:
+                print(json.dumps(json.loads(response.read()), indent=2))
+        except (OSError, ValueError) as exc:
+            print(f"Error: {exc}", file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        store = CoordinatorStore(Path(args.db))
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    api = CoordinatorApi(store)
+
+    async def handle(request: async_http.Request) -> async_http.Response:
+        return api.handle(request)
+
+    def announce(host: str, port: int) -> None:
+        print(f"Flex Plus coordinator listening on http://{host}:{port}/", flush=True)
+
+    try:
+        async_http.serve(handle, args.host, args.port, on_ready=announce)
+    except KeyboardInterrupt:
+        print("\nStopping coordinator...")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Chip identity registry: which physical board (factory MAC) was flashed as which FP serial.
+
+Every successful flash records MAC -> serial. Before anything is written, the flasher reads the MAC
+at connect time and checks it here: a board already flashed as another serial, or a serial already
+given to another board, is a conflict (refused unless FLEX_DEVICE_CONFLICTS=warn), and a board
+flashed before with the same serial is re-flashed as a rework. Lookups are primary-key and index
+seeks in logs/device_registry.sqlite3; an empty registry is seeded from the flash history's
+successful attempts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from flash_history import DEFAULT_HISTORY_PATH, SUCCESS_STATUSES
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_REGISTRY_PATH = PRODUCTION_DIR / "logs" / "device_registry.sqlite3"
+# "block" refuses to flash on a conflict; "warn" logs it and flashes anyway (latest serial wins).
+BLOCK_CONFLICTS = os.environ.get("FLEX_DEVICE_CONFLICTS", "block").strip().lower() != "warn"
+# Lines the helper scripts and the GUI print, so the GUI can follow a script-run check.
+REWORK_NOTE = "Re-flashing as a rework"
+CONFLICT_NOTE = "Identity conflict:"
+MAC_FORMAT_RE = re.compile(r"^(?:[0-9a-f]{2}:){5}[0-9a-f]{2}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    mac TEXT PRIMARY KEY,
+    serial TEXT NOT NULL,
+    release TEXT,
+    station TEXT,
+    first_flashed_at REAL NOT NULL,
+    last_flashed_at REAL NOT NULL,
+    flashes INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS devices_serial ON devices (serial, last_flashed_at);
+"""
+
+
+def normalize_mac(value: str) -> str:
+    """'24:0a:c4:..' from any case or '-'/'' separators; raises ValueError otherwise."""
+    digits = re.sub(r"[^0-9a-fA-F]", "", value)
+    mac = ":".join(digits[index : index + 2] for index in range(0, len(digits), 2)).lower()
+    if not MAC_FORMAT_RE.match(mac):
+        raise ValueError(f"invalid MAC address '{value}'")
+    return mac
+
+
+class Verdict(NamedTuple):
+    """Outcome of check(): status is new, known, mac_conflict or serial_conflict."""
+
+    status: str
+    mac: str
+    serial: str
+    known_serial: str | None = None
+    known_mac: str | None = None
+    message: str = ""
+
+    @property
+    def conflict(self) -> bool:
+        return self.status in ("mac_conflict", "serial_conflict")
+
+
+def _when(stamp: object) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(float(stamp)))  # type: ignore[arg-type]
+
+
+class DeviceRegistry:
+    def __init__(self, path: Path = DEFAULT_REGISTRY_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "DeviceRegistry":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0])
+
+    def lookup(self, mac: str) -> dict[str, object] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM devices WHERE mac = ?", (normalize_mac(mac),)).fetchone()
+        return dict(row) if row else None
+
+    def by_serial(self, serial: str) -> dict[str, object] | None:
+        """The board most recently flashed as serial."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM devices WHERE serial = ? ORDER BY last_flashed_at DESC LIMIT 1", (serial,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def check(self, mac: str, serial: str) -> Verdict:
+        """Classify flashing the board with this MAC as serial, before anything is written."""
+        mac = normalize_mac(mac)
+        device = self.lookup(mac)
+        if device is not None and device["serial"] == serial:
+            return Verdict(
+                "known",
+                mac,
+                serial,
+                known_serial=serial,
+                message=f"Board {mac} was flashed as {serial} on {_when(device['last_flashed_at'])}.",
+            )
+        if device is not None:
+            return Verdict(
+                "mac_conflict",
+                mac,
+                serial,
+                known_serial=str(device["serial"]),
+                message=(
+                    f"Board {mac} was already flashed as {device['serial']} on {_when(device['last_flashed_at'])}"
+                    f" ({device['station'] or 'unknown station'});"
+                    f" flashing it as {serial} would give it a second serial."
+                ),
+            )
+        owner = self.by_serial(serial)
+        if owner is not None:
+            return Verdict(
+                "serial_conflict",
+                mac,
+                serial,
+                known_mac=str(owner["mac"]),
+                message=(
+                    f"{serial} already belongs to board {owner['mac']} (flashed {_when(owner['last_flashed_at'])}"
+                    f" on {owner['station'] or 'unknown station'}); board {mac} needs a serial of its own."
+                ),
+            )
+        return Verdict("new", mac, serial)
+
+    def record(
+        self,
+        mac: str,
+        serial: str,
+        release: str | None = None,
+        station: str | None = None,
+        flashed_at: float | None = None,
+    ) -> None:
+        """Note a successful flash; a board re-flashed under another serial keeps the newest one."""
+        flashed_at = time.time() if flashed_at is None else flashed_at
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO devices (mac, serial, release, station, first_flashed_at, last_flashed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(mac) DO UPDATE SET serial = excluded.serial,"
+                " release = COALESCE(excluded.release, release), station = COALESCE(excluded.station, station),"
+                " last_flashed_at = MAX(last_flashed_at, excluded.last_flashed_at), flashes = flashes + 1",
+                (normalize_mac(mac), serial, release, station, flashed_at, flashed_at),
+            )
+            self._conn.commit()
+
+    def import_history(self, history_path: Path) -> int:
+        """Seed the registry from successful flash-history attempts that carry a MAC, oldest first."""
+        source = sqlite3.connect(f"file:{history_path}?mode=ro", uri=True, timeout=10)
+        try:
+            placeholders = ", ".join("?" for _ in SUCCESS_STATUSES)
+            rows = source.execute(
+                "SELECT mac, serial, release, COALESCE(finished_at, started_at) FROM attempts"
+                f" WHERE mac IS NOT NULL AND status IN ({placeholders}) ORDER BY started_at",
+                SUCCESS_STATUSES,
+            ).fetchall()
+        finally:
+            source.close()
+        imported = 0
+        for mac, serial, release, flashed_at in rows:
+            try:
+                self.record(mac, serial, release, None, float(flashed_at))
+            except ValueError:
+                continue
+            imported += 1
+        return imported
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registry", default=str(DEFAULT_REGISTRY_PATH), help="SQLite registry file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser(
+        "check", help="Print DEVICE_STATUS (new, known, mac_conflict, serial_conflict) and DEVICE_MESSAGE for eval."
+    )
+    check.add_argument("--mac", required=True)
+    check.add_argument("--serial", required=True)
+    record = sub.add_parser("record", help="Record a successful flash (used by the helper scripts).")
+    record.add_argument("--mac", required=True)
+    record.add_argument("--serial", required=True)
+    record.add_argument("--release")
+    record.add_argument("--station")
+    lookup = sub.add_parser("lookup", help="Print the board recorded for a MAC or serial as JSON.")
+    lookup.add_argument("--mac")
+    lookup.add_argument("--serial")
+    importer = sub.add_parser("import", help="Seed the registry from a flash history database.")
+    importer.add_argument("history", nargs="?", default=str(DEFAULT_HISTORY_PATH))
+    args = parser.parse_args(argv)
+
+    try:
+        with DeviceRegistry(Path(args.registry)) as registry:
+            if args.command == "check":
+                verdict = registry.check(args.mac, args.serial)
+                print(f"DEVICE_STATUS={verdict.status}")
+                print(f"DEVICE_MESSAGE={shlex.quote(verdict.message)}")
+            elif args.command == "record":
+                registry.record(args.mac, args.serial, args.release, args.station)
+            elif args.command == "lookup":
+                if not args.mac and not args.serial:
+                    parser.error("lookup needs --mac or --serial")
+                device = registry.lookup(args.mac) if args.mac else registry.by_serial(args.serial)
+                if device is None:
+                    print("Error: no board recorded.", file=sys.stderr)
+                    return 1
+                print(json.dumps(device, indent=2))
+            else:
+                print(f"Imported {registry.import_history(Path(args.history))} flash(es) from {args.history}.")
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Per-board flash encryption state, keyed by the chip's factory MAC.
+
+A full `espefuse summary` reads and decodes every eFuse block only to find FLASH_CRYPT_CNT. The
+flashers read it with one register read instead: FLASH_CRYPT_CNT is bits 20-26 of EFUSE_BLK0_RDATA0,
+and esptool's connect banner carries the MAC. `probe` decodes both from `esptool read-mem 0x3ff5a000`
+for any board; the registry records the state each board was left in, per key fingerprint. Entries
+recorded under a different key fingerprint are dropped on lookup.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_REGISTRY_PATH = PRODUCTION_DIR / "logs" / "efuse_registry.sqlite3"
+
+EFUSE_BLK0_RDATA0 = 0x3FF5A000
+FLASH_CRYPT_CNT_SHIFT = 20
+FLASH_CRYPT_CNT_MASK = 0x7F
+
+MAC_RE = re.compile(r"MAC:\s*((?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2})")
+_READ_MEM_RE = re.compile(rf"0x0*{EFUSE_BLK0_RDATA0:x}\s*=\s*(0x[0-9a-fA-F]+)", re.IGNORECASE)
+
+
+def key_fingerprint(key_path: Path) -> str:
+    return hashlib.sha256(key_path.read_bytes()).hexdigest()[:16]
+
+
+def flash_crypt_cnt_from_rdata0(value: int) -> int:
+    return (value >> FLASH_CRYPT_CNT_SHIFT) & FLASH_CRYPT_CNT_MASK
+
+
+def parse_read_mem_output(output: str) -> tuple[str | None, int | None]:
+    """Return (mac, EFUSE_BLK0_RDATA0) from `esptool read-mem 0x3ff5a000` output."""
+    mac_match = MAC_RE.search(output)
+    value_match = _READ_MEM_RE.search(output)
+    mac = mac_match.group(1).lower() if mac_match else None
+    value = int(value_match.group(1), 16) if value_match else None
+    return mac, value
+
+
+class EfuseRegistry:
+    def __init__(self, path: Path = DEFAULT_REGISTRY_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS boards ("
+            " mac TEXT PRIMARY KEY,"
+            " key_fingerprint TEXT NOT NULL,"
+            " flash_crypt_cnt INTEGER NOT NULL,"
+            " updated_at INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "EfuseRegistry":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def lookup(self, mac: str, fingerprint: str) -> int | None:
+        """Last recorded FLASH_CRYPT_CNT for the board, or None if unknown or keyed differently."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key_fingerprint, flash_crypt_cnt FROM boards WHERE mac = ?", (mac.lower(),)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != fingerprint:
+                self._conn.execute("DELETE FROM boards WHERE mac = ?", (mac.lower(),))
+                self._conn.commit()
+                return None
+            return int(row[1])
+
+    def record(self, mac: str, fingerprint: str, flash_crypt_cnt: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO boards (mac, key_fingerprint, flash_crypt_cnt, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(mac) DO UPDATE SET key_fingerprint = excluded.key_fingerprint,"
+                " flash_crypt_cnt = excluded.flash_crypt_cnt, updated_at = excluded.updated_at",
+                (mac.lower(), fingerprint, int(flash_crypt_cnt), int(time.time())),
+            )
+            self._conn.commit()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registry", default=str(DEFAULT_REGISTRY_PATH), help="SQLite registry file.")
+    parser.add_argument("--keyfile", required=True, help="Flash encryption key the board is keyed with.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser(
+        "probe",
+        help="Read `esptool read-mem 0x3ff5a000` output on stdin; print BOARD_MAC and FLASH_CRYPT_CNT for eval.",
+    )
+    record = sub.add_parser("record", help="Record a board's FLASH_CRYPT_CNT.")
+    record.add_argument("--mac", required=True)
+    record.add_argument("--flash-crypt-cnt", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    try:
+        fingerprint = key_fingerprint(Path(args.keyfile))
+        with EfuseRegistry(Path(args.registry)) as registry:
+            if args.command == "record":
+                registry.record(args.mac, fingerprint, args.flash_crypt_cnt)
+                return 0
+            mac, value = parse_read_mem_output(sys.stdin.read())
+            print(f"BOARD_MAC={shlex.quote(mac or '')}")
+            print(f"FLASH_CRYPT_CNT={'' if value is None else flash_crypt_cnt_from_rdata0(value)}")
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Error: eFuse registry unavailable: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
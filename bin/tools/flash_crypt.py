@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""ESP32 flash encryption of factory images without shelling out to espsecure.py."""
+
+from __future__ import annotations
+
+import argparse
+import binascii
+import collections
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except Exception:  # noqa: BLE001
+    Cipher = None  # type: ignore[assignment]
+
+FACTORY_CFG_ADDRESS = 0x3F0000
+DEFAULT_CRYPT_CONFIG = 0xF
+DEFAULT_CACHE_ENTRIES = 128
+
+# Key tweak constants from espsecure.py: the ESP32 XORs bits of (offset >> 5) into the key of
+# every 32-byte block, restricted to the key bit ranges enabled by FLASH_CRYPT_CONFIG.
+_TWEAK_MUL1 = 0x0000200004000080000004000080001000000200004000080000040000800010
+_TWEAK_MUL2 = 0x0000000000000000200000000000000010000000000000002000000000000001
+_TWEAK_MUL2_MASK = 0x000000000000007FE00000000000000FF000000000000007E00000000000000F
+_TWEAK_RANGE_BITS = (
+    (1, 0xFFFFFFFFFFFFFFFFE00000000000000000000000000000000000000000000000),
+    (2, 0x00000000000000001FFFFFFFFFFFFFFFF0000000000000000000000000000000),
+    (4, 0x000000000000000000000000000000000FFFFFFFFFFFFFFFE000000000000000),
+    (8, 0x0000000000000000000000000000000000000000000000001FFFFFFFFFFFFFFF),
+)
+
+
+def _build_aes_tables() -> tuple[list[int], list[int], list[list[int]]]:
+    sbox = [0] * 256
+    p = q = 1
+    while True:
+        p = (p ^ (p << 1) ^ (0x1B if p & 0x80 else 0)) & 0xFF
+        q ^= q << 1
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xFF
+        if q & 0x80:
+            q ^= 0x09
+        x = q ^ ((q << 1) | (q >> 7)) ^ ((q << 2) | (q >> 6)) ^ ((q << 3) | (q >> 5)) ^ ((q << 4) | (q >> 4))
+        sbox[p] = (x ^ 0x63) & 0xFF
+        if p == 1:
+            break
+    sbox[0] = 0x63
+    inv_sbox = [0] * 256
+    for index, value in enumerate(sbox):
+        inv_sbox[value] = index
+
+    def gmul(a: int, b: int) -> int:
+        result = 0
+        while b:
+            if b & 1:
+                result ^= a
+            a = ((a << 1) ^ (0x1B if a & 0x80 else 0)) & 0xFF
+            b >>= 1
+        return result
+
+    td0 = []
+    for value in inv_sbox:
+        td0.append((gmul(value, 14) << 24) | (gmul(value, 9) << 16) | (gmul(value, 13) << 8) | gmul(value, 11))
+    tables = [td0]
+    for _ in range(3):
+        tables.append([((word >> 8) | (word << 24)) & 0xFFFFFFFF for word in tables[-1]])
+    return sbox, inv_sbox, tables
+
+
+_SBOX, _INV_SBOX, (_TD0, _TD1, _TD2, _TD3) = _build_aes_tables()
+
+
+def _aes256_decryption_schedule(key: bytes) -> list[int]:
+    words = [int.from_bytes(key[i : i + 4], "big") for i in range(0, 32, 4)]
+    rcon = 1
+    for i in range(8, 60):
+        temp = words[i - 1]
+        if i % 8 == 0:
+            temp = ((temp << 8) | (temp >> 24)) & 0xFFFFFFFF
+            temp = (
+                (_SBOX[temp >> 24] << 24)
+                | (_SBOX[(temp >> 16) & 0xFF] << 16)
+                | (_SBOX[(temp >> 8) & 0xFF] << 8)
+                | _SBOX[temp & 0xFF]
+            ) ^ (rcon << 24)
+            rcon = ((rcon << 1) ^ (0x1B if rcon & 0x80 else 0)) & 0xFF
+        elif i % 8 == 4:
+            temp = (
+                (_SBOX[temp >> 24] << 24)
+                | (_SBOX[(temp >> 16) & 0xFF] << 16)
+                | (_SBOX[(temp >> 8) & 0xFF] << 8)
+                | _SBOX[temp & 0xFF]
+            )
+        words.append(words[i - 8] ^ temp)
+    # Equivalent inverse cipher: reverse the round keys and InvMixColumns the inner ones.
+    schedule: list[int] = []
+    for round_index in range(14, -1, -1):
+        round_words = words[round_index * 4 : round_index * 4 + 4]
+        if 0 < round_index < 14:
+            round_words = [
+                _TD0[_SBOX[w >> 24]] ^ _TD1[_SBOX[(w >> 16) & 0xFF]] ^ _TD2[_SBOX[(w >> 8) & 0xFF]] ^ _TD3[_SBOX[w & 0xFF]]
+                for w in round_words
+            ]
+        schedule.extend(round_words)
+    return schedule
+
+
+def _aes256_decrypt_block(schedule: list[int], block: bytes) -> bytes:
+    s0 = int.from_bytes(block[0:4], "big") ^ schedule[0]
+    s1 = int.from_bytes(block[4:8], "big") ^ schedule[1]
+    s2 = int.from_bytes(block[8:12], "big") ^ schedule[2]
+    s3 = int.from_bytes(block[12:16], "big") ^ schedule[3]
+    td0, td1, td2, td3 = _TD0, _TD1, _TD2, _TD3
+    for k in range(4, 56, 4):
+        t0 = td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xFF] ^ td2[(s2 >> 8) & 0xFF] ^ td3[s1 & 0xFF] ^ schedule[k]
+        t1 = td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xFF] ^ td2[(s3 >> 8) & 0xFF] ^ td3[s2 & 0xFF] ^ schedule[k + 1]
+        t2 = td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xFF] ^ td2[(s0 >> 8) & 0xFF] ^ td3[s3 & 0xFF] ^ schedule[k + 2]
+        t3 = td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xFF] ^ td2[(s1 >> 8) & 0xFF] ^ td3[s0 & 0xFF] ^ schedule[k + 3]
+        s0, s1, s2, s3 = t0, t1, t2, t3
+    inv = _INV_SBOX
+    out = bytearray(16)
+    for index, (a, b, c, d) in enumerate(((s0, s3, s2, s1), (s1, s0, s3, s2), (s2, s1, s0, s3), (s3, s2, s1, s0))):
+        word = (
+            (inv[a >> 24] << 24) | (inv[(b >> 16) & 0xFF] << 16) | (inv[(c >> 8) & 0xFF] << 8) | inv[d & 0xFF]
+        ) ^ schedule[56 + index]
+        out[index * 4 : index * 4 + 4] = word.to_bytes(4, "big")
+    return bytes(out)
+
+
+def _block_decryptor(key: bytes) -> Callable[[bytes], bytes]:
+    """Return an AES-256 ECB single-block decrypt function, via cryptography when installed."""
+    if Cipher is not None:
+        decryptor = Cipher(algorithms.AES(key), modes.ECB()).decryptor()
+        return decryptor.update
+    schedule = _aes256_decryption_schedule(key)
+    return lambda block: _aes256_decrypt_block(schedule, block)
+
+
+def load_hardware_key(path: Path) -> bytes:
+    """Load a key file the way espsecure.py does (128/192-bit keys are extended to 256 bits)."""
+    key = path.read_bytes()
+    if len(key) == 16:
+        return hashlib.sha256(key).digest()
+    if len(key) == 24:
+        return key + key[8:16]
+    if len(key) == 32:
+        return key
+    raise ValueError(f"Flash encryption key {path} must be 16, 24 or 32 bytes long (got {len(key)}).")
+
+
+def tweak_range_bits(crypt_config: int) -> int:
+    bits = 0
+    for flag, mask in _TWEAK_RANGE_BITS:
+        if crypt_config & flag:
+            bits |= mask
+    return bits
+
+
+def encrypt_flash_data(key: bytes, data: bytes | memoryview, address: int, crypt_config: int = DEFAULT_CRYPT_CONFIG) -> bytes:
+    """Encrypt data as the ESP32 flash controller would store it at address.
+
+    Mirrors espsecure.py encrypt_flash_data: each 16-byte block is byte-reversed, run through AES-256
+    *decryption* with the key tweaked for its 32-byte block, and byte-reversed again.
+    """
+    if address % 16:
+        raise ValueError(f"Flash address 0x{address:x} must be a multiple of 16.")
+    if len(data) % 16:
+        raise ValueError("Data length must be a multiple of 16 bytes.")
+    key_value = int.from_bytes(key, "big")
+    tweak_range = tweak_range_bits(crypt_config)
+    out = bytearray(len(data))
+    decrypt: Callable[[bytes], bytes] | None = None
+    for offset in range(0, len(data), 16):
+        block_address = address + offset
+        if decrypt is None or block_address % 32 == 0:
+            block = block_address >> 5
+            tweak = ((_TWEAK_MUL1 * block) | ((_TWEAK_MUL2 * block) & _TWEAK_MUL2_MASK)) & tweak_range
+            decrypt = _block_decryptor((key_value ^ tweak).to_bytes(32, "big"))
+        out[offset : offset + 16] = decrypt(bytes(data[offset : offset + 16])[::-1])[::-1]
+    return bytes(out)
+
+
+class FlashEncryptor:
+    """Holds one station key in memory and caches encrypted images by (CRC, key, address)."""
+
+    def __init__(self, key: bytes, crypt_config: int = DEFAULT_CRYPT_CONFIG, cache_entries: int = DEFAULT_CACHE_ENTRIES) -> None:
+        self._key = key
+        self.crypt_config = crypt_config
+        self.fingerprint = hashlib.sha256(key).hexdigest()[:16]
+        self._cache: collections.OrderedDict[tuple[int, int, str, int], bytes] = collections.OrderedDict()
+        self._cache_entries = cache_entries
+        self._lock = threading.Lock()
+
+    def encrypt(self, data: bytes | memoryview, address: int = FACTORY_CFG_ADDRESS) -> bytes:
+        cache_key = (binascii.crc32(data) & 0xFFFFFFFF, len(data), self.fingerprint, address)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+        encrypted = encrypt_flash_data(self._key, data, address, self.crypt_config)
+        with self._lock:
+            self._cache[cache_key] = encrypted
+            while len(self._cache) > self._cache_entries:
+                self._cache.popitem(last=False)
+        return encrypted
+
+
+_ENCRYPTORS: dict[tuple[str, int, int], FlashEncryptor] = {}
+_ENCRYPTORS_LOCK = threading.Lock()
+
+
+def load_encryptor(key_path: Path, crypt_config: int = DEFAULT_CRYPT_CONFIG) -> FlashEncryptor:
+    """Return the session-wide encryptor for a key file, reloading only when the file changes."""
+    resolved = key_path.resolve()
+    stat = resolved.stat()
+    cache_key = (str(resolved), stat.st_mtime_ns, crypt_config)
+    with _ENCRYPTORS_LOCK:
+        encryptor = _ENCRYPTORS.get(cache_key)
+        if encryptor is None:
+            for stale in [k for k in _ENCRYPTORS if k[0] == str(resolved)]:
+                del _ENCRYPTORS[stale]
+            encryptor = FlashEncryptor(load_hardware_key(resolved), crypt_config)
+            _ENCRYPTORS[cache_key] = encryptor
+        return encryptor
+
+
+def compare_with_espsecure(key_path: Path, espsecure: list[str]) -> int:
+    """Encrypt sample vectors in-process and with espsecure.py; return the number of mismatches."""
+    vectors = [
+        (0x3F0000, bytes(range(256)) * 256),
+        (0x3F0000, b"\xFF" * 0x10000),
+        (0x1000, os.urandom(0x4000)),
+        (0x10010, os.urandom(0x1030)),
+    ]
+    encryptor = load_encryptor(key_path)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, (address, data) in enumerate(vectors):
+            plain = Path(tmp) / f"plain{index}.bin"
+            expected = Path(tmp) / f"expected{index}.bin"
+            plain.write_bytes(data)
+            subprocess.run(
+                [*espsecure, "encrypt_flash_data", "--keyfile", str(key_path), "--address", hex(address),
+                 "--output", str(expected), str(plain)],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            match = encryptor.encrypt(data, address) == expected.read_bytes()
+            failures += 0 if match else 1
+            print(f"vector {index}: address=0x{address:x} length={len(data)} {'OK' if match else 'MISMATCH'}")
+    return failures
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keyfile", required=True, help="Flash encryption key (flash_encryption_key.bin).")
+    parser.add_argument("--address", default=hex(FACTORY_CFG_ADDRESS), help="Flash address of the image (default: 0x3F0000).")
+    parser.add_argument("--flash-crypt-conf", default="0xF", help="FLASH_CRYPT_CONFIG eFuse value (default: 0xF).")
+    parser.add_argument("--output", help="Encrypted output file.")
+    parser.add_argument("input", nargs="?", help="Plaintext image to encrypt.")
+    parser.add_argument(
+        "--compare-espsecure",
+        nargs="?",
+        const="",
+        metavar="CMD",
+        help="Check sample vectors byte-for-byte against espsecure.py (default: espsecure.py on PATH).",
+    )
+    args = parser.parse_args(argv)
+    key_path = Path(args.keyfile)
+
+    if args.compare_espsecure is not None:
+        command = shlex.split(args.compare_espsecure) if args.compare_espsecure else []
+        if not command:
+            found = shutil.which("espsecure.py") or shutil.which("espsecure")
+            command = [found] if found else [sys.executable, "-m", "espsecure"]
+        failures = compare_with_espsecure(key_path, command)
+        return 1 if failures else 0
+
+    if not args.input or not args.output:
+        parser.error("input and --output are required unless --compare-espsecure is given.")
+    try:
+        address = int(args.address, 0)
+        encryptor = load_encryptor(key_path, int(args.flash_crypt_conf, 0))
+        encrypted = encryptor.encrypt(Path(args.input).read_bytes(), address)
+    except (OSError, ValueError) as exc:
+        raise SystemExit(f"Flash encryption failed: {exc}") from exc
+    Path(args.output).write_bytes(encrypted)
+    print(f"Encrypted {len(encrypted)} bytes for 0x{address:x} (key {encryptor.fingerprint}) -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
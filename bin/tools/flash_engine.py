@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""Flash one Flex Plus unit over a single esptool connection.
+
+The shell helpers launch espefuse and esptool once per stage, and every launch resets the chip and
+re-syncs the ROM loader. This engine drives esptool v5 and espefuse as libraries instead: one
+connection (and one stub upload) covers the eFuse check, the batched encryption burn, the optional
+digest comparison, write-flash and the optional post-write MD5 verification. When the esptool package is not importable, available() is
+False and callers keep using the shell helpers. esptool is imported on first use rather than with this
+module, since importing it is a noticeable part of the GUI's start-up.
+
+esptool and espefuse print through one process-wide logger. The engine installs a logger that sends
+each line to the log function of the job running on the calling thread, so parallel jobs keep their
+output (write progress, `Wrote N bytes` summaries, eFuse burns) in their own logs and transcripts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import hashlib
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
+
+import efuse_registry
+
+espefuse = None
+attach_flash = detect_chip = reset_chip = run_stub = write_flash = None
+_import_lock = threading.Lock()
+_imported = False
+
+ROM_BAUD = 115200
+DEFAULT_FLASH_BAUD = 460800
+# esptool's --before/--after modes; fixtures without auto-reset wiring connect with "no-reset".
+DEFAULT_BEFORE = "default-reset"
+DEFAULT_AFTER = "hard-reset"
+ENCRYPTION_EFUSES = {
+    "FLASH_CRYPT_CONFIG": 0xF,
+    "FLASH_CRYPT_CNT": 1,
+    "DISABLE_DL_DECRYPT": 1,
+    "DISABLE_DL_CACHE": 1,
+}
+FLASH_ENCRYPTION_KEY_BLOCK = "BLOCK1"
+
+Region = tuple[int, Path]
+LogFn = Callable[[str], None]
+StageFn = Callable[[str, float, bool], None]
+
+
+class FlashEngineError(RuntimeError):
+    """Raised when a stage fails; the message is meant for the operator log."""
+
+
+class _JobOutput:
+    """esptool's logger (the TemplateLogger interface), routed to the job on the calling thread.
+
+    Partial lines such as esptool's `Connecting....` dots are held until the line ends. Threads
+    outside flash_unit print to stdout as esptool would.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def route(self, log: LogFn) -> Iterator[None]:
+        self._local.log, self._local.pending = log, ""
+        try:
+            yield
+        finally:
+            if self._local.pending.strip():
+                log(self._local.pending)
+            self._local.log, self._local.pending = None, ""
+
+    def print(self, *args: object, sep: str = " ", end: str = "\n", **_: object) -> None:
+        text = sep.join(str(arg) for arg in args) + end
+        log = getattr(self._local, "log", None)
+        if log is None:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+        *lines, self._local.pending = (self._local.pending + text).split("\n")
+        for line in lines:
+            log(line)
+
+    def note(self, message: str) -> None:
+        self.print(f"Note: {message}")
+
+    def warning(self, message: str) -> None:
+        self.print(f"Warning: {message}")
+
+    def error(self, message: str) -> None:
+        self.print(f"Error: {message}")
+
+    def warn(self, message: str, suggestion: str | None = None) -> None:
+        self.warning(message)
+
+    def err(self, message: str, suggestion: str | None = None) -> None:
+        self.error(message)
+
+    def debug(self, *args: object) -> None:
+        pass
+
+    def stage(self, finish: bool = False) -> None:
+        pass
+
+    def progress_bar(self, cur_iter: int, total_iters: int, prefix: str = "", suffix: str = "", bar_length: int = 30) -> None:
+        # One "Writing at 0x... (NN.N %)" line per update, the form flash_progress parses.
+        percent = 100.0 * cur_iter / total_iters if total_iters else 100.0
+        self.print(f"{prefix.rstrip()} ({percent:.1f} %){suffix}")
+
+    def set_verbosity(self, verbosity: str) -> None:
+        pass
+
+
+_OUTPUT = _JobOutput()
+
+
+def _import_esptool() -> None:
+    global espefuse, attach_flash, detect_chip, reset_chip, run_stub, write_flash, _imported
+    with _import_lock:
+        if _imported:
+            return
+        _imported = True
+        try:
+            import espefuse
+            from esptool.cmds import attach_flash, detect_chip, reset_chip, run_stub, write_flash
+            from esptool.logger import TemplateLogger, log
+        except ImportError:  # pragma: no cover - depends on the station's Python environment
+            espefuse = None
+            detect_chip = None
+            return
+        TemplateLogger.register(_JobOutput)
+        log.set_logger(_OUTPUT)
+
+
+def available() -> bool:
+    _import_esptool()
+    return detect_chip is not None and espefuse is not None
+
+
+def file_md5(path: Path) -> str:
+    digest = hashlib.md5()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FlashSession:
+    """One open connection to the chip, reused by every stage until close()."""
+
+    def __init__(
+        self,
+        port: str,
+        baud: int = DEFAULT_FLASH_BAUD,
+        log: LogFn = print,
+        before: str = DEFAULT_BEFORE,
+        after: str = DEFAULT_AFTER,
+    ) -> None:
+        if not available():
+            raise FlashEngineError("esptool/espefuse Python packages are not installed.")
+        self.port = port
+        self.baud = baud
+        self.log = log
+        self.before = before
+        self.after = after
+        self.esp = None
+        self.mac = ""
+        self._efuses = None
+
+    def open(self) -> None:
+        self.log(f"Connecting to {self.port}...")
+        try:
+            esp = detect_chip(self.port, ROM_BAUD, self.before)
+            self.mac = ":".join(f"{b:02x}" for b in esp.read_mac())
+            self.log(f"Chip: {esp.get_chip_description()}, MAC {self.mac}")
+            # The eFuse stages talk to the ROM loader; the stub is uploaded once they are done.
+            self.esp = esp
+        except Exception as exc:  # noqa: BLE001
+            raise FlashEngineError(f"unable to connect on {self.port}: {exc}") from exc
+
+    def close(self, reset: bool = True) -> None:
+        if self.esp is None:
+            return
+        try:
+            if self._efuses is not None:
+                self._efuses.__exit__(None, None, None)
+            if reset:
+                reset_chip(self.esp, self.after)
+        finally:
+            self.esp._port.close()
+            self.esp = None
+            self._efuses = None
+
+    def _efuse_commands(self):
+        if self._efuses is None:
+            commands = espefuse.init_commands(esp=self.esp, batch_mode=True, do_not_confirm=True)
+            self._efuses = commands.__enter__()
+        return self._efuses
+
+    def flash_crypt_cnt(self, registry: efuse_registry.EfuseRegistry | None, fingerprint: str) -> int:
+        """Read FLASH_CRYPT_CNT with one register read; espefuse's full eFuse read is left to the burn."""
+        try:
+            count = efuse_registry.flash_crypt_cnt_from_rdata0(self.esp.read_reg(efuse_registry.EFUSE_BLK0_RDATA0))
+            self.log(f"Board {self.mac}: FLASH_CRYPT_CNT={count}.")
+        except Exception as exc:  # noqa: BLE001
+            raise FlashEngineError(f"unable to read FLASH_CRYPT_CNT: {exc}") from exc
+        if registry is not None:
+            registry.record(self.mac, fingerprint, count)
+        return count
+
+    def burn_flash_encryption(self, key_path: Path, registry: efuse_registry.EfuseRegistry | None = None) -> None:
+        """Burn the key (unless already read-protected) and the four encryption eFuses in one batch."""
+        try:
+            commands = self._efuse_commands()
+            self.log("Burning flash encryption key and eFuses...")
+            if commands.efuses[FLASH_ENCRYPTION_KEY_BLOCK].is_readable():
+                with key_path.open("rb") as key_file:
+                    commands.burn_key(["flash_encryption"], [key_file], no_protect_key=False)
+            else:
+                self.log("Flash encryption key already programmed; skipping burn_key step.")
+            commands.burn_efuse(dict(ENCRYPTION_EFUSES))
+            # Batch mode queues the key and all four fields; they are programmed in one burn.
+            commands.burn_all(check_batch_mode=True)
+        except Exception as exc:  # noqa: BLE001
+            raise FlashEngineError(f"flash encryption setup failed: {exc}") from exc
+        self.log("Flash encryption eFuses programmed.")
+        if registry is not None:
+            registry.record(self.mac, efuse_registry.key_fingerprint(key_path), 1)
+
+    def _ensure_stub(self) -> None:
+        if getattr(self.esp, "IS_STUB", False):
+            return
+        try:
+            self.esp = run_stub(self.esp)
+            if self.baud != ROM_BAUD:
+                self.esp.change_baud(self.baud)
+            attach_flash(self.esp)
+        except Exception as exc:  # noqa: BLE001
+            raise FlashEngineError(f"unable to start the flasher stub: {exc}") from exc
+
+    def _region_matches(self, offset: int, path: Path, digests: dict[Path, str]) -> bool:
+        """The chip hashes the range itself; nothing is read back over the serial link."""
+        expected = digests.get(path) or file_md5(path)
+        try:
+            actual = self.esp.flash_md5sum(offset, path.stat().st_size)
+        except Exception:  # noqa: BLE001
+            actual = None
+        return actual == expected
+
+    def changed_regions(self, regions: Sequence[Region], digests: dict[Path, str] | None = None) -> list[Region]:
+        """Regions whose on-chip MD5 differs from the image (or could not be read)."""
+        self._ensure_stub()
+        changed: list[Region] = []
+        for offset, path in regions:
+            if self._region_matches(offset, path, digests or {}):
+                self.log(f"  0x{offset:x}: digest matches, skipping")
+            else:
+                self.log(f"  0x{offset:x}: digest differs or unreadable, rewriting")
+                changed.append((offset, path))
+        return changed
+
+    def verify(self, regions: Sequence[Region], digests: dict[Path, str] | None = None) -> None:
+        """Raise unless every written range hashes, on the chip, to the host's digest of its image."""
+        self._ensure_stub()
+        mismatched = []
+        for offset, path in regions:
+            if self._region_matches(offset, path, digests or {}):
+                self.log(f"  0x{offset:x}: verified")
+            else:
+                self.log(f"  0x{offset:x}: digest mismatch")
+                mismatched.append(f"0x{offset:x}")
+        if mismatched:
+            raise FlashEngineError(f"post-flash verification failed at {', '.join(mismatched)}")
+
+    def write(self, regions: Iterable[Region], pre_encrypted: bool) -> None:
+        self._ensure_stub()
+        addr_data = [(offset, str(path)) for offset, path in regions]
+        try:
+            write_flash(
+                self.esp,
+                addr_data,
+                flash_mode="dio",
+                flash_freq="40m",
+                flash_size="detect",
+                compress=not pre_encrypted,
+                no_compress=pre_encrypted,
+            )
+        except Exception as exc:  # noqa: BLE001
+            raise FlashEngineError(f"write-flash failed: {exc}") from exc
+
+
+def flash_unit(
+    port: str,
+    regions: Sequence[Region],
+    key_path: Path | None,
+    differential: bool = False,
+    digests: dict[Path, str] | None = None,
+    baud: int = DEFAULT_FLASH_BAUD,
+    log: LogFn = print,
+    registry_path: Path | None = efuse_registry.DEFAULT_REGISTRY_PATH,
+    on_stage: StageFn | None = None,
+    verify: bool = False,
+    on_connect: Callable[[str], bool] | None = None,
+    before: str = DEFAULT_BEFORE,
+    after: str = DEFAULT_AFTER,
+) -> str:
+    """Run the whole per-unit sequence on one connection and return the chip MAC.
+
+    key_path None means a plaintext bundle: no eFuse work and compressed writes. on_stage is called
+    with (stage, seconds, ok) as each stage ends, using the stage names of the helper scripts.
+    verify compares the chip's MD5 of every written range with digests (or the file's MD5).
+    on_connect gets the chip MAC before anything is burned or written; it returns True to switch to a
+    differential re-flash and raises FlashEngineError to stop. esptool's own output goes to log too.
+    """
+
+    @contextlib.contextmanager
+    def stage(name: str) -> Iterator[None]:
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            if on_stage is not None:
+                on_stage(name, time.monotonic() - started, ok)
+
+    with _OUTPUT.route(log):
+        session = FlashSession(port, baud, log, before, after)
+        with stage("connect"):
+            session.open()
+        completed = False
+        try:
+            if on_connect is not None and on_connect(session.mac):
+                differential = True
+            burned = False
+            if key_path:
+                registry = efuse_registry.EfuseRegistry(registry_path) if registry_path else None
+                try:
+                    with stage("efuse_read"):
+                        needs_setup = session.flash_crypt_cnt(registry, efuse_registry.key_fingerprint(key_path)) == 0
+                    if needs_setup:
+                        with stage("key_burn"):
+                            session.burn_flash_encryption(key_path, registry)
+                        burned = True
+                    else:
+                        log("Flash encryption already enabled on target.")
+                finally:
+                    if registry is not None:
+                        registry.close()
+            if differential and burned:
+                log("Flash encryption was just enabled; differential re-flash needs a full write.")
+            elif differential:
+                log("Comparing on-device region digests...")
+                with stage("compare"):
+                    regions = session.changed_regions(regions, digests)
+            if not regions:
+                log("All regions already match the bundle; nothing to rewrite.")
+            else:
+                log(f"Flashing {len(regions)} region(s) to {port}...")
+                with stage("write_flash"):
+                    session.write(regions, pre_encrypted=key_path is not None)
+                if verify:
+                    log("Verifying written regions against the bundle digests...")
+                    with stage("verify"):
+                        session.verify(regions, digests)
+                log("Flash complete.")
+            completed = True
+            return session.mac
+        finally:
+            session.close(reset=completed)
+
+
+def _parse_region(value: str) -> Region:
+    offset, _, path = value.partition("=")
+    if not path:
+        raise argparse.ArgumentTypeError(f"expected OFFSET=FILE, got '{value}'")
+    return int(offset, 0), Path(path)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Flash images over one esptool connection.")
+    parser.add_argument("--port", required=True, help="Serial port of the unit.")
+    parser.add_argument("--baud", type=int, default=DEFAULT_FLASH_BAUD, help="Flash baud rate.")
+    parser.add_argument("--keyfile", help="Flash encryption key; enables eFuse setup and raw writes.")
+    parser.add_argument("--diff", action="store_true", help="Rewrite only regions whose MD5 differs.")
+    parser.add_argument("--verify", action="store_true", help="Compare on-chip MD5s of the written regions afterwards.")
+    parser.add_argument("--before", default=DEFAULT_BEFORE, help="esptool reset mode before connecting.")
+    parser.add_argument("--after", default=DEFAULT_AFTER, help="esptool reset mode after a successful flash.")
+    parser.add_argument("regions", nargs="+", type=_parse_region, help="OFFSET=FILE pairs.")
+    args = parser.parse_args(argv)
+
+    if not available():
+        print("Error: esptool/espefuse Python packages are not installed.", file=sys.stderr)
+        return 2
+    try:
+        flash_unit(
+            args.port,
+            args.regions,
+            Path(args.keyfile) if args.keyfile else None,
+            args.diff,
+            baud=args.baud,
+            verify=args.verify,
+            before=args.before,
+            after=args.after,
+        )
+    except FlashEngineError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
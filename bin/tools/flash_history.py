@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""Production history: one indexed row per flash attempt, replacing logs/flash_log.csv."""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import datetime as dt
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_HISTORY_PATH = PRODUCTION_DIR / "logs" / "flash_history.sqlite3"
+LEGACY_CSV_PATH = PRODUCTION_DIR / "logs" / "flash_log.csv"
+
+# wifi_pending: flashed, with Wi-Fi provisioning still queued; the provisioning worker settles it.
+SUCCESS_STATUSES = ("success", "wired_only", "wifi_pending", "wifi_success")
+MAX_PAGE_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+_IDENTIFIER_RE = re.compile(r"^FP(\d{2})-\d{8}$")
+# Equality filters accepted by query(); each has an index led by the column.
+FILTER_COLUMNS = ("serial", "batch", "mac", "port", "release", "status", "ok")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    serial TEXT NOT NULL,
+    batch TEXT,
+    mac TEXT,
+    port TEXT,
+    release TEXT,
+    status TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    rework INTEGER NOT NULL DEFAULT 0,
+    stages TEXT,
+    message TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS attempts_identity ON attempts (serial, started_at, status);
+CREATE INDEX IF NOT EXISTS attempts_started ON attempts (started_at);
+CREATE INDEX IF NOT EXISTS attempts_batch ON attempts (batch, started_at);
+CREATE INDEX IF NOT EXISTS attempts_mac ON attempts (mac, started_at);
+CREATE INDEX IF NOT EXISTS attempts_port ON attempts (port, started_at);
+CREATE INDEX IF NOT EXISTS attempts_release ON attempts (release, started_at);
+CREATE INDEX IF NOT EXISTS attempts_status ON attempts (status, started_at);
+CREATE INDEX IF NOT EXISTS attempts_ok ON attempts (ok, started_at);
+"""
+
+
+def batch_of(serial: str) -> str | None:
+    """'07' for FP07-25100001; None for serials that do not follow the identifier format."""
+    match = _IDENTIFIER_RE.match(serial)
+    return match.group(1) if match else None
+
+
+def parse_time(value: str) -> float:
+    """Epoch seconds from an epoch number, an ISO date (local midnight) or an ISO timestamp."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = dt.datetime.fromisoformat(value)
+    return parsed.timestamp()
+
+
+class HistoryStore:
+    def __init__(self, path: Path = DEFAULT_HISTORY_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "HistoryStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def record(
+        self,
+        serial: str,
+        status: str,
+        started_at: float,
+        finished_at: float | None = None,
+        mac: str | None = None,
+        port: str | None = None,
+        release: str | None = None,
+        rework: bool = False,
+        stages: dict[str, float] | None = None,
+        message: str | None = None,
+    ) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO attempts"
+                " (started_at, finished_at, serial, batch, mac, port, release, status, ok, rework, stages, message)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    started_at,
+                    finished_at,
+                    serial,
+                    batch_of(serial),
+                    mac.lower() if mac else None,
+                    port,
+                    release,
+                    status,
+                    int(status in SUCCESS_STATUSES),
+                    int(rework),
+                    json.dumps(stages, sort_keys=True) if stages else None,
+                    message,
+                ),
+            )
+            self._conn.commit()
+            return int(cursor.lastrowid)
+
+    def update_attempt(
+        self,
+        serial: str,
+        started_at: float,
+        status: str,
+        message: str | None = None,
+        stages: dict[str, float] | None = None,
+    ) -> bool:
+        """Settle the newest attempt for (serial, started_at), merging stages into its timings."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, stages FROM attempts WHERE serial = ? AND started_at = ? ORDER BY id DESC LIMIT 1",
+                (serial, started_at),
+            ).fetchone()
+            if row is None:
+                return False
+            merged = {**(json.loads(row["stages"]) if row["stages"] else {}), **(stages or {})}
+            self._conn.execute(
+                "UPDATE OR REPLACE attempts SET status = ?, ok = ?, stages = ?, message = COALESCE(?, message) WHERE id = ?",
+                (status, int(status in SUCCESS_STATUSES), json.dumps(merged, sort_keys=True) if merged else None, message, row["id"]),
+            )
+            self._conn.commit()
+            return True
+
+    def import_csv(self, path: Path) -> int:
+        """Bulk-load flash_log.csv rows (timestamp,serial,release,status); re-imports are no-ops."""
+
+        def rows() -> Iterable[tuple[object, ...]]:
+            with path.open("r", encoding="utf-8", newline="") as fh:
+                for row in csv.reader(fh):
+                    if len(row) < 4:
+                        continue
+                    try:
+                        started_at = parse_time(row[0])
+                    except ValueError:
+                        continue
+                    serial, release, status = row[1].strip(), row[2].strip(), row[3].strip()
+                    yield (
+                        started_at,
+                        serial,
+                        batch_of(serial),
+                        release,
+                        status,
+                        int(status in SUCCESS_STATUSES),
+                    )
+
+        with self._lock:
+            before = self._conn.total_changes
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO attempts (started_at, serial, batch, release, status, ok)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows(),
+                )
+            return self._conn.total_changes - before
+
+    def query(
+        self,
+        filters: dict[str, str] | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: str | None = None,
+    ) -> tuple[list[dict[str, object]], str | None]:
+        """Newest-first page of attempts; pass the returned cursor back to get the next page.
+
+        The cursor is "<started_at>:<id>" of the last row, so paging is a keyset seek on the
+        started_at indexes rather than an OFFSET scan.
+        """
+        clauses: list[str] = []
+        values: list[object] = []
+        for column, value in (filters or {}).items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"unknown filter '{column}'")
+            clauses.append(f"{column} = ?")
+            values.append(int(value) if column == "ok" else value)
+        if since is not None:
+            clauses.append("started_at >= ?")
+            values.append(since)
+        if until is not None:
+            clauses.append("started_at < ?")
+            values.append(until)
+        if cursor:
+            try:
+                cursor_time, cursor_id = cursor.split(":", 1)
+                values.extend([float(cursor_time), float(cursor_time), int(cursor_id)])
+            except ValueError as exc:
+                raise ValueError("invalid cursor") from exc
+            clauses.append("(started_at < ? OR (started_at = ? AND id < ?))")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        sql = "SELECT * FROM attempts"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY started_at DESC, id DESC LIMIT ?"
+        values.append(limit + 1)
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(sql, values)]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['started_at']!r}:{rows[-1]['id']}"
+        for row in rows:
+            row["ok"] = bool(row["ok"])
+            row["rework"] = bool(row["rework"])
+            row["stages"] = json.loads(row["stages"]) if row["stages"] else {}
+        return rows, next_cursor
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--history", default=str(DEFAULT_HISTORY_PATH), help="SQLite history file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    importer = sub.add_parser("import", help="Bulk-import flash_log.csv files.")
+    importer.add_argument("csv", nargs="*", default=[str(LEGACY_CSV_PATH)])
+    record = sub.add_parser("record", help="Record one attempt (used by the helper scripts).")
+    record.add_argument("--serial", required=True)
+    record.add_argument("--status", required=True)
+    record.add_argument("--started-at", type=float, default=None)
+    record.add_argument("--release")
+    record.add_argument("--port")
+    record.add_argument("--mac")
+    record.add_argument("--rework", action="store_true")
+    show = sub.add_parser("query", help="Print attempts as JSON lines, newest first.")
+    for column in FILTER_COLUMNS:
+        show.add_argument(f"--{column}")
+    show.add_argument("--since", help="Epoch seconds or ISO date/time.")
+    show.add_argument("--until", help="Epoch seconds or ISO date/time.")
+    show.add_argument("--limit", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        with HistoryStore(Path(args.history)) as store:
+            if args.command == "import":
+                for name in args.csv:
+                    added = store.import_csv(Path(name))
+                    print(f"Imported {added} attempt(s) from {name}.")
+            elif args.command == "record":
+                now = time.time()
+                store.record(
+                    args.serial,
+                    args.status,
+                    args.started_at or now,
+                    finished_at=now,
+                    mac=args.mac,
+                    port=args.port,
+                    release=args.release,
+                    rework=args.rework,
+                )
+            else:
+                filters = {column: getattr(args, column) for column in FILTER_COLUMNS if getattr(args, column)}
+                rows, _ = store.query(
+                    filters,
+                    since=parse_time(args.since) if args.since else None,
+                    until=parse_time(args.until) if args.until else None,
+                    limit=args.limit,
+                )
+                for row in rows:
+                    print(json.dumps(row))
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
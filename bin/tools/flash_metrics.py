@@ -0,0 +1,145 @@
+"""Per-stage timing aggregation for the flashing pipeline, rendered as Prometheus text.
+
+The helper scripts print `::stage <name> start` / `::stage <name> end <ok|failed>` around each
+stage; flash_engine reports the same stages through a callback. StageMetrics keeps a cumulative
+histogram, a bounded sample window for p50/p95 and failure counts per stage, plus unit completions
+for throughput and the bytes esptool reports writing, for the serial link's effective rate.
+"""
+
+from __future__ import annotations
+
+import collections
+import re
+import threading
+import time
+
+STAGE_MARKER = re.compile(r"^::stage (?P<name>[a-z0-9_]+) (?P<event>start|end)(?: (?P<result>ok|failed))?\s*$")
+# Seconds; spans a sub-second register read up to a multi-minute full write at low baud.
+BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+QUANTILES = (0.5, 0.95)
+SAMPLE_WINDOW = 500
+THROUGHPUT_WINDOW = 3600.0
+
+
+class _StageStats:
+    def __init__(self) -> None:
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.failures = 0
+        self.samples: collections.deque[float] = collections.deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, seconds: float, ok: bool) -> None:
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+        if not ok:
+            self.failures += 1
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class StageMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stages: dict[str, _StageStats] = {}
+        self._units: collections.Counter[str] = collections.Counter()
+        self._completions: collections.deque[float] = collections.deque()
+        self._written_bytes = 0
+        self._write_seconds = 0.0
+        self._writes: collections.deque[tuple[float, int, float]] = collections.deque()
+
+    def observe(self, stage: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self._stages.setdefault(stage, _StageStats()).observe(max(0.0, seconds), ok)
+
+    def unit_finished(self, ok: bool, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._units["success" if ok else "failed"] += 1
+            self._completions.append(now)
+            self._trim(now)
+
+    def observe_write(self, size: int, seconds: float, now: float | None = None) -> None:
+        """One region written: `size` uncompressed bytes in `seconds` as esptool reported them."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._written_bytes += size
+            self._write_seconds += max(0.0, seconds)
+            self._writes.append((now, size, max(0.0, seconds)))
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        while self._completions and self._completions[0] < now - THROUGHPUT_WINDOW:
+            self._completions.popleft()
+        while self._writes and self._writes[0][0] < now - THROUGHPUT_WINDOW:
+            self._writes.popleft()
+
+    def _recent_rate(self) -> float:
+        seconds = sum(entry[2] for entry in self._writes)
+        return sum(entry[1] for entry in self._writes) / seconds if seconds > 0 else 0.0
+
+    def render(self, extra_gauges: dict[str, float] | None = None) -> str:
+        now = time.time()
+        lines: list[str] = []
+        with self._lock:
+            self._trim(now)
+            lines += [
+                "# HELP flex_units_total Flash attempts finished, by result.",
+                "# TYPE flex_units_total counter",
+            ]
+            for result in ("success", "failed"):
+                lines.append(f'flex_units_total{{result="{result}"}} {self._units[result]}')
+            lines += [
+                "# HELP flex_units_last_hour Flash attempts finished in the last hour.",
+                "# TYPE flex_units_last_hour gauge",
+                f"flex_units_last_hour {len(self._completions)}",
+                "# HELP flex_flash_bytes_written_total Image bytes written to flash, as reported by esptool.",
+                "# TYPE flex_flash_bytes_written_total counter",
+                f"flex_flash_bytes_written_total {self._written_bytes}",
+                "# HELP flex_flash_write_seconds_total Time esptool spent writing those bytes.",
+                "# TYPE flex_flash_write_seconds_total counter",
+                f"flex_flash_write_seconds_total {self._write_seconds:.3f}",
+                "# HELP flex_flash_throughput_bytes_per_second Effective write rate over the last hour.",
+                "# TYPE flex_flash_throughput_bytes_per_second gauge",
+                f"flex_flash_throughput_bytes_per_second {self._recent_rate():.1f}",
+                "# HELP flex_stage_duration_seconds Time spent in each flashing stage.",
+                "# TYPE flex_stage_duration_seconds histogram",
+            ]
+            for name in sorted(self._stages):
+                stats = self._stages[name]
+                label = _escape(name)
+                for bound, count in zip(BUCKETS, stats.bucket_counts):
+                    lines.append(f'flex_stage_duration_seconds_bucket{{stage="{label}",le="{bound}"}} {count}')
+                lines.append(f'flex_stage_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {stats.count}')
+                lines.append(f'flex_stage_duration_seconds_sum{{stage="{label}"}} {stats.total:.3f}')
+                lines.append(f'flex_stage_duration_seconds_count{{stage="{label}"}} {stats.count}')
+            lines += [
+                f"# HELP flex_stage_duration_quantile_seconds Stage duration quantiles over the last {SAMPLE_WINDOW} runs.",
+                "# TYPE flex_stage_duration_quantile_seconds gauge",
+            ]
+            for name in sorted(self._stages):
+                for q in QUANTILES:
+                    value = self._stages[name].quantile(q)
+                    lines.append(f'flex_stage_duration_quantile_seconds{{stage="{_escape(name)}",quantile="{q}"}} {value:.3f}')
+            lines += [
+                "# HELP flex_stage_failures_total Stages that ended in failure.",
+                "# TYPE flex_stage_failures_total counter",
+            ]
+            for name in sorted(self._stages):
+                lines.append(f'flex_stage_failures_total{{stage="{_escape(name)}"}} {self._stages[name].failures}')
+        for name, value in (extra_gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
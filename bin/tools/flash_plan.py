@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""Flash layout for a Flex Plus release, derived from partitions_factory.csv and manifest.json.
+
+Regions that lie close together at the low addresses (otadata and the application in the shipped
+layout) are written as one combined image each, gaps padded with 0xFF, so esptool pays its
+per-region begin/erase/verify round trips fewer times. The combined images are built once per
+release under .cache/coalesced/ and never span a partition the release does not write (nvs keeps
+its contents). FLEX_COALESCE_REGIONS=0 writes every artifact separately.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shlex
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_RELEASE_DIR = PRODUCTION_DIR / "release"
+DEFAULT_PARTITIONS_CSV = PRODUCTION_DIR / "partitions_factory.csv"
+DEFAULT_CACHE_PATH = PRODUCTION_DIR / ".cache" / "flash_plan.json"
+DEFAULT_COALESCED_DIR = PRODUCTION_DIR / ".cache" / "coalesced"
+COALESCE_REGIONS = os.environ.get("FLEX_COALESCE_REGIONS", "1").lower() not in {"0", "false", "no"}
+# Largest 0xFF gap worth padding. Pre-encrypted images go out uncompressed, so a 4 KB sector of
+# padding costs about as much wire time at 460800 baud as the set-up of a separate region.
+COALESCE_MAX_GAP = int(os.environ.get("FLEX_COALESCE_MAX_GAP", "0x1000"), 0)
+# Combined images kept in the cache directory (a few releases' worth).
+COALESCED_KEEP = 16
+
+# The bootloader and partition table sit at fixed ESP32 offsets outside the partition table.
+BOOTLOADER_OFFSET = 0x1000
+PARTITION_TABLE_OFFSET = 0x8000
+# Manifest artifact -> partition holding it (None: fixed offset above).
+ARTIFACT_PARTITIONS = {
+    "bootloader": None,
+    "partitions": None,
+    "boot_app0": "otadata",
+    "firmware": "app0",
+    "spiffs": "spiffs",
+    "factory_cfg": "factorycfg",
+}
+FACTORY_CFG = "factory_cfg"
+_HASH_CHUNK = 1 << 20
+
+
+class Partition(NamedTuple):
+    name: str
+    type: str
+    subtype: str
+    offset: int
+    size: int
+    flags: str
+
+
+class Region(NamedTuple):
+    name: str
+    offset: int
+    limit: int
+    path: Path
+    size: int
+    sha256: str
+    md5: str
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.limit
+
+
+def parse_partition_table(path: Path) -> list[Partition]:
+    partitions: list[Partition] = []
+    with path.open("r", encoding="utf-8", newline="") as fh:
+        for row in csv.reader(fh):
+            if not row or row[0].strip().startswith("#"):
+                continue
+            fields = [field.strip() for field in row] + [""] * 6
+            try:
+                partitions.append(
+                    Partition(fields[0], fields[1], fields[2], int(fields[3], 0), int(fields[4], 0), fields[5])
+                )
+            except ValueError as exc:
+                raise ValueError(f"Invalid partition row in {path}: {row}") from exc
+    return sorted(partitions, key=lambda part: part.offset)
+
+
+class DigestCache:
+    """sha256/md5 of files keyed by (path, mtime, size), persisted between runs."""
+
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, object]] = {}
+        self._dirty = False
+        if path is not None:
+            try:
+                self._entries = json.loads(path.read_text())
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def digest(self, path: Path) -> tuple[int, str, str]:
+        stat = path.stat()
+        key = str(path.resolve())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+                return stat.st_size, str(entry["sha256"]), str(entry["md5"])
+        sha256 = hashlib.sha256()
+        md5 = hashlib.md5()
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(_HASH_CHUNK), b""):
+                sha256.update(chunk)
+                md5.update(chunk)
+        with self._lock:
+            self._entries[key] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": sha256.hexdigest(),
+                "md5": md5.hexdigest(),
+            }
+            self._dirty = True
+        return stat.st_size, sha256.hexdigest(), md5.hexdigest()
+
+    def save(self) -> None:
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_name(self.path.name + ".tmp")
+                tmp_path.write_text(json.dumps(self._entries, indent=1, sort_keys=True))
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as exc:
+                print(f"Warning: unable to save flash plan cache {self.path}: {exc}", file=sys.stderr)
+
+
+class FlashPlan:
+    """Regions to write for one release, with sizes and digests of the release artifacts.
+
+    The factory_cfg region points at the release template; per-unit images are checked with
+    check_region() and substituted by the caller.
+    """
+
+    def __init__(self, release_dir: Path, manifest: dict[str, object], partitions: list[Partition], regions: list[Region], errors: list[str]) -> None:
+        self.release_dir = release_dir
+        self.manifest = manifest
+        self.partitions = partitions
+        self.regions = regions
+        self.errors = errors
+        self._write_regions: list[Region] | None = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return str(self.manifest.get("version", "unknown"))
+
+    @property
+    def encrypted(self) -> bool:
+        return self.manifest.get("flash_encryption") == "enabled"
+
+    def region(self, name: str) -> Region:
+        for region in self.regions:
+            if region.name == name:
+                return region
+        raise KeyError(name)
+
+    def check_region(self, name: str, path: Path) -> str | None:
+        """Return an error message when path does not fit the named region."""
+        region = self.region(name)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return f"missing file {path}"
+        if size > region.limit:
+            return f"{name} ({size} bytes) exceeds its {region.limit}-byte region at 0x{region.offset:x}"
+        return None
+
+    def write_regions(self, coalesce: bool = COALESCE_REGIONS, cache_dir: Path = DEFAULT_COALESCED_DIR) -> list[Region]:
+        """Regions as written to the chip: adjacent release images merged into cached combined images.
+
+        Falls back to the separate regions when coalescing is off, the plan has errors or the
+        combined images cannot be written.
+        """
+        if not coalesce or self.errors:
+            return self.regions
+        with self._write_lock:
+            if self._write_regions is None:
+                try:
+                    self._write_regions = [
+                        group[0] if len(group) == 1 else _combined_region(group, cache_dir)
+                        for group in coalesce_groups(self.regions, self.partitions, COALESCE_MAX_GAP)
+                    ]
+                except OSError as exc:
+                    print(f"Warning: unable to build combined flash images in {cache_dir}: {exc}", file=sys.stderr)
+                    return self.regions
+                _prune_combined(cache_dir, {region.path for region in self._write_regions})
+            return self._write_regions
+
+    def esptool_args(self, overrides: dict[str, Path] | None = None, coalesce: bool = COALESCE_REGIONS) -> list[str]:
+        overrides = overrides or {}
+        args: list[str] = []
+        for region in self.write_regions(coalesce):
+            args.extend([hex(region.offset), str(overrides.get(region.name, region.path))])
+        return args
+
+    def summary(self, coalesce: bool = COALESCE_REGIONS) -> dict[str, object]:
+        return {
+            "version": self.version,
+            "built_at": str(self.manifest.get("built_at", "unknown")),
+            "flash_encryption": str(self.manifest.get("flash_encryption", "unknown")),
+            "factory_ssid": str(self.manifest.get("factory_ssid", "FP00-00000000")),
+            "ap_password": str(self.manifest.get("ap_password", "12345678")),
+            "target_ip": str(self.manifest.get("target_ip", "192.168.4.1")),
+            "release_dir": str(self.release_dir),
+            "errors": list(self.errors),
+            "regions": [
+                {
+                    "name": region.name,
+                    "offset": region.offset,
+                    "limit": region.limit,
+                    "path": str(region.path),
+                    "size": region.size,
+                    "sha256": region.sha256,
+                    "md5": region.md5,
+                }
+                for region in self.regions
+            ],
+            "write_regions": [
+                {
+                    "name": region.name,
+                    "offset": region.offset,
+                    "limit": region.limit,
+                    "path": str(region.path),
+                    "size": region.size,
+                    "sha256": region.sha256,
+                    "md5": region.md5,
+                }
+                for region in self.write_regions(coalesce)
+            ],
+        }
+
+
+def _region_bounds(name: str, partitions: list[Partition]) -> tuple[int, int]:
+    partition_name = ARTIFACT_PARTITIONS[name]
+    if name == "bootloader":
+        return BOOTLOADER_OFFSET, PARTITION_TABLE_OFFSET - BOOTLOADER_OFFSET
+    if name == "partitions":
+        first = min((part.offset for part in partitions), default=PARTITION_TABLE_OFFSET + 0x1000)
+        return PARTITION_TABLE_OFFSET, first - PARTITION_TABLE_OFFSET
+    for part in partitions:
+        if part.name == partition_name:
+            return part.offset, part.size
+    raise ValueError(f"Partition '{partition_name}' for {name} is missing from the partition table.")
+
+
+def build_plan(release_dir: Path, partitions_csv: Path, cache: DigestCache) -> FlashPlan:
+    manifest_path = release_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    partitions = parse_partition_table(partitions_csv)
+    artifacts = manifest.get("artifacts") or {}
+    encrypted = manifest.get("encrypted_artifacts") or {}
+    regions: list[Region] = []
+    errors: list[str] = []
+    for name in ARTIFACT_PARTITIONS:
+        try:
+            offset, limit = _region_bounds(name, partitions)
+        except ValueError as exc:
+            errors.append(str(exc))
+            continue
+        candidates = [release_dir / str(rel) for rel in (encrypted.get(name), artifacts.get(name)) if rel]
+        path = next((candidate for candidate in candidates if candidate.is_file()), None)
+        if path is None:
+            errors.append(f"required artifact '{name}' missing (checked {', '.join(map(str, candidates)) or 'nothing'})")
+            continue
+        size, sha256, md5 = cache.digest(path)
+        if size > limit:
+            errors.append(f"{name} ({size} bytes) exceeds its {limit}-byte region at 0x{offset:x}")
+        regions.append(Region(name, offset, limit, path, size, sha256, md5))
+    regions.sort(key=lambda region: region.offset)
+    cache.save()
+    return FlashPlan(release_dir, manifest, partitions, regions, errors)
+
+
+def coalesce_groups(regions: list[Region], partitions: list[Partition], max_gap: int) -> list[list[Region]]:
+    """Split offset-sorted regions into runs that can be written as one image.
+
+    A region joins the previous run when neither is the per-unit factory_cfg, the gap between them
+    is at most max_gap bytes and no partition the release does not write (nvs, app1) overlaps it.
+    """
+    written = {ARTIFACT_PARTITIONS[region.name] for region in regions}
+    protected = [(part.offset, part.offset + part.size) for part in partitions if part.name not in written]
+    groups: list[list[Region]] = []
+    for region in regions:
+        previous = groups[-1][-1] if groups else None
+        if previous is not None and FACTORY_CFG not in (previous.name, region.name):
+            gap_start, gap_end = previous.offset + previous.size, region.offset
+            if 0 <= gap_end - gap_start <= max_gap and not any(
+                start < gap_end and gap_start < end for start, end in protected
+            ):
+                groups[-1].append(region)
+                continue
+        groups.append([region])
+    return groups
+
+
+def _combined_region(group: list[Region], cache_dir: Path) -> Region:
+    """Build (or reuse) the 0xFF-padded image covering a run of regions."""
+    first, last = group[0], group[-1]
+    key = hashlib.sha256(" ".join(f"{region.offset:x}:{region.sha256}" for region in group).encode()).hexdigest()
+    path = cache_dir / f"{first.offset:06x}_{key[:16]}.bin"
+    size = last.offset + last.size - first.offset
+    if not path.is_file() or path.stat().st_size != size:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        image = bytearray(b"\xff" * size)
+        for region in group:
+            image[region.offset - first.offset : region.offset - first.offset + region.size] = region.path.read_bytes()
+        # Per-port flasher processes can build the same image at once: each writes its own temp file
+        # and hashes its own bytes, and os.replace makes whichever finishes last the cached copy.
+        fd, tmp_name = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(image)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        sha256, md5 = hashlib.sha256(image).hexdigest(), hashlib.md5(image).hexdigest()
+    else:
+        os.utime(path)
+        _, sha256, md5 = DigestCache(None).digest(path)
+    name = "+".join(region.name for region in group)
+    return Region(name, first.offset, last.end - first.offset, path, size, sha256, md5)
+
+
+def _prune_combined(cache_dir: Path, keep: set[Path]) -> None:
+    try:
+        images = sorted(cache_dir.glob("*.bin"), key=lambda path: path.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for path in images[COALESCED_KEEP:]:
+        if path not in keep:
+            path.unlink(missing_ok=True)
+
+
+def partitions_for(release_dir: Path) -> Path:
+    """Partition table shipped alongside a release directory, falling back to the checkout's."""
+    candidate = release_dir.parent / DEFAULT_PARTITIONS_CSV.name
+    return candidate if candidate.is_file() else DEFAULT_PARTITIONS_CSV
+
+
+_PLANS: dict[tuple[str, str], tuple[tuple[int, ...], FlashPlan]] = {}
+_PLANS_LOCK = threading.Lock()
+
+
+def _inputs_signature(release_dir: Path, partitions_csv: Path) -> tuple[int, ...]:
+    signature: list[int] = []
+    for path in (release_dir / "manifest.json", partitions_csv):
+        stat = path.stat()
+        signature.extend((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def load_plan(
+    release_dir: Path = DEFAULT_RELEASE_DIR,
+    partitions_csv: Path | None = None,
+    cache_path: Path | None = DEFAULT_CACHE_PATH,
+) -> FlashPlan:
+    """Return the plan for a release, rebuilt only when the manifest or partition table changes."""
+    partitions_csv = partitions_csv or partitions_for(release_dir)
+    key = (str(release_dir.resolve()), str(partitions_csv.resolve()))
+    signature = _inputs_signature(release_dir, partitions_csv)
+    with _PLANS_LOCK:
+        cached = _PLANS.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+    plan = build_plan(release_dir, partitions_csv, DigestCache(cache_path))
+    with _PLANS_LOCK:
+        _PLANS[key] = (signature, plan)
+    return plan
+
+
+def emit_shell(plan: FlashPlan, coalesce: bool = COALESCE_REGIONS) -> str:
+    summary = plan.summary(coalesce)
+    lines = [
+        f"BUNDLE_VERSION={shlex.quote(plan.version)}",
+        f"FLASH_ENCRYPTION_MANIFEST={shlex.quote(str(summary['flash_encryption']))}",
+        f"FACTORY_SSID={shlex.quote(str(summary['factory_ssid']))}",
+        f"FACTORY_PASSWORD={shlex.quote(str(summary['ap_password']))}",
+        f"TARGET_IP={shlex.quote(str(summary['target_ip']))}",
+    ]
+    for field in ("name", "offset", "limit", "path"):
+        values = [hex(value) if isinstance(value, int) else str(value) for value in (getattr(r, field) for r in plan.write_regions(coalesce))]
+        lines.append(f"PLAN_REGION_{field.upper()}S=({' '.join(shlex.quote(value) for value in values)})")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("format", choices=("shell", "json"), help="Print shell assignments or JSON.")
+    parser.add_argument("--release-dir", default=str(DEFAULT_RELEASE_DIR), help="Release directory holding manifest.json.")
+    parser.add_argument("--partitions", help="Partition table CSV (default: the one beside the release directory).")
+    parser.add_argument("--cache", default=str(DEFAULT_CACHE_PATH), help="Digest cache file ('' disables it).")
+    parser.add_argument(
+        "--separate", action="store_true", help="Write every artifact as its own region (no combined images)."
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        plan = load_plan(Path(args.release_dir), Path(args.partitions) if args.partitions else None, Path(args.cache) if args.cache else None)
+    except (OSError, ValueError) as exc:
+        print(f"Error: unable to load flash plan: {exc}", file=sys.stderr)
+        return 1
+    for error in plan.errors:
+        print(f"Verification error: {error}", file=sys.stderr)
+    if plan.errors:
+        return 1
+    coalesce = COALESCE_REGIONS and not args.separate
+    if args.format == "json":
+        print(json.dumps(plan.summary(coalesce), indent=2))
+    else:
+        sys.stdout.write(emit_shell(plan, coalesce))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
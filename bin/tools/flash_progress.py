@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Structured progress from esptool/espefuse output: region, bytes written, throughput and ETA.
+
+esptool prints a `Writing at 0x... (NN %)` line for every 16 KB block, several hundred per unit.
+ProgressTracker folds them into one progress record per job, so the GUI can show a single updating
+entry instead of keeping each line. It also follows the phases around the write (connecting, eFuse
+burns, digest comparison, verification) and learns which regions a rework skips. Region sizes come
+from the flash plan; the `Wrote N bytes ... in T seconds` summary of each region gives the exact
+effective rate, which is also reported to the stage metrics.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import sys
+import time
+from typing import Iterable, NamedTuple
+
+# esptool v4 prints "(NN %)", v5 a bar followed by "NN.N%".
+WRITING_RE = re.compile(r"Writing at (0x[0-9a-fA-F]+)[.\s]*(?:\[[^\]]*\]\s*)?\(?\s*(\d+(?:\.\d+)?)\s*%")
+ERASE_RE = re.compile(r"Flash will be erased from (0x[0-9a-fA-F]+) to (0x[0-9a-fA-F]+)")
+COMPRESSED_RE = re.compile(r"Compressed (\d+) bytes to (\d+)")
+WROTE_RE = re.compile(r"Wrote (\d+) bytes(?: \((\d+) compressed\))? at (0x[0-9a-fA-F]+) in ([\d.]+) seconds")
+BAUD_RE = re.compile(r"Changing baud rate to (\d+)")
+SKIP_RE = re.compile(r"^\s*(0x[0-9a-fA-F]+): digest matches, skipping")
+PHASES = (
+    (re.compile(r"^Connecting"), "connecting"),
+    (re.compile(r"Burn(ing)? (keys|flash encryption)|The efuses to burn"), "burning eFuses"),
+    (re.compile(r"Comparing on-device region digests"), "comparing digests"),
+    (re.compile(r"^Verifying|Verifying written regions"), "verifying"),
+    (re.compile(r"^Hard resetting"), "resetting"),
+)
+
+
+class Region(NamedTuple):
+    name: str
+    offset: int
+    size: int
+
+
+def is_progress_line(line: str) -> bool:
+    return bool(WRITING_RE.search(line))
+
+
+class ProgressTracker:
+    """Consumes one job's output lines; not thread-safe (each job feeds its own tracker)."""
+
+    def __init__(self, regions: Iterable[Region] = ()) -> None:
+        self.regions: dict[int, Region] = {}
+        self.set_regions(regions)
+        self._skipped: set[int] = set()
+        self.phase = "starting"
+        self.baud: int | None = None
+        self._current: Region | None = None
+        self._current_percent = 0.0
+        self._current_started: float | None = None
+        self._done_bytes = 0
+        self._done_seconds = 0.0
+        self._done_offsets: set[int] = set()
+        self.updated_at = time.time()
+
+    def set_regions(self, regions: Iterable[Region]) -> None:
+        """Name and size the regions the job will write (from the flash plan) for totals and ETA."""
+        for region in regions:
+            self.regions[region.offset] = region
+
+    def finish(self, ok: bool) -> None:
+        self.phase = "done" if ok else "failed"
+        self._current = None
+        self._current_started = None
+        self.updated_at = time.time()
+
+    def _region_at(self, offset: int, size: int | None = None) -> Region:
+        region = self.regions.get(offset)
+        if region is None:
+            region = self.regions[offset] = Region(f"0x{offset:x}", offset, size or 0)
+        elif size and not region.size:
+            region = self.regions[offset] = region._replace(size=size)
+        return region
+
+    def feed(self, line: str, now: float | None = None) -> tuple[bool, tuple[str, int, float] | None]:
+        """Process a line; returns (is a progress line, (region, bytes, seconds) when a region finished)."""
+        now = time.monotonic() if now is None else now
+        text = line.strip()
+        match = WRITING_RE.search(text)
+        if match:
+            offset = int(match.group(1), 16)
+            current = self._current
+            if current is None or not current.offset <= offset < current.offset + max(current.size, 1):
+                starts = [
+                    start
+                    for start, region in self.regions.items()
+                    if start <= offset < start + max(region.size, 1) and start not in self._done_offsets
+                ]
+                self._start_region(self._region_at(max(starts) if starts else offset), now)
+            self._current_percent = min(100.0, float(match.group(2)))
+            self.phase = "writing"
+            self.updated_at = time.time()
+            return True, None
+        finished = None
+        if (match := ERASE_RE.search(text)) is not None:
+            self._start_region(self._region_at(int(match.group(1), 16)), now)
+            self.phase = "erasing"
+        elif (match := COMPRESSED_RE.search(text)) is not None and self._current is not None:
+            self._current = self._region_at(self._current.offset, int(match.group(1)))
+        elif (match := WROTE_RE.search(text)) is not None:
+            size, offset, seconds = int(match.group(1)), int(match.group(3), 16), float(match.group(4))
+            region = self._region_at(offset, size)
+            if self._current_started is not None and seconds <= 0:
+                seconds = now - self._current_started
+            self._done_bytes += size
+            self._done_seconds += seconds
+            self._done_offsets.add(offset)
+            self._current = None
+            self._current_percent = 0.0
+            self._current_started = None
+            # The next region's erase or first block sets the phase again; after the last, none does.
+            self.phase = "written"
+            finished = (region.name, size, seconds)
+        elif (match := BAUD_RE.search(text)) is not None:
+            self.baud = int(match.group(1))
+        elif (match := SKIP_RE.search(text)) is not None:
+            self._skipped.add(int(match.group(1), 16))
+        else:
+            for pattern, phase in PHASES:
+                if pattern.search(text):
+                    self.phase = phase
+                    break
+            else:
+                return False, None
+        self.updated_at = time.time()
+        return False, finished
+
+    def _start_region(self, region: Region, now: float) -> None:
+        if self._current is not None and self._current.offset == region.offset:
+            return
+        self._current = region
+        self._current_percent = 0.0
+        self._current_started = now
+
+    def snapshot(self, now: float | None = None) -> dict[str, object]:
+        now = time.monotonic() if now is None else now
+        current = self._current
+        current_bytes = int(current.size * self._current_percent / 100) if current else 0
+        elapsed = self._done_seconds + (now - self._current_started if self._current_started is not None else 0.0)
+        written = self._done_bytes + current_bytes
+        rate = written / elapsed if elapsed > 0 and written > 0 else None
+        remaining = sum(
+            region.size
+            for offset, region in self.regions.items()
+            if offset not in self._done_offsets
+            and offset not in self._skipped
+            and (current is None or offset != current.offset)
+        )
+        if current is not None:
+            remaining += current.size - current_bytes
+        total = written + remaining
+        return {
+            "phase": self.phase,
+            "region": current.name if current else None,
+            "offset": f"0x{current.offset:x}" if current else None,
+            "region_percent": round(self._current_percent, 1) if current else None,
+            "bytes_written": written,
+            "bytes_total": total,
+            "percent": round(100 * written / total, 1) if total else None,
+            "rate_kbps": round(rate / 1024, 1) if rate else None,
+            "eta_seconds": round(remaining / rate, 1) if rate and remaining else (0.0 if rate else None),
+            "baud": self.baud,
+            "updated_at": self.updated_at,
+        }
+
+
+def main(argv: list[str]) -> int:
+    """Print the progress record after every line of esptool output read from stdin."""
+    tracker = ProgressTracker()
+    for line in sys.stdin:
+        progress, finished = tracker.feed(line)
+        if progress or finished:
+            print(json.dumps(tracker.snapshot()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
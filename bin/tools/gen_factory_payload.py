@@ -5,9 +5,12 @@ from __future__ import annotations
 
 import argparse
 import binascii
+import csv
+import mmap
 import os
 import struct
 import sys
+from pathlib import Path
 
 
 # 'FPXF' => Flex Plus factory payload. Different magic prevents cross-loading with Main Hub.
@@ -18,6 +21,14 @@ PASSWORD_FIELD_LEN = 64
 RESERVED_LEN = 48
 HEADER_STRUCT = struct.Struct("<IHH")
 CRC_STRUCT = struct.Struct("<I")
+PAYLOAD_LEN = HEADER_STRUCT.size + SERIAL_FIELD_LEN + PASSWORD_FIELD_LEN + RESERVED_LEN + CRC_STRUCT.size
+DEFAULT_PARTITION_SIZE = 0x10000
+DEFAULT_PASSWORD = "12345678"
+IDENTIFIER_PREFIX = "FP"
+# Batch packs: a text index followed by one partition image per unit, each aligned to the partition
+# size so `dd bs=<partition size> skip=<slot>` (or an mmap slice) reads a unit without parsing.
+PACK_MAGIC = "FPXPACK"
+PACK_VERSION = 1
 
 
 def sanitize_serial(value: str) -> str:
@@ -55,20 +66,195 @@ def build_payload(serial_suffix: str, password: str) -> bytes:
     return bytes(body)
 
 
+def build_partition_image(serial_suffix: str, password: str, partition_size: int) -> bytes:
+    payload = build_payload(serial_suffix, password)
+    if len(payload) > partition_size:
+        raise ValueError(
+            f"Payload ({len(payload)} bytes) does not fit in partition ({partition_size} bytes). "
+            "Increase the partition size."
+        )
+    return payload + b"\xFF" * (partition_size - len(payload))
+
+
+def verify_payload(blob: bytes | memoryview, expected_serial: str, expected_password: str) -> int:
+    """Check magic, CRC and fields of a factory payload; return its CRC."""
+    if len(blob) < PAYLOAD_LEN:
+        raise ValueError("Factory payload truncated.")
+    magic, _version, _flags = HEADER_STRUCT.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Factory payload magic mismatch: 0x{magic:08x}")
+    serial_end = HEADER_STRUCT.size + SERIAL_FIELD_LEN
+    password_end = serial_end + PASSWORD_FIELD_LEN
+    reserved_end = password_end + RESERVED_LEN
+    (stored_crc,) = CRC_STRUCT.unpack_from(blob, reserved_end)
+    if binascii.crc32(blob[:reserved_end]) & 0xFFFFFFFF != stored_crc:
+        raise ValueError("Factory payload CRC mismatch.")
+    serial = bytes(blob[HEADER_STRUCT.size : serial_end]).split(b"\x00", 1)[0].decode("ascii", errors="ignore")
+    password = bytes(blob[serial_end:password_end]).split(b"\x00", 1)[0].decode("ascii", errors="ignore")
+    if serial != expected_serial:
+        raise ValueError(f"Factory payload serial mismatch (got '{serial}' expected '{expected_serial}').")
+    if password != expected_password:
+        raise ValueError("Factory payload password mismatch.")
+    return stored_crc
+
+
+def format_identifier(batch: int, year: int, month: int, serial: int) -> str:
+    return f"{IDENTIFIER_PREFIX}{batch:02d}-{year:02d}{month:02d}{serial:04d}"
+
+
+def pack_file_name(batch: int, year: int, month: int) -> str:
+    return f"{IDENTIFIER_PREFIX}{batch:02d}-{year:02d}{month:02d}.fpxpack"
+
+
+def parse_serial_range(value: str) -> list[int]:
+    """Parse '1-100' or '1,4,10-12' into a sorted list of serial numbers."""
+    serials: set[int] = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (int(item) for item in part.split("-", 1))
+            if first > last:
+                raise ValueError(f"Invalid serial range: {part}")
+            serials.update(range(first, last + 1))
+        else:
+            serials.add(int(part))
+    if not serials or min(serials) <= 0:
+        raise ValueError("Serial range must contain positive serial numbers.")
+    return sorted(serials)
+
+
+def load_password_overrides(path: Path | None, batch: int) -> dict[int, str]:
+    if path is None or not path.exists():
+        return {}
+    overrides: dict[int, str] = {}
+    with path.open("r", encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            try:
+                if int(row["batch"]) == batch:
+                    overrides[int(row["serial"])] = row["password"].strip()
+            except (KeyError, TypeError, ValueError) as exc:
+                raise ValueError(f"Invalid row in {path}: {row}") from exc
+    return overrides
+
+
+def write_pack(output: Path, units: list[tuple[str, str]], partition_size: int) -> int:
+    """Build, CRC and verify every (serial, password) image and write them as one pack file."""
+    entries: list[str] = []
+    images: list[bytes] = []
+    for slot, (serial_suffix, password) in enumerate(units):
+        image = build_partition_image(sanitize_serial(serial_suffix), validate_password(password), partition_size)
+        crc = verify_payload(image, serial_suffix, password)
+        entries.append(f"{serial_suffix} {slot} {crc:08x}\n")
+        images.append(image)
+
+    index = "".join(entries).encode("ascii")
+    header_len = len(f"{PACK_MAGIC} {PACK_VERSION} {len(units)} {partition_size} 0000000000\n")
+    data_offset = -(-(header_len + len(index)) // partition_size) * partition_size
+    header = f"{PACK_MAGIC} {PACK_VERSION} {len(units)} {partition_size} {data_offset:010d}\n".encode("ascii")
+    preamble = (header + index).ljust(data_offset, b"\n")
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(output.name + ".tmp")
+    with tmp_path.open("wb") as fh:
+        fh.write(preamble)
+        for image in images:
+            fh.write(image)
+    os.replace(tmp_path, output)
+    return len(units)
+
+
+class FactoryPack:
+    """Memory-mapped view of a batch pack; payload() slices the map without copying.
+
+    Release any views returned by payload() before calling close().
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._fh = path.open("rb")
+        try:
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:
+            self._fh.close()
+            raise ValueError(f"Factory pack {path} is empty.") from exc
+        header_end = self._map.find(b"\n")
+        fields = self._map[:header_end].decode("ascii", errors="replace").split()
+        if len(fields) != 5 or fields[0] != PACK_MAGIC or int(fields[1]) != PACK_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a factory pack.")
+        count, self.partition_size, self.data_offset = (int(item) for item in fields[2:])
+        self.index: dict[str, tuple[int, int]] = {}
+        for line in self._map[header_end + 1 : self.data_offset].decode("ascii").splitlines()[:count]:
+            serial, slot, crc = line.split()
+            self.index[serial] = (int(slot), int(crc, 16))
+
+    def __contains__(self, serial: str) -> bool:
+        return serial in self.index
+
+    def payload(self, serial: str) -> memoryview:
+        slot, _crc = self.index[serial]
+        start = self.data_offset + slot * self.partition_size
+        return memoryview(self._map)[start : start + self.partition_size]
+
+    def crc(self, serial: str) -> int:
+        return self.index[serial][1]
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.close()
+        self._fh.close()
+
+    def __enter__(self) -> "FactoryPack":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def build_batch_pack(args: argparse.Namespace, partition_size: int) -> int:
+    if args.year is None or args.month is None:
+        raise SystemExit("--year and --month are required with --batch.")
+    try:
+        serials = parse_serial_range(args.serials)
+        overrides = load_password_overrides(Path(args.passwords) if args.passwords else None, args.batch)
+    except ValueError as exc:
+        raise SystemExit(f"Batch pack failed: {exc}") from exc
+    units = [
+        (format_identifier(args.batch, args.year, args.month, number), overrides.get(number, args.password))
+        for number in serials
+    ]
+    output = Path(args.pack_output or pack_file_name(args.batch, args.year, args.month))
+    try:
+        count = write_pack(output, units, partition_size)
+    except ValueError as exc:
+        raise SystemExit(f"Batch pack failed: {exc}") from exc
+    print(f"Wrote factory pack: {count} units, {partition_size} bytes each -> {output}")
+    return 0
+
+
 def main(argv: list[str]) -> int:
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("--serial", required=True, help="Factory serial suffix (alphanumeric/_/-, <=28 chars).")
+    parser.add_argument("--serial", help="Factory serial suffix (alphanumeric/_/-, <=28 chars).")
     parser.add_argument(
         "--password",
-        default=os.environ.get("FLEX_FACTORY_PASSWORD", "12345678"),
-        help="SoftAP password (8-63 printable ASCII, default: $FLEX_FACTORY_PASSWORD or 12345678).",
+        default=os.environ.get("FLEX_FACTORY_PASSWORD", DEFAULT_PASSWORD),
+        help=f"SoftAP password (8-63 printable ASCII, default: $FLEX_FACTORY_PASSWORD or {DEFAULT_PASSWORD}).",
     )
-    parser.add_argument("--output", required=True, help="Output file path for the partition image.")
+    parser.add_argument("--output", help="Output file path for the partition image.")
     parser.add_argument(
         "--partition-size",
-        default="0x10000",
-        help="Total partition size in bytes (default: 0x10000).",
+        default=hex(DEFAULT_PARTITION_SIZE),
+        help=f"Total partition size in bytes (default: {DEFAULT_PARTITION_SIZE:#x}).",
     )
+    batch_group = parser.add_argument_group("batch packs")
+    batch_group.add_argument("--batch", type=int, help="Build one pack for every unit of this batch instead of one image.")
+    batch_group.add_argument("--year", type=int, help="Build year (YY) used in the batch identifiers.")
+    batch_group.add_argument("--month", type=int, help="Build month (MM) used in the batch identifiers.")
+    batch_group.add_argument("--serials", default="1-100", help="Inter-batch serials, e.g. 1-100 or 1,4,10-12.")
+    batch_group.add_argument("--passwords", help="passwords.csv with batch,serial,password overrides.")
+    batch_group.add_argument("--pack-output", help="Pack file path (default: FP<batch>-<YY><MM>.fpxpack).")
     args = parser.parse_args(argv)
 
     try:
@@ -78,6 +264,11 @@ def main(argv: list[str]) -> int:
     if partition_size <= 0:
         raise SystemExit("Partition size must be positive.")
 
+    if args.batch is not None:
+        return build_batch_pack(args, partition_size)
+    if not args.serial or not args.output:
+        parser.error("--serial and --output are required unless --batch is given.")
+
     try:
         serial_suffix = sanitize_serial(args.serial)
     except ValueError as exc:
@@ -88,15 +279,11 @@ def main(argv: list[str]) -> int:
     except ValueError as exc:
         raise SystemExit(f"Password validation failed: {exc}") from exc
 
-    payload = build_payload(serial_suffix, password)
-    if len(payload) > partition_size:
-        raise SystemExit(
-            f"Payload ({len(payload)} bytes) does not fit in partition ({partition_size} bytes). "
-            "Increase the partition size."
-        )
-
-    blob = bytearray(b"\xFF" * partition_size)
-    blob[: len(payload)] = payload
+    try:
+        blob = build_partition_image(serial_suffix, password, partition_size)
+        verify_payload(blob, serial_suffix, password)
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
 
     os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
     with open(args.output, "wb") as fh:
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Serial port inventory kept current by a background watcher.
+
+Enumerating ports is slow on some stations (a PowerShell launch on Windows without pyserial), so
+the GUI asks this module instead of globbing per request. On Linux the watcher sleeps on inotify
+events for /dev and rescans only when a node appears or disappears; elsewhere it polls. Each port
+carries its USB VID/PID/serial where the platform exposes them, and every add/remove is kept as a
+numbered event for long-polling clients, subscribers and wait_for_port().
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import glob
+import json
+import os
+import platform
+import select
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple
+
+try:
+    import serial.tools.list_ports as list_ports  # type: ignore
+except ImportError:  # pragma: no cover - pyserial is optional
+    list_ports = None
+
+DARWIN_PATTERNS = ("/dev/cu.usbserial-*", "/dev/cu.SLAB_USB*", "/dev/cu.usbmodem*", "/dev/cu.wchusbserial*")
+LINUX_PATTERNS = ("/dev/ttyUSB*", "/dev/ttyACM*")
+POLL_INTERVAL = 1.0
+WINDOWS_POLL_INTERVAL = 2.0
+# inotify-driven watchers still rescan now and then in case an event was missed.
+RESCAN_INTERVAL = 10.0
+EVENT_HISTORY = 256
+
+_IN_ATTRIB = 0x004
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+
+
+class PortInfo(NamedTuple):
+    device: str
+    vid: int | None = None
+    pid: int | None = None
+    serial_number: str | None = None
+    description: str = ""
+
+    def to_dict(self) -> dict[str, object]:
+        return {
+            "device": self.device,
+            "vid": f"{self.vid:04x}" if self.vid is not None else None,
+            "pid": f"{self.pid:04x}" if self.pid is not None else None,
+            "serial_number": self.serial_number,
+            "description": self.description,
+        }
+
+
+def default_patterns() -> tuple[str, ...]:
+    env = os.environ.get("FLEX_PORT_GLOBS", "").strip()
+    if env:
+        return tuple(part for part in env.split(os.pathsep) if part)
+    system = platform.system()
+    if system == "Darwin":
+        return DARWIN_PATTERNS
+    if system == "Windows":
+        return ()
+    return LINUX_PATTERNS
+
+
+def _read_sysfs(path: Path) -> str | None:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def _linux_usb_info(device: str) -> PortInfo:
+    try:
+        node = (Path("/sys/class/tty") / Path(device).name / "device").resolve(strict=True)
+    except OSError:
+        return PortInfo(device)
+    for parent in (node, *node.parents):
+        vid = _read_sysfs(parent / "idVendor")
+        if vid is None:
+            continue
+        pid = _read_sysfs(parent / "idProduct")
+        return PortInfo(
+            device,
+            int(vid, 16),
+            int(pid, 16) if pid else None,
+            _read_sysfs(parent / "serial"),
+            _read_sysfs(parent / "product") or "",
+        )
+    return PortInfo(device)
+
+
+def _pyserial_ports() -> dict[str, PortInfo]:
+    if list_ports is None:
+        return {}
+    return {
+        info.device: PortInfo(info.device, info.vid, info.pid, info.serial_number, info.description or "")
+        for info in list_ports.comports()
+    }
+
+
+def _windows_port_names() -> list[str]:
+    try:
+        result = subprocess.run(
+            ["powershell", "-NoLogo", "-NoProfile", "[System.IO.Ports.SerialPort]::GetPortNames() | Sort-Object"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+            check=True,
+        )
+    except Exception:  # noqa: BLE001
+        return ["COM3", "COM4"]
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def enumerate_ports(patterns: Iterable[str] | None = None) -> list[PortInfo]:
+    """Current serial ports, in discovery order, with USB details where available."""
+    patterns = tuple(default_patterns() if patterns is None else patterns)
+    system = platform.system()
+    if system == "Windows" and not patterns:
+        details = _pyserial_ports()
+        if details:
+            return [details[name] for name in sorted(details)]
+        return [PortInfo(name) for name in _windows_port_names()]
+    devices: list[str] = []
+    for pattern in patterns:
+        for device in sorted(glob.glob(pattern)):
+            if device not in devices:
+                devices.append(device)
+    if system == "Linux":
+        return [_linux_usb_info(device) for device in devices]
+    details = _pyserial_ports() if devices else {}
+    return [details.get(device, PortInfo(device)) for device in devices]
+
+
+class _Inotify:
+    """Minimal inotify binding: one watch on the directories holding the port nodes."""
+
+    def __init__(self, directories: Iterable[str]) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_CREATE | _IN_DELETE | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO
+        watched = 0
+        for directory in directories:
+            if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) >= 0:
+                watched += 1
+        if not watched:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a directory changes (True) or timeout passes (False)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PortWatcher:
+    def __init__(self, patterns: Iterable[str] | None = None, poll_interval: float | None = None) -> None:
+        self.patterns = tuple(default_patterns() if patterns is None else patterns)
+        self.poll_interval = poll_interval or (WINDOWS_POLL_INTERVAL if platform.system() == "Windows" else POLL_INTERVAL)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._ports: dict[str, PortInfo] = {}
+        self._events: collections.deque[dict[str, object]] = collections.deque(maxlen=EVENT_HISTORY)
+        self._seq = 0
+        self._scanned = False
+        self._subscribers: list[Callable[[dict[str, object]], None]] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.mode = "poll"
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="port-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def subscribe(self, callback: Callable[[dict[str, object]], None]) -> None:
+        """callback(event) runs on the watcher thread for every add/remove."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def rescan(self) -> list[dict[str, object]]:
+        current = {info.device: info for info in enumerate_ports(self.patterns)}
+        events: list[dict[str, object]] = []
+        with self._lock:
+            now = time.time()
+            for device in [name for name in self._ports if name not in current]:
+                events.append(self._event_locked("remove", self._ports.pop(device), now))
+            for device, info in current.items():
+                if device not in self._ports:
+                    self._ports[device] = info
+                    events.append(self._event_locked("add", info, now))
+            self._ports = {device: self._ports[device] for device in current}
+            self._scanned = True
+            self._changed.notify_all()
+            subscribers = list(self._subscribers)
+        for event in events:
+            for callback in subscribers:
+                try:
+                    callback(event)
+                except Exception as exc:  # noqa: BLE001
+                    print(f"Warning: port event handler failed: {exc}", file=sys.stderr)
+        return events
+
+    def _event_locked(self, kind: str, info: PortInfo, now: float) -> dict[str, object]:
+        self._seq += 1
+        event = {"seq": self._seq, "event": kind, "port": info.to_dict(), "at": now}
+        self._events.append(event)
+        return event
+
+    def _run(self) -> None:
+        inotify = None
+        directories = sorted({os.path.dirname(pattern) for pattern in self.patterns if os.path.dirname(pattern)})
+        if platform.system() == "Linux" and directories:
+            try:
+                inotify = _Inotify(directories)
+                self.mode = "inotify"
+            except (OSError, AttributeError) as exc:
+                print(f"Warning: inotify unavailable, polling serial ports instead: {exc}", file=sys.stderr)
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.rescan()
+                except Exception as exc:  # noqa: BLE001
+                    print(f"Warning: failed to enumerate serial ports: {exc}", file=sys.stderr)
+                if inotify is None:
+                    self._stop.wait(self.poll_interval)
+                elif inotify.wait(RESCAN_INTERVAL):
+                    # udev creates the node and then fixes its permissions; settle before rescanning.
+                    time.sleep(0.05)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _ensure_scanned(self) -> None:
+        with self._lock:
+            scanned = self._scanned
+        if not scanned:
+            self.rescan()
+
+    def ports(self) -> list[PortInfo]:
+        self._ensure_scanned()
+        with self._lock:
+            return list(self._ports.values())
+
+    def devices(self) -> list[str]:
+        return [info.device for info in self.ports()]
+
+    def events_since(self, seq: int, timeout: float = 0.0) -> tuple[list[dict[str, object]], int]:
+        """Events numbered > seq, waiting up to timeout for one; returns (events, latest seq)."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._lock:
+            while self._seq <= seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return [event for event in self._events if int(event["seq"]) > seq], self._seq
+
+    def wait_for_port(self, device: str | None = None, timeout: float = 10.0) -> str | None:
+        """Return device (or, without one, the first port) as soon as it is present; None on timeout."""
+        self._ensure_scanned()
+        if self._thread is None:
+            self.start()
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._lock:
+            while True:
+                if device is None and self._ports:
+                    return next(iter(self._ports))
+                if device is not None and device in self._ports:
+                    return device
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Print the current ports as JSON.")
+    wait = sub.add_parser("wait", help="Block until a port is present; prints it, exits 1 on timeout.")
+    wait.add_argument("--port", help="Device to wait for (default: any serial port).")
+    wait.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        print(json.dumps([info.to_dict() for info in PortWatcher().ports()], indent=2))
+        return 0
+    port = args.port if args.port and args.port != "auto" else None
+    patterns = default_patterns()
+    if port is not None and os.path.dirname(port):
+        # An explicit device path is watched even when it matches none of the usual patterns.
+        patterns += (glob.escape(port),)
+    watcher = PortWatcher(patterns)
+    found = watcher.wait_for_port(port, args.timeout)
+    if found is None:
+        return 1
+    print(found)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Per-port production runs ("batch 07, serials 12-100 on port X"), persisted across GUI restarts.
+
+Each run remembers the next serial to flash and whether the fixture still holds the last flashed
+board; the GUI starts the next unit once that board has been swapped for a fresh one.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_QUEUE_PATH = PRODUCTION_DIR / "logs" / "production_queue.json"
+
+
+class QueueRun:
+    """One port's run through a serial range."""
+
+    FIELDS = ("port", "batch", "year", "month", "first", "last", "next_serial", "rework", "awaiting_swap", "flashed", "failed")
+
+    def __init__(
+        self,
+        port: str,
+        batch: int,
+        year: int,
+        month: int,
+        first: int,
+        last: int,
+        next_serial: int | None = None,
+        rework: bool = False,
+        awaiting_swap: bool = False,
+        flashed: int = 0,
+        failed: int = 0,
+    ) -> None:
+        self.port = port
+        self.batch = batch
+        self.year = year
+        self.month = month
+        self.first = first
+        self.last = last
+        self.next_serial = first if next_serial is None else next_serial
+        self.rework = rework
+        self.awaiting_swap = awaiting_swap
+        self.flashed = flashed
+        self.failed = failed
+
+    @property
+    def done(self) -> bool:
+        return self.next_serial > self.last
+
+    def to_dict(self) -> dict[str, object]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, object]) -> "QueueRun":
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+
+class ProductionQueue:
+    def __init__(self, path: Path = DEFAULT_QUEUE_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._runs: dict[str, QueueRun] = {}
+        try:
+            for entry in json.loads(path.read_text()):
+                run = QueueRun.from_dict(entry)
+                self._runs[run.port] = run
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, KeyError) as exc:
+            print(f"Warning: ignoring unreadable production queue {path}: {exc}")
+
+    def _save_locked(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(json.dumps([run.to_dict() for run in self._runs.values()], indent=1))
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            print(f"Warning: unable to save production queue {self.path}: {exc}")
+
+    def runs(self) -> list[QueueRun]:
+        with self._lock:
+            return [QueueRun.from_dict(run.to_dict()) for run in self._runs.values()]
+
+    def summary(self) -> list[dict[str, object]]:
+        with self._lock:
+            return [run.to_dict() for _, run in sorted(self._runs.items())]
+
+    def add(self, run: QueueRun) -> None:
+        if run.first > run.last:
+            raise ValueError("The first serial must not be after the last one.")
+        with self._lock:
+            if run.port in self._runs:
+                raise ValueError(f"A production run is already queued on {run.port}.")
+            self._runs[run.port] = run
+            self._save_locked()
+
+    def remove(self, port: str) -> QueueRun | None:
+        with self._lock:
+            run = self._runs.pop(port, None)
+            if run is not None:
+                self._save_locked()
+            return run
+
+    def board_swapped(self, port: str) -> None:
+        """The flashed board was removed (or the operator asked to go on): the next unit may start."""
+        with self._lock:
+            run = self._runs.get(port)
+            if run is not None and run.awaiting_swap:
+                run.awaiting_swap = False
+                self._save_locked()
+
+    def finished(self, port: str, serial: int, success: bool) -> QueueRun | None:
+        """Record the outcome of serial on port; successful units advance the run, finished runs are dropped."""
+        with self._lock:
+            run = self._runs.get(port)
+            if run is None or run.next_serial != serial:
+                return None
+            run.awaiting_swap = True
+            if success:
+                run.flashed += 1
+                run.next_serial += 1
+            else:
+                run.failed += 1
+            if run.done:
+                del self._runs[port]
+            self._save_locked()
+            return run
+
+    def skip(self, port: str) -> QueueRun | None:
+        """Move past the current serial without flashing it (e.g. a board set aside after a failure)."""
+        with self._lock:
+            run = self._runs.get(port)
+            if run is None:
+                return None
+            run.next_serial += 1
+            if run.done:
+                del self._runs[port]
+            self._save_locked()
+            return run
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Background release updates: fetch, stage, verify, then swap the active release between jobs.
+
+The flash path never touches git. A worker thread fetches the production repo, exports the
+upstream revision's release/ and partition table into .releases/<rev>/ with `git archive`, and
+checks the staged bundle with flash_plan (every artifact present, fits its partition and, when the
+manifest lists sha256 digests, matches them). Only a verified bundle becomes active; the switch is
+one pointer update under a lock plus an os.replace() of .releases/active.json, so a job always
+sees either the old release or the new one. Jobs resolve active_release_dir() once at start.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import flash_plan
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_STATE_DIR = PRODUCTION_DIR / ".releases"
+DEFAULT_INTERVAL = 300.0
+KEEP_SNAPSHOTS = 3
+GIT_TIMEOUT = 120
+
+LogFn = Callable[[str], None]
+SwapFn = Callable[[Path, flash_plan.FlashPlan], None]
+
+
+class ReleaseUpdateError(RuntimeError):
+    """Raised when a fetched release cannot be staged or fails verification."""
+
+
+def _git(repo_dir: Path, *args: str) -> str:
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(repo_dir), *args],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=GIT_TIMEOUT,
+        )
+    except subprocess.CalledProcessError as exc:
+        raise ReleaseUpdateError(f"git {' '.join(args)} failed: {exc.stderr.strip()}") from exc
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        raise ReleaseUpdateError(f"git {' '.join(args)} failed: {exc}") from exc
+    return result.stdout.strip()
+
+
+def verify_release(release_dir: Path) -> flash_plan.FlashPlan:
+    """Build the flash plan for a staged release and raise if it does not match its manifest."""
+    try:
+        plan = flash_plan.build_plan(release_dir, flash_plan.partitions_for(release_dir), flash_plan.DigestCache(None))
+    except (OSError, ValueError) as exc:
+        raise ReleaseUpdateError(f"unable to read release at {release_dir}: {exc}") from exc
+    errors = list(plan.errors)
+    expected = plan.manifest.get("sha256") or {}
+    for region in plan.regions:
+        digest = expected.get(region.name) if isinstance(expected, dict) else None
+        if digest and str(digest).lower() != region.sha256:
+            errors.append(f"{region.name} sha256 {region.sha256} does not match the manifest")
+    if errors:
+        raise ReleaseUpdateError("; ".join(errors))
+    return plan
+
+
+class ReleaseUpdater:
+    """Keeps a verified release snapshot active and refreshes it from upstream in the background."""
+
+    def __init__(
+        self,
+        repo_dir: Path = PRODUCTION_DIR,
+        state_dir: Path = DEFAULT_STATE_DIR,
+        interval: float = DEFAULT_INTERVAL,
+        is_idle: Callable[[], bool] | None = None,
+        on_swap: SwapFn | None = None,
+        log: LogFn = print,
+    ) -> None:
+        self.repo_dir = repo_dir
+        self.state_dir = state_dir
+        self.interval = interval
+        self._is_idle = is_idle or (lambda: True)
+        self._on_swap = on_swap
+        self._log = log
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._active_dir = repo_dir / "release"
+        self._active_rev: str | None = None
+        self._rejected: set[str] = set()
+        self._last_check: float | None = None
+        self._last_error: str | None = None
+        self._restore()
+
+    @property
+    def _pointer_path(self) -> Path:
+        return self.state_dir / "active.json"
+
+    def _restore(self) -> None:
+        """Reuse the snapshot that was active last run, if it is still present and valid."""
+        try:
+            pointer = json.loads(self._pointer_path.read_text())
+            release_dir = Path(pointer["release_dir"])
+            verify_release(release_dir)
+        except (OSError, ValueError, KeyError, TypeError, ReleaseUpdateError):
+            return
+        self._active_dir = release_dir
+        self._active_rev = str(pointer.get("revision") or "") or None
+
+    def active_release_dir(self) -> Path:
+        with self._lock:
+            return self._active_dir
+
+    def status(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "release_dir": str(self._active_dir),
+                "revision": self._active_rev,
+                "last_check": self._last_check,
+                "last_error": self._last_error,
+            }
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="release-updater", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.check_once()
+            self._stop.wait(self.interval)
+
+    def check_once(self) -> bool:
+        """Fetch upstream and activate its release if it is new and verifies. Returns True on a swap."""
+        swapped = False
+        error: str | None = None
+        try:
+            swapped = self._update()
+        except ReleaseUpdateError as exc:
+            error = str(exc)
+            self._log(f"Warning: release update failed: {exc}")
+        with self._lock:
+            self._last_check = time.time()
+            self._last_error = error
+        return swapped
+
+    def _update(self) -> bool:
+        _git(self.repo_dir, "fetch", "--quiet", "--tags")
+        try:
+            upstream = _git(self.repo_dir, "rev-parse", "--verify", "--quiet", "@{u}")
+        except ReleaseUpdateError:
+            return False  # Detached or no tracking branch: nothing to follow.
+        with self._lock:
+            current = self._active_rev
+        if current is None:
+            current = _git(self.repo_dir, "rev-parse", "HEAD")
+            with self._lock:
+                self._active_rev = self._active_rev or current
+        swapped = False
+        if upstream != current and upstream not in self._rejected:
+            # A failed export (git archive, disk) is retried on the next poll; only a bundle that
+            # fails verification is rejected for good.
+            release_dir = self._stage(upstream)
+            try:
+                plan = verify_release(release_dir)
+            except ReleaseUpdateError:
+                self._rejected.add(upstream)
+                shutil.rmtree(release_dir.parent, ignore_errors=True)
+                raise
+            self._activate(upstream, release_dir, plan)
+            swapped = True
+        if self._is_idle() and upstream not in self._rejected:
+            self._fast_forward_checkout(upstream)
+            self._prune()
+        return swapped
+
+    def _stage(self, revision: str) -> Path:
+        """Export release/ and the partition table at revision into .releases/<rev>/."""
+        snapshot = self.state_dir / revision[:12]
+        release_dir = snapshot / "release"
+        if release_dir.is_dir():
+            return release_dir
+        # Pathspecs are relative to repo_dir; archive member names are relative to the repo root.
+        prefix = _git(self.repo_dir, "rev-parse", "--show-prefix")
+        members = ["release", flash_plan.DEFAULT_PARTITIONS_CSV.name]
+        staging = self.state_dir / f".{revision[:12]}.staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            staging.mkdir(parents=True)
+            process = subprocess.Popen(
+                ["git", "-C", str(self.repo_dir), "archive", "--format=tar", revision, "--", *members],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            try:
+                self._extract(process.stdout, prefix, staging)
+            except tarfile.TarError as exc:
+                extract_error: Exception | None = exc
+            else:
+                extract_error = None
+            stderr = process.stderr.read().decode("utf-8", errors="ignore").strip()
+            if process.wait() != 0 or extract_error is not None:
+                raise ReleaseUpdateError(f"git archive {revision[:12]} failed: {stderr or extract_error}")
+            os.replace(staging, snapshot)
+        except OSError as exc:
+            raise ReleaseUpdateError(f"unable to stage release {revision[:12]}: {exc}") from exc
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return release_dir
+
+    @staticmethod
+    def _extract(stream, prefix: str, staging: Path) -> None:
+        root = staging.resolve()
+        with tarfile.open(fileobj=stream, mode="r|") as archive:
+            for member in archive:
+                relative = member.name[len(prefix):] if member.name.startswith(prefix) else member.name
+                target = (root / relative).resolve()
+                if root not in target.parents:
+                    continue
+                if member.isdir():
+                    target.mkdir(parents=True, exist_ok=True)
+                elif member.isfile():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    with target.open("wb") as fh:
+                        shutil.copyfileobj(archive.extractfile(member), fh)
+
+    def _activate(self, revision: str, release_dir: Path, plan: flash_plan.FlashPlan) -> None:
+        pointer = {"revision": revision, "release_dir": str(release_dir), "version": plan.version, "activated_at": time.time()}
+        tmp_path = self._pointer_path.with_name(self._pointer_path.name + ".tmp")
+        try:
+            tmp_path.write_text(json.dumps(pointer, indent=2))
+            os.replace(tmp_path, self._pointer_path)
+        except OSError as exc:
+            raise ReleaseUpdateError(f"unable to record the active release: {exc}") from exc
+        with self._lock:
+            self._active_dir = release_dir
+            self._active_rev = revision
+        self._log(f"Release {plan.version} ({revision[:12]}) is now active.")
+        if self._on_swap is not None:
+            self._on_swap(release_dir, plan)
+
+    def _fast_forward_checkout(self, upstream: str) -> None:
+        """Bring the checkout itself up to date (scripts, tools) while no job is running."""
+        try:
+            if _git(self.repo_dir, "rev-parse", "HEAD") != upstream:
+                _git(self.repo_dir, "merge", "--ff-only", "--quiet", upstream)
+        except ReleaseUpdateError as exc:
+            self._log(f"Warning: checkout left at its current revision: {exc}")
+
+    def _prune(self) -> None:
+        if not self.state_dir.is_dir():
+            return
+        with self._lock:
+            active = self._active_dir
+        snapshots = sorted(
+            (path for path in self.state_dir.iterdir() if path.is_dir() and not path.name.startswith(".")),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+        for stale in snapshots[KEEP_SNAPSHOTS:]:
+            if stale != active.parent:
+                shutil.rmtree(stale, ignore_errors=True)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--state-dir", default=str(DEFAULT_STATE_DIR), help="Directory holding release snapshots.")
+    parser.add_argument("command", choices=("check", "status"), help="Fetch and activate once, or print the active release.")
+    args = parser.parse_args(argv)
+
+    state_dir = Path(args.state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    updater = ReleaseUpdater(state_dir=state_dir)
+    if args.command == "check" and not updater.check_once() and updater.status()["last_error"]:
+        return 1
+    print(json.dumps(updater.status(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+"""Simulated ESP32 fixtures for exercising the flasher without hardware (macOS/Linux).
+
+`serve` opens one pty per fixture and links it as <dir>/ttySIM<n>. Behind each pty a model of the
+chip answers the ROM sync and keeps its eFuses (FLASH_CRYPT_CNT, key block) and the MD5 of every
+written region. The `esptool` and `espefuse` commands, installed as wrappers by `install`, talk to
+that model over the pty, print the lines the flasher scripts parse, and take as long as the modeled
+link: sync and stub upload, wire bytes at the requested baud (10 bits per byte), the flash's own
+write and hashing rates. Every modeled delay is multiplied by --time-scale (FLEX_SIM_TIME_SCALE).
+
+Failures are injected on the device side: --fail-sync (probability a connect gets no sync),
+--fail-write (probability a write-flash breaks off mid-transfer) and --max-baud (writes and on-chip
+hashes above it fail with esptool's serial-noise error, which baud_profile treats as a link error). Creating
+<port>.swap makes the fixture present a fresh board (new MAC, blank eFuses) at its next connect.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import select
+import signal
+import sys
+import termios
+import threading
+import time
+import tty
+import uuid
+import zlib
+from pathlib import Path
+
+import efuse_registry
+
+ESPTOOL_VERSION = "v4.8.1"
+CHIP_DESCRIPTION = "ESP32-D0WD-V3 (revision v3.1)"
+MAC_PREFIX = "24:0a:c4"
+PORT_PREFIX = "ttySIM"
+ROM_BAUD = 115200
+FLASH_BLOCK_SIZE = 0x4000
+
+# Modeled seconds, before --time-scale.
+SYNC_SECONDS = 0.6
+CONNECT_TIMEOUT = 5.0
+RESET_SECONDS = 0.1
+EFUSE_READ_SECONDS = 0.3
+BURN_SECONDS = 0.5
+# Fixed cost of each written region: the flash-begin, flash-end and MD5 command round trips.
+REGION_SETUP_SECONDS = 0.08
+# Bytes per second the chip erases and programs, and hashes for verify-flash / "Hash of data verified".
+FLASH_WRITE_RATE = 200_000
+FLASH_HASH_RATE = 3_000_000
+# Client-side wait beyond the modeled time before a silent device counts as gone.
+REPLY_GRACE = 10.0
+
+FIELDS = ("FLASH_CRYPT_CNT", "FLASH_CRYPT_CONFIG", "DISABLE_DL_ENCRYPT", "DISABLE_DL_DECRYPT", "DISABLE_DL_CACHE")
+
+
+def default_time_scale() -> float:
+    return float(os.environ.get("FLEX_SIM_TIME_SCALE", "1.0"))
+
+
+class SimError(RuntimeError):
+    """A fatal esptool-style error; the message is printed after 'A fatal error occurred: '."""
+
+
+class Board:
+    """One chip on a fixture: MAC, eFuses and the MD5 of each written region."""
+
+    def __init__(self, fixture: int, number: int) -> None:
+        self.mac = f"{MAC_PREFIX}:{fixture & 0xFF:02x}:{(number >> 8) & 0xFF:02x}:{number & 0xFF:02x}"
+        self.efuses = dict.fromkeys(FIELDS, 0)
+        self.key_burned = False
+        self.regions: dict[int, tuple[int, str]] = {}
+
+    def rdata0(self) -> int:
+        return (self.efuses["FLASH_CRYPT_CNT"] & efuse_registry.FLASH_CRYPT_CNT_MASK) << efuse_registry.FLASH_CRYPT_CNT_SHIFT
+
+    def flash_md5(self, offset: int, size: int) -> str:
+        stored = self.regions.get(offset)
+        if stored is not None and stored[0] == size:
+            return stored[1]
+        return hashlib.md5(b"\xff" * size).hexdigest()
+
+
+class SimDevice:
+    """Serves the chip model on a pty master; one request line in, one reply line out."""
+
+    def __init__(
+        self,
+        fixture: int,
+        link: Path,
+        time_scale: float,
+        fail_sync: float,
+        fail_write: float,
+        max_baud: int | None,
+        rng: random.Random,
+    ) -> None:
+        self.fixture = fixture
+        self.link = link
+        self.time_scale = time_scale
+        self.fail_sync = fail_sync
+        self.fail_write = fail_write
+        self.max_baud = max_baud
+        self.rng = rng
+        self.boards = 1
+        self.board = Board(fixture, self.boards)
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.tty_name = os.ttyname(slave)
+        # Nothing may hold the slave open between tool runs, or the scripts' lsof check sees a busy port.
+        os.close(slave)
+        link.unlink(missing_ok=True)
+        link.symlink_to(self.tty_name)
+        self._write_plan: dict[str, object] | None = None
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def serve_forever(self) -> None:
+        buffer = b""
+        while True:
+            readable, _, _ = select.select([self.master], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                chunk = os.read(self.master, 65536)
+            except OSError:
+                # EIO while no tool has the port open.
+                time.sleep(0.02)
+                continue
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                reply = self.handle(request)
+                reply["id"] = request.get("id")
+                try:
+                    os.write(self.master, json.dumps(reply).encode("ascii") + b"\n")
+                except OSError:
+                    pass
+
+    def handle(self, request: dict[str, object]) -> dict[str, object]:
+        op = request.get("op")
+        board = self.board
+        if op == "sync":
+            swap = self.link.with_name(self.link.name + ".swap")
+            if swap.exists():
+                swap.unlink(missing_ok=True)
+                self.boards += 1
+                self.board = board = Board(self.fixture, self.boards)
+            if self.rng.random() < self.fail_sync:
+                self._sleep(CONNECT_TIMEOUT)
+                return {"ok": False, "error": "Failed to connect to ESP32: No serial data received."}
+            self._sleep(SYNC_SECONDS)
+            return {"ok": True, "mac": board.mac, "chip": CHIP_DESCRIPTION}
+        if op == "read_reg":
+            address = int(request.get("address", 0))
+            return {"ok": True, "value": board.rdata0() if address == efuse_registry.EFUSE_BLK0_RDATA0 else 0}
+        if op == "efuse_summary":
+            self._sleep(EFUSE_READ_SECONDS)
+            return {"ok": True, "mac": board.mac, "efuses": board.efuses, "key_burned": board.key_burned}
+        if op == "burn_key":
+            self._sleep(BURN_SECONDS)
+            if board.key_burned:
+                return {"ok": False, "error": "BLOCK1 is read-protected and write-protected; the key cannot be burned again."}
+            board.key_burned = True
+            return {"ok": True}
+        if op == "burn_efuse":
+            self._sleep(BURN_SECONDS)
+            for name, value in dict(request.get("fields") or {}).items():
+                if name not in board.efuses:
+                    return {"ok": False, "error": f"Unknown eFuse {name}"}
+                board.efuses[name] |= int(value)
+            return {"ok": True}
+        if op == "write_begin":
+            baud = int(request.get("baud", ROM_BAUD))
+            blocks = max(1, int(request.get("blocks", 1)))
+            fail_at = None
+            error = ""
+            if self.max_baud is not None and baud > self.max_baud:
+                fail_at, error = 0, "Invalid head of packet (0xE0): Possible serial noise or corruption."
+            elif self.rng.random() < self.fail_write:
+                fail_at, error = self.rng.randrange(blocks), "Packet content transfer stopped (received 8 bytes)"
+            self._write_plan = {"baud": baud, "fail_at": fail_at, "error": error}
+            # Region set-up, then the erase of the first sectors.
+            self._sleep(REGION_SETUP_SECONDS + int(request.get("size", 0)) / FLASH_WRITE_RATE / 8)
+            return {"ok": True}
+        if op == "write_block":
+            plan = self._write_plan or {"baud": ROM_BAUD, "fail_at": None, "error": ""}
+            wire_seconds = int(request.get("wire_bytes", 0)) * 10 / int(plan["baud"])
+            flash_seconds = int(request.get("size", 0)) / FLASH_WRITE_RATE
+            if plan["fail_at"] == int(request.get("seq", 0)):
+                self._sleep(wire_seconds / 2)
+                self._write_plan = None
+                return {"ok": False, "error": plan["error"]}
+            self._sleep(max(wire_seconds, flash_seconds))
+            return {"ok": True}
+        if op == "write_end":
+            offset, size = int(request.get("offset", 0)), int(request.get("size", 0))
+            self._sleep(size / FLASH_HASH_RATE)
+            board.regions = {
+                start: region
+                for start, region in board.regions.items()
+                if start + region[0] <= offset or start >= offset + size
+            }
+            board.regions[offset] = (size, str(request.get("md5")))
+            self._write_plan = None
+            return {"ok": True}
+        if op == "flash_md5":
+            if self.max_baud is not None and int(request.get("baud", ROM_BAUD)) > self.max_baud:
+                return {"ok": False, "error": "Invalid head of packet (0xE0): Possible serial noise or corruption."}
+            offset, size = int(request.get("offset", 0)), int(request.get("size", 0))
+            self._sleep(size / FLASH_HASH_RATE)
+            return {"ok": True, "md5": board.flash_md5(offset, size)}
+        if op == "reset":
+            self._sleep(RESET_SECONDS)
+            return {"ok": True}
+        return {"ok": False, "error": f"unsupported request {op!r}"}
+
+
+class Link:
+    """The tool side of a simulated port."""
+
+    def __init__(self, port: str) -> None:
+        try:
+            self.fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        except OSError as exc:
+            raise SimError(f"Could not open {port}, the port doesn't exist") from exc
+        tty.setraw(self.fd)
+        termios.tcflush(self.fd, termios.TCIOFLUSH)
+        self._buffer = b""
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def call(self, op: str, timeout: float, **fields: object) -> dict[str, object]:
+        request_id = uuid.uuid4().hex
+        os.write(self.fd, json.dumps({"op": op, "id": request_id, **fields}).encode("ascii") + b"\n")
+        deadline = time.monotonic() + timeout + REPLY_GRACE
+        while True:
+            while b"\n" in self._buffer:
+                line, self._buffer = self._buffer.split(b"\n", 1)
+                try:
+                    reply = json.loads(line)
+                except ValueError:
+                    continue
+                if reply.get("id") != request_id:
+                    continue  # Left over from a tool that gave up on an earlier request.
+                if not reply.get("ok"):
+                    raise SimError(str(reply.get("error") or "request failed"))
+                return reply
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SimError("Failed to connect to ESP32: No serial data received.")
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable:
+                try:
+                    self._buffer += os.read(self.fd, 65536)
+                except BlockingIOError:
+                    pass
+
+
+def _int(value: str) -> int:
+    return int(value, 0)
+
+
+def _pairs(values: list[str]) -> list[tuple[int, Path]]:
+    if len(values) % 2:
+        raise SimError("Values must be address followed by file name pairs")
+    return [(int(values[i], 0), Path(values[i + 1])) for i in range(0, len(values), 2)]
+
+
+def _connect(link: Link, port: str, scale: float) -> dict[str, object]:
+    print(f"Serial port {port}")
+    print("Connecting....", flush=True)
+    info = link.call("sync", (SYNC_SECONDS + CONNECT_TIMEOUT) * scale)
+    print(f"Chip is {info['chip']}")
+    print("Features: WiFi, BT, Dual Core, 240MHz, VRef calibration in efuse, Coding Scheme None")
+    print("Crystal is 40MHz")
+    print(f"MAC: {info['mac']}")
+    return info
+
+
+def _run_stub(baud: int) -> None:
+    print("Uploading stub...")
+    print("Running stub...")
+    print("Stub running...")
+    if baud != ROM_BAUD:
+        print(f"Changing baud rate to {baud}")
+        print("Changed.")
+
+
+def _write_flash(link: Link, args: argparse.Namespace, scale: float) -> None:
+    print("Configuring flash size...")
+    for offset, path in _pairs(args.addr_filename):
+        data = path.read_bytes()
+        md5 = hashlib.md5(data).hexdigest()
+        wire = data if args.no_compress or args.encrypt else zlib.compress(data, 9)
+        blocks = max(1, -(-len(wire) // FLASH_BLOCK_SIZE))
+        end = offset + max(len(data), 1) - 1
+        print(f"Flash will be erased from 0x{offset:08x} to 0x{end | 0xFFF:08x}...")
+        if wire is not data:
+            print(f"Compressed {len(data)} bytes to {len(wire)}...")
+        started = time.monotonic()
+        link.call(
+            "write_begin", (REGION_SETUP_SECONDS + len(data) / FLASH_WRITE_RATE) * scale, offset=offset, size=len(data), blocks=blocks, baud=args.baud
+        )
+        for seq in range(blocks):
+            chunk = len(wire[seq * FLASH_BLOCK_SIZE : (seq + 1) * FLASH_BLOCK_SIZE])
+            plain = len(data) * chunk // max(len(wire), 1)
+            print(f"Writing at 0x{offset + seq * len(data) // blocks:08x}... ({100 * seq // blocks} %)", flush=True)
+            link.call(
+                "write_block",
+                max(chunk * 10 / args.baud, plain / FLASH_WRITE_RATE) * scale,
+                seq=seq,
+                wire_bytes=chunk,
+                size=plain,
+            )
+        print(f"Writing at 0x{end:08x}... (100 %)")
+        link.call("write_end", len(data) / FLASH_HASH_RATE * scale, offset=offset, size=len(data), md5=md5)
+        seconds = max(time.monotonic() - started, 1e-3)
+        compressed = f" ({len(wire)} compressed)" if wire is not data else ""
+        print(
+            f"Wrote {len(data)} bytes{compressed} at 0x{offset:08x} in {seconds:.1f} seconds"
+            f" (effective {len(data) * 8 / seconds / 1000:.1f} kbit/s)..."
+        )
+        print("Hash of data verified.", flush=True)
+
+
+def _verify_flash(link: Link, args: argparse.Namespace, scale: float) -> bool:
+    ok = True
+    for offset, path in _pairs(args.addr_filename):
+        data = path.read_bytes()
+        print(f"Verifying 0x{len(data):x} ({len(data)}) bytes @ 0x{offset:08x} in flash against {path}...")
+        digest = link.call("flash_md5", len(data) / FLASH_HASH_RATE * scale, offset=offset, size=len(data), baud=args.baud)["md5"]
+        if digest == hashlib.md5(data).hexdigest():
+            print("-- verify OK (digest matched)")
+        else:
+            print("-- verify FAILED (digest mismatch)")
+            ok = False
+    return ok
+
+
+def _leave(link: Link, after: str, scale: float) -> None:
+    print()
+    print("Leaving...")
+    if after.replace("_", "-") == "hard-reset":
+        print("Hard resetting via RTS pin...")
+        link.call("reset", RESET_SECONDS * scale)
+    else:
+        print("Staying in bootloader.")
+
+
+def esptool_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="esptool", description="Simulated esptool for sim_device fixtures.")
+    parser.add_argument("--chip", "-c", default="auto")
+    parser.add_argument("--port", "-p", default=os.environ.get("ESPTOOL_PORT", ""))
+    parser.add_argument("--baud", "-b", type=int, default=ROM_BAUD)
+    parser.add_argument("--before", default="default-reset")
+    parser.add_argument("--after", "-a", default="hard-reset")
+    sub = parser.add_subparsers(dest="command", required=True)
+    write = sub.add_parser("write-flash", aliases=["write_flash"])
+    write.add_argument("--no-compress", "-u", action="store_true")
+    write.add_argument("--compress", "-z", action="store_true")
+    write.add_argument("--encrypt", action="store_true")
+    write.add_argument("--erase-all", "-e", action="store_true")
+    for command in (write, sub.add_parser("verify-flash", aliases=["verify_flash"])):
+        command.add_argument("--flash-mode", "--flash_mode", "-fm")
+        command.add_argument("--flash-freq", "--flash_freq", "-ff")
+        command.add_argument("--flash-size", "--flash_size", "-fs")
+        command.add_argument("addr_filename", nargs="+")
+    sub.add_parser("read-mac", aliases=["read_mac"])
+    read_mem = sub.add_parser("read-mem", aliases=["read_mem"])
+    read_mem.add_argument("address", type=_int)
+    args = parser.parse_args(argv)
+    command = args.command.replace("_", "-")
+    scale = default_time_scale()
+
+    print(f"esptool.py {ESPTOOL_VERSION}")
+    link: Link | None = None
+    try:
+        link = Link(args.port)
+        info = _connect(link, args.port, scale)
+        ok = True
+        if command == "read-mac":
+            print(f"MAC: {info['mac']}")
+        elif command == "read-mem":
+            value = int(link.call("read_reg", 0.0, address=args.address)["value"])
+            print(f"0x{args.address:08x} = 0x{value:08x}")
+        else:
+            _run_stub(args.baud)
+            if command == "write-flash":
+                _write_flash(link, args, scale)
+            else:
+                ok = _verify_flash(link, args, scale)
+        _leave(link, args.after, scale)
+        if not ok:
+            raise SimError("Verify failed.")
+    except (SimError, OSError) as exc:
+        print(f"\nA fatal error occurred: {exc}", flush=True)
+        return 2
+    finally:
+        if link is not None:
+            link.close()
+    return 0
+
+
+def _confirm(do_not_confirm: bool) -> None:
+    if do_not_confirm:
+        return
+    print("Type 'BURN' (all capitals) to continue.", flush=True)
+    if sys.stdin.readline().strip() != "BURN":
+        raise SimError("Burn aborted.")
+
+
+def _print_summary(reply: dict[str, object]) -> None:
+    efuses = dict(reply["efuses"])  # type: ignore[arg-type]
+    rule = "-" * 120
+    print("EFUSE_NAME (Block) Description  = [Meaningful Value] [Readable/Writeable] (Hex Value)")
+    print(rule)
+    print("Identity fuses:")
+    print(f"{'MAC (BLOCK0)':<50} {'Factory MAC Address':<50} = {reply['mac']} (CRC 0x00 OK) R/W")
+    print()
+    print("Security fuses:")
+    cnt = int(efuses["FLASH_CRYPT_CNT"])
+    print(f"{'FLASH_CRYPT_CNT (BLOCK0)':<50} {'Flash encryption mode counter':<50} = {cnt} R/W (0b{cnt:07b})")
+    config = int(efuses["FLASH_CRYPT_CONFIG"])
+    print(f"{'FLASH_CRYPT_CONFIG (BLOCK0)':<50} {'Flash encryption config (key tweak bits)':<50} = {config} R/W (0x{config:x})")
+    for name in FIELDS[2:]:
+        value = bool(efuses[name])
+        print(f"{name + ' (BLOCK0)':<50} {'Disable flash ' + name.rsplit('_', 1)[1].lower() + ' in UART bootloader':<50} = {value} R/W (0b{int(value)})")
+    key = "?? " * 32 if reply["key_burned"] else "00 " * 32
+    access = "-/-" if reply["key_burned"] else "R/W"
+    print(f"{'BLOCK1 (BLOCK1)':<50} {'Flash encryption key':<50}\n   = {key}{access}")
+
+
+def espefuse_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="espefuse", description="Simulated espefuse for sim_device fixtures.")
+    parser.add_argument("--chip", "-c", default="auto")
+    parser.add_argument("--port", "-p", default=os.environ.get("ESPTOOL_PORT", ""))
+    parser.add_argument("--baud", "-b", type=int, default=ROM_BAUD)
+    parser.add_argument("--do-not-confirm", action="store_true")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("summary")
+    burn_key = sub.add_parser("burn_key", aliases=["burn-key"])
+    burn_key.add_argument("block")
+    burn_key.add_argument("keyfile", type=Path)
+    burn_efuse = sub.add_parser("burn_efuse", aliases=["burn-efuse"])
+    burn_efuse.add_argument("name_value_pairs", nargs="+")
+    args = parser.parse_args(argv)
+    command = args.command.replace("-", "_")
+    scale = default_time_scale()
+
+    print(f"espefuse.py {ESPTOOL_VERSION}")
+    link: Link | None = None
+    try:
+        link = Link(args.port)
+        print("Connecting....", flush=True)
+        link.call("sync", (SYNC_SECONDS + CONNECT_TIMEOUT) * scale)
+        print("Detecting chip type... ESP32")
+        if command == "summary":
+            print('=== Run "summary" command ===')
+            _print_summary(link.call("efuse_summary", EFUSE_READ_SECONDS * scale))
+        elif command == "burn_key":
+            if len(args.keyfile.read_bytes()) != 32:
+                raise SimError(f"Incorrect key file size {args.keyfile.stat().st_size}. Key file must be 32 bytes.")
+            _confirm(args.do_not_confirm)
+            print(f"Burn keys to blocks:\n - BLOCK1 -> [{args.block}]")
+            link.call("burn_key", BURN_SECONDS * scale)
+            print("Successful")
+        else:
+            values = args.name_value_pairs
+            if len(values) % 2:
+                raise SimError("The number of eFuse names and values must match.")
+            fields = {values[i]: int(values[i + 1], 0) for i in range(0, len(values), 2)}
+            _confirm(args.do_not_confirm)
+            print("The efuses to burn:")
+            for name, value in fields.items():
+                print(f"  {name} = {value}")
+            link.call("burn_efuse", BURN_SECONDS * scale, fields=fields)
+            print("Successful")
+    except (SimError, OSError) as exc:
+        print(f"A fatal error occurred: {exc}", flush=True)
+        return 2
+    finally:
+        if link is not None:
+            link.close()
+    return 0
+
+
+def install(directory: Path) -> tuple[Path, Path]:
+    """Write executable esptool/espefuse wrappers into directory; returns their paths."""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for tool in ("esptool", "espefuse"):
+        path = directory / tool
+        path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).resolve()}" {tool} "$@"\n')
+        path.chmod(0o755)
+        paths.append(path)
+    return paths[0], paths[1]
+
+
+def serve(args: argparse.Namespace) -> int:
+    directory = Path(args.dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(args.seed)
+    devices = [
+        SimDevice(
+            index,
+            directory / f"{PORT_PREFIX}{index}",
+            args.time_scale,
+            args.fail_sync,
+            args.fail_write,
+            args.max_baud,
+            random.Random(rng.random()),
+        )
+        for index in range(args.count)
+    ]
+    for device in devices:
+        threading.Thread(target=device.serve_forever, name=f"sim-{device.fixture}", daemon=True).start()
+        print(f"{device.link} -> {device.tty_name}")
+    print("ready", flush=True)
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    stop.wait()
+    for device in devices:
+        device.link.unlink(missing_ok=True)
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    tool = Path(sys.argv[0]).name
+    if tool in ("esptool", "esptool.py"):
+        return esptool_main(argv)
+    if tool in ("espefuse", "espefuse.py"):
+        return espefuse_main(argv)
+    if argv and argv[0] == "esptool":
+        return esptool_main(argv[1:])
+    if argv and argv[0] == "espefuse":
+        return espefuse_main(argv[1:])
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="Run simulated fixtures until interrupted.")
+    serve_parser.add_argument("--count", type=int, default=1, help="Number of fixtures.")
+    serve_parser.add_argument("--dir", required=True, help="Directory for the ttySIM<n> port links.")
+    serve_parser.add_argument("--time-scale", type=float, default=default_time_scale(), help="Multiplier on modeled delays.")
+    serve_parser.add_argument("--fail-sync", type=float, default=0.0, help="Probability a connect fails to sync.")
+    serve_parser.add_argument("--fail-write", type=float, default=0.0, help="Probability a write-flash breaks off.")
+    serve_parser.add_argument("--max-baud", type=int, help="Writes and hashes above this rate fail with a link error.")
+    serve_parser.add_argument("--seed", type=int, help="Seed for injected failures.")
+    install_parser = sub.add_parser("install", help="Write esptool/espefuse wrappers that use the simulator.")
+    install_parser.add_argument("--dir", required=True)
+    sub.add_parser("esptool", help="Run the simulated esptool (remaining arguments are passed on).")
+    sub.add_parser("espefuse", help="Run the simulated espefuse (remaining arguments are passed on).")
+    args = parser.parse_args(argv)
+
+    if args.command == "install":
+        for path in install(Path(args.dir)):
+            print(path)
+        return 0
+    return serve(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Full per-unit flash transcripts, gzip-compressed on disk and indexed by serial and MAC.
+
+The GUI keeps only the last lines of each job in memory. Every line (stage markers included, each
+prefixed with the seconds since the job started) is also streamed into its own gzip file under
+logs/transcripts/<YYYY-MM>/, so nothing accumulates in memory and a failed unit's esptool/espefuse
+output survives later jobs. A SQLite index next to the files maps serial and MAC to transcripts;
+pruning drops the oldest transcripts beyond FLEX_TRANSCRIPT_MAX_MB in total or older than
+FLEX_TRANSCRIPT_MAX_DAYS, and a runaway job stops being recorded at MAX_TRANSCRIPT_BYTES.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DIR = PRODUCTION_DIR / "logs" / "transcripts"
+INDEX_NAME = "index.sqlite3"
+DEFAULT_MAX_BYTES = int(float(os.environ.get("FLEX_TRANSCRIPT_MAX_MB", "2048")) * 1024 * 1024)
+DEFAULT_MAX_AGE = float(os.environ.get("FLEX_TRANSCRIPT_MAX_DAYS", "365")) * 86400
+# Uncompressed bytes kept per job; later lines are dropped with one note.
+MAX_TRANSCRIPT_BYTES = 16 * 1024 * 1024
+# Compressed data is flushed to disk at least this often, so a crash loses little.
+FLUSH_INTERVAL = 5.0
+_SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    serial TEXT NOT NULL,
+    mac TEXT,
+    port TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    path TEXT NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS transcripts_serial ON transcripts (serial, started_at);
+CREATE INDEX IF NOT EXISTS transcripts_mac ON transcripts (mac, started_at);
+CREATE INDEX IF NOT EXISTS transcripts_started ON transcripts (started_at);
+"""
+
+
+def read_gzip(path: Path) -> bytes:
+    """Decompress a transcript, keeping whatever precedes a truncated tail (job still running or crashed)."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks: list[bytes] = []
+    with path.open("rb") as fh:
+        while True:
+            block = fh.read(1 << 16)
+            if not block:
+                break
+            try:
+                chunks.append(decompressor.decompress(block))
+            except zlib.error:
+                break
+            if decompressor.eof:
+                break
+    return b"".join(chunks)
+
+
+class TranscriptWriter:
+    """Streams one job's lines into its gzip file; thread-safe, and every call after close() is ignored."""
+
+    def __init__(self, store: "TranscriptStore", row_id: int, path: Path, started: float) -> None:
+        self._store = store
+        self.row_id = row_id
+        self.path = path
+        self._started = started
+        self._lock = threading.Lock()
+        self._file: gzip.GzipFile | None = gzip.GzipFile(path, "wb", compresslevel=6)
+        self._written = 0
+        self._flushed_at = time.monotonic()
+        self.mac: str | None = None
+
+    def write(self, line: str) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            data = f"[{time.monotonic() - self._started:9.3f}] {line.rstrip()}\n".encode("utf-8", "replace")
+            if self._written + len(data) > MAX_TRANSCRIPT_BYTES:
+                if self._written <= MAX_TRANSCRIPT_BYTES:
+                    self._file.write(b"[transcript truncated: size limit reached]\n")
+                    self._written = MAX_TRANSCRIPT_BYTES + 1
+                return
+            self._written += len(data)
+            self._file.write(data)
+            if time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed_at = time.monotonic()
+
+    def close(self, status: str, mac: str | None = None) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        self._store.finish(self.row_id, status, mac or self.mac, self.path)
+
+
+class TranscriptStore:
+    def __init__(
+        self, directory: Path = DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES, max_age: float = DEFAULT_MAX_AGE
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(directory / INDEX_NAME), timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def recover(self) -> None:
+        """Settle transcripts left 'running' by a previous GUI; they keep whatever reached the disk."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, path FROM transcripts WHERE status = 'running'").fetchall()
+            for row in rows:
+                try:
+                    size = (self.directory / row["path"]).stat().st_size
+                except OSError:
+                    size = 0
+                self._conn.execute("UPDATE transcripts SET status = 'interrupted', bytes = ? WHERE id = ?", (size, row["id"]))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def open(self, serial: str, port: str | None, started_at: float | None = None) -> TranscriptWriter:
+        started_at = time.time() if started_at is None else started_at
+        stamp = dt.datetime.fromtimestamp(started_at)
+        folder = self.directory / stamp.strftime("%Y-%m")
+        folder.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO transcripts (serial, port, started_at, status, path) VALUES (?, ?, ?, 'running', '')",
+                (serial, port, started_at),
+            )
+            row_id = int(cursor.lastrowid)
+            name = f"{_SAFE_NAME_RE.sub('_', serial)}_{stamp.strftime('%Y%m%dT%H%M%S')}_{row_id}.log.gz"
+            path = folder / name
+            self._conn.execute(
+                "UPDATE transcripts SET path = ? WHERE id = ?", (str(path.relative_to(self.directory)), row_id)
+            )
+            self._conn.commit()
+        return TranscriptWriter(self, row_id, path, time.monotonic())
+
+    def finish(self, row_id: int, status: str, mac: str | None, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = 0
+        with self._lock:
+            self._conn.execute(
+                "UPDATE transcripts SET status = ?, mac = COALESCE(?, mac), finished_at = ?, bytes = ? WHERE id = ?",
+                (status, mac.lower() if mac else None, time.time(), size, row_id),
+            )
+            self._conn.commit()
+        self.prune()
+
+    def prune(self, now: float | None = None) -> int:
+        """Delete transcripts past the age limit, then the oldest until the total fits; returns the count."""
+        now = time.time() if now is None else now
+        with self._lock:
+            doomed = self._conn.execute(
+                "SELECT id, path, bytes FROM transcripts WHERE status != 'running' AND started_at < ?",
+                (now - self.max_age,),
+            ).fetchall()
+            total = int(self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM transcripts").fetchone()[0])
+            total -= sum(int(row["bytes"]) for row in doomed)
+            if total > self.max_bytes:
+                skip = {row["id"] for row in doomed}
+                for row in self._conn.execute(
+                    "SELECT id, path, bytes FROM transcripts WHERE status != 'running' ORDER BY started_at"
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    if row["id"] in skip:
+                        continue
+                    doomed.append(row)
+                    total -= int(row["bytes"])
+            for row in doomed:
+                (self.directory / row["path"]).unlink(missing_ok=True)
+            if doomed:
+                self._conn.executemany("DELETE FROM transcripts WHERE id = ?", [(row["id"],) for row in doomed])
+                self._conn.commit()
+        for folder in self.directory.iterdir() if doomed else ():
+            if folder.is_dir():
+                try:
+                    folder.rmdir()  # Succeeds only once a month's folder is empty.
+                except OSError:
+                    pass
+        return len(doomed)
+
+    def find(self, serial: str | None = None, mac: str | None = None, limit: int = 20) -> list[dict[str, object]]:
+        """Newest-first transcripts of a serial and/or MAC."""
+        clauses, values = [], []
+        if serial:
+            clauses.append("serial = ?")
+            values.append(serial)
+        if mac:
+            clauses.append("mac = ?")
+            values.append(mac.lower())
+        if not clauses:
+            raise ValueError("a serial or MAC is required")
+        sql = f"SELECT * FROM transcripts WHERE {' AND '.join(clauses)} ORDER BY started_at DESC, id DESC LIMIT ?"
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, [*values, max(1, limit)])]
+
+    def get(self, row_id: int) -> dict[str, object] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM transcripts WHERE id = ?", (row_id,)).fetchone()
+        return dict(row) if row else None
+
+    def path_of(self, row: dict[str, object]) -> Path:
+        return self.directory / str(row["path"])
+
+    def text(self, row: dict[str, object]) -> str:
+        return read_gzip(self.path_of(row)).decode("utf-8", "replace")
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=str(DEFAULT_DIR), help="Transcript directory (holds the index).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="Print the newest transcript of a serial or MAC (or list them).")
+    show.add_argument("--serial")
+    show.add_argument("--mac")
+    show.add_argument("--id", type=int, help="A specific transcript from --list.")
+    show.add_argument("--list", action="store_true", help="List the unit's transcripts as JSON.")
+    sub.add_parser("prune", help="Apply the size and age limits now.")
+    args = parser.parse_args(argv)
+
+    try:
+        store = TranscriptStore(Path(args.dir))
+        if args.command == "prune":
+            print(f"Removed {store.prune()} transcript(s).")
+            return 0
+        if args.id is not None:
+            row = store.get(args.id)
+            rows = [row] if row else []
+        else:
+            rows = store.find(args.serial, args.mac, limit=100 if args.list else 1)
+        if args.list:
+            print(json.dumps(rows, indent=2))
+            return 0
+        if not rows:
+            print("Error: no transcript found.", file=sys.stderr)
+            return 1
+        sys.stdout.write(store.text(rows[0]))
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Per-unit SSID/serial/password lookups backed by an on-disk index of passwords.csv.
+
+The CSV is parsed once into a SQLite index (.cache/units.sqlite3) keyed by (batch, serial);
+later starts reuse the index as long as the CSV's size and mtime are unchanged, so a 100k-row order
+costs nothing at start-up and each lookup is one primary-key read. Lookups notice an edited CSV by
+its mtime and rebuild the index in place; an edit that fails validation is reported and the previous
+index stays in use. Serials run to 9999, the width of the identifier's serial field.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CSV_PATH = PRODUCTION_DIR / "passwords.csv"
+DEFAULT_INDEX_PATH = PRODUCTION_DIR / ".cache" / "units.sqlite3"
+DEFAULT_PASSWORD = "12345678"
+SERIAL_MIN = 1
+SERIAL_MAX = 9999
+YEAR_MIN = 0
+YEAR_MAX = 99
+MONTH_MIN = 1
+MONTH_MAX = 12
+PASSWORD_MIN_LEN = 8
+PASSWORD_MAX_LEN = 63
+IDENTIFIER_PREFIX = "FP"
+# How often lookups stat the CSV for edits.
+RELOAD_CHECK_INTERVAL = 1.0
+INSERT_CHUNK = 5000
+
+
+class UnitStoreError(ValueError):
+    """Raised when passwords.csv cannot be indexed; the message names the offending row."""
+
+
+def validate_year(value: int) -> None:
+    if not (YEAR_MIN <= value <= YEAR_MAX):
+        raise ValueError(f"Year must be between {YEAR_MIN:02d} and {YEAR_MAX:02d}.")
+
+
+def validate_month(value: int) -> None:
+    if not (MONTH_MIN <= value <= MONTH_MAX):
+        raise ValueError(f"Month must be between {MONTH_MIN:02d} and {MONTH_MAX:02d}.")
+
+
+def validate_serial(value: int) -> None:
+    if not (SERIAL_MIN <= value <= SERIAL_MAX):
+        raise ValueError(f"Serial must be between {SERIAL_MIN} and {SERIAL_MAX}.")
+
+
+def format_identifier(batch: int, year: int, month: int, serial: int) -> str:
+    return f"{IDENTIFIER_PREFIX}{batch:02d}-{year:02d}{month:02d}{serial:04d}"
+
+
+def _signature(path: Path) -> str | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _read_rows(path: Path):
+    """Yield validated (batch, serial, password) rows from passwords.csv."""
+    with path.open("r", encoding="utf-8", newline="") as fh:
+        reader = csv.DictReader(fh)
+        if not {"batch", "serial", "password"}.issubset(reader.fieldnames or set()):
+            raise UnitStoreError("Password CSV must contain batch,serial,password columns.")
+        for row in reader:
+            try:
+                batch = int(row["batch"])
+                serial = int(row["serial"])
+            except (TypeError, ValueError) as exc:
+                raise UnitStoreError(f"Invalid batch/serial value in {path}: {row}") from exc
+            password = (row["password"] or "").strip()
+            if not (SERIAL_MIN <= serial <= SERIAL_MAX):
+                raise UnitStoreError(f"Serial {serial} out of supported range {SERIAL_MIN}-{SERIAL_MAX}.")
+            if not (PASSWORD_MIN_LEN <= len(password) <= PASSWORD_MAX_LEN):
+                raise UnitStoreError(f"Password for batch {batch} serial {serial} violates length constraints.")
+            yield batch, serial, password
+
+
+def build_index(csv_path: Path, index_path: Path) -> int:
+    """Write a fresh index for csv_path next to index_path and swap it in; returns the row count."""
+    signature = _signature(csv_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(tmp_path))
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(
+            "CREATE TABLE units (batch INTEGER NOT NULL, serial INTEGER NOT NULL, password TEXT NOT NULL,"
+            " PRIMARY KEY (batch, serial)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        rows = _read_rows(csv_path)
+        count = 0
+        while True:
+            chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+            if not chunk:
+                break
+            try:
+                conn.executemany("INSERT INTO units (batch, serial, password) VALUES (?, ?, ?)", chunk)
+            except sqlite3.IntegrityError:
+                seen: set[tuple[int, int]] = set()
+                for batch, serial, _ in chunk:
+                    if (batch, serial) in seen or conn.execute(
+                        "SELECT 1 FROM units WHERE batch = ? AND serial = ?", (batch, serial)
+                    ).fetchone():
+                        raise UnitStoreError(f"Duplicate password entry for batch {batch} serial {serial:04d}.") from None
+                    seen.add((batch, serial))
+                raise
+            count += len(chunk)
+        conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [("source", signature or ""), ("units", str(count)), ("built_at", str(time.time()))],
+        )
+        conn.commit()
+    except BaseException:
+        conn.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(tmp_path, index_path)
+    return count
+
+
+class UnitStore:
+    """Derives each unit's identifier and password; passwords.csv overrides the default password."""
+
+    def __init__(
+        self,
+        csv_path: Path = DEFAULT_CSV_PATH,
+        default_password: str = DEFAULT_PASSWORD,
+        index_path: Path = DEFAULT_INDEX_PATH,
+    ) -> None:
+        self.csv_path = csv_path
+        self.default_password = default_password
+        self.index_path = index_path
+        self.loaded_from_disk = False
+        self.units = 0
+        self.last_error: str | None = None
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._signature: str | None = None
+        self._checked_at = 0.0
+
+    def load(self) -> None:
+        """Open (or build) the index for the current CSV; raises UnitStoreError if the CSV is invalid."""
+        with self._lock:
+            self._refresh_locked(strict=True)
+
+    def _open_locked(self) -> str | None:
+        """Open the existing index and return the source signature it was built from."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if not self.index_path.exists():
+            return None
+        try:
+            conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        except sqlite3.Error:
+            return None
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        except sqlite3.Error:
+            conn.close()
+            return None
+        self._conn = conn
+        self.units = int(meta.get("units", 0))
+        return meta.get("source")
+
+    def _refresh_locked(self, strict: bool) -> None:
+        self._checked_at = time.monotonic()
+        signature = _signature(self.csv_path)
+        if signature == self._signature and (signature is None or self._conn is not None):
+            return
+        if signature is None:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._signature = None
+            self.loaded_from_disk = False
+            self.units = 0
+            self.last_error = None
+            return
+        if self._open_locked() != signature:
+            if self._conn is not None:
+                # Windows cannot replace a file that is still open.
+                self._conn.close()
+                self._conn = None
+            try:
+                build_index(self.csv_path, self.index_path)
+            except (OSError, sqlite3.Error, UnitStoreError) as exc:
+                self.last_error = str(exc)
+                if strict:
+                    raise UnitStoreError(str(exc)) from exc
+                print(f"Warning: keeping the previous unit index; {self.csv_path} was not reloaded: {exc}", file=sys.stderr)
+                self._signature = signature  # Do not retry until the file changes again.
+                self._open_locked()
+                return
+            if self._open_locked() is None:
+                raise UnitStoreError(f"unable to open unit index {self.index_path}")
+            if self.loaded_from_disk:
+                print(f"Reloaded {self.units} unit(s) from {self.csv_path}.")
+        self._signature = signature
+        self.loaded_from_disk = True
+        self.last_error = None
+
+    def _passwords_locked(self, batch: int, first: int, last: int) -> dict[int, str]:
+        if time.monotonic() - self._checked_at >= RELOAD_CHECK_INTERVAL:
+            self._refresh_locked(strict=False)
+        if self._conn is None:
+            return {}
+        rows = self._conn.execute(
+            "SELECT serial, password FROM units WHERE batch = ? AND serial BETWEEN ? AND ?", (batch, first, last)
+        ).fetchall()
+        return dict(rows)
+
+    def _validate(self, batch: int, year: int, month: int, serials: tuple[int, ...]) -> None:
+        if batch <= 0:
+            raise ValueError("Batch number must be positive.")
+        for serial in serials:
+            validate_serial(serial)
+        validate_year(year)
+        validate_month(month)
+
+    def _unit(self, batch: int, year: int, month: int, serial: int, password: str) -> dict[str, object]:
+        serial_suffix = format_identifier(batch, year, month, serial)
+        return {
+            "batch": batch,
+            "year": year,
+            "month": month,
+            "serial_number": serial,
+            "serial": serial_suffix,
+            "ssid": serial_suffix,
+            "password": password,
+        }
+
+    def lookup(self, batch: int, serial: int, year: int, month: int) -> dict[str, object]:
+        self._validate(batch, year, month, (serial,))
+        with self._lock:
+            passwords = self._passwords_locked(batch, serial, serial)
+        return self._unit(batch, year, month, serial, passwords.get(serial, self.default_password))
+
+    def lookup_range(self, batch: int, year: int, month: int, first: int, last: int) -> list[dict[str, object]]:
+        """Every unit from first to last (inclusive) with one index query."""
+        self._validate(batch, year, month, (first, last))
+        if first > last:
+            raise ValueError("The first serial must not be after the last one.")
+        with self._lock:
+            passwords = self._passwords_locked(batch, first, last)
+        return [
+            self._unit(batch, year, month, serial, passwords.get(serial, self.default_password))
+            for serial in range(first, last + 1)
+        ]
+
+    def status(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "path": str(self.csv_path),
+                "loaded_from_disk": self.loaded_from_disk,
+                "units": self.units,
+                "last_error": self.last_error,
+            }
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default=str(DEFAULT_CSV_PATH), help="passwords.csv with batch,serial,password rows.")
+    parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), help="SQLite index file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="Validate the CSV and rebuild the index.")
+    lookup = sub.add_parser("lookup", help="Print units FIRST-LAST of a batch as JSON.")
+    lookup.add_argument("--batch", type=int, required=True)
+    lookup.add_argument("--year", type=int, required=True)
+    lookup.add_argument("--month", type=int, required=True)
+    lookup.add_argument("--first", type=int, default=SERIAL_MIN)
+    lookup.add_argument("--last", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "build":
+            print(f"Indexed {build_index(Path(args.csv), Path(args.index))} unit(s).")
+            return 0
+        store = UnitStore(Path(args.csv), index_path=Path(args.index))
+        store.load()
+        last = args.first if args.last is None else args.last
+        print(json.dumps(store.lookup_range(args.batch, args.year, args.month, args.first, last), indent=2))
+    except (OSError, ValueError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
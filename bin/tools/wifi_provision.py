@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Wi-Fi provisioning of flashed units by background workers, off the flashing critical path.
+
+After write-flash a unit boots into its factory SoftAP. A worker joins that SSID, waits for the
+unit's HTTP port with a TCP probe (backing off from 0.2 s to 2 s), posts the unit's serial and
+SoftAP password to /debug/update over the worker's HTTP client, restores the station's Wi-Fi and
+settles the unit's flash-history row as wifi_success or wifi_failed. Every unit broadcasts the same
+factory SSID, so each Wi-Fi interface provisions one unit at a time: there is one worker per
+interface, and a lock file per interface keeps the helper scripts' background runs and the GUI apart.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import collections
+import contextlib
+import http.client
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+import flash_history
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows stations do not provision over Wi-Fi yet
+    fcntl = None
+
+PRODUCTION_DIR = Path(__file__).resolve().parent.parent
+LOCK_DIR = PRODUCTION_DIR / "logs"
+HTTP_PORT = 80
+READY_TIMEOUT = 40.0
+PROBE_BACKOFF = (0.2, 2.0)
+HTTP_TIMEOUT = 10.0
+JOIN_TIMEOUT = 30
+RECENT_RESULTS = 50
+NOT_ASSOCIATED = "You are not associated with an AirPort network."
+
+LogFn = Callable[[str], None]
+
+
+class ProvisionError(RuntimeError):
+    """Raised when a unit cannot be provisioned; the message is meant for the operator log."""
+
+
+class ProvisionTask(NamedTuple):
+    serial: str
+    password: str
+    factory_ssid: str
+    factory_password: str
+    target_ip: str
+    # Identifies the unit's flash-history row; None skips the history update.
+    started_at: float | None = None
+
+
+def debug_credentials() -> tuple[str, str]:
+    return os.environ.get("FLEX_DEBUG_USER", "admin"), os.environ.get("FLEX_DEBUG_PASSWORD", "S1mpl3Flex#2025")
+
+
+def wifi_devices() -> list[str]:
+    """Interfaces to provision through: FLEX_WIFI_DEVICES (comma separated), WIFI_DEVICE, or the first Wi-Fi port."""
+    configured = os.environ.get("FLEX_WIFI_DEVICES") or os.environ.get("WIFI_DEVICE") or ""
+    devices = [device.strip() for device in configured.split(",") if device.strip()]
+    if devices or shutil.which("networksetup") is None:
+        return devices
+    try:
+        listing = subprocess.run(
+            ["networksetup", "-listallhardwareports"], capture_output=True, text=True, timeout=10, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    lines = listing.splitlines()
+    for index, line in enumerate(lines):
+        if line.strip() == "Hardware Port: Wi-Fi" and index + 1 < len(lines):
+            device = lines[index + 1].partition(":")[2].strip()
+            if device:
+                return [device]
+    return []
+
+
+def wait_for_tcp(host: str, port: int = HTTP_PORT, timeout: float = READY_TIMEOUT) -> bool:
+    """True once host accepts a TCP connection on port; backs off between refused or timed-out tries."""
+    deadline = time.monotonic() + timeout
+    delay = PROBE_BACKOFF[0]
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            with socket.create_connection((host, port), timeout=min(1.0, remaining)):
+                return True
+        except OSError:
+            pass
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, PROBE_BACKOFF[1])
+
+
+@contextlib.contextmanager
+def interface_lock(device: str) -> Iterator[None]:
+    """Exclusive use of a Wi-Fi interface across processes (GUI workers and script background runs)."""
+    if fcntl is None:
+        yield
+        return
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    with (LOCK_DIR / f"wifi_{device}.lock").open("w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class WifiInterface:
+    """One station Wi-Fi interface, switched with macOS networksetup."""
+
+    def __init__(self, device: str) -> None:
+        self.device = device
+
+    def current_network(self) -> str | None:
+        try:
+            output = subprocess.run(
+                ["networksetup", "-getairportnetwork", self.device], capture_output=True, text=True, timeout=10
+            ).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        network = output.splitlines()[0].partition(": ")[2].strip() if output else ""
+        return network if network and network != NOT_ASSOCIATED else None
+
+    def join(self, ssid: str, password: str) -> None:
+        try:
+            result = subprocess.run(
+                ["networksetup", "-setairportnetwork", self.device, ssid, password],
+                capture_output=True,
+                text=True,
+                timeout=JOIN_TIMEOUT,
+            )
+        except (OSError, subprocess.SubprocessError) as exc:
+            raise ProvisionError(f"unable to join {ssid} on {self.device}: {exc}") from exc
+        # networksetup exits 0 even when it could not join, and says so on stdout.
+        output = (result.stdout + result.stderr).strip()
+        if result.returncode != 0 or "error" in output.lower() or "could not" in output.lower():
+            raise ProvisionError(f"unable to join {ssid} on {self.device}: {output or result.returncode}")
+
+    def restore(self, network: str | None) -> None:
+        """Rejoin the network the station was on before (its password comes from the keychain)."""
+        if network:
+            with contextlib.suppress(OSError, subprocess.SubprocessError):
+                subprocess.run(
+                    ["networksetup", "-setairportnetwork", self.device, network],
+                    capture_output=True,
+                    timeout=JOIN_TIMEOUT,
+                )
+
+
+class DebugClient:
+    """One HTTP client per worker, reused for every unit; http.client reconnects after a unit reboots."""
+
+    def __init__(self, host: str, port: int = HTTP_PORT, timeout: float = HTTP_TIMEOUT) -> None:
+        self._conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        user, password = debug_credentials()
+        token = base64.b64encode(f"{user}:{password}".encode("utf-8")).decode("ascii")
+        self._headers = {
+            "Authorization": f"Basic {token}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+
+    @property
+    def host(self) -> str:
+        return self._conn.host
+
+    def update(self, serial: str, password: str) -> None:
+        body = urllib.parse.urlencode({"serial": serial, "password": password})
+        for attempt in (1, 2):
+            try:
+                self._conn.request("POST", "/debug/update", body=body, headers=self._headers)
+                response = self._conn.getresponse()
+                detail = response.read().decode("utf-8", errors="replace").strip()
+            except (OSError, http.client.HTTPException) as exc:
+                self._conn.close()
+                if attempt == 2:
+                    raise ProvisionError(f"/debug/update failed: {exc}") from exc
+                continue
+            # The unit reboots into its new SSID; never keep its connection.
+            self._conn.close()
+            if response.status >= 400:
+                raise ProvisionError(f"/debug/update answered {response.status}: {detail[:200]}")
+            return
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def provision(task: ProvisionTask, interface: WifiInterface, client: DebugClient, log: LogFn = print) -> None:
+    """Join the unit's factory SoftAP, push its serial and password, and restore the station's Wi-Fi."""
+    previous = interface.current_network()
+    try:
+        log(f"[{task.serial}] Joining factory SSID {task.factory_ssid} on {interface.device}...")
+        interface.join(task.factory_ssid, task.factory_password)
+        if not wait_for_tcp(task.target_ip):
+            raise ProvisionError(f"device did not answer on {task.target_ip}:{HTTP_PORT}")
+        log(f"[{task.serial}] Provisioning SSID via /debug/update")
+        client.update(task.serial, task.password)
+        log(f"[{task.serial}] SSID updated; the device reboots as {task.serial}.")
+    finally:
+        interface.restore(previous)
+
+
+def record_result(history_path: Path | None, task: ProvisionTask, ok: bool, message: str, seconds: float) -> None:
+    if history_path is None or task.started_at is None:
+        return
+    try:
+        with flash_history.HistoryStore(history_path) as history:
+            history.update_attempt(
+                task.serial,
+                task.started_at,
+                "wifi_success" if ok else "wifi_failed",
+                message=None if ok else message,
+                stages={"wifi": round(seconds, 3)},
+            )
+    except Exception as exc:  # noqa: BLE001
+        print(f"Warning: unable to record provisioning of {task.serial}: {exc}", file=sys.stderr)
+
+
+class ProvisionQueue:
+    """Units waiting for Wi-Fi provisioning, served by one worker thread per Wi-Fi interface."""
+
+    def __init__(
+        self,
+        devices: list[str] | None = None,
+        history_path: Path | None = flash_history.DEFAULT_HISTORY_PATH,
+        log: LogFn = print,
+    ) -> None:
+        self.devices = wifi_devices() if devices is None else devices
+        self.history_path = history_path
+        self._log = log
+        self._queue: queue.Queue[ProvisionTask] = queue.Queue()
+        self._lock = threading.Lock()
+        self._active: dict[str, str] = {}
+        self._results: collections.deque[dict[str, object]] = collections.deque(maxlen=RECENT_RESULTS)
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        if not self.devices:
+            self._log("Warning: no Wi-Fi interface found; queued units will not be provisioned.")
+        for device in self.devices:
+            thread = threading.Thread(target=self._work, args=(device,), name=f"wifi-{device}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, task: ProvisionTask) -> None:
+        if not self.devices:
+            record_result(self.history_path, task, False, "no Wi-Fi interface to provision with", 0.0)
+            return
+        self._queue.put(task)
+
+    def summary(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "devices": list(self.devices),
+                "pending": self._queue.qsize(),
+                "active": dict(self._active),
+                "recent": list(self._results),
+            }
+
+    def _work(self, device: str) -> None:
+        interface = WifiInterface(device)
+        client: DebugClient | None = None
+        while True:
+            task = self._queue.get()
+            if client is None or client.host != task.target_ip:
+                client = DebugClient(task.target_ip)
+            with self._lock:
+                self._active[device] = task.serial
+            started = time.monotonic()
+            ok, message = True, "provisioned"
+            try:
+                with interface_lock(device):
+                    provision(task, interface, client, self._log)
+            except Exception as exc:  # noqa: BLE001
+                ok, message = False, str(exc)
+                self._log(f"[{task.serial}] Wi-Fi provisioning failed: {exc}")
+            seconds = time.monotonic() - started
+            record_result(self.history_path, task, ok, message, seconds)
+            with self._lock:
+                self._active.pop(device, None)
+                self._results.appendleft(
+                    {"serial": task.serial, "ok": ok, "message": message, "seconds": round(seconds, 3), "at": time.time()}
+                )
+            self._queue.task_done()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", default=str(flash_history.DEFAULT_HISTORY_PATH), help="SQLite history file ('' skips it).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("provision", help="Provision one unit now (the helper scripts run this in the background).")
+    run.add_argument("--serial", required=True)
+    run.add_argument("--password", default=os.environ.get("FLEX_AP_PASSWORD", ""), help="Unit SoftAP password (default $FLEX_AP_PASSWORD).")
+    run.add_argument("--ssid", required=True, help="Factory SSID the freshly flashed unit broadcasts.")
+    run.add_argument("--ssid-password", default=os.environ.get("FLEX_FACTORY_PASSWORD", ""), help="Default $FLEX_FACTORY_PASSWORD.")
+    run.add_argument("--target-ip", required=True)
+    run.add_argument("--started-at", type=float, help="started_at of the unit's flash-history row to settle.")
+    run.add_argument("--device", help="Wi-Fi interface (default: the first detected).")
+    args = parser.parse_args(argv)
+
+    devices = [args.device] if args.device else wifi_devices()
+    if not devices:
+        print("Error: no Wi-Fi interface found; set FLEX_WIFI_DEVICES.", file=sys.stderr)
+        return 1
+    task = ProvisionTask(args.serial, args.password, args.ssid, args.ssid_password, args.target_ip, args.started_at)
+    history_path = Path(args.history) if args.history else None
+    started = time.monotonic()
+    try:
+        with interface_lock(devices[0]):
+            provision(task, WifiInterface(devices[0]), DebugClient(task.target_ip))
+    except ProvisionError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        record_result(history_path, task, False, str(exc), time.monotonic() - started)
+        return 1
+    record_result(history_path, task, True, "provisioned", time.monotonic() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))